@@ -23,73 +23,38 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
     "pool_pre_ping":   True,
     "pool_recycle":    300,
     "pool_timeout":    30,
-    "connect_args":    {"connect_timeout": 30},
 }
+if not db_url.startswith("sqlite"):
+    # libpq's keyword; sqlite3.connect() rejects it
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"]["connect_args"] = {"connect_timeout": 30}
 
 db = SQLAlchemy(app)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+CORS(app, resources={r"/api/*": {"origins": "*"}}, expose_headers=["ETag", "X-Total-Count", "X-Profile-File"])
 
 
 # =========================================================
 # FUZZY DUPLICATE DETECTION
 # =========================================================
 
-try:
-    from fuzzywuzzy import fuzz as _fuzz
-    FUZZ_AVAILABLE = True
-except ImportError:
-    FUZZ_AVAILABLE = False
-    print("[SkyVigilance] WARNING: fuzzywuzzy not installed — duplicate scoring disabled.")
+from dedup import FUZZ_AVAILABLE, case_fields, incoming_fields, score_fields
 
+if not FUZZ_AVAILABLE:
+    print("[SkyVigilance] WARNING: neither rapidfuzz nor fuzzywuzzy installed — duplicate scoring disabled.")
 
-def _fuzzy_score(incoming: dict, existing_case) -> float:
-    if not FUZZ_AVAILABLE:
-        return 0.0
-
-    tr  = existing_case.triage   or {}
-    prods = existing_case.products or [{}]
-    evts  = existing_case.events   or [{}]
-
-    c_initials = tr.get("patientInitials", "")
-    c_drug     = (prods[0] if prods else {}).get("name", "")
-    c_event    = (evts[0]  if evts  else {}).get("term", "")
-    c_pt       = (evts[0]  if evts  else {}).get("pt",   "")
-    c_country  = tr.get("country", "")
-
-    drug_in    = incoming.get("drugName", "")
-    event_in   = incoming.get("eventTerm", "")
-    pt_in      = incoming.get("eventPt",   "")
-    init_in    = incoming.get("patientInitials", "")
-    country_in = incoming.get("country", "")
-
-    drug_score = _fuzz.token_sort_ratio(drug_in.lower(), c_drug.lower()) if (drug_in and c_drug) else 0
-
-    event_score = max(
-        _fuzz.token_sort_ratio(event_in.lower(), c_event.lower()) if (event_in and c_event) else 0,
-        _fuzz.ratio(pt_in.lower(), c_pt.lower())                   if (pt_in    and c_pt  ) else 0,
-    )
-
-    init_score = _fuzz.ratio(init_in.upper(), c_initials.upper()) if (init_in and c_initials) else 0
-    country_score = 100 if (country_in and country_in == c_country) else 0
-
-    if drug_score == 0 or event_score == 0:
-        return 0.0
 
-    return (
-        drug_score    * 0.35 +
-        event_score   * 0.35 +
-        init_score    * 0.20 +
-        country_score * 0.10
-    )
+def _fuzzy_score(incoming: dict, existing_case) -> float:
+    return score_fields(incoming_fields(incoming), case_fields(existing_case))
 
 
 # =========================================================
 # E2B(R3) XML BUILDER
 # =========================================================
 
-from lxml import etree
+from lazy import LazyModule
 import uuid as _uuid_mod
 
+etree = LazyModule("lxml.etree")     # imported on the first E2B build
+
 HL7      = "urn:hl7-org:v3"
 XSI      = "http://www.w3.org/2001/XMLSchema-instance"
 XSI_TYPE = f"{{{XSI}}}type"
@@ -189,6 +154,10 @@ DRUG_CHAR = {
     "Treatment/Other": "2", "Interacting": "3",
 }
 
+# codeSystemVersion of a MedDRA code whose entry does not record the
+# release it was coded against (flask meddra-recode writes it)
+MEDDRA_VERSION = os.getenv("MEDDRA_VERSION", "28.1")
+
 
 def E(tag, attrib=None, text=None, parent=None):
     e = (etree.Element(f"{{{HL7}}}{tag}", attrib or {}, nsmap=NSMAP)
@@ -249,6 +218,19 @@ class Case(db.Model):
     archival    = db.Column(db.JSON)
     narrative = db.Column(db.Text)
 
+    # reporting-clock due date and the lease of whoever is working
+    # the case (worklist.py); claims leave updated_at alone
+    due_date      = db.Column(db.Date)
+    claimed_by    = db.Column(db.String(120))
+    claim_expires = db.Column(db.DateTime)
+
+    # the default listing order, and count/max(updated_at) for list ETags;
+    # the per-step worklist queues in due-date order
+    __table_args__ = (
+        db.Index("ix_case_updated", "updated_at", "id"),
+        db.Index("ix_case_worklist", "current_step", "status", "due_date", "id"),
+    )
+
     def to_dict(self):
         return {
             "id":          self.id,
@@ -274,11 +256,19 @@ class Case(db.Model):
 # AUDIT LOG MODEL
 # =========================================================
 
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def audit_ts_display(ts):
+    # "%d %b %Y, %H:%M" without strftime — locale independent and cheaper per row
+    return f"{ts.day:02d} {_MONTHS[ts.month - 1]} {ts.year}, {ts.hour:02d}:{ts.minute:02d}"
+
+
 class AuditLog(db.Model):
     __tablename__ = "audit_log"
 
     id           = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    case_id      = db.Column(db.String, db.ForeignKey("pv_case.id", ondelete="CASCADE"), nullable=False, index=True)
+    case_id      = db.Column(db.String, db.ForeignKey("pv_case.id", ondelete="CASCADE"), nullable=False)
     timestamp    = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     action_type  = db.Column(db.String(60), nullable=False)
     performed_by = db.Column(db.String(80), nullable=False)
@@ -288,27 +278,24 @@ class AuditLog(db.Model):
     section      = db.Column(db.String(60), nullable=True)
     details      = db.Column(db.Text,    nullable=True)
 
+    # inspection queries filter by case / user / action over a time
+    # range and page on (timestamp, id) — see audit.py
+    __table_args__ = (
+        db.Index("ix_audit_ts",        "timestamp",    "id"),
+        db.Index("ix_audit_case_ts",   "case_id",      "timestamp", "id"),
+        db.Index("ix_audit_user_ts",   "performed_by", "timestamp", "id"),
+        db.Index("ix_audit_action_ts", "action_type",  "timestamp", "id"),
+    )
+
     def to_dict(self):
         ts = self.timestamp
         if not isinstance(ts, datetime):
             try:
-                raw = str(ts).strip()
-                if not raw or raw.lower() in ("none", "null", "invalid date", "nat"):
-                    raise ValueError
-                from datetime import datetime as _dt
-                for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S",
-                            "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S",
-                            "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M"):
-                    try:
-                        ts = _dt.strptime(raw[:26], fmt); break
-                    except ValueError:
-                        continue
-                else:
-                    raise ValueError
-            except Exception:
+                ts = datetime.fromisoformat(str(ts).strip()[:26])
+            except ValueError:
                 ts = datetime.utcnow()
 
-        ts_display = ts.strftime("%d %b %Y, %H:%M")
+        ts_display = audit_ts_display(ts)
         return {
             "id":          self.id,
             "caseId":      self.case_id,
@@ -345,7 +332,7 @@ class MeddraTerm(db.Model):
     soc_name       = db.Column(db.String(500))
     soc_abbrev     = db.Column(db.String(10))
     current_llt    = db.Column(db.String(1),   default="Y")
-    meddra_version = db.Column(db.String(10),  default="28.1")
+    meddra_version = db.Column(db.String(10),  default=MEDDRA_VERSION)
 
     def to_dict(self):
         return {
@@ -366,51 +353,137 @@ class MeddraTerm(db.Model):
 
 
 # =========================================================
-# DB INIT
+# CASE SUMMARY MODEL — typed, indexed copies of the fields
+# listing, signal and duplicate queries filter on
 # =========================================================
 
-def init_db():
-    import time
-    max_attempts = 5
-    for attempt in range(1, max_attempts + 1):
-        try:
-            with app.app_context():
-                db.create_all()
-                from sqlalchemy import text
-                with db.engine.connect() as conn:
-                    for col in ("submissions", "archival"):
-                        try:
-                            conn.execute(text(f"ALTER TABLE pv_case ADD COLUMN {col} JSON"))
-                            conn.commit()
-                            print(f"[SkyVigilance] Migration: added column '{col}' to pv_case.")
-                        except Exception:
-                            pass 
-            print(f"[SkyVigilance] DB init OK (attempt {attempt})")
-            return
-        except Exception as e:
-            wait = attempt * 2
-            print(f"[SkyVigilance] DB init attempt {attempt} failed: {e}. Retrying in {wait}s...")
-            time.sleep(wait)
-    print("[SkyVigilance] WARNING: DB init failed after all retries.")
-
-init_db()
-
-
-def _repair_audit_on_startup():
-    try:
-        with app.app_context():
-            fixed = 0
-            for e in AuditLog.query.all():
-                if e.timestamp is None or not isinstance(e.timestamp, datetime):
-                    e.timestamp = datetime.utcnow()
-                    fixed += 1
-            if fixed:
-                db.session.commit()
-                print(f"[SkyVigilance] Repaired {fixed} corrupt audit timestamp(s).")
-    except Exception as ex:
-        print(f"[SkyVigilance] Audit repair skipped: {ex}")
+class CaseSummary(db.Model):
+    __tablename__ = "pv_case_summary"
+
+    case_id          = db.Column(db.String, db.ForeignKey("pv_case.id", ondelete="CASCADE"), primary_key=True)
+    country          = db.Column(db.String(100), index=True)
+    receipt_date     = db.Column(db.Date,        index=True)
+    report_type      = db.Column(db.String(60))
+    reporter_qual    = db.Column(db.String(60),  index=True)
+    patient_initials = db.Column(db.String(20))
+    first_drug       = db.Column(db.String(255))
+    first_generic    = db.Column(db.String(255))
+    suspect_drug     = db.Column(db.String(255))
+    suspect_drug_key = db.Column(db.String(255), index=True)
+    first_event_term = db.Column(db.String(500))
+    first_pt         = db.Column(db.String(500))
+    first_pt_code    = db.Column(db.String(8),   index=True)
+    onset_date       = db.Column(db.Date)
+    serious          = db.Column(db.Boolean,     index=True, default=False)
+    serious_flags    = db.Column(db.String(200))
+
+
+# =========================================================
+# CASE TEXT MODEL — the free-text fields of a case flattened
+# for full-text search (textsearch.py). docid is the FTS5
+# content rowid on SQLite; on PostgreSQL a generated
+# tsvector column with a GIN index is added by migration 5.
+# current_step / status are copied from pv_case so filtered
+# searches never read the case JSON rows.
+# =========================================================
 
-_repair_audit_on_startup()
+class CaseText(db.Model):
+    __tablename__ = "pv_case_text"
+
+    docid        = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    case_id      = db.Column(db.String, db.ForeignKey("pv_case.id", ondelete="CASCADE"), nullable=False, unique=True)
+    events       = db.Column(db.Text)      # event verbatims, one per line
+    history      = db.Column(db.Text)      # medical history descriptions
+    labs         = db.Column(db.Text)      # lab test names
+    narrative    = db.Column(db.Text)
+    current_step = db.Column(db.Integer)
+    status       = db.Column(db.String(100))
+
+
+# =========================================================
+# SIGNAL COUNT MODEL — drug x event case counts maintained
+# by the ORM hooks. drug_key "" / event_key "" rows hold the
+# event / drug marginals, ("", "") the case total.
+# =========================================================
+
+class SignalCount(db.Model):
+    __tablename__ = "pv_signal_count"
+
+    level     = db.Column(db.String(3),   primary_key=True)     # "pt" | "soc"
+    drug_key  = db.Column(db.String(500), primary_key=True)
+    event_key = db.Column(db.String(500), primary_key=True)
+    drug      = db.Column(db.String(500))
+    event     = db.Column(db.String(500))
+    n         = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ix_signal_count_drug",  "level", "drug_key",  "n"),
+        db.Index("ix_signal_count_event", "level", "event_key", "n"),
+    )
+
+
+# =========================================================
+# MEDDRA CODING DECISION MODEL — verbatim -> LLT choices of
+# the auto-coder (autocode.py), one row per kind and folded
+# verbatim. "auto" rows are its own suggestions, kept for
+# the dictionary version they were made against; coders
+# mark them "confirmed" or "rejected".
+# =========================================================
+
+class CodingDecision(db.Model):
+    __tablename__ = "meddra_coding_decision"
+
+    kind           = db.Column(db.String(12),  primary_key=True)    # event | history | lab | indication
+    verbatim_key   = db.Column(db.String(500), primary_key=True)
+    verbatim       = db.Column(db.String(500))
+    llt_code       = db.Column(db.String(8))
+    pt_code        = db.Column(db.String(8))
+    confidence     = db.Column(db.Float)
+    method         = db.Column(db.String(20))
+    status         = db.Column(db.String(12),  nullable=False, default="auto")
+    cases          = db.Column(db.Integer,     default=0)            # uncoded occurrences at the last run
+    decided_by     = db.Column(db.String(80))
+    decided_at     = db.Column(db.DateTime,    default=datetime.utcnow)
+    meddra_version = db.Column(db.String(10))
+
+    __table_args__ = (
+        db.Index("ix_coding_decision_review", "status", "cases"),
+    )
+
+    def to_dict(self):
+        return {
+            "kind":       self.kind,
+            "key":        self.verbatim_key,
+            "verbatim":   self.verbatim,
+            "lltCode":    self.llt_code,
+            "ptCode":     self.pt_code,
+            "confidence": self.confidence,
+            "method":     self.method,
+            "status":     self.status,
+            "cases":      self.cases,
+            "decidedBy":  self.decided_by,
+            "decidedAt":  self.decided_at.isoformat() if self.decided_at else None,
+            "version":    self.meddra_version,
+        }
+
+
+# =========================================================
+# DB INIT — schema migrations (migrations.py). Render runs
+# no Procfile release phase, so each worker checks at import
+# whether schema_version is behind MIGRATIONS (one query)
+# and only then migrates, under the advisory lock that makes
+# concurrent workers apply every step once. MIGRATE_ON_BOOT:
+#   auto  (default) migrate when behind
+#   1     always run migrate()
+#   0     never; `flask --app app db-migrate` runs it, e.g.
+#         as a Render pre-deploy command or release phase
+# =========================================================
+
+MIGRATE_ON_BOOT = os.getenv("MIGRATE_ON_BOOT", "auto")
+if MIGRATE_ON_BOOT != "0":
+    from migrations import migrate_with_retry
+    with app.app_context():
+        migrate_with_retry(db.engine, strict=False, only_if_behind=MIGRATE_ON_BOOT != "1")
 
 
 # =========================================================
@@ -432,10 +505,15 @@ def _validate_step(data, step):
     return len(errors) == 0, errors
 
 
+# sync: AuditLog rows join the caller's transaction; async: see audit_writer.py
+AUDIT_WRITER  = os.getenv("AUDIT_WRITER", "sync")
+PENDING_AUDIT = "pending_audit"
+
+
 def log_event(case_id, action_type, performed_by, role,
               step_from=None, step_to=None, section=None, details=None):
     try:
-        entry = AuditLog(
+        row = dict(
             case_id      = case_id,
             timestamp    = datetime.utcnow(),
             action_type  = action_type,
@@ -446,7 +524,13 @@ def log_event(case_id, action_type, performed_by, role,
             section      = section,
             details      = details,
         )
-        db.session.add(entry)
+        if AUDIT_WRITER == "async":
+            # handed to the writer when this transaction commits
+            session = db.session()
+            tx = session.get_nested_transaction() or session.get_transaction()
+            session.info.setdefault(PENDING_AUDIT, []).append((tx, row))
+        else:
+            db.session.add(AuditLog(**row))
     except Exception as e:
         print(f"[AUDIT] Failed to log event: {e}")
 
@@ -458,6 +542,17 @@ def extract_audit(data):
     return performed_by, role, data
 
 
+# =========================================================
+# HOOKS, ROUTES & CLI COMMANDS
+# =========================================================
+
+import hooks      # noqa: E402,F401
+import audit_writer  # noqa: E402,F401
+import telemetry  # noqa: E402,F401
+import routes     # noqa: E402,F401
+import commands   # noqa: E402,F401
+
+
 # =========================================================
 # E2B XML BUILDER (full ICH E2B R3)
 # =========================================================
@@ -566,7 +661,10 @@ def build_e2b_xml(case):
         for h in history_entries:
             h_obs = E("observation", {"classCode": "OBS", "moodCode": "EVN"},
                       parent=E("component", {"typeCode": "COMP"}, parent=hist_org))
-            code_el = E("code", {"nullFlavor": "UNK"}, parent=h_obs)
+            h_code  = h.get("meddraLltCode") or h.get("meddraPtCode")
+            code_el = E("code", {"code": h_code, "codeSystem": OID["meddra"],
+                                 "codeSystemVersion": h.get("meddraVersion") or MEDDRA_VERSION}
+                        if h_code else {"nullFlavor": "UNK"}, parent=h_obs)
             E("originalText", parent=code_el, text=h["description"])
 
             if h.get("startDate") or h.get("stopDate"):
@@ -599,7 +697,8 @@ def build_e2b_xml(case):
         for lab in lab_entries:
             t_obs = E("observation", {"classCode": "OBS", "moodCode": "EVN"},
                       parent=E("component", {"typeCode": "COMP"}, parent=test_org))
-            t_code = E("code", {"code": "10000001", "codeSystem": OID["meddra"]}, parent=t_obs)
+            t_code = E("code", {"code": lab.get("meddraLltCode") or lab.get("meddraPtCode") or "10000001",
+                                "codeSystem": OID["meddra"]}, parent=t_obs)
             E("originalText", parent=t_code, text=lab["testName"])
 
             if lab.get("testDate"):
@@ -717,9 +816,11 @@ def build_e2b_xml(case):
                                      parent=sub_admin))
                 E("code", {"code": "19", "codeSystem": OID["cs_data_elem"],
                            "codeSystemVersion": "2.0", "displayName": "indication"}, parent=ind_obs)
-                ind_val = E("value", {XSI_TYPE: "CE", "code": "10000001",
+                ind_val = E("value", {XSI_TYPE: "CE",
+                                      "code": drug.get("indicationLltCode") or drug.get("indicationPtCode") or "10000001",
                                       "codeSystem": OID["meddra"],
-                                      "codeSystemVersion": "28.1"}, parent=ind_obs)
+                                      "codeSystemVersion": drug.get("indicationVersion") or MEDDRA_VERSION},
+                            parent=ind_obs)
                 E("originalText", parent=ind_val, text=drug["indication"])
 
             if drug.get("actionTaken"):
@@ -0,0 +1,215 @@
+# =========================================================
+# AUDIT TRAIL QUERIES — cross-case filters (case, user, role,
+# action, section, time range), keyset pagination on
+# (timestamp, id) and a streaming CSV export for inspectors.
+# Rows are read as plain tuples, not ORM objects, and the
+# timestamp is formatted straight from the datetime.
+# =========================================================
+
+import base64
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select, tuple_
+
+from app import db, AuditLog, audit_ts_display
+
+MAX_LIMIT = 1000
+CSV_BATCH = 5000
+
+_T    = AuditLog.__table__
+_COLS = (_T.c.id, _T.c.case_id, _T.c.timestamp, _T.c.action_type, _T.c.performed_by,
+         _T.c.role, _T.c.step_from, _T.c.step_to, _T.c.section, _T.c.details)
+
+CSV_HEADERS = ["Entry ID", "Case ID", "Timestamp (UTC)", "Action", "Performed By", "Role",
+               "Step From", "Step To", "Section", "Details"]
+
+
+class AuditQueryError(ValueError):
+    pass
+
+
+# ---------------------------------------------------------
+# Timestamps
+# ---------------------------------------------------------
+
+def as_datetime(ts):
+    # DateTime columns already come back as datetime; one ISO parse
+    # covers the legacy text values, anything else is unreadable
+    if isinstance(ts, datetime):
+        return ts
+    try:
+        return datetime.fromisoformat(str(ts).strip()[:26])
+    except ValueError:
+        return None
+
+
+def entry_dict(row):
+    # row: (id, case_id, timestamp, action_type, performed_by, role,
+    #       step_from, step_to, section, details) — AuditLog.to_dict layout
+    ts = as_datetime(row[2]) or datetime.utcnow()
+    shown = audit_ts_display(ts)
+    return {
+        "id":          row[0],
+        "caseId":      row[1],
+        "timestamp":   shown,
+        "performedAt": shown,
+        "at":          ts.isoformat(),
+        "actionType":  row[3],
+        "action":      row[3],
+        "performedBy": row[4],
+        "role":        row[5],
+        "stepFrom":    row[6],
+        "stepTo":      row[7],
+        "step":        row[7],
+        "section":     row[8],
+        "details":     row[9],
+    }
+
+
+# ---------------------------------------------------------
+# Request parsing
+# ---------------------------------------------------------
+
+def _list(args, name):
+    return [s.strip() for s in (args.get(name) or "").split(",") if s.strip()]
+
+
+def _when(value, name, end=False):
+    # ISO date or datetime; a bare date as upper bound covers the whole day
+    try:
+        if len(value) == 10:
+            d = datetime.combine(date.fromisoformat(value), datetime.min.time())
+            return d + timedelta(days=1) if end else d
+        return datetime.fromisoformat(value.replace("Z", ""))
+    except ValueError:
+        raise AuditQueryError(f"{name} must be an ISO date or datetime.")
+
+
+def parse_args(args, case_id=None):
+    opts = {
+        "case":    [case_id] if case_id else _list(args, "caseId"),
+        "user":    _list(args, "user"),
+        "role":    _list(args, "role"),
+        "action":  _list(args, "action"),
+        "section": _list(args, "section"),
+        "from":    _when(args["from"], "from") if args.get("from") else None,
+        "to":      _when(args["to"], "to", end=True) if args.get("to") else None,
+        "order":   args.get("order", "asc" if case_id else "desc"),
+        "cursor":  args.get("cursor"),
+        "limit":   args.get("limit"),
+    }
+    if opts["order"] not in ("asc", "desc"):
+        raise AuditQueryError("order must be 'asc' or 'desc'.")
+    try:
+        opts["limit"] = max(1, min(int(opts["limit"] or 100), MAX_LIMIT))
+    except ValueError:
+        raise AuditQueryError("limit must be numeric.")
+    return opts
+
+
+def encode_cursor(ts, entry_id):
+    raw = json.dumps([ts.isoformat() if isinstance(ts, datetime) else ts, entry_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        ts, entry_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return datetime.fromisoformat(ts), int(entry_id)
+    except (ValueError, TypeError) as e:
+        raise AuditQueryError(f"Invalid cursor: {e}")
+
+
+# ---------------------------------------------------------
+# Query building
+# ---------------------------------------------------------
+
+def _where(opts):
+    # each filter is an IN so single values and lists share a plan;
+    # ix_audit_* lead with the filter column and end in (timestamp, id)
+    conds = []
+    for key, col in (("case", _T.c.case_id), ("user", _T.c.performed_by), ("role", _T.c.role),
+                     ("action", _T.c.action_type), ("section", _T.c.section)):
+        if opts[key]:
+            conds.append(col.in_(opts[key]))
+    if opts["from"]:
+        conds.append(_T.c.timestamp >= opts["from"])
+    if opts["to"]:
+        conds.append(_T.c.timestamp < opts["to"])
+    return conds
+
+
+def _ordered(stmt, desc):
+    if desc:
+        return stmt.order_by(_T.c.timestamp.desc(), _T.c.id.desc())
+    return stmt.order_by(_T.c.timestamp.asc(), _T.c.id.asc())
+
+
+def _after(ts, entry_id, desc):
+    # row-value comparison: both PostgreSQL and SQLite turn it into an
+    # index range seek, where the expanded OR form scans on SQLite
+    key = tuple_(_T.c.timestamp, _T.c.id)
+    return key < tuple_(ts, entry_id) if desc else key > tuple_(ts, entry_id)
+
+
+def query_page(args, case_id=None):
+    opts  = parse_args(args, case_id)
+    desc  = opts["order"] == "desc"
+    conds = _where(opts)
+    if opts["cursor"]:
+        conds.append(_after(*decode_cursor(opts["cursor"]), desc))
+
+    stmt = _ordered(select(*_COLS).where(*conds), desc).limit(opts["limit"] + 1)
+    rows = db.session.execute(stmt).all()
+    more = len(rows) > opts["limit"]
+    rows = rows[:opts["limit"]]
+    return {
+        "items":      [entry_dict(r) for r in rows],
+        "limit":      opts["limit"],
+        "order":      opts["order"],
+        "nextCursor": encode_cursor(rows[-1][2], rows[-1][0]) if (more and rows) else None,
+    }
+
+
+def count(args, case_id=None):
+    opts = parse_args(args, case_id)
+    return db.session.execute(select(func.count()).select_from(_T).where(*_where(opts))).scalar()
+
+
+# ---------------------------------------------------------
+# CSV export
+# ---------------------------------------------------------
+
+def export_rows(args, case_id=None):
+    # walks the filtered trail in keyset batches, so a multi-million
+    # row export never holds more than CSV_BATCH rows or one long cursor
+    opts = parse_args(args, case_id)
+    desc = opts["order"] == "desc"
+    base = _where(opts)
+    last = decode_cursor(opts["cursor"]) if opts["cursor"] else None
+    while True:
+        conds = base + [_after(*last, desc)] if last else base
+        rows  = db.session.execute(_ordered(select(*_COLS).where(*conds), desc).limit(CSV_BATCH)).all()
+        for r in rows:
+            ts = as_datetime(r[2])
+            yield [r[0], r[1], ts.isoformat(sep=" ", timespec="seconds") if ts else r[2],
+                   r[3], r[4], r[5], r[6], r[7], r[8], r[9]]
+        if len(rows) < CSV_BATCH:
+            return
+        last = (rows[-1][2], rows[-1][0])
+
+
+def stream_csv(rows):
+    buf = io.StringIO()
+    out = csv.writer(buf, quoting=csv.QUOTE_MINIMAL, lineterminator="\n")
+    out.writerow(CSV_HEADERS)
+    for row in rows:
+        out.writerow(row)
+        if buf.tell() > 64 * 1024:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
@@ -0,0 +1,280 @@
+# =========================================================
+# AUDIT WRITER
+# ---------------------------------------------------------
+# AUDIT_WRITER=sync (default) adds each AuditLog row to the
+# request's session, so the entry commits in the same
+# transaction as the change it records — keep it for
+# regulated (21 CFR Part 11 / Annex 11) deployments.
+#
+# AUDIT_WRITER=async holds the entries on the session until
+# it commits (a rollback, or a rolled back savepoint, drops
+# them), then hands them to a per-process writer thread that
+# inserts them as one multi-row INSERT every AUDIT_FLUSH_MS
+# or AUDIT_FLUSH_SIZE entries. AUDIT_DURABILITY sets what a
+# crash can lose:
+#   memory  entries not yet flushed (at most one interval)
+#   spool   appended to a journal in AUDIT_SPOOL_DIR on
+#           commit; replayed at start if the worker died
+#   fsync   as spool, fsync'd before the request returns
+# A batch that fails on a connection-class error is retried
+# whole. Any other error (a row the database rejects: FK,
+# over-length value) bisects the batch down to the rows at
+# fault, which go to the dead-letter file DEAD_LETTER with
+# their error instead of blocking every later batch.
+# =========================================================
+
+import atexit
+import fcntl
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+from app import app, db, AuditLog, AUDIT_WRITER, PENDING_AUDIT
+
+DURABILITY  = os.getenv("AUDIT_DURABILITY", "spool")
+FLUSH_MS    = int(os.getenv("AUDIT_FLUSH_MS", "200"))
+FLUSH_SIZE  = int(os.getenv("AUDIT_FLUSH_SIZE", "500"))
+QUEUE_MAX   = int(os.getenv("AUDIT_QUEUE_MAX", "20000"))
+SPOOL_DIR   = os.getenv("AUDIT_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "skyvig-audit"))
+DEAD_LETTER = "dead-audit.ndjson"          # in SPOOL_DIR; not replayed at start
+
+_audit = AuditLog.__table__
+
+if AUDIT_WRITER not in ("sync", "async"):
+    raise ValueError(f"AUDIT_WRITER must be sync or async, not {AUDIT_WRITER!r}")
+
+
+def _encode(row, **extra):
+    return json.dumps({**row, "timestamp": row["timestamp"].isoformat(), **extra})
+
+
+def _transient(e):
+    # the database, not the rows: retry the batch as it is
+    return isinstance(e, (OperationalError, InterfaceError)) or (
+        isinstance(e, DBAPIError) and e.connection_invalidated)
+
+
+def _decode(line):
+    row = json.loads(line)
+    row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+    return row
+
+
+class _Segment:
+    # one journal file, flock'ed by its writer until its rows are in the
+    # database, so a starting worker only replays segments nobody owns
+    def __init__(self, path, create=True):
+        self.path = path
+        flags     = os.O_WRONLY | os.O_APPEND | (os.O_CREAT if create else 0)
+        self.f    = open(os.open(path, flags, 0o600), "a", encoding="utf-8")
+        try:
+            fcntl.flock(self.f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.f.close()
+            raise
+
+    def append(self, rows, sync):
+        self.f.write("".join(_encode(r) + "\n" for r in rows))
+        self.f.flush()
+        if sync:
+            os.fsync(self.f.fileno())
+
+    def drop(self):
+        os.unlink(self.path)
+        self.f.close()
+
+
+class AuditWriter:
+    def __init__(self, durability=DURABILITY, flush_ms=FLUSH_MS, flush_size=FLUSH_SIZE,
+                 queue_max=QUEUE_MAX, spool_dir=SPOOL_DIR):
+        if durability not in ("memory", "spool", "fsync"):
+            raise ValueError(f"AUDIT_DURABILITY must be memory, spool or fsync, not {durability!r}")
+        self.durability = durability
+        self.interval   = flush_ms / 1000
+        self.flush_size = flush_size
+        self.queue_max  = queue_max
+        self.spool_dir  = spool_dir
+        self.queue      = []
+        self.segment    = None
+        self.retry      = []            # (rows, segment) batches whose insert failed
+        self.seq        = 0
+        self.lock       = threading.Lock()    # queue + current segment
+        self.flushing   = threading.Lock()    # one INSERT at a time
+        self.wake       = threading.Event()
+        self.stats      = {"queued": 0, "written": 0, "batches": 0, "failures": 0, "deadLettered": 0,
+                           "lastError": None}
+        self.thread     = None
+        self.pid        = None
+
+    # -- request side ------------------------------------------------------
+
+    def submit(self, rows):
+        self._ensure_thread()
+        with self.lock:
+            if self.durability != "memory":
+                if self.segment is None:
+                    self.segment = self._new_segment()
+                self.segment.append(rows, self.durability == "fsync")
+            self.queue.extend(rows)
+            self.stats["queued"] += len(rows)
+            backlog = len(self.queue)
+        if backlog >= self.queue_max:
+            self.flush()                # back-pressure: the caller pays for the insert
+        elif backlog >= self.flush_size:
+            self.wake.set()
+
+    # -- writer side -------------------------------------------------------
+
+    def flush(self):
+        # -> entries written; batches stopped by a transient error stay
+        # queued for the next flush
+        with self.flushing:
+            with self.lock:
+                rows, seg = self.queue, self.segment
+                self.queue, self.segment = [], None
+            if rows:
+                self.retry.append((rows, seg))
+            written = 0
+            while self.retry:
+                rows, seg = self.retry[0]
+                done, rest = self._write(rows)
+                written += done
+                if rest:
+                    if seg is not None and len(rest) < len(rows):
+                        # journal only what is still unwritten
+                        seg.drop()
+                        seg = self._new_segment()
+                        seg.append(rest, self.durability == "fsync")
+                    self.retry[0] = (rest, seg)
+                    break
+                self.retry.pop(0)
+                if seg is not None:
+                    seg.drop()
+                self.stats["batches"] += 1
+            return written
+
+    def _write(self, rows):
+        # -> (entries written, entries left after a transient error);
+        # rows rejected on their own are bisected out and dead-lettered
+        parts, written = [rows], 0
+        while parts:
+            part = parts.pop()
+            try:
+                with app.app_context(), db.engine.begin() as conn:
+                    conn.execute(_audit.insert(), part)
+            except Exception as e:
+                self.stats["failures"] += 1
+                self.stats["lastError"] = str(e).splitlines()[0]
+                if _transient(e):
+                    print(f"[AUDIT] Batch of {len(part)} entries not written, will retry: "
+                          f"{self.stats['lastError']}")
+                    return written, [r for p in parts + [part] for r in p]
+                if len(part) == 1:
+                    self._dead_letter(part[0])
+                else:
+                    mid = len(part) // 2
+                    parts += [part[mid:], part[:mid]]
+                continue
+            written += len(part)
+            self.stats["written"] += len(part)
+        return written, []
+
+    def _dead_letter(self, row):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        with open(os.path.join(self.spool_dir, DEAD_LETTER), "a", encoding="utf-8") as f:
+            f.write(_encode(row, error=self.stats["lastError"]) + "\n")
+        self.stats["deadLettered"] += 1
+        print(f"[AUDIT] Entry for case {row.get('case_id')} rejected, written to "
+              f"{DEAD_LETTER}: {self.stats['lastError']}")
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            if self.flush() == 0 and self.retry:
+                time.sleep(min(5.0, self.interval * 10))    # database unavailable: back off
+
+    def _ensure_thread(self):
+        # started lazily, and again in a forked worker (threads do not survive fork)
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    if self.pid is not None:    # forked: the parent's batches are its own
+                        self.queue, self.segment, self.retry = [], None, []
+                    self.thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                    self.thread.start()
+                    self.pid = os.getpid()
+
+    # -- journal -----------------------------------------------------------
+
+    def _new_segment(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.seq += 1
+        return _Segment(os.path.join(self.spool_dir, f"audit-{os.getpid()}-{self.seq:08d}.ndjson"))
+
+    def replay(self):
+        # re-insert journal segments left by a worker that died before flushing
+        self._ensure_thread()
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "audit-*.ndjson"))):
+            try:
+                seg = _Segment(path, create=False)
+            except (BlockingIOError, FileNotFoundError):
+                continue                # owned by a live worker, or just flushed
+            with open(path, encoding="utf-8") as f:
+                rows = [_decode(line) for line in f if line.strip()]
+            if rows:
+                with self.flushing:
+                    self.retry.append((rows, seg))
+            else:
+                seg.drop()
+            replayed += len(rows)
+        if replayed:
+            print(f"[SkyVigilance] Audit journal: replaying {replayed} unflushed entries.")
+            self.flush()
+        return replayed
+
+
+writer = AuditWriter() if AUDIT_WRITER == "async" else None
+
+
+# ---------------------------------------------------------
+# Session hooks — entries follow their transaction
+# ---------------------------------------------------------
+
+def _chain(tx):
+    while tx is not None:
+        yield tx
+        tx = tx.parent
+
+
+@event.listens_for(db.session, "after_commit")
+def _audit_commit(session):
+    pending = session.info.pop(PENDING_AUDIT, None)
+    if pending and writer is not None:
+        writer.submit([row for _, row in pending])
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _audit_rollback(session, previous_transaction):
+    pending = session.info.get(PENDING_AUDIT)
+    if not pending:
+        return
+    if not previous_transaction.nested:
+        session.info.pop(PENDING_AUDIT, None)
+        return
+    session.info[PENDING_AUDIT] = [(tx, row) for tx, row in pending
+                                   if previous_transaction not in _chain(tx)]
+
+
+if writer is not None:
+    atexit.register(writer.flush)
+    if writer.durability != "memory":
+        writer.replay()
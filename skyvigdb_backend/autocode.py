@@ -0,0 +1,467 @@
+# =========================================================
+# MEDDRA AUTO-CODING
+# ---------------------------------------------------------
+# Maps reporter verbatims — event terms, medical history
+# descriptions, lab test names, indications — to LLT / PT
+# candidates with a confidence for the coder to confirm:
+#   exact       llt_name equal after case / space folding  1.00
+#   normalized  equal after spelling, plural and filler-    0.95
+#               word folding (oedema = edema, "severe" ...)
+#   tokens      the same words in another order             0.90
+#   fuzzy       the meddra_search ranking, re-scored by     <= 0.85
+#               edit similarity
+# A hash hit spread over several PTs is discounted (the
+# coder has to pick); a non-current LLT is coded to its PT.
+# Suggestions are memoized per worker and every decision is
+# kept in meddra_coding_decision under the folded verbatim,
+# so a repeat — in the same run, a later run or another
+# worker — is a dict lookup. Confirmed decisions always
+# apply; auto ones from AUTOCODE_MIN_CONFIDENCE up.
+# =========================================================
+
+import difflib
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from app import db, Case, CodingDecision, log_event
+from hooks import get_meddra_index
+from lazy import LazyModule, available
+from meddra_search import normalize, to_dict
+from metrics import AUTOCODE_TOTAL
+
+RAPIDFUZZ_AVAILABLE = available("rapidfuzz")
+_fuzz = LazyModule("rapidfuzz.fuzz")
+
+KINDS          = ("event", "history", "lab", "indication")
+STATUSES       = ("auto", "confirmed", "rejected")
+MIN_CONFIDENCE = float(os.getenv("AUTOCODE_MIN_CONFIDENCE", "0.95"))
+MEMO_SIZE      = int(os.getenv("AUTOCODE_CACHE", "50000"))
+CONFIDENCE     = {"exact": 1.0, "normalized": 0.95, "tokens": 0.9, "fuzzy": 0.85}
+AMBIGUOUS      = 0.8       # factor when a hash hit spans several PTs
+NON_CURRENT    = 0.05      # taken off when the hit is a non-current LLT
+FUZZY_POOL     = 25        # search results re-scored by the fuzzy tier
+FUZZY_MIN      = 0.7       # similarity below this is not a candidate
+
+_TOKEN_RE  = re.compile(r"[a-z0-9]+")
+_SPELLING  = [(re.compile(p), r) for p, r in (
+    (r"aem", "em"),              # haematoma, anaemia, ischaemia, leukaemia
+    (r"oe(?=[ds])", "e"),        # oedema, oesophagitis, oestrogen
+    (r"rrhoea", "rrhea"),        # diarrhoea, amenorrhoea
+    (r"paed", "ped"),
+    (r"foet", "fet"),
+    (r"aesth", "esth"),
+    (r"gynaec", "gynec"),
+    (r"isation$", "ization"),
+    (r"our$", "or"),             # tumour
+    (r"tre$", "ter"),            # litre
+)]
+_STOPWORDS = {"a", "an", "the", "of", "and", "with", "in", "on", "to", "for", "by", "at",
+              "mild", "moderate", "severe", "slight", "very", "pt", "patient"}
+_KEEP_S    = ("ss", "us", "is", "as", "os")
+
+
+class AutocodeError(ValueError):
+    pass
+
+
+# ---------------------------------------------------------
+# Verbatim folding — applied to the dictionary and the
+# verbatims alike, so a fold only has to be consistent
+# ---------------------------------------------------------
+
+def _fold_token(t):
+    for pattern, repl in _SPELLING:
+        t = pattern.sub(repl, t)
+    if len(t) > 4 and t.endswith("ies"):
+        return t[:-3] + "y"
+    if len(t) > 3 and t.endswith("s") and not t.endswith(_KEEP_S):
+        return t[:-1]
+    return t
+
+
+def fold(s):
+    tokens = [_fold_token(t) for t in _TOKEN_RE.findall(normalize(s))]
+    kept   = [t for t in tokens if t not in _STOPWORDS]
+    return " ".join(kept or tokens)
+
+
+def _bag(folded):
+    return " ".join(sorted(set(folded.split())))
+
+
+def coding_key(verbatim):
+    # decisions are stored under the folded verbatim
+    return fold(verbatim)[:500]
+
+
+def _similarity(a, b):
+    if RAPIDFUZZ_AVAILABLE:
+        return _fuzz.token_sort_ratio(a, b) / 100
+    return difflib.SequenceMatcher(None, " ".join(sorted(a.split())), " ".join(sorted(b.split()))).ratio()
+
+
+# =========================================================
+# CODER — hash tiers over the MedDRA search index's rows
+# =========================================================
+
+class Coder:
+
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self.signature = None
+        self.version   = None
+        self.index     = None
+        self.folded    = {}            # folded llt_name -> row ids
+        self.bags      = {}            # sorted distinct folded words -> row ids
+        self.by_code   = {}            # llt_code -> row id
+        self.pt_llt    = {}            # pt_code -> row id of the PT's own LLT
+        self._memo     = OrderedDict()
+
+    def load(self, index):
+        folded, bags, by_code, pt_llt = {}, {}, {}, {}
+        for i, row in enumerate(index.rows):
+            f = fold(row[1])
+            folded.setdefault(f, []).append(i)
+            bags.setdefault(_bag(f), []).append(i)
+            by_code[row[0]] = i
+            if row[0] == row[2]:
+                pt_llt[row[2]] = i
+        with self._lock:
+            self.index, self.folded, self.bags = index, folded, bags
+            self.by_code, self.pt_llt = by_code, pt_llt
+            self.signature = index.signature
+            self.version   = index.signature[1] if index.signature else None
+            self._memo.clear()
+        return self
+
+    def row(self, llt_code):
+        i = self.by_code.get(llt_code)
+        return self.index.rows[i] if i is not None else None
+
+    # -----------------------------------------------------
+    # Tiers — each returns [(row id, confidence, method)]
+    # -----------------------------------------------------
+
+    def _hash(self, ids, method):
+        # current LLTs first; a non-current one stands for its PT
+        current, moved = [], []
+        for i in ids:
+            if self.index.current[i]:
+                current.append(i)
+            else:
+                j = self.pt_llt.get(self.index.rows[i][2])
+                if j is not None and self.index.current[j]:
+                    moved.append(j)
+        ids  = list(dict.fromkeys(current or moved))
+        if not ids:
+            return []
+        conf = CONFIDENCE[method] - (0 if current else NON_CURRENT)
+        if len({self.index.rows[i][2] for i in ids}) > 1:
+            conf *= AMBIGUOUS
+        return [(i, round(conf, 3), method) for i in ids]
+
+    def _fuzzy(self, q, f):
+        best = {}
+        for row in self.index.search(q, FUZZY_POOL, current_only=True):
+            sim = _similarity(f, fold(row[1]))
+            if sim >= FUZZY_MIN and sim > best.get(row[2], (0,))[0]:
+                best[row[2]] = (sim, self.by_code[row[0]])
+        ranked = sorted(best.values(), key=lambda x: -x[0])
+        return [(i, round(CONFIDENCE["fuzzy"] * sim, 3), "fuzzy") for sim, i in ranked]
+
+    def suggest(self, verbatim, limit=5):
+        q = normalize(verbatim)
+        if not q or self.index is None:
+            return []
+        hit = self._memo.get(q)
+        if hit is not None:
+            AUTOCODE_TOTAL.inc("memo")
+            with self._lock:
+                if q in self._memo:
+                    self._memo.move_to_end(q)
+            return hit[:limit]
+        f   = fold(q)
+        out = (self._hash(self.index.exact.get(q, ()), "exact")
+               or self._hash(self.folded.get(f, ()), "normalized")
+               or self._hash(self.bags.get(_bag(f), ()), "tokens")
+               or self._fuzzy(q, f))
+        AUTOCODE_TOTAL.inc(out[0][2] if out else "none")
+        with self._lock:
+            self._memo[q] = out
+            if len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return out[:limit]
+
+    def candidate(self, i, confidence, method):
+        return dict(to_dict(self.index.rows[i]), confidence=confidence, method=method)
+
+
+coder = Coder()
+
+
+def get_coder():
+    index = get_meddra_index()
+    if coder.signature != index.signature:
+        coder.load(index)
+        print(f"[SkyVigilance] MedDRA auto-coder loaded ({len(coder.folded)} folded names).")
+    return coder
+
+
+# =========================================================
+# DECISIONS — plain dicts keyed by (kind, folded verbatim)
+# =========================================================
+
+_D = CodingDecision.__table__
+_DECISION_COLS = ("kind", "verbatim_key", "verbatim", "llt_code", "pt_code", "confidence", "method",
+                  "status", "cases", "decided_by", "decided_at", "meddra_version")
+
+
+def load_decisions(kinds=KINDS, keys=None):
+    q = db.session.query(*(getattr(CodingDecision, c) for c in _DECISION_COLS)).filter(CodingDecision.kind.in_(kinds))
+    if keys is not None:
+        if not keys:
+            return {}
+        q = q.filter(CodingDecision.verbatim_key.in_(keys))
+    return {(r.kind, r.verbatim_key): dict(zip(_DECISION_COLS, r)) for r in q}
+
+
+def save_decisions(decisions, keys, existing):
+    # insert the new keys, update the rest, in two executemany calls
+    rows = [decisions[k] for k in keys]
+    new  = [r for r in rows if (r["kind"], r["verbatim_key"]) not in existing]
+    old  = [dict(r, k_kind=r["kind"], k_key=r["verbatim_key"]) for r in rows
+            if (r["kind"], r["verbatim_key"]) in existing]
+    if new:
+        db.session.execute(_D.insert(), new)
+    if old:
+        db.session.execute(_D.update()
+                           .where(_D.c.kind == bindparam("k_kind"))
+                           .where(_D.c.verbatim_key == bindparam("k_key"))
+                           .values({c: bindparam(c) for c in _DECISION_COLS[2:]}), old)
+    existing.update((r["kind"], r["verbatim_key"]) for r in new)
+
+
+def decide(cdr, decisions, kind, key, verbatim):
+    # -> the decision dict for a verbatim, computing (and adding to
+    # `decisions`) an auto one when there is no usable stored row
+    # (a rejection stays until a coder confirms something else)
+    d = decisions.get((kind, key))
+    if d is not None and (d["status"] != "auto" or d["meddra_version"] == cdr.version):
+        return d
+    top = next(iter(cdr.suggest(verbatim, limit=1)), None)
+    row = cdr.index.rows[top[0]] if top else None
+    d   = {"kind": kind, "verbatim_key": key, "verbatim": verbatim[:500],
+           "llt_code": row[0] if row else None, "pt_code": row[2] if row else None,
+           "confidence": top[1] if top else 0.0, "method": top[2] if top else "none",
+           "status": "auto", "cases": 0, "decided_by": "autocode",
+           "decided_at": datetime.utcnow(), "meddra_version": cdr.version}
+    decisions[(kind, key)] = d
+    return d
+
+
+def applies(d, min_confidence):
+    if d["llt_code"] is None or d["status"] == "rejected":
+        return False
+    return d["status"] == "confirmed" or (d["confidence"] or 0) >= min_confidence
+
+
+def suggestions(verbatims, kind="event", limit=5):
+    # POST /api/meddra/autocode — candidates plus any stored decision
+    if kind not in KINDS:
+        raise AutocodeError(f"kind must be one of {list(KINDS)}.")
+    cdr    = get_coder()
+    keys   = {coding_key(v) for v in verbatims if v}
+    stored = load_decisions((kind,), list(keys))
+    out    = []
+    for v in verbatims:
+        key   = coding_key(v or "")
+        d     = stored.get((kind, key))
+        cands = [cdr.candidate(*s) for s in cdr.suggest(v or "", limit)]
+        if d is not None and d["status"] == "rejected":
+            cands = [c for c in cands if c["llt_code"] != d["llt_code"]]
+        elif d is not None and d["status"] == "confirmed" and cdr.row(d["llt_code"]) is not None:
+            cands = [cdr.candidate(cdr.by_code[d["llt_code"]], 1.0, "confirmed")] + \
+                    [c for c in cands if c["llt_code"] != d["llt_code"]][:limit - 1]
+        out.append({"verbatim": v, "kind": kind, "key": key,
+                    "status": d["status"] if d is not None else None,
+                    "confidence": cands[0]["confidence"] if cands else 0.0,
+                    "candidates": cands})
+    return out
+
+
+def record_decisions(items, user):
+    # confirm / reject from the review queue; -> saved rows
+    cdr       = get_coder()
+    decisions = {}
+    for item in items:
+        kind, status, verbatim = item.get("kind", "event"), item.get("status"), item.get("verbatim") or ""
+        code = str(item.get("lltCode") or "")
+        if kind not in KINDS:
+            raise AutocodeError(f"kind must be one of {list(KINDS)}.")
+        if status not in ("confirmed", "rejected"):
+            raise AutocodeError("status must be confirmed or rejected.")
+        key = item.get("key") or coding_key(verbatim)
+        row = cdr.row(code)
+        if not key or row is None:
+            raise AutocodeError(f"Unknown verbatim or LLT code: {verbatim!r} / {code!r}.")
+        decisions[(kind, key)] = {
+            "kind": kind, "verbatim_key": key, "verbatim": (verbatim or key)[:500],
+            "llt_code": row[0], "pt_code": row[2], "confidence": 1.0 if status == "confirmed" else 0.0,
+            "method": "manual", "status": status, "cases": item.get("cases") or 0,
+            "decided_by": user, "decided_at": datetime.utcnow(), "meddra_version": cdr.version}
+    existing = set(load_decisions(KINDS, [k for _, k in decisions]))
+    save_decisions(decisions, list(decisions), existing)
+    return list(decisions.values())
+
+
+# =========================================================
+# CASE FIELDS — where each kind's verbatim and codes live
+# (the fields the MedDRA pickers of the case form write)
+# =========================================================
+
+def uncoded(case):
+    # (kind, index, verbatim) for each verbatim with no PT code yet
+    for i, e in enumerate(case.events or []):
+        if e.get("term") and not e.get("pt_code"):
+            yield "event", i, e["term"]
+    pat = case.patient or {}
+    for i, h in enumerate(pat.get("otherHistory") or []):
+        if h.get("description") and not h.get("meddraPtCode"):
+            yield "history", i, h["description"]
+    for i, lab in enumerate(pat.get("labData") or []):
+        if lab.get("testName") and not lab.get("meddraPtCode"):
+            yield "lab", i, lab["testName"]
+    for i, p in enumerate(case.products or []):
+        if p.get("indication") and not p.get("indicationPtCode"):
+            yield "indication", i, p["indication"]
+
+
+_FIELDS = {"event":      ("term",        "pt_code"),
+           "history":    ("description", "meddraPtCode"),
+           "lab":        ("testName",    "meddraPtCode"),
+           "indication": ("indication",  "indicationPtCode")}
+CODE_KEYS = {"event":      ("llt_code",          "pt_code",          "meddra_version"),
+             "history":    ("meddraLltCode",     "meddraPtCode",     "meddraVersion"),
+             "lab":        ("meddraLltCode",     "meddraPtCode",     "meddraVersion"),
+             "indication": ("indicationLltCode", "indicationPtCode", "indicationVersion")}
+
+
+def code_fields(kind, row):
+    if kind == "event":
+        return {"llt": row[1], "llt_code": row[0], "pt": row[3], "pt_code": row[2],
+                "hlt": row[5], "hlgt": row[7], "soc": row[9], "meddra_version": row[12]}
+    if kind == "indication":
+        return {"indicationPt": row[3], "indicationPtCode": row[2], "indicationLlt": row[1],
+                "indicationLltCode": row[0], "indicationSoc": row[9], "indicationVersion": row[12]}
+    return {"meddraPt": row[3], "meddraPtCode": row[2], "meddraLlt": row[1], "meddraLltCode": row[0],
+            "meddraHlt": row[5], "meddraSoc": row[9], "meddraVersion": row[12]}
+
+
+def entry_lists(case):
+    # editable copies of a case's coded lists, by kind
+    patient = dict(case.patient or {})
+    return patient, {"event":      [dict(e) for e in case.events or []],
+                     "indication": [dict(p) for p in case.products or []],
+                     "history":    [dict(h) for h in patient.get("otherHistory") or []],
+                     "lab":        [dict(x) for x in patient.get("labData") or []]}
+
+
+def store_lists(case, patient, lists, kinds):
+    # reassign the sections that changed, so the JSON columns (and
+    # the summary / signal / text hooks) see the change
+    if "event" in kinds:
+        case.events = lists["event"]
+    if "indication" in kinds:
+        case.products = lists["indication"]
+    if kinds & {"history", "lab"}:
+        if "history" in kinds:
+            patient["otherHistory"] = lists["history"]
+        if "lab" in kinds:
+            patient["labData"] = lists["lab"]
+        case.patient = patient
+
+
+def _apply(cdr, todo, user, role):
+    # todo: case id -> [(kind, index, verbatim, decision)]
+    applied = 0
+    for case in db.session.query(Case).filter(Case.id.in_(list(todo))):
+        patient, lists = entry_lists(case)
+        kinds, notes   = set(), []
+        for kind, i, verbatim, d in todo[case.id]:
+            entries            = lists[kind]
+            text_key, code_key = _FIELDS[kind]
+            row                = cdr.row(d["llt_code"])
+            # the case may have been edited since the scan
+            if (row is None or i >= len(entries) or entries[i].get(text_key) != verbatim
+                    or entries[i].get(code_key)):
+                continue
+            entries[i].update(code_fields(kind, row))
+            kinds.add(kind)
+            notes.append(f"{kind} '{verbatim}' -> {row[1]} / PT {row[3]} ({row[2]}) "
+                         f"{d['method']} {d['confidence']:.2f}")
+        if not notes:
+            continue
+        store_lists(case, patient, lists, kinds)
+        log_event(case.id, "MEDDRA_AUTOCODED", user, role, section="coding", details="; ".join(notes))
+        applied += len(notes)
+    return applied
+
+
+def run_backlog(kinds=KINDS, apply=False, min_confidence=MIN_CONFIDENCE, ids=None, chunk=1000,
+                user="autocode", role="system", progress=None):
+    # one keyset pass over the cases: decide every uncoded verbatim
+    # (repeats hit the decision dict), write the codes that clear
+    # the bar chunk by chunk, then store the decisions with their
+    # occurrence counts for the review queue
+    cdr       = get_coder()
+    decisions = load_decisions(kinds)
+    existing  = set(decisions)
+    counts    = Counter()
+    stats     = Counter()
+    cols      = (Case.id, Case.patient, Case.products, Case.events)
+    last_id   = ""
+    while True:
+        q = db.session.query(*cols).filter(Case.id > last_id)
+        if ids is not None:
+            q = q.filter(Case.id.in_(ids))
+        rows = q.order_by(Case.id).limit(chunk).all()
+        if not rows:
+            break
+        todo = {}
+        for row in rows:
+            for kind, i, verbatim in uncoded(row):
+                key = coding_key(verbatim)
+                if kind not in kinds or not key:
+                    continue
+                d = decide(cdr, decisions, kind, key, verbatim)
+                counts[(kind, key)] += 1
+                stats["uncoded"]    += 1
+                if applies(d, min_confidence):
+                    stats["codable"] += 1
+                    if apply:
+                        todo.setdefault(row.id, []).append((kind, i, verbatim, d))
+        if todo:
+            stats["coded"] += _apply(cdr, todo, user, role)
+        db.session.commit()
+        db.session.expunge_all()
+        last_id         = rows[-1].id
+        stats["cases"] += len(rows)
+        if progress is not None:
+            progress(stats)
+
+    for key, n in counts.items():
+        if ids is None or key not in existing:
+            decisions[key]["cases"] = n
+    if ids is None:
+        # a full pass: verbatims no longer seen are no longer in the backlog
+        db.session.execute(_D.update().where(_D.c.kind.in_(kinds)).values(cases=0))
+    save_decisions(decisions, list(counts), existing)
+    db.session.commit()
+    stats["verbatims"] = len(counts)
+    stats["review"]    = sum(1 for k in counts if not applies(decisions[k], min_confidence))
+    return stats
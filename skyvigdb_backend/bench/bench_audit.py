@@ -0,0 +1,126 @@
+# =========================================================
+# BENCHMARK — audit trail queries over N synthetic entries
+# (5,000 cases, 40 users, 12 action types, two years).
+# Times the first 100-row page of a user + time range query,
+# an action query and a deep page for one case, with the
+# composite indexes and with only the old case_id index;
+# then the full CSV export and the per-row serialization
+# (ORM object + to_dict vs. tuple + entry_dict).
+#   python bench/bench_audit.py --entries 1000000
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_audit.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+
+import app                                                   # noqa: E402
+from app import AuditLog, db                                 # noqa: E402
+from audit import entry_dict, export_rows, query_page, stream_csv, _COLS   # noqa: E402
+from sqlalchemy import select, text                          # noqa: E402
+
+ACTIONS = ["CASE_CREATED", "CASE_UPDATED", "STEP_ADVANCED", "CASE_RETURNED", "E2B_EXPORTED",
+           "CASE_IMPORTED", "NARRATIVE_EDITED", "MEDDRA_CODED", "QC_APPROVED", "QC_RETURNED",
+           "CASE_ARCHIVED", "CASE_VIEWED"]
+
+
+def _fill(n):
+    rnd   = random.Random(7)
+    start = datetime(2023, 1, 1)
+    step  = timedelta(days=730) / max(n, 1)
+    t = AuditLog.__table__
+    db.session.execute(t.delete())
+    batch = []
+    for i in range(n):
+        batch.append({"case_id": f"CASE-{rnd.randrange(5000):05d}", "timestamp": start + step * i,
+                      "action_type": rnd.choice(ACTIONS), "performed_by": f"user{rnd.randrange(40):02d}",
+                      "role": rnd.choice(("Processor", "Medical Reviewer", "QC", "system")),
+                      "step_from": 1, "step_to": 2, "section": "triage", "details": "Saved"})
+        if len(batch) == 50000:
+            db.session.execute(t.insert(), batch)
+            batch.clear()
+    if batch:
+        db.session.execute(t.insert(), batch)
+    db.session.commit()
+
+
+def _indexes(on):
+    for ix in AuditLog.__table__.indexes:
+        db.session.execute(text(f"DROP INDEX IF EXISTS {ix.name}"))
+    db.session.execute(text("DROP INDEX IF EXISTS ix_audit_log_case_id"))
+    if on:
+        for ix in AuditLog.__table__.indexes:
+            ix.create(db.session.connection())
+    else:
+        db.session.execute(text("CREATE INDEX ix_audit_log_case_id ON audit_log (case_id)"))
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+
+
+def _best(fn, runs=5):
+    out = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return min(out)
+
+
+QUERIES = {
+    "user + 30 days":   {"user": "user07", "from": "2024-03-01", "to": "2024-03-30"},
+    "action, newest":   {"action": "QC_RETURNED"},
+    "case, page 3":     {"caseId": "CASE-00042", "order": "asc"},
+}
+
+
+def _page3(args):
+    body = query_page(args)
+    for _ in range(2):
+        body = query_page({**args, "cursor": body["nextCursor"]}) if body["nextCursor"] else body
+    return body
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--entries", type=int, default=1000000)
+    args = ap.parse_args()
+
+    with app.app.app_context():
+        t0 = time.perf_counter()
+        _fill(args.entries)
+        print(f"{args.entries:,} audit entries written in {time.perf_counter() - t0:.1f}s")
+
+        print(f"{'query (100 rows)':18} {'case_id index ms':>17} {'composite ms':>13}")
+        timings = {}
+        for on in (False, True):
+            _indexes(on)
+            for label, q in QUERIES.items():
+                q = {**q, "limit": "100"}
+                fn = (lambda q=q: _page3(q)) if label.startswith("case") else (lambda q=q: query_page(q))
+                timings.setdefault(label, []).append(_best(fn) * 1000)
+        for label, (old, new) in timings.items():
+            print(f"{label:18} {old:>17.1f} {new:>13.1f}")
+
+        t0 = time.perf_counter()
+        size = sum(len(chunk) for chunk in stream_csv(export_rows({"order": "asc"})))
+        elapsed = time.perf_counter() - t0
+        print(f"CSV export: {size / 1e6:.1f} MB in {elapsed:.1f}s ({args.entries / elapsed:,.0f} rows/s)")
+
+        n = min(args.entries, 100000)
+        orm = _best(lambda: [e.to_dict() for e in AuditLog.query.limit(n).all()], 3)
+        db.session.expunge_all()
+        raw = _best(lambda: [entry_dict(r) for r in db.session.execute(select(*_COLS).limit(n))], 3)
+        print(f"serialize {n:,} rows: ORM to_dict {orm:.2f}s, tuple entry_dict {raw:.2f}s "
+              f"({orm / raw:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
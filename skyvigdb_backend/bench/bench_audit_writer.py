@@ -0,0 +1,127 @@
+# =========================================================
+# BENCHMARK — case save throughput with the synchronous and
+# the asynchronous audit writer. Each mode runs in its own
+# interpreter (AUDIT_WRITER is read at import). T threads
+# PUT section updates through the Flask test client; every
+# save writes the case and one audit entry per changed
+# section (the section-level diff of the case PUT), then
+# commits. Reports saves/s, p50/p95 latency, SQL statements
+# per save on the request thread, and checks that every
+# audit entry reached the table after the final flush.
+#   python bench/bench_audit_writer.py --threads 8 --saves 4000
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_DB  = os.path.join(tempfile.gettempdir(), "skyvig_bench_audit_writer.db")
+
+MODES = [
+    ("sync",          {"AUDIT_WRITER": "sync"}),
+    ("async memory",  {"AUDIT_WRITER": "async", "AUDIT_DURABILITY": "memory"}),
+    ("async spool",   {"AUDIT_WRITER": "async", "AUDIT_DURABILITY": "spool"}),
+    ("async fsync",   {"AUDIT_WRITER": "async", "AUDIT_DURABILITY": "fsync"}),
+]
+SECTIONS = ("triage", "general", "patient")
+
+
+def child(threads, saves, cases):
+    sys.path.insert(0, ROOT)
+    import app
+    from app import AuditLog, Case, db, log_event
+    from sqlalchemy import event
+    from sqlalchemy.orm.attributes import flag_modified
+
+    # the write path of the case PUT: load, apply the changed sections,
+    # one audit entry per section, commit
+    @app.app.route("/bench/cases/<case_id>", methods=["PUT"])
+    def bench_put(case_id):
+        data = app.request.get_json()
+        case = db.session.get(Case, case_id)
+        for section, value in data.items():
+            setattr(case, section, value)
+            flag_modified(case, section)
+            log_event(case_id, "CASE_UPDATED", "bench", "Processor", section=section, details="Saved")
+        db.session.commit()
+        return app.jsonify({"ok": True})
+
+    with app.app.app_context():
+        db.session.query(AuditLog).delete()
+        db.session.query(Case).delete()
+        db.session.add_all(Case(id=f"BW-{i:05d}", current_step=1, status="open",
+                                triage={}, general={}, patient={}) for i in range(cases))
+        db.session.commit()
+        engine = db.engine
+
+    # statements run by request threads (network round trips on a real server)
+    stmts = {"n": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, params, context, executemany):
+        if threading.current_thread().name != "audit-writer":
+            stmts["n"] += 1
+
+    lat, per = [], saves // threads
+
+    def work(t):
+        client, mine = app.app.test_client(), []
+        for i in range(per):
+            body = {s: {"note": f"{t}-{i}"} for s in SECTIONS}
+            t0 = time.perf_counter()
+            r = client.put(f"/bench/cases/BW-{(t * per + i) % cases:05d}", json=body)
+            mine.append(time.perf_counter() - t0)
+            assert r.status_code == 200, r.data
+        lat.extend(mine)
+
+    stmts["n"] = 0
+    t0 = time.perf_counter()
+    pool = [threading.Thread(target=work, args=(t,)) for t in range(threads)]
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    elapsed = time.perf_counter() - t0
+    per_save = stmts["n"] / max(len(lat), 1)
+
+    import audit_writer
+    if audit_writer.writer is not None:
+        audit_writer.writer.flush()
+    with app.app.app_context():
+        written = db.session.query(AuditLog).count()
+    lat.sort()
+    print(json.dumps({"saves": len(lat), "seconds": elapsed, "p50": lat[len(lat) // 2],
+                      "p95": lat[int(len(lat) * 0.95)], "stmts": per_save, "expected": len(lat) * len(SECTIONS),
+                      "written": written}))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=8)
+    ap.add_argument("--saves",   type=int, default=4000)
+    ap.add_argument("--cases",   type=int, default=2000)
+    ap.add_argument("--child",   action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        return child(args.threads, args.saves, args.cases)
+
+    print(f"{'mode':14} {'saves/s':>8} {'p50 ms':>7} {'p95 ms':>7} {'stmts/save':>11} {'audit rows':>12}")
+    for label, env in MODES:
+        env = {**os.environ, "DATABASE_URL": os.environ.get("DATABASE_URL", f"sqlite:///{_DB}"), **env}
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--threads", str(args.threads),
+                              "--saves", str(args.saves), "--cases", str(args.cases)],
+                             cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"{label:14} {r['saves'] / r['seconds']:>8.0f} {r['p50'] * 1000:>7.2f} {r['p95'] * 1000:>7.2f} "
+              f"{r['stmts']:>11.1f} {r['written']:>6}/{r['expected']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# =========================================================
+# BENCHMARK — MedDRA auto-coding of the uncoded backlog.
+# Cases get reporter-style verbatims (case, plural,
+# severity words, swapped words, spelling, typos) of known
+# dictionary terms with their codes removed, then:
+#   suggest     per-verbatim latency cold / memoized, against
+#               taking the first MedDRA search hit
+#   accuracy    share of verbatims whose top candidate is
+#               the right PT, per tier, and of those that
+#               clear --min-confidence
+#   backlog     the dry-run pass (decisions computed and
+#               stored), a second pass on the stored
+#               decisions, and the applying pass
+#   python bench/bench_autocode.py --cases 20000 --terms 80000
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_autocode.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+
+import app                                                   # noqa: E402
+import autocode                                              # noqa: E402
+from app import AuditLog, Case, CaseSummary, CaseText, CodingDecision, MeddraTerm, SignalCount, db   # noqa: E402
+from synth import make_full_cases, meddra_terms, reporter_verbatim   # noqa: E402
+
+_MEDDRA_COLS = ("llt_code", "llt_name", "pt_code", "pt_name", "hlt_code", "hlt_name", "hlgt_code",
+                "hlgt_name", "soc_code", "soc_name", "soc_abbrev", "current_llt", "meddra_version")
+_CASE_COLS   = ("id", "status", "current_step", "triage", "general", "patient", "products", "events",
+                "medical", "narrative")
+_CODED       = ("llt", "llt_code", "pt", "pt_code", "hlt", "hlgt", "soc", "meddra_version")
+
+
+def _uncode(cases, terms, rng):
+    # -> {(kind, verbatim): right pt_code}; events and history keep a
+    # dictionary term under a reporter's wording, indications the PT
+    current = [r for r in terms if r[11] == "Y"]
+    truth   = {}
+    for c in cases:
+        for e in c.events:
+            if rng.random() < 0.6:
+                row = rng.choice(current)
+                for k in _CODED:
+                    e.pop(k, None)
+                e["term"] = reporter_verbatim(rng, row[1])
+                truth[("event", e["term"])] = row[2]
+        for h in c.patient.get("otherHistory") or []:
+            row = rng.choice(current)
+            h["description"], h["meddraPt"], h["meddraPtCode"] = reporter_verbatim(rng, row[1]), "", ""
+            truth[("history", h["description"])] = row[2]
+        for p in c.products:
+            if p.get("indication"):
+                row = rng.choice(current)
+                p["indication"] = reporter_verbatim(rng, row[3])
+                truth[("indication", p["indication"])] = row[2]
+    return truth
+
+
+def _fill(cases, terms):
+    for model in (AuditLog, SignalCount, CaseSummary, CaseText, CodingDecision, Case, MeddraTerm):
+        db.session.query(model).delete()
+    db.session.commit()
+    db.session.execute(MeddraTerm.__table__.insert(), [dict(zip(_MEDDRA_COLS, r)) for r in terms])
+    db.session.commit()
+    for i in range(0, len(cases), 1000):
+        db.session.add_all(Case(**{k: getattr(c, k, None) for k in _CASE_COLS}) for c in cases[i:i + 1000])
+        db.session.commit()
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases",          type=int,   default=20000)
+    ap.add_argument("--terms",          type=int,   default=80000)
+    ap.add_argument("--min-confidence", type=float, default=autocode.MIN_CONFIDENCE)
+    args = ap.parse_args()
+
+    rng   = random.Random(4)
+    terms = meddra_terms(args.terms)
+    cases = make_full_cases(args.cases, terms)
+    truth = _uncode(cases, terms, rng)
+    with app.app.app_context():
+        t0 = time.perf_counter()
+        _fill(cases, terms)
+        print(f"loaded {len(terms)} LLTs and {len(cases)} cases in {time.perf_counter() - t0:.1f}s")
+
+        t0  = time.perf_counter()
+        cdr = autocode.get_coder()
+        print(f"coder built in {time.perf_counter() - t0:.2f}s")
+
+        sample = rng.sample(sorted(truth), min(5000, len(truth)))
+        cold, warm, base = [], [], []
+        right, total, cleared, cleared_right = Counter(), Counter(), 0, 0
+        base_right = 0
+        for kind, v in sample:
+            t0  = time.perf_counter()
+            top = cdr.suggest(v, 1)
+            cold.append((time.perf_counter() - t0) * 1e6)
+            t0  = time.perf_counter()
+            cdr.suggest(v, 1)
+            warm.append((time.perf_counter() - t0) * 1e6)
+            t0  = time.perf_counter()
+            hit = cdr.index.search(v, 1)
+            base.append((time.perf_counter() - t0) * 1e6)
+            base_right += bool(hit) and hit[0][2] == truth[(kind, v)]
+            method = top[0][2] if top else "none"
+            ok     = bool(top) and cdr.index.rows[top[0][0]][2] == truth[(kind, v)]
+            total[method] += 1
+            right[method] += ok
+            if top and top[0][1] >= args.min_confidence:
+                cleared       += 1
+                cleared_right += ok
+        print(f"\nsuggest (us)   p50 {_pct(cold, .5):>7.0f}  p95 {_pct(cold, .95):>7.0f}  "
+              f"memoized p50 {_pct(warm, .5):.1f}  first search hit p50 {_pct(base, .5):.0f}")
+        print(f"{'tier':11} {'share':>6} {'right PT':>9}")
+        for method, n in total.most_common():
+            print(f"{method:11} {n / len(sample):>6.1%} {right[method] / n:>9.1%}")
+        print(f"all tiers {sum(right.values()) / len(sample):.1%} right (first search hit: "
+              f"{base_right / len(sample):.1%}); {cleared / len(sample):.1%} clear "
+              f">= {args.min_confidence}, {cleared_right / max(cleared, 1):.2%} of them right")
+
+        print()
+        for label, apply in (("dry run", False), ("stored decisions", False), ("apply", True)):
+            autocode.coder._memo.clear()
+            t0    = time.perf_counter()
+            stats = autocode.run_backlog(apply=apply, min_confidence=args.min_confidence)
+            s     = time.perf_counter() - t0
+            print(f"{label:17} {s:6.2f}s  {stats['cases'] / s:>7.0f} cases/s  {stats['uncoded']} uncoded, "
+                  f"{stats['verbatims']} distinct, {stats['codable']} codable, {stats['coded']} coded, "
+                  f"{stats['review']} to review")
+        left = autocode.run_backlog(min_confidence=args.min_confidence)
+        print(f"after apply: {left['uncoded']} uncoded entries left, "
+              f"{db.session.query(AuditLog).filter_by(action_type='MEDDRA_AUTOCODED').count()} audit entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# =========================================================
+# BENCHMARK — read-heavy endpoints with the response cache
+# off, cold (per-case entries only) and warm. Requests go
+# through the test client:
+#   list   GET /api/cases?limit=50 over the first pages, full
+#          case dicts (the worklist); "warm" repeats them
+#   case   the same pages after one case per page changed
+#          (page entry stale, the other case dicts still hit)
+#   meddra GET /api/meddra/search with a Zipf-ish mix of
+#          popular typed prefixes
+# and If-None-Match revalidation (304) for the list.
+#   python bench/bench_cache.py --cases 5000 --terms 40000
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_cache.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+
+import app                                                   # noqa: E402
+from app import AuditLog, Case, CaseSummary, MeddraTerm, SignalCount, db   # noqa: E402
+from cache import LRUCache, NullCache, response_cache        # noqa: E402
+from synth import make_rich_cases, meddra_terms              # noqa: E402
+
+_MEDDRA_COLS = ("llt_code", "llt_name", "pt_code", "pt_name", "hlt_code", "hlt_name", "hlgt_code",
+                "hlgt_name", "soc_code", "soc_name", "soc_abbrev", "current_llt", "meddra_version")
+
+
+def _fill(n_cases, n_terms):
+    for model in (AuditLog, SignalCount, CaseSummary, Case, MeddraTerm):
+        db.session.query(model).delete()
+    db.session.commit()
+    db.session.execute(MeddraTerm.__table__.insert(),
+                       [dict(zip(_MEDDRA_COLS, r)) for r in meddra_terms(n_terms)])
+    fields = ("id", "current_step", "triage", "general", "patient", "products", "events", "medical", "narrative")
+    cases  = make_rich_cases(n_cases)
+    for i in range(0, n_cases, 1000):
+        db.session.add_all(Case(**{k: getattr(c, k, None) for k in fields}) for c in cases[i:i + 1000])
+        db.session.commit()
+    return [r[1].lower() for r in meddra_terms(n_terms)]
+
+
+def _touch(client, urls):
+    # edit the first case of every page
+    with app.app.app_context():
+        for u in urls:
+            c = db.session.get(Case, client.get(u).get_json()["items"][0]["id"])
+            c.narrative = (c.narrative or "") + " (edited)"
+            db.session.commit()
+
+
+def _timed(client, urls, headers=None):
+    t0 = time.perf_counter()
+    for u in urls:
+        r = client.get(u, headers=headers or {})
+        assert r.status_code in (200, 304), (u, r.status_code)
+    return (time.perf_counter() - t0) / len(urls) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases", type=int, default=5000)
+    ap.add_argument("--terms", type=int, default=40000)
+    ap.add_argument("--pages", type=int, default=10)
+    ap.add_argument("--searches", type=int, default=2000)
+    args = ap.parse_args()
+
+    client = app.app.test_client()
+    with app.app.app_context():
+        names = _fill(args.cases, args.terms)
+
+    # the first pages of the worklist, walked with nextCursor
+    urls, url = [], "/api/cases?limit=50&sort=id"
+    for _ in range(args.pages):
+        urls.append(url)
+        cursor = client.get(url).get_json()["nextCursor"]
+        url = f"/api/cases?limit=50&sort=id&cursor={cursor}"
+    rng = random.Random(5)
+    popular = [n[:rng.randint(3, 6)] for n in rng.sample(names, 200)]
+    searches = [f"/api/meddra/search?q={popular[min(int(rng.paretovariate(1.2)) - 1, 199)]}&limit=20"
+                for _ in range(args.searches)]
+
+    print(f"{args.cases} cases, {args.terms} LLTs; ms per request")
+    print(f"{'':8} {'off':>7} {'cold':>7} {'warm':>7} {'304':>7}")
+
+    response_cache.backend = NullCache()
+    off = _timed(client, urls * 3)
+    response_cache.backend = LRUCache()
+    cold = _timed(client, urls)
+    warm = _timed(client, urls * 3)
+    etags = [client.get(u).headers["ETag"] for u in urls]
+    t0 = time.perf_counter()
+    for u, e in zip(urls * 3, etags * 3):
+        assert client.get(u, headers={"If-None-Match": e}).status_code == 304
+    reval = (time.perf_counter() - t0) / (len(urls) * 3) * 1000
+    print(f"{'list':8} {off:>7.2f} {cold:>7.2f} {warm:>7.2f} {reval:>7.2f}")
+
+    # one case per page changes: its page entry is stale, its neighbours still hit
+    response_cache.backend = NullCache()
+    _touch(client, urls)
+    off_c = _timed(client, urls)
+    response_cache.backend = LRUCache()
+    _timed(client, urls)                                  # every case dict cached
+    _touch(client, urls)
+    part = _timed(client, urls)
+    print(f"{'case':8} {off_c:>7.2f} {'':>7} {part:>7.2f} {'':>7}   (1 of 50 cases per page changed)")
+
+    response_cache.backend = NullCache()
+    m_off = _timed(client, searches)
+    response_cache.clear()
+    response_cache.backend = LRUCache()
+    m_all = _timed(client, searches)
+    m_warm = _timed(client, searches)
+    print(f"{'meddra':8} {m_off:>7.2f} {m_all:>7.2f} {m_warm:>7.2f} {'':>7}   (cold = first pass, repeats hit)")
+    print(response_cache.stats()["namespaces"])
+
+
+if __name__ == "__main__":
+    main()
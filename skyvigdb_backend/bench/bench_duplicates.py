@@ -0,0 +1,68 @@
+# =========================================================
+# BENCHMARK — indexed vs brute-force duplicate check
+# ---------------------------------------------------------
+#   python bench/bench_duplicates.py --sizes 1000 10000 100000 500000
+# Reports median / p95 query latency per corpus size for the
+# blocked index, and counts how many sampled queries return
+# the same top-N as the brute-force scan.
+# =========================================================
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import DuplicateIndex, brute_force_search, incoming_fields    # noqa: E402
+from synth import make_cases, incoming_from              # noqa: E402
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes",   type=int, nargs="+", default=[1000, 10000, 100000, 500000])
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--verify",  type=int, default=5, help="queries checked against brute force")
+    ap.add_argument("--limit",   type=int, default=10)
+    ap.add_argument("--threshold", type=float, default=80.0)
+    args = ap.parse_args()
+
+    print(f"{'cases':>8} {'build s':>8} {'cand':>6} {'p50 ms':>8} {'p95 ms':>8} {'brute ms':>9} parity")
+    for n in args.sizes:
+        cases = make_cases(n)
+        t0 = time.perf_counter()
+        index = DuplicateIndex()
+        for c in cases:
+            index.upsert_case(c)
+        build = time.perf_counter() - t0
+
+        rng     = random.Random(n)
+        queries = [incoming_from(rng.choice(cases), rng) for _ in range(args.queries)]
+        lat, cand = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            index.search(q, threshold=args.threshold, limit=args.limit)
+            lat.append((time.perf_counter() - t0) * 1000)
+            cand.append(len(index.candidates(incoming_fields(q))))
+
+        same, brute = 0, []
+        for q in queries[:args.verify]:
+            t0 = time.perf_counter()
+            expected = brute_force_search(q, cases, threshold=args.threshold, limit=args.limit)
+            brute.append((time.perf_counter() - t0) * 1000)
+            same += expected == index.search(q, threshold=args.threshold, limit=args.limit)
+
+        print(f"{n:>8} {build:>8.2f} {statistics.mean(cand):>6.1f} {_pct(lat, .5):>8.3f} "
+              f"{_pct(lat, .95):>8.3f} {statistics.median(brute) if brute else 0:>9.1f} "
+              f"{same}/{min(args.verify, len(queries))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# =========================================================
+# BENCHMARK — E2B(R3) batch export throughput: one ICH ICSR
+# batch message for N synthetic cases (3 products, 3 events,
+# 4 lab results each), rendered serially, in a process pool
+# and from a warm per-case XML cache; plain and gzip output
+#   python bench/bench_e2b_batch.py --cases 5000 --workers 4
+# Imports the app for build_e2b_xml; DATABASE_URL defaults to
+# a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'skyvig_bench.db')}")
+
+import app                          # noqa: E402,F401  (registers the glue modules first)
+from e2b_batch import XmlCache, write_batch   # noqa: E402
+from synth import make_rich_cases              # noqa: E402
+
+
+class _Count:
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def _run(label, cases, compress=False, workers=1, cache=None):
+    sink = _Count()
+    t0 = time.perf_counter()
+    n = write_batch(sink, iter(cases), "BATCH-BENCH", compress, workers=workers, cache=cache)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:18} {n} cases  {elapsed:6.2f}s  {n / elapsed:8,.0f} cases/s  {sink.bytes / 1e6:6.1f} MB out")
+    return n / elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases",   type=int, default=5000)
+    ap.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    args = ap.parse_args()
+
+    cases = make_rich_cases(args.cases)
+    stamp = datetime(2024, 1, 1)
+    for c in cases:
+        c.updated_at = stamp
+    print(f"{args.cases} cases, {args.workers} worker(s), {os.cpu_count()} CPU(s)")
+
+    rss0   = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    serial = _run("serial", cases)
+    _run("serial gzip", cases, compress=True)
+    if args.workers > 1:
+        _run(f"pool x{args.workers}", cases, workers=args.workers)
+    cache = XmlCache(1 << 30)
+    _run("cache cold", cases, workers=args.workers, cache=cache)
+    cached = _run("cache warm", cases, workers=args.workers, cache=cache)
+    _run("cache warm gzip", cases, compress=True, workers=args.workers, cache=cache)
+    print(f"warm cache {cached / serial:.1f}x serial, {len(cache)} entries / {cache.size / 1e6:.1f} MB, "
+          f"peak RSS growth {(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0) / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
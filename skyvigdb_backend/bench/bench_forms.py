@@ -0,0 +1,83 @@
+# =========================================================
+# BENCHMARK — CIOMS I / MedWatch 3500A PDF rendering. Per
+# form, the time to render one case with the pre-compiled
+# template against compiling the layout for every case (what
+# drawing the whole form per case costs), then a ZIP of both
+# forms for N cases serial and in a forked pool. Every PDF
+# is checked: each xref offset must land on its object.
+#   python bench/bench_forms.py --cases 2000 --workers 4
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_forms.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+
+import app                                                   # noqa: E402,F401
+import forms                                                 # noqa: E402
+from synth import make_narrative_cases                       # noqa: E402
+
+_STARTXREF = re.compile(rb"startxref\n(\d+)\n%%EOF\n$")
+
+
+def _check(pdf):
+    xref = int(_STARTXREF.search(pdf).group(1))
+    rows = pdf[xref:].split(b"\n")
+    assert rows[0] == b"xref", "startxref does not point at the xref table"
+    for num, row in enumerate(rows[3:3 + int(rows[1].split()[1]) - 1], 1):
+        offset = int(row[:10])
+        assert pdf.startswith(b"%d 0 obj" % num, offset), f"object {num} not at {offset}"
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases",   type=int, default=2000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    cases = make_narrative_cases(args.cases)
+    build = {"cioms": forms._cioms, "medwatch": forms._medwatch}
+    print(f"{'':9} {'p50 ms':>7} {'p95 ms':>7} {'uncompiled p50':>15} {'KB':>5} {'pages':>6}")
+    for name, form in forms.FORMS.items():
+        lat, raw, size, pages = [], [], 0, 0
+        for i, case in enumerate(cases):
+            t0  = time.perf_counter()
+            pdf = form.render(case)
+            lat.append((time.perf_counter() - t0) * 1000)
+            _check(pdf)
+            size  += len(pdf)
+            pages += pdf.count(b"/Type /Page ")
+            if i < 200:
+                t0 = time.perf_counter()
+                build[name]().render(case)
+                raw.append((time.perf_counter() - t0) * 1000)
+        print(f"{name:9} {_pct(lat, .5):>7.2f} {_pct(lat, .95):>7.2f} {_pct(raw, .5):>15.2f} "
+              f"{size / len(cases) / 1024:>5.1f} {pages / len(cases):>6.2f}")
+
+    for workers in sorted({1, args.workers}):
+        t0  = time.perf_counter()
+        zip_ = b"".join(forms.stream_zip(cases, list(forms.FORMS), workers=workers))
+        s   = time.perf_counter() - t0
+        zf  = zipfile.ZipFile(io.BytesIO(zip_))
+        for info in zf.infolist()[:50]:
+            _check(zf.read(info))
+        print(f"ZIP {workers:>2} worker(s): {len(zf.infolist())} PDFs in {s:.2f}s "
+              f"({len(zf.infolist()) / s:.0f} forms/s, {len(zip_) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# =========================================================
+# BENCHMARK — bulk case ingestion: an E2B(R3) batch of N
+# synthetic cases (build_e2b_xml bodies plus E.i reaction
+# observations carrying the country of incidence) and the
+# equivalent line listing CSV, each imported into a fresh
+# database; cases/min and peak RSS growth per format
+#   python bench/bench_ingest.py --cases 10000
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_ingest.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+
+import app                                                   # noqa: E402
+from app import E, OID, XSI_TYPE, AuditLog, Case, SignalCount, CaseSummary, db   # noqa: E402
+from e2b_batch import render_porr                            # noqa: E402
+from ingest import ingest, open_upload                       # noqa: E402
+from line_listing import case_rows, stream_csv               # noqa: E402
+from lxml import etree                                       # noqa: E402
+from synth import make_rich_cases                            # noqa: E402
+
+_HEAD = (b'<?xml version="1.0" encoding="UTF-8"?>\n'
+         b'<MCCI_IN200100UV01 xmlns="urn:hl7-org:v3" '
+         b'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ITSVersion="XML_1.0">')
+_TAIL = b"</MCCI_IN200100UV01>"
+
+
+def _reactions(porr, case):
+    role = porr.find(".//{urn:hl7-org:v3}primaryRole")
+    for ev in case.events:
+        obs = E("observation", {"classCode": "OBS", "moodCode": "EVN"},
+                parent=E("subjectOf2", {"typeCode": "SBJ"}, parent=role))
+        E("code", {"code": "29", "codeSystem": OID["cs_data_elem"]}, parent=obs)
+        eff = E("effectiveTime", {XSI_TYPE: "IVL_TS"}, parent=obs)
+        E("low", {"value": (ev.get("onsetDate") or "2024-01-01").replace("-", "")}, parent=eff)
+        val = E("value", {XSI_TYPE: "CE", "code": ev.get("pt_code") or "", "codeSystem": OID["meddra"]}, parent=obs)
+        E("originalText", parent=val, text=ev.get("term"))
+        place = E("locatedPlace", {"classCode": "COUNTRY", "determinerCode": "INSTANCE"},
+                  parent=E("locatedEntity", {"classCode": "LOCE"}, parent=E("location", {"typeCode": "LOC"},
+                                                                              parent=obs)))
+        E("code", {"code": "GB", "codeSystem": OID["iso_country"]}, parent=place)
+
+
+def write_e2b(path, cases):
+    with open(path, "wb") as f:
+        f.write(_HEAD)
+        for c in cases:
+            porr = etree.fromstring(render_porr(c)[1])
+            if porr.find(".//{urn:hl7-org:v3}observation/{urn:hl7-org:v3}code[@code='29']") is None:
+                _reactions(porr, c)
+            f.write(etree.tostring(porr))
+        f.write(_TAIL)
+
+
+def write_csv(path, cases):
+    with open(path, "wb") as f:
+        for chunk in stream_csv(r for c in cases for r in case_rows(c, "rows")):
+            f.write(chunk)
+
+
+def _prepare(n, e2b, csv_path):
+    cases = make_rich_cases(n)
+    for c in cases:
+        c.triage = {**(c.triage or {}), "country": "United Kingdom"}
+    write_e2b(e2b, cases)
+    write_csv(csv_path, cases)
+
+
+def _reset():
+    for model in (AuditLog, SignalCount, CaseSummary, Case):
+        db.session.query(model).delete()
+    db.session.commit()
+
+
+def _run(label, path, chunk):
+    _reset()
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.perf_counter()
+    with open(path, "rb") as f:
+        fmt, records = open_upload(f)
+        report = ingest(records, "bench", "system", os.path.basename(path), chunk)
+    elapsed = time.perf_counter() - t0
+    rss = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss0) / 1024
+    print(f"{label:5} {os.path.getsize(path) / 1e6:7.1f} MB  {report['created']:>6} created "
+          f"{report['failed']:>4} failed  {elapsed:6.1f}s  {report['created'] / elapsed * 60:>9,.0f} cases/min  "
+          f"peak RSS +{rss:.0f} MB")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases", type=int, default=10000)
+    ap.add_argument("--chunk", type=int, default=500)
+    args = ap.parse_args()
+
+    tmp = tempfile.gettempdir()
+    e2b, csv_path = os.path.join(tmp, "skyvig_ingest.xml"), os.path.join(tmp, "skyvig_ingest.csv")
+    # files are written in a child so its memory does not mask the importer's peak RSS
+    child = multiprocessing.get_context("fork").Process(target=_prepare, args=(args.cases, e2b, csv_path))
+    child.start()
+    child.join()
+    with app.app.app_context():
+        _run("e2b", e2b, args.chunk)
+        _run("csv", csv_path, args.chunk)
+
+
+if __name__ == "__main__":
+    main()
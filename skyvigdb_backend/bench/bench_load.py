@@ -0,0 +1,307 @@
+# =========================================================
+# LOAD TEST — end-to-end API throughput and latency. Loads N
+# full synthetic cases (synth.make_full_cases), a synthetic
+# MedDRA dictionary and an audit trail into DATABASE_URL
+# (a throwaway SQLite file by default, or a local
+# PostgreSQL), serves the app on a local threaded server —
+# or drives --url, e.g. gunicorn on the same database — and
+# runs a weighted request mix at each --concurrency level:
+#   case_list        GET  /api/cases (summary page, step filter)
+#   duplicate_check  POST /api/cases/duplicate-check
+#   meddra_search    GET  /api/meddra/search
+#   e2b_export       GET  /api/cases/<id>/e2b
+#   audit            GET  /api/audit?caseId=
+# Per level and endpoint: requests, errors, throughput and
+# p50/p90/p95/p99/max latency, written to --out as JSON;
+# --compare an earlier file prints the change.
+#
+# The local server shares the driver's process (and GIL), so
+# its numbers are for comparing runs; for capacity, point
+# --url at a multi-worker server and pass --no-load once the
+# data is in.
+#   python bench/bench_load.py --cases 20000 --concurrency 1,8,32 --duration 20 --out load.json
+# =========================================================
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import quote, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_load.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+
+import app                                                   # noqa: E402
+from app import AuditLog, Case, CaseSummary, CaseText, MeddraTerm, SignalCount, db   # noqa: E402
+from synth import STAGES, incoming_from, make_full_cases, meddra_queries, meddra_terms   # noqa: E402
+
+_MEDDRA_COLS = ("llt_code", "llt_name", "pt_code", "pt_name", "hlt_code", "hlt_name", "hlgt_code",
+                "hlgt_name", "soc_code", "soc_name", "soc_abbrev", "current_llt", "meddra_version")
+_CASE_COLS   = ("id", "status", "current_step", "triage", "general", "patient", "products", "events",
+                "medical", "narrative")
+_ROLES       = ("Triage", "Data Entry", "Medical", "Quality", "Submissions", "Archival")
+
+
+# ---------------------------------------------------------
+# Data
+# ---------------------------------------------------------
+
+def _fill(cases, terms, audit_per_case):
+    for model in (AuditLog, SignalCount, CaseSummary, CaseText, Case, MeddraTerm):
+        db.session.query(model).delete()
+    db.session.commit()
+    db.session.execute(MeddraTerm.__table__.insert(), [dict(zip(_MEDDRA_COLS, r)) for r in terms])
+    db.session.commit()
+    for i in range(0, len(cases), 1000):
+        # ORM inserts, so the summary / text / signal hooks run as in production
+        db.session.add_all(Case(**{k: getattr(c, k, None) for k in _CASE_COLS}) for c in cases[i:i + 1000])
+        db.session.commit()
+    rng, t0 = random.Random(9), datetime(2024, 1, 1)
+    for i in range(0, len(cases), 2000):
+        rows = []
+        for c in cases[i:i + 2000]:
+            for k in range(min(audit_per_case, c.current_step + 1)):
+                step = min(k + 1, c.current_step)
+                rows.append(dict(case_id=c.id, timestamp=t0 + timedelta(minutes=rng.randint(0, 500000)),
+                                 action_type="CASE_CREATED" if k == 0 else rng.choice(["CASE_UPDATED",
+                                                                                       "STEP_CHANGED"]),
+                                 performed_by=f"user{rng.randint(1, 40)}", role=_ROLES[step - 1],
+                                 step_from=step - 1 if k else None, step_to=step if k else None,
+                                 section=rng.choice(["triage", "products", "events", "patient"]),
+                                 details="synthetic"))
+        db.session.execute(AuditLog.__table__.insert(), rows)
+        db.session.commit()
+
+
+# ---------------------------------------------------------
+# Request mix — name: (default weight, rng, data -> request)
+# ---------------------------------------------------------
+
+SCENARIOS = {
+    "case_list":       (30, lambda rng, d: ("GET", f"/api/cases?limit=50&fields=summary&step={rng.randint(1, 6)}",
+                                            None)),
+    "duplicate_check": (15, lambda rng, d: ("POST", "/api/cases/duplicate-check",
+                                            incoming_from(rng.choice(d["cases"]), rng))),
+    "meddra_search":   (30, lambda rng, d: ("GET", f"/api/meddra/search?q={quote(rng.choice(d['queries']))}"
+                                                   f"&current=true&limit=20", None)),
+    "e2b_export":      (10, lambda rng, d: ("GET", f"/api/cases/{rng.choice(d['e2b'])}/e2b", None)),
+    "audit":           (15, lambda rng, d: ("GET", f"/api/audit?caseId={rng.choice(d['cases']).id}&limit=50",
+                                            None)),
+}
+
+
+def _mix(spec):
+    # "case_list=30,meddra_search=50" -> [(name, weight)]
+    if not spec:
+        return [(name, w) for name, (w, _) in SCENARIOS.items()]
+    out = []
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        out.append((name, float(weight or 1)))
+    return out
+
+
+class _Client:
+    # one keep-alive connection per driver thread, reopened when
+    # the server closes it
+    def __init__(self, base):
+        u = urlsplit(base)
+        self.host, self.port, self.prefix = u.hostname, u.port or 80, u.path.rstrip("/")
+        self.conn = None
+
+    def request(self, method, path, body):
+        data    = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if data else {}
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            try:
+                self.conn.request(method, self.prefix + path, data, headers)
+                resp = self.conn.getresponse()
+                resp.read()
+                if resp.will_close:
+                    self.conn.close()
+                    self.conn = None
+                return resp.status
+            except (http.client.HTTPException, OSError):
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+
+def _serve():
+    from werkzeug.serving import make_server
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+# ---------------------------------------------------------
+# Driver
+# ---------------------------------------------------------
+
+def _pct(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+
+def _stats(samples, elapsed):
+    lat = sorted(ms for ms, _ in samples)
+    r   = lambda v: round(v, 2) if v is not None else None                  # noqa: E731
+    return {
+        "requests":       len(samples),
+        "errors":         sum(1 for _, status in samples if not 200 <= status < 400),
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "mean_ms":        r(sum(lat) / len(lat)) if lat else None,
+        "p50_ms":         r(_pct(lat, .50)),
+        "p90_ms":         r(_pct(lat, .90)),
+        "p95_ms":         r(_pct(lat, .95)),
+        "p99_ms":         r(_pct(lat, .99)),
+        "max_ms":         r(lat[-1]) if lat else None,
+    }
+
+
+def run_level(base, concurrency, duration, mix, data, seed=1):
+    names, weights = zip(*mix)
+    stop = time.perf_counter() + duration
+
+    def worker(k):
+        rng, client, out = random.Random(seed * 1000 + k), _Client(base), []
+        while time.perf_counter() < stop:
+            name = rng.choices(names, weights)[0]
+            method, path, body = SCENARIOS[name][1](rng, data)
+            t0 = time.perf_counter()
+            try:
+                status = client.request(method, path, body)
+            except (http.client.HTTPException, OSError):
+                status = 0
+            out.append((name, (time.perf_counter() - t0) * 1000, status))
+        return out
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as ex:
+        samples = [s for part in ex.map(worker, range(concurrency)) for s in part]
+    elapsed = time.perf_counter() - t0
+    by_name = {name: [(ms, st) for n, ms, st in samples if n == name] for name in names}
+    return {"concurrency": concurrency, "duration_s": round(elapsed, 2),
+            "total": _stats([(ms, st) for _, ms, st in samples], elapsed),
+            "endpoints": {name: _stats(s, elapsed) for name, s in by_name.items()}}
+
+
+def _print(level):
+    print(f"\nconcurrency {level['concurrency']} ({level['duration_s']}s)")
+    print(f"{'':16} {'req':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, s in list(level["endpoints"].items()) + [("total", level["total"])]:
+        if s["requests"]:
+            print(f"{name:16} {s['requests']:>7} {s['errors']:>5} {s['throughput_rps']:>8.1f} "
+                  f"{s['p50_ms']:>8.1f} {s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['max_ms']:>8.1f}")
+
+
+def _compare(old, new):
+    # p95 and throughput change per endpoint, for levels run in both
+    before = {lv["concurrency"]: lv for lv in old["levels"]}
+    print(f"\nvs {old['meta'].get('commit') or '?'} ({old['meta'].get('started')})")
+    print(f"{'':16} {'conc':>5} {'p95 ms':>17} {'rps':>17}")
+    for lv in new["levels"]:
+        prev = before.get(lv["concurrency"])
+        if prev is None:
+            continue
+        for name, s in list(lv["endpoints"].items()) + [("total", lv["total"])]:
+            p = prev["total"] if name == "total" else prev["endpoints"].get(name)
+            if not p or not p["requests"] or not s["requests"]:
+                continue
+            dp = (s["p95_ms"] - p["p95_ms"]) / p["p95_ms"] * 100 if p["p95_ms"] else 0.0
+            dr = (s["throughput_rps"] - p["throughput_rps"]) / p["throughput_rps"] * 100
+            print(f"{name:16} {lv['concurrency']:>5} {p['p95_ms']:>7.1f} -> {s['p95_ms']:>7.1f} "
+                  f"{p['throughput_rps']:>7.1f} -> {s['throughput_rps']:>7.1f}  ({dp:+.0f}% / {dr:+.0f}%)")
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases",       type=int, default=20000)
+    ap.add_argument("--terms",       type=int, default=80000, help="synthetic MedDRA LLTs")
+    ap.add_argument("--audit",       type=int, default=5, help="audit rows per case (at most step + 1)")
+    ap.add_argument("--concurrency", default="1,8,32", help="comma-separated levels")
+    ap.add_argument("--duration",    type=float, default=20, help="seconds per level")
+    ap.add_argument("--mix",         help="name=weight,... (default: every scenario, default weights)")
+    ap.add_argument("--url",         help="drive a running server instead, e.g. http://127.0.0.1:5000")
+    ap.add_argument("--no-load",     action="store_true", help="the database already holds this data")
+    ap.add_argument("--seed",        type=int, default=1)
+    ap.add_argument("--out",         help="write the results here as JSON")
+    ap.add_argument("--compare",     help="an earlier --out file to compare against")
+    args = ap.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    mix    = _mix(args.mix)
+    terms  = meddra_terms(args.terms)
+    cases  = make_full_cases(args.cases, terms, seed=args.seed)
+    load_s = None
+    if not args.no_load:
+        t0 = time.perf_counter()
+        with app.app.app_context():
+            _fill(cases, terms, args.audit)
+        load_s = round(time.perf_counter() - t0, 1)
+        print(f"loaded {len(cases)} cases, {len(terms)} MedDRA terms in {load_s}s")
+    data = {"cases": cases, "e2b": [c.id for c in cases if c.current_step >= 3] or [cases[0].id],
+            "queries": meddra_queries(terms, 5000, random.Random(args.seed))}
+
+    server, base = (None, args.url) if args.url else _serve()
+    started = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    try:
+        warm = _Client(base)
+        rng  = random.Random(0)
+        for name, _ in mix:                                           # first-hit index / cache builds
+            for _ in range(3):
+                warm.request(*SCENARIOS[name][1](rng, data))
+        results = []
+        for c in levels:
+            results.append(run_level(base, c, args.duration, mix, data, args.seed))
+            _print(results[-1])
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    with app.app.app_context():
+        dialect = db.engine.dialect.name
+    report = {
+        "meta": {"started": started, "commit": _commit(), "python": platform.python_version(),
+                 "cpus": os.cpu_count(), "database": dialect, "server": args.url or "werkzeug (in-process)",
+                 "cases": len(cases), "steps": {s: sum(c.current_step == i + 1 for c in cases)
+                                                for i, s in enumerate(STAGES)},
+                 "meddra_terms": len(terms), "audit_per_case": args.audit, "load_s": load_s,
+                 "duration_s": args.duration, "mix": dict(mix), "seed": args.seed},
+        "levels": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nwrote {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            _compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
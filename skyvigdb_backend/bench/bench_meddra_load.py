@@ -0,0 +1,60 @@
+# =========================================================
+# BENCHMARK — MedDRA release load: stream-parse a synthetic
+# 80k LLT ASCII release and bulk-load it into a side table,
+# then switch it live
+#   python bench/bench_meddra_load.py --terms 80000 [--url postgresql://...]
+# =========================================================
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, MetaData, String, Table, create_engine   # noqa: E402
+
+from meddra_loader import activate, hierarchy, load_release, release_rows   # noqa: E402
+from synth import meddra_terms, write_meddra_release                    # noqa: E402
+
+
+def _template():
+    # same columns as app.MeddraTerm, without importing the app
+    cols = [Column("llt_code", String(8), primary_key=True), Column("llt_name", String(500), nullable=False)]
+    for name in ("pt", "hlt", "hlgt", "soc"):
+        cols += [Column(f"{name}_code", String(8)), Column(f"{name}_name", String(500))]
+    cols += [Column("soc_abbrev", String(10)), Column("current_llt", String(1)),
+             Column("meddra_version", String(10))]
+    return Table("meddra_terms", MetaData(), *cols)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--terms", type=int, default=80000)
+    ap.add_argument("--url",   help="Database URL (default: a temporary SQLite file).")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        release = os.path.join(tmp, "MedAscii")
+        write_meddra_release(release, meddra_terms(args.terms, version="28.1"), version="28.1")
+        engine = create_engine(args.url or f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+
+        t0 = time.perf_counter()
+        hier = hierarchy(release)
+        t1 = time.perf_counter()
+        n = sum(1 for _ in release_rows(release, "28.1"))
+        t2 = time.perf_counter()
+        print(f"hierarchy {len(hier)} PTs in {t1 - t0:.2f}s, {n} LLT rows parsed in {t2 - t1:.2f}s")
+
+        t0 = time.perf_counter()
+        with engine.begin() as conn:
+            table, n = load_release(conn, _template(), release_rows(release, "28.1"), "28.1")
+            activate(conn, "28.1")
+        print(f"loaded {n} rows into {table} and activated in {time.perf_counter() - t0:.2f}s, "
+              f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# =========================================================
+# BENCHMARK — MedDRA search latency over a synthetic 80k LLT
+# dictionary, with the keystroke-style queries searchMeddra
+# sends (2+ char prefixes, multi-word, misspellings)
+#   python bench/bench_meddra_search.py --terms 80000
+# =========================================================
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from meddra_search import MeddraIndex    # noqa: E402
+from synth import meddra_queries, meddra_terms   # noqa: E402
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--terms",   type=int, default=80000)
+    ap.add_argument("--queries", type=int, default=5000)
+    ap.add_argument("--limit",   type=int, default=20)
+    args = ap.parse_args()
+
+    rows = meddra_terms(args.terms)
+    t0 = time.perf_counter()
+    index = MeddraIndex().load(rows)
+    print(f"loaded {len(index)} terms in {time.perf_counter() - t0:.2f}s")
+
+    rng = random.Random(5)
+    queries = meddra_queries(rows, args.queries, rng)
+    lat, empty = [], 0
+    for q in queries:
+        t0 = time.perf_counter()
+        res = index.search(q, limit=args.limit)
+        lat.append((time.perf_counter() - t0) * 1000)
+        empty += not res
+    print(f"queries={len(queries)} p50={_pct(lat, .5):.3f}ms p95={_pct(lat, .95):.3f}ms "
+          f"p99={_pct(lat, .99):.3f}ms max={max(lat):.3f}ms empty={empty}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# =========================================================
+# BENCHMARK — MedDRA version upgrade over a large case
+# table: 28.1 live, a synthetic 29.0 side-loaded with ~2%
+# of LLTs changed, N cases coded against 28.1 (events,
+# history, indications). Times the code-array diff, the
+# impact scan with and without the raw-text prefilter
+# (every case decoded), and the bulk recode of every
+# update / recode proposal, then checks a second impact
+# pass finds only the manual ones left.
+#   python bench/bench_meddra_upgrade.py --cases 500000
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_meddra_upgrade.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+
+import app                                                   # noqa: E402
+import meddra_upgrade                                        # noqa: E402
+from app import AuditLog, Case, CaseSummary, CaseText, MeddraTerm, SignalCount, db   # noqa: E402
+from meddra_loader import load_release                       # noqa: E402
+from synth import make_full_cases, meddra_next_version, meddra_terms   # noqa: E402
+
+_MEDDRA_COLS = ("llt_code", "llt_name", "pt_code", "pt_name", "hlt_code", "hlt_name", "hlgt_code",
+                "hlgt_name", "soc_code", "soc_name", "soc_abbrev", "current_llt", "meddra_version")
+_CASE_COLS   = ("status", "current_step", "triage", "general", "patient", "products", "events",
+                "medical", "narrative")
+
+
+def _fill(n, templates, old, new):
+    # Core inserts of cloned templates: the scan only reads pv_case
+    for model in (AuditLog, SignalCount, CaseSummary, CaseText, Case, MeddraTerm):
+        db.session.query(model).delete()
+    db.session.commit()
+    db.session.execute(MeddraTerm.__table__.insert(), [dict(zip(_MEDDRA_COLS, r)) for r in old])
+    load_release(db.session.connection(), MeddraTerm.__table__, new, new[0][12])
+    db.session.commit()
+    rows = [{k: getattr(c, k, None) for k in _CASE_COLS} for c in templates]
+    for i in range(0, n, 5000):
+        db.session.execute(Case.__table__.insert(),
+                           [dict(rows[j % len(rows)], id=f"PV-{j:07d}") for j in range(i, min(n, i + 5000))])
+        db.session.commit()
+
+
+def _impact(old_v, new_v, prefilter=True):
+    affects = meddra_upgrade.VersionDiff.affects
+    if not prefilter:
+        meddra_upgrade.VersionDiff.affects = lambda self, codes: True
+    try:
+        t0     = time.perf_counter()
+        report = meddra_upgrade.impact(old_v, new_v)
+        return report, time.perf_counter() - t0
+    finally:
+        meddra_upgrade.VersionDiff.affects = affects
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases",     type=int, default=500000)
+    ap.add_argument("--templates", type=int, default=20000)
+    ap.add_argument("--terms",     type=int, default=80000)
+    ap.add_argument("--no-load",   action="store_true", help="Reuse the cases of the previous run.")
+    args = ap.parse_args()
+
+    old = meddra_terms(args.terms)
+    new = meddra_next_version(old)
+    with app.app.app_context():
+        if not args.no_load:
+            t0 = time.perf_counter()
+            _fill(args.cases, make_full_cases(min(args.templates, args.cases), old), old, new)
+            print(f"loaded {args.cases} cases, MedDRA 28.1 ({len(old)}) and 29.0 ({len(new)}) "
+                  f"in {time.perf_counter() - t0:.0f}s")
+
+        t0   = time.perf_counter()
+        diff = meddra_upgrade.version_diff("28.1", "29.0")
+        print(f"diff {time.perf_counter() - t0:.2f}s "
+              f"({'numpy' if meddra_upgrade.NUMPY_AVAILABLE else 'sets'}): {diff.summary()}")
+
+        report, s = _impact("28.1", "29.0")
+        print(f"impact, prefiltered   {s:6.1f}s  {report['scanned'] / s:>7.0f} cases/s  "
+              f"{report['impactedCases']} cases, {report['entries']} entries, {len(report['groups'])} groups")
+        full, s = _impact("28.1", "29.0", prefilter=False)
+        assert full["entries"] == report["entries"], "the prefilter dropped affected entries"
+        print(f"impact, decode all    {s:6.1f}s  {full['scanned'] / s:>7.0f} cases/s")
+        by_action = {}
+        for g in report["groups"]:
+            by_action[g["action"]] = by_action.get(g["action"], 0) + g["entries"]
+        print(f"entries by action: {by_action}")
+
+        t0    = time.perf_counter()
+        stats = meddra_upgrade.recode("28.1", "29.0", actions=("update", "recode"))
+        s     = time.perf_counter() - t0
+        print(f"recode                {s:6.1f}s  {stats['entries']} entries in {stats['cases']} cases, "
+              f"{db.session.query(AuditLog).filter_by(action_type='MEDDRA_RECODED').count()} audit entries")
+        left, s = _impact("28.1", "29.0")
+        print(f"impact after recode   {s:6.1f}s  {left['entries']} entries left "
+              f"(manual: {by_action.get('manual', 0)})")
+
+
+if __name__ == "__main__":
+    main()
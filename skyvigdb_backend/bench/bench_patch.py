@@ -0,0 +1,112 @@
+# =========================================================
+# BENCHMARK — one field edit on a large case: the whole-form
+# PUT write path (every section assigned and flagged, as the
+# frontend sends the entire form) against PATCH with a JSON
+# Patch / merge patch touching a single product field.
+# Both go through the test client; reports the request body,
+# bytes bound into the case UPDATE and time per save.
+#   python bench/bench_patch.py --products 20 --events 20 --labs 50
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_patch.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+
+import app                                                   # noqa: E402
+from app import AuditLog, Case, db, log_event                # noqa: E402
+from patch import SECTIONS, case_etag                        # noqa: E402
+from sqlalchemy import event                                 # noqa: E402
+from sqlalchemy.orm.attributes import flag_modified          # noqa: E402
+from synth import make_rich_cases                            # noqa: E402
+
+_bytes = {"n": 0}
+
+
+def _count(conn, cursor, statement, params, context, executemany):
+    if statement.lstrip().upper().startswith("UPDATE PV_CASE"):
+        _bytes["n"] += sum(len(p) for p in (params.values() if isinstance(params, dict) else params)
+                           if isinstance(p, (str, bytes)))
+
+
+# the write path of the case PUT: every section of the submitted form
+# assigned and flagged, one audit entry, commit
+@app.app.route("/bench/cases/<case_id>", methods=["PUT"])
+def _put(case_id):
+    form = app.request.get_json()
+    case = db.session.get(Case, case_id)
+    for s in SECTIONS:
+        setattr(case, s, form[s])
+        if s != "narrative":
+            flag_modified(case, s)
+    log_event(case_id, "CASE_UPDATED", "bench", "Processor", details="Saved")
+    db.session.commit()
+    return app.jsonify(case.to_dict())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--products", type=int, default=20)
+    ap.add_argument("--events",   type=int, default=20)
+    ap.add_argument("--labs",     type=int, default=50)
+    ap.add_argument("--saves",    type=int, default=300)
+    args = ap.parse_args()
+
+    c = make_rich_cases(1, products=args.products, events=args.events, labs=args.labs)[0]
+    c.id = "PATCH-BENCH"
+    client = app.app.test_client()
+    with app.app.app_context():
+        db.session.query(AuditLog).delete()
+        db.session.query(Case).filter_by(id=c.id).delete()
+        db.session.add(Case(**{k: getattr(c, k, None) for k in ("id", "current_step", *SECTIONS)}))
+        db.session.commit()
+        size = len(json.dumps(db.session.get(Case, c.id).to_dict()))
+        event.listen(db.engine, "before_cursor_execute", _count)
+
+        def run(label, fn):
+            _bytes["n"] = sent = 0
+            t0 = time.perf_counter()
+            for i in range(args.saves):
+                sent += fn(i)
+            elapsed = time.perf_counter() - t0
+            print(f"{label:22} {sent / args.saves / 1024:>10.2f} {_bytes['n'] / args.saves / 1024:>9.1f} "
+                  f"{elapsed / args.saves * 1000:>8.2f}")
+
+        def put(i):
+            db.session.expire_all()
+            form = db.session.get(Case, c.id).to_dict()
+            form["products"][0]["dose"] = str(i)
+            body = json.dumps(form)
+            assert client.put(f"/bench/cases/{c.id}", data=body, content_type="application/json").status_code == 200
+            return len(body)
+
+        def patch(i, merge):
+            etag = case_etag(db.session.get(Case, c.id))
+            db.session.expire_all()
+            if merge:
+                products = db.session.get(Case, c.id).products
+                products[0] = {**products[0], "dose": str(i)}
+                body, ctype = json.dumps({"products": products}), "application/merge-patch+json"
+            else:
+                body = json.dumps([{"op": "replace", "path": "/products/0/dose", "value": str(i)}])
+                ctype = "application/json-patch+json"
+            r = client.patch(f"/api/cases/{c.id}", data=body, headers={"If-Match": etag, "Content-Type": ctype})
+            assert r.status_code == 200, r.json
+            return len(body)
+
+        print(f"case JSON {size / 1024:.1f} KB; {args.saves} saves changing products[0].dose")
+        print(f"{'':22} {'request KB':>10} {'UPDATE KB':>9} {'ms/save':>8}")
+        run("PUT (whole form)", put)
+        run("PATCH json-patch", lambda i: patch(i, False))
+        run("PATCH merge-patch", lambda i: patch(i, True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# =========================================================
+# BENCHMARK — duplicate scoring, one query against N cases:
+#   legacy  the pairwise fuzzywuzzy _fuzzy_score as it was
+#           (fields re-read from the case JSON, strings
+#           lower-cased and token-sorted on every call)
+#   fields  the same scorer on already-extracted fields
+#   batch   dedup.score_many over prepared candidates, one
+#           cdist per field (per-pair calls below BATCH_MIN)
+# and checks that every batch score equals the legacy one,
+# including on punctuation / non-ASCII / empty fields.
+#   python bench/bench_scoring.py --sizes 10 100 1000 10000
+# =========================================================
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzywuzzy import fuzz                                          # noqa: E402
+from dedup import WEIGHTS, case_fields, incoming_fields, prepare, score_many   # noqa: E402
+from synth import make_cases, incoming_from                          # noqa: E402
+
+
+def _legacy_fields(a, b):
+    # score_fields before the batch scorer, verbatim
+    drug_score = fuzz.token_sort_ratio(a["drug"], b["drug"]) if (a["drug"] and b["drug"]) else 0
+
+    event_score = max(
+        fuzz.token_sort_ratio(a["event"], b["event"]) if (a["event"] and b["event"]) else 0,
+        fuzz.ratio(a["pt"], b["pt"])                  if (a["pt"]    and b["pt"]   ) else 0,
+    )
+
+    init_score    = fuzz.ratio(a["initials"], b["initials"]) if (a["initials"] and b["initials"]) else 0
+    country_score = 100 if (a["country"] and a["country"] == b["country"]) else 0
+
+    if drug_score == 0 or event_score == 0:
+        return 0.0
+
+    return (
+        drug_score    * WEIGHTS["drug"] +
+        event_score   * WEIGHTS["event"] +
+        init_score    * WEIGHTS["initials"] +
+        country_score * WEIGHTS["country"]
+    )
+
+
+def _legacy(incoming, case):
+    return _legacy_fields(incoming_fields(incoming), case_fields(case))
+
+
+def _odd_fields(rng):
+    # strings that exercise full_process: punctuation, Latin-1, other scripts, blanks
+    pool = ["", " ", "+++", "Ibuprofène 400mg", "IBUPROFEN", "ibuprofen / codeine", "Naïve–rash",
+            "rash, naïve", "héPatite", "hepatite", "Ωmega-3", "omega 3", "ß-blocker", "b blocker",
+            "café au lait", "  spaced   out  ", "PT term", "pt term", "a", "ab"]
+    pick = lambda: rng.choice(pool)
+    return {"drug": pick().lower(), "event": pick().lower(), "pt": pick().lower(),
+            "initials": pick().upper(), "country": rng.choice(["", "India", "France"]),
+            "pt_code": "", "onset": None}
+
+
+def _per_cand(fn, n, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat / n * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    ap.add_argument("--queries", type=int, default=20)
+    args = ap.parse_args()
+
+    cases = make_cases(max(args.sizes), seed=3, n_drugs=40, n_events=60)
+    rng   = random.Random(9)
+    queries = [incoming_from(rng.choice(cases), rng) for _ in range(args.queries)]
+
+    print(f"{'cands':>7} {'legacy us':>10} {'fields us':>10} {'batch us':>9} {'speedup':>8} {'fields x':>9}  (per candidate)")
+    for n in args.sizes:
+        pool   = cases[:n]
+        fields = [case_fields(c) for c in pool]
+        preps  = [prepare(f) for f in fields]              # what DuplicateIndex keeps per case
+        rep    = max(1, 2000 // n)
+
+        legacy = sum(_per_cand(lambda: [_legacy(q, c) for c in pool], n, rep) for q in queries) / len(queries)
+        pair   = sum(_per_cand(lambda: [_legacy_fields(incoming_fields(q), f) for f in fields], n, rep)
+                     for q in queries) / len(queries)
+        batch  = sum(_per_cand(lambda: score_many(prepare(incoming_fields(q)), preps), n, rep * 5)
+                     for q in queries) / len(queries)
+        print(f"{n:>7} {legacy:>10.2f} {pair:>10.2f} {batch:>9.3f} {legacy / batch:>7.1f}x {pair / batch:>8.1f}x")
+
+    # parity: every synthetic query against 2000 cases, and awkward
+    # strings, each scored on its own (per-pair path) and in a batch (cdist)
+    groups  = [(incoming_fields(q), [case_fields(c) for c in cases[:2000]]) for q in queries]
+    groups += [(_odd_fields(rng), [_odd_fields(rng) for _ in range(100)]) for _ in range(200)]
+    same = total = 0
+    for a, bs in groups:
+        want    = [_legacy_fields(a, b) for b in bs]
+        batched = score_many(prepare(a), [prepare(b) for b in bs])
+        single  = [score_many(prepare(a), [prepare(b)])[0] for b in bs]
+        same  += sum(float(x) == w for x, w in zip(batched, want)) + sum(x == w for x, w in zip(single, want))
+        total += 2 * len(bs)
+    print(f"parity: {same}/{total} scores identical (single and batched)")
+
+
+if __name__ == "__main__":
+    main()
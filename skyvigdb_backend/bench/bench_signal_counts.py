@@ -0,0 +1,94 @@
+# =========================================================
+# BENCHMARK — incremental pv_signal_count maintenance: case
+# insert / update throughput with and without the signal
+# hooks, loading the signal tables from the aggregates vs.
+# counting the case JSON, and top-N index lookups
+#   python bench/bench_signal_counts.py --cases 20000
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_signals.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+
+import app                          # noqa: E402
+import hooks                        # noqa: E402
+from sqlalchemy import event        # noqa: E402
+from app import db, Case, SignalCount   # noqa: E402
+from synth import make_signal_cases     # noqa: E402
+
+_LISTENERS = (("after_insert", hooks._signal_insert), ("before_update", hooks._signal_update),
+              ("before_delete", hooks._signal_delete))
+
+
+def _reset():
+    db.session.query(SignalCount).delete()
+    db.session.query(Case).delete()
+    db.session.commit()
+
+
+def _write(cases, rng, batch=500):
+    t0 = time.perf_counter()
+    for i, c in enumerate(cases):
+        db.session.add(Case(id=c.id, products=c.products, events=c.events, triage={}))
+        if i % batch == batch - 1:
+            db.session.commit()
+    db.session.commit()
+    t1 = time.perf_counter()
+    sample = rng.sample(cases, len(cases) // 10)
+    for i, c in enumerate(sample):
+        obj = db.session.get(Case, c.id)
+        obj.events = rng.choice(cases).events
+        if i % batch == batch - 1:
+            db.session.commit()
+    db.session.commit()
+    t2 = time.perf_counter()
+    return len(cases) / (t1 - t0), len(sample) / (t2 - t1)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases",   type=int, default=20000)
+    ap.add_argument("--lookups", type=int, default=500)
+    args = ap.parse_args()
+
+    cases, _ = make_signal_cases(args.cases)
+    with app.app.app_context():
+        for name, fn in _LISTENERS:
+            event.remove(Case, name, fn)
+        _reset()
+        ins0, upd0 = _write(cases, random.Random(1))
+        for name, fn in _LISTENERS:
+            event.listen(Case, name, fn)
+        _reset()
+        ins1, upd1 = _write(cases, random.Random(1))
+        print(f"{args.cases} cases    insert/s  update/s")
+        print(f"  no hooks   {ins0:8.0f}  {upd0:8.0f}")
+        print(f"  hooks      {ins1:8.0f}  {upd1:8.0f}   ({1e3 / ins1 - 1e3 / ins0:.2f} ms extra per insert)")
+
+        n = db.session.query(Case).count()
+        t0 = time.perf_counter()
+        hooks.build_signal_tables(n)
+        t1 = time.perf_counter()
+        hooks.build_signal_tables(-1)           # signature mismatch -> JSON recount
+        t2 = time.perf_counter()
+        print(f"signal tables: from aggregates {t1 - t0:.2f}s, from case JSON {t2 - t1:.2f}s")
+
+        rng   = random.Random(2)
+        drugs = [p["name"] for c in rng.sample(cases, args.lookups) for p in c.products[:1]]
+        t0 = time.perf_counter()
+        for d in drugs:
+            hooks.top_signal_counts("pt", drug=d, limit=20)
+        t1 = time.perf_counter()
+        print(f"top-20 PTs per drug: {(t1 - t0) / len(drugs) * 1e3:.2f} ms/lookup")
+
+
+if __name__ == "__main__":
+    main()
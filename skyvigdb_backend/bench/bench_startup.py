@@ -0,0 +1,82 @@
+# =========================================================
+# BENCHMARK — worker boot time vs. audit_log size. For each
+# size a SQLite database is filled with audit rows (the last
+# 0.1% with corrupt timestamps) and migrated; then `import
+# app` is timed in fresh interpreters as gunicorn boots a
+# worker (MIGRATE_ON_BOOT=0), and with the default
+# schema_version check (MIGRATE_ON_BOOT=auto). The legacy
+# per-row ORM repair scan is timed for comparison with the
+# set-based UPDATE.
+#   python bench/bench_startup.py --sizes 0,100000,1000000
+# =========================================================
+
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _fill(path, n):
+    if os.path.exists(path):
+        os.remove(path)
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}", "MIGRATE_ON_BOOT": "1"}
+    subprocess.run([sys.executable, "-c", "import app"], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    con = sqlite3.connect(path)
+    con.execute("DELETE FROM schema_version WHERE version = 2")   # repair runs again below
+    rows = ((f"CASE-{i % 5000:05d}", "corrupt" if i >= n - n // 1000 else "2024-01-01 10:00:00.000000",
+             "CASE_UPDATED", "bench", "Processor", "triage", "Saved") for i in range(n))
+    con.executemany("INSERT INTO audit_log (case_id, timestamp, action_type, performed_by, role, "
+                    "section, details) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    con.commit()
+    con.close()
+
+
+def _run(path, code, boot):
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{path}", "MIGRATE_ON_BOOT": boot}
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+_BOOT = "import time; t = time.perf_counter(); import app; print(time.perf_counter() - t)"
+
+_MIGRATE = ("import time, app; from migrations import migrate\n"
+            "with app.app.app_context():\n"
+            "    t = time.perf_counter()\n"
+            "    migrate(app.db.engine)\n"
+            "    print(time.perf_counter() - t)")
+
+_LEGACY = ("import time, app; from datetime import datetime; from app import AuditLog\n"
+           "with app.app.app_context():\n"
+           "    t = time.perf_counter()\n"
+           "    try:\n"
+           "        bad = sum(1 for e in AuditLog.query.all() if not isinstance(e.timestamp, datetime))\n"
+           "    except ValueError:\n"
+           "        pass   # the ORM cannot read a corrupt SQLite timestamp; they come last\n"
+           "    print(time.perf_counter() - t)")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="0,100000,1000000")
+    ap.add_argument("--runs",  type=int, default=5)
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), "skyvig_bench_startup.db")
+    print(f"{'audit rows':>10} {'boot s':>8} {'boot+check s':>13} {'repair UPDATE s':>16} {'legacy scan s':>14}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        _fill(path, n)
+        repair = _run(path, _MIGRATE, "0")
+        legacy = _run(path, _LEGACY, "0")
+        boot   = min(_run(path, _BOOT, "0") for _ in range(args.runs))
+        check  = min(_run(path, _BOOT, "auto") for _ in range(args.runs))
+        print(f"{n:>10} {boot:>8.3f} {check:>13.3f} {repair:>16.3f} {legacy:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# =========================================================
+# BENCHMARK — cost of the telemetry hooks per request. The
+# same request mix runs through the test client with:
+#   off       request hooks and SQL listeners detached
+#   on        latency / SQL accounting, Server-Timing
+#   files     as on, plus a METRICS_DIR snapshot after every
+#             request (METRICS_FLUSH=0; the default is 5 s)
+#   profiled  every request under cProfile (X-Profile)
+# and times one /metrics scrape.
+#   python bench/bench_telemetry.py --cases 2000 --requests 300
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_telemetry.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+os.environ.setdefault("PROFILE_TOKEN", "bench")
+os.environ.setdefault("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "skyvig_bench_profiles"))
+
+import app                                                   # noqa: E402
+import metrics                                               # noqa: E402
+import telemetry                                             # noqa: E402
+from app import AuditLog, Case, CaseSummary, CaseText, SignalCount, db   # noqa: E402
+from sqlalchemy import event                                 # noqa: E402
+from sqlalchemy.engine import Engine                         # noqa: E402
+from synth import make_rich_cases                            # noqa: E402
+
+_HOOKS = ((app.app.before_request_funcs, telemetry._request_start),
+          (app.app.after_request_funcs,  telemetry._request_end),
+          (app.app.teardown_request_funcs, telemetry._request_teardown))
+_SQL   = (("before_cursor_execute", telemetry._sql_start), ("after_cursor_execute", telemetry._sql_end))
+
+
+def _fill(n):
+    for model in (AuditLog, SignalCount, CaseSummary, CaseText, Case):
+        db.session.query(model).delete()
+    db.session.commit()
+    fields = ("id", "current_step", "triage", "general", "patient", "products", "events", "medical", "narrative")
+    cases  = make_rich_cases(n)
+    for i in range(0, n, 1000):
+        db.session.add_all(Case(**{k: getattr(c, k, None) for k in fields}) for c in cases[i:i + 1000])
+        db.session.commit()
+    return cases
+
+
+def _attach(on):
+    for funcs, fn in _HOOKS:
+        hooks = funcs.setdefault(None, [])
+        if on and fn not in hooks:
+            hooks.append(fn)
+        elif not on and fn in hooks:
+            hooks.remove(fn)
+    for name, fn in _SQL:
+        if on and not event.contains(Engine, name, fn):
+            event.listen(Engine, name, fn)
+        elif not on and event.contains(Engine, name, fn):
+            event.remove(Engine, name, fn)
+
+
+def _run(client, calls, headers=None):
+    t0 = time.perf_counter()
+    for method, url, body in calls:
+        r = client.open(url, method=method, json=body, headers=headers)
+        assert r.status_code == 200, (url, r.status_code)
+    return (time.perf_counter() - t0) / len(calls) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases",    type=int, default=2000)
+    ap.add_argument("--requests", type=int, default=300)
+    ap.add_argument("--repeat",   type=int, default=3)
+    args = ap.parse_args()
+
+    client = app.app.test_client()
+    with app.app.app_context():
+        cases = _fill(args.cases)
+    mix = [("GET", "/api/cases?limit=20&fields=summary", None),
+           ("GET", "/api/meddra/search?q=hepat", None),
+           ("POST", "/api/cases/duplicate-check",
+            {"drug": cases[0].products[0]["name"], "event": cases[0].events[0]["term"]})]
+    calls = [mix[i % len(mix)] for i in range(args.requests)]
+    _run(client, calls)                                      # warm the indexes and caches
+
+    files = tempfile.mkdtemp(prefix="skyvig_bench_metrics")
+    modes = {
+        "off":      (False, "", None),
+        "on":       (True,  "", None),
+        "files":    (True,  files, None),
+        "profiled": (True,  "", {"X-Profile": os.environ["PROFILE_TOKEN"]}),
+    }
+    best = {}
+    for _ in range(args.repeat):
+        for name, (on, mdir, headers) in modes.items():
+            _attach(on)
+            metrics.METRICS_DIR, metrics.METRICS_FLUSH = mdir, 0.0
+            us = _run(client, calls, headers)
+            best[name] = min(best.get(name, us), us)
+    _attach(True)
+    metrics.METRICS_DIR = files
+
+    print(f"{'':10} {'us/request':>11} {'overhead':>9}")
+    for name, us in best.items():
+        print(f"{name:10} {us:>11.0f} {us - best['off']:>+8.0f}us")
+    t0 = time.perf_counter()
+    body = client.get("/metrics").data
+    print(f"/metrics scrape: {(time.perf_counter() - t0) * 1000:.1f} ms, {len(body.splitlines())} lines")
+    shutil.rmtree(files, ignore_errors=True)
+    shutil.rmtree(os.environ["PROFILE_DIR"], ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# =========================================================
+# BENCHMARK — full-text case search over N narratives. Loads
+# the cases, times `flask text-index` (pv_case_text + FTS5
+# on SQLite) and the in-process index build, then a query
+# mix per engine, each a 20-result page with snippets (the
+# totals are the separate count=true query, not timed):
+#   rare      one uncommon word (a drug name)
+#   common    two words found in most narratives
+#   prefix    hepat*
+#   phrase    "emergency department"
+#   excluded  a common word minus another
+#   filtered  a common word restricted to one step / status
+#   python bench/bench_text_search.py --cases 200000
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_text.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+
+import app                                                   # noqa: E402
+import textsearch                                            # noqa: E402
+from app import AuditLog, Case, CaseSummary, CaseText, SignalCount, db   # noqa: E402
+from commands import text_index                              # noqa: E402
+from hooks import refresh_text_index                         # noqa: E402
+from synth import make_narrative_cases                       # noqa: E402
+
+_STATUSES = ("Triage", "Data Entry", "Medical Review", "Quality Check", "Submitted", "Closed")
+
+
+def _fill(n):
+    for model in (AuditLog, SignalCount, CaseSummary, CaseText, Case):
+        db.session.query(model).delete()
+    db.session.commit()
+    cases = make_narrative_cases(n)
+    rng   = random.Random(4)
+    cols  = ("id", "triage", "general", "patient", "products", "events", "medical", "narrative")
+    for i in range(0, n, 5000):
+        # Core insert: the ORM hooks are what `text-index` replaces for existing data
+        db.session.execute(Case.__table__.insert(), [
+            {**{k: getattr(c, k, None) for k in cols}, "current_step": s, "status": _STATUSES[s - 1]}
+            for c in cases[i:i + 5000] for s in [rng.randint(1, 6)]])
+        db.session.commit()
+    return cases
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases",   type=int, default=200000)
+    ap.add_argument("--repeat",  type=int, default=20)
+    args = ap.parse_args()
+
+    client = app.app.test_client()
+    with app.app.app_context():
+        cases = _fill(args.cases)
+    rng   = random.Random(8)
+    drugs = [c.products[0]["name"].lower() for c in rng.sample(cases, args.repeat)]
+    mix = {
+        "rare":     [f"q={d}" for d in drugs],
+        "common":   ["q=patient reported"],
+        "prefix":   ["q=hepat*"],
+        "phrase":   ['q="emergency department"'],
+        "excluded": ["q=patient -hospitalised"],
+        "filtered": ["q=discontinued&step=3", "q=recovered&status=Medical Review", "q=patient&step=2,4"],
+    }
+
+    t0 = time.perf_counter()
+    result = app.app.test_cli_runner().invoke(text_index, ["--chunk", "5000"])
+    assert result.exit_code == 0, result.output
+    print(f"{args.cases} cases; text-index backfill {time.perf_counter() - t0:.1f}s")
+
+    print(f"{'':10} {'engine':>7} {'p50 ms':>8} {'p95 ms':>8} {'hits':>8}")
+    for name in ("fts5", "memory"):
+        textsearch._engine["name"] = name
+        if name == "memory":
+            t0 = time.perf_counter()
+            with app.app.app_context():
+                refresh_text_index()
+            print(f"{'':10} in-process index built in {time.perf_counter() - t0:.1f}s")
+        for kind, queries in mix.items():
+            lat, hits = [], 0
+            for i in range(args.repeat):
+                url = f"/api/cases/search?{queries[i % len(queries)]}&limit=20"
+                t0 = time.perf_counter()
+                r = client.get(url)
+                lat.append((time.perf_counter() - t0) * 1000)
+                assert r.status_code == 200, r.json
+                hits += len(r.json["items"])
+            total = client.get(f"/api/cases/search?{queries[0]}&count=true").json["total"]
+            print(f"{kind:10} {name:>7} {_pct(lat, .5):>8.1f} {_pct(lat, .95):>8.1f} {total:>8}")
+    print(client.get("/api/cases/search?q=\"emergency department\" hepat*&limit=1").json["items"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# =========================================================
+# BENCHMARK — worklist queues and concurrent claiming.
+# N cases spread over the six workflow steps (two statuses
+# at the Medical step) with due dates from the reporting
+# clock, then:
+#   browse      load every case row and filter / sort by
+#               step in Python (what the case list does in
+#               the browser), against worklist.queue()
+#   queue       queue() latency at N/10 and at N cases, to
+#               show the page cost does not grow with them
+#   claim       --workers processes claiming --batch cases
+#               at a time from the Medical step until
+#               --claims are taken; every claim is checked
+#               against the others for a double claim
+#   expiry      a lapsed lease is claimable again, a live
+#               one is not
+#   python bench/bench_worklist.py --cases 200000 --workers 8
+# DATABASE_URL defaults to a throwaway SQLite file.
+# =========================================================
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DB = os.path.join(tempfile.gettempdir(), "skyvig_bench_worklist.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_DB}")
+
+import app                                                   # noqa: E402
+import worklist                                              # noqa: E402
+from app import AuditLog, Case, CaseSummary, CaseText, SignalCount, db   # noqa: E402
+from summary import due_from                                 # noqa: E402
+from synth import STAGES                                     # noqa: E402
+
+_FLAGS = ((), (), (), ("hospitalisation",), ("medSignificant",), ("death",))
+
+
+def _rows(start, n, rng):
+    for i in range(start, start + n):
+        step    = rng.choices(range(1, 7), weights=(3, 3, 3, 2, 2, 2))[0]
+        status  = STAGES[step - 1]
+        if step == 3 and rng.random() < 0.3:
+            status = "Medical Review"
+        receipt = date(2025, 1, 1) + timedelta(days=rng.randint(0, 600))
+        flags   = rng.choice(_FLAGS)
+        yield {"id": f"PV-{i:07d}", "current_step": step, "status": status,
+               "triage": {"receiptDate": receipt.isoformat(), "seriousness": {f: True for f in flags}},
+               "due_date": due_from(receipt, flags), "created_at": datetime.utcnow(),
+               "updated_at": datetime.utcnow()}
+
+
+def _fill(start, n, rng):
+    rows = _rows(start, n, rng)
+    for i in range(0, n, 5000):
+        db.session.execute(Case.__table__.insert(), [next(rows) for _ in range(min(5000, n - i))])
+        db.session.commit()
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _timed(fn, runs):
+    out = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def _claimer(n, claims, batch, lease, out):
+    # one worker process: claim until the shared budget is spent; an
+    # empty claim (SQLite lock timeouts) hands its share back
+    with app.app.app_context():
+        db.engine.dispose(close=False)
+        got, lat, empty = [], [], 0
+        while True:
+            with claims.get_lock():
+                if claims.value <= 0:
+                    break
+                claims.value -= batch
+            t0 = time.perf_counter()
+            ids = [c["id"] for c in worklist.claim(3, f"user{n}", "Medical", limit=batch, lease=lease)]
+            lat.append((time.perf_counter() - t0) * 1000)
+            got.extend(ids)
+            if not ids:
+                empty += 1
+                with claims.get_lock():
+                    claims.value += batch
+                if not worklist.queue(3, limit=1):
+                    break
+        out.put((n, got, lat, empty))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases",   type=int, default=200000)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--claims",  type=int, default=4000)
+    ap.add_argument("--batch",   type=int, default=1)
+    ap.add_argument("--runs",    type=int, default=200)
+    args = ap.parse_args()
+
+    rng = random.Random(7)
+    with app.app.app_context():
+        for model in (AuditLog, SignalCount, CaseSummary, CaseText, Case):
+            db.session.query(model).delete()
+        db.session.commit()
+
+        small = args.cases // 10
+        for label, start, n in (("N/10", 0, small), ("N", small, args.cases - small)):
+            t0 = time.perf_counter()
+            _fill(start, n, rng)
+            total = db.session.query(Case).count()
+            print(f"loaded {n} cases in {time.perf_counter() - t0:.1f}s ({total} in total)")
+            q = _timed(lambda: worklist.queue(3, limit=20), args.runs)
+            s = _timed(lambda: worklist.step_statuses(3), args.runs)
+            print(f"  queue at {label:4}  p50 {_pct(q, .5):6.2f} ms  p95 {_pct(q, .95):6.2f} ms   "
+                  f"(status scan p50 {_pct(s, .5):.2f} ms)")
+
+        def browse():
+            rows = [c for c in db.session.query(Case).yield_per(5000) if c.current_step == 3]
+            rows.sort(key=lambda c: c.triage.get("receiptDate", ""))
+            db.session.expunge_all()
+            return rows[:20]
+        b = _timed(browse, 3)
+        print(f"browse all cases   p50 {_pct(b, .5):8.0f} ms")
+
+        plan = db.session.execute(db.text(
+            "EXPLAIN QUERY PLAN " + str(worklist._head(3, "Medical", 20, datetime.utcnow()).compile(
+                db.engine, compile_kwargs={"literal_binds": True})))).all() \
+            if db.engine.dialect.name == "sqlite" else []
+        for row in plan:
+            print(f"  plan: {row[-1]}")
+
+    claims = multiprocessing.Value("i", args.claims)
+    out    = multiprocessing.Queue()
+    t0     = time.perf_counter()
+    procs  = [multiprocessing.Process(target=_claimer, args=(n, claims, args.batch, 3600, out))
+              for n in range(args.workers)]
+    for p in procs:
+        p.start()
+    results = sorted(out.get() for _ in procs)
+    for p in procs:
+        p.join()
+    s   = time.perf_counter() - t0
+    ids = [i for _, got, _, _ in results for i in got]
+    lat = [x for _, _, l, _ in results for x in l]
+    print(f"\nclaim, {args.workers} processes x batch {args.batch}: {len(ids)} cases in {s:.1f}s "
+          f"({len(ids) / s:.0f}/s)  p50 {_pct(lat, .5):.1f} ms  p95 {_pct(lat, .95):.1f} ms  "
+          f"p99 {_pct(lat, .99):.1f} ms")
+    print(f"  double claims: {len(ids) - len(set(ids))}, "
+          f"empty claims (lock timeouts): {sum(r[3] for r in results)}")
+    with app.app.app_context():
+        held = dict(db.session.execute(db.select(Case.id, Case.claimed_by).where(Case.id.in_(ids[:5000]))).all())
+        owners = {i: f"user{n}" for n, got, _, _ in results for i in got}
+        print(f"  owner mismatches: {sum(held[i] != owners[i] for i in held)}")
+        first = worklist.queue(3, limit=1)[0]["dueDate"]
+        print(f"  queue head now due {first}; claimed ones were due up to "
+              f"{max(c.due_date for c in db.session.query(Case).filter(Case.id.in_(ids[:5000])))}")
+
+        lapsed, live = ids[0], ids[1]
+        db.session.execute(Case.__table__.update().where(Case.id == lapsed)
+                           .values(claim_expires=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        got = [c["id"] for c in worklist.claim(3, "late", "Medical", limit=10)]
+        print(f"\nexpiry: lapsed lease reclaimed {lapsed in got}, live lease reclaimed {live in got}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+# =========================================================
+# SYNTHETIC DATA FOR BENCHMARKS
+# ---------------------------------------------------------
+# Deterministic generators shaped like the JSON sections the
+# frontend saves and build_e2b_xml consumes. Nothing here
+# touches the database.
+# =========================================================
+
+import itertools
+import os
+import random
+import zlib
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+_SYL = [c + v for c in "bcdfghklmnprstvxz" for v in "aeiou"] + ["pro", "cor", "tra", "ple"]
+_DRUG_END = ["mab", "pril", "sartan", "statin", "olol", "azole", "cillin", "mycin", "vir", "tide"]
+_EVENT_HEAD = ["Acute", "Chronic", "Drug-induced", "Severe", "Allergic", "Toxic", ""]
+_EVENT_BODY = ["hepatitis", "rash", "nausea", "headache", "pneumonitis", "neuropathy",
+               "pancreatitis", "nephritis", "arrhythmia", "anaemia", "dermatitis", "myopathy",
+               "colitis", "vasculitis", "thrombocytopenia", "urticaria", "seizure", "oedema"]
+COUNTRIES = ["India", "United States", "Germany", "France", "Japan", "Brazil",
+             "United Kingdom", "Canada", "Australia", "Spain", "Italy", "Mexico"]
+
+
+def drug_names(n, seed=7):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < n:
+        stem = "".join(rng.choice(_SYL) for _ in range(rng.randint(2, 3)))
+        names.add((stem + rng.choice(_DRUG_END)).capitalize())
+    return sorted(names)
+
+
+def event_terms(n, seed=11):
+    rng = random.Random(seed)
+    terms = set()
+    while len(terms) < n:
+        qual = "".join(rng.choice(_SYL) for _ in range(rng.randint(2, 3))).capitalize()
+        terms.add(" ".join(x for x in (rng.choice(_EVENT_HEAD), qual, rng.choice(_EVENT_BODY)) if x))
+    return sorted(terms)
+
+
+def _typo(rng, s):
+    if len(s) < 6:
+        return s
+    i = rng.randint(4, len(s) - 1)
+    return s[:i] + s[i + 1:]
+
+
+def make_case(rng, i, drugs, events, start=date(2022, 1, 1)):
+    drug    = rng.choice(drugs)
+    ev      = rng.choice(events)
+    onset   = start + timedelta(days=rng.randint(0, 900))
+    initials = "".join(rng.choice("ABCDEFGHJKLMNPRST") for _ in range(2))
+    return SimpleNamespace(
+        id       = f"PV-{i:07d}",
+        status   = "Triage",
+        current_step = 1,
+        updated_at = None,
+        triage   = {"patientInitials": initials, "country": rng.choice(COUNTRIES),
+                    "receiptDate": (onset + timedelta(days=rng.randint(0, 30))).isoformat(),
+                    "qualification": rng.choice(["Physician", "Pharmacist", "Consumer"])},
+        products = [{"name": drug, "role": "Suspect", "dose": str(rng.choice([5, 10, 20, 50])),
+                     "doseUnit": "mg", "route": "Oral"}],
+        events   = [{"term": ev, "pt": ev, "pt_code": str(10000000 + events.index(ev)),
+                     "onsetDate": onset.isoformat()}],
+        general  = {"reportType": "Spontaneous"},
+        patient  = {"initials": initials, "sex": ("Male", "Female")[i % 2], "age": 18 + i % 70,
+                    "ageUnit": "years", "weight": 50 + i % 50},
+        medical  = {},
+        narrative = f"Patient {initials} experienced {ev.lower()} after starting {drug}.",
+    )
+
+
+def make_cases(n, seed=1, n_drugs=1500, n_events=3000, dup_rate=0.05):
+    rng    = random.Random(seed)
+    drugs  = drug_names(n_drugs)
+    events = event_terms(n_events)
+    cases  = []
+    for i in range(n):
+        if cases and rng.random() < dup_rate:
+            src = rng.choice(cases)
+            c = make_case(rng, i, drugs, events)
+            c.triage   = dict(src.triage)
+            c.products = [dict(src.products[0], name=_typo(rng, src.products[0]["name"]))]
+            c.events   = [dict(src.events[0])]
+        else:
+            c = make_case(rng, i, drugs, events)
+        cases.append(c)
+    return cases
+
+
+def incoming_from(case, rng):
+    return {
+        "patientInitials": case.triage["patientInitials"],
+        "drugName":        _typo(rng, case.products[0]["name"]),
+        "eventTerm":       case.events[0]["term"],
+        "eventPt":         case.events[0]["pt"],
+        "country":         case.triage["country"],
+        "onsetDate":       case.events[0]["onsetDate"],
+    }
+
+
+# ---------------------------------------------------------
+# MedDRA-like dictionary: SOC > HLGT > HLT > PT > LLT
+# ---------------------------------------------------------
+
+_SITES = ["hepatic", "renal", "cardiac", "pulmonary", "cutaneous", "gastric", "ocular",
+          "neural", "muscular", "vascular", "splenic", "pancreatic", "thyroid", "adrenal",
+          "bone marrow", "skin", "joint", "ear", "bladder", "uterine"]
+_LESIONS = ["failure", "injury", "disorder", "inflammation", "haemorrhage", "pain",
+            "oedema", "necrosis", "infection", "neoplasm", "fibrosis", "atrophy",
+            "hypertrophy", "ulcer", "cyst", "stenosis", "toxicity", "syndrome"]
+_MODS = ["acute", "chronic", "severe", "mild", "recurrent", "congenital", "drug-induced",
+         "allergic", "toxic", "idiopathic", "primary", "secondary", "immune-mediated"]
+
+
+def meddra_terms(n_llt=80000, version="28.1", seed=3):
+    rng = random.Random(seed)
+    socs = [(str(10000000 + i), f"{s.capitalize()} disorders", s[:5].capitalize())
+            for i, s in enumerate(_SITES[:27])]
+    rows, pts, seen = [], [], set()
+    code = 10010000
+    n_pt = max(1, n_llt // 4)
+    while len(pts) < n_pt:
+        name = " ".join(x for x in (rng.choice(_MODS + [""] * 6),
+                                    rng.choice(_SITES),
+                                    "".join(rng.choice(_SYL) for _ in range(rng.randint(0, 2))),
+                                    rng.choice(_LESIONS)) if x).capitalize()
+        if name in seen:
+            continue
+        seen.add(name)
+        soc = rng.choice(socs)
+        code += 1
+        pts.append((str(code), name, soc))
+    for pt_code, pt_name, soc in pts:
+        hlt  = (str(int(soc[0]) + 500000), f"{pt_name.split()[-1].capitalize()} NEC")
+        hlgt = (str(int(soc[0]) + 600000), f"{soc[1].split()[0]} conditions")
+        variants = [pt_name] + [f"{pt_name} {rng.choice(['NOS', 'aggravated', 'grade 2', 'worsening'])}"
+                                for _ in range(3)]
+        for j, llt_name in enumerate(variants):
+            if len(rows) >= n_llt:
+                break
+            llt_code = pt_code if j == 0 else str(20000000 + len(rows))
+            rows.append((llt_code, llt_name, pt_code, pt_name, hlt[0], hlt[1], hlgt[0], hlgt[1],
+                         soc[0], soc[1], soc[2], "N" if rng.random() < 0.05 else "Y", version))
+    return rows
+
+
+def write_meddra_release(directory, rows, version="28.1"):
+    # rows from meddra_terms(), written as a MedDRA ASCII release
+    os.makedirs(directory, exist_ok=True)
+    pts, hlts, hlgts, socs = {}, {}, {}, {}
+    links = {"hlt_pt": set(), "hlgt_hlt": set(), "soc_hlgt": set()}
+    for r in rows:
+        pts[r[2]]  = (r[3], r[8])
+        hlts[r[4]] = r[5]
+        hlgts[r[6]] = r[7]
+        socs[r[8]] = (r[9], r[10])
+        links["hlt_pt"].add((r[4], r[2]))
+        links["hlgt_hlt"].add((r[6], r[4]))
+        links["soc_hlgt"].add((r[8], r[6]))
+
+    def write(name, lines):
+        with open(os.path.join(directory, name), "w", encoding="utf-8", newline="") as f:
+            for fields in lines:
+                f.write("$".join(fields) + "$\r\n")
+
+    write("meddra_release.asc", [(version, "English", "", "", "")])
+    write("llt.asc", [(r[0], r[1], r[2], "", "", "", "", "", "", r[11], "") for r in rows])
+    write("pt.asc", [(c, n, "", soc, "", "", "", "", "", "", "") for c, (n, soc) in pts.items()])
+    write("hlt.asc", [(c, n, "", "", "", "", "", "") for c, n in hlts.items()])
+    write("hlgt.asc", [(c, n, "", "", "", "", "", "") for c, n in hlgts.items()])
+    write("soc.asc", [(c, n, a, "", "", "", "", "", "", "") for c, (n, a) in socs.items()])
+    for name, pairs in links.items():
+        write(f"{name}.asc", sorted(pairs))
+    seen = set()
+    hier = []
+    for r in rows:
+        if r[2] not in seen:
+            seen.add(r[2])
+            hier.append((r[2], r[4], r[6], r[8], r[3], r[5], r[7], r[9], r[10], "", r[8], "Y"))
+    write("mdhier.asc", hier)
+
+
+def make_rich_cases(n, seed=1, products=3, events=3, labs=4):
+    # submission-wave shaped cases: several products, events, lab results
+    rng    = random.Random(seed)
+    drugs  = drug_names(300)
+    terms  = event_terms(600)
+    cases  = make_cases(n, seed, n_drugs=300, n_events=600, dup_rate=0)
+    for c in cases:
+        start = date.fromisoformat(c.events[0]["onsetDate"])
+        c.current_step = 3
+        c.products += [{"name": rng.choice(drugs), "genericName": rng.choice(drugs).lower(),
+                        "role": rng.choice(["Concomitant", "Suspect"]), "dose": str(rng.choice([1, 2, 5])),
+                        "doseUnit": "mg", "route": "Oral", "frequency": "Once daily",
+                        "startDate": (start - timedelta(days=rng.randint(5, 90))).isoformat(),
+                        "indication": rng.choice(terms), "actionTaken": "Dose not changed",
+                        "authNumber": f"AN{rng.randint(10000, 99999)}", "authCountry": c.triage["country"]}
+                       for _ in range(products - 1)]
+        c.events += [{"term": t, "pt": t, "pt_code": str(10000000 + terms.index(t)),
+                      "onsetDate": (start + timedelta(days=rng.randint(0, 10))).isoformat()}
+                     for t in rng.sample(terms, events - 1)]
+        c.patient["labData"] = [{"testName": rng.choice(["ALT", "AST", "Bilirubin", "Creatinine", "INR"]),
+                                 "testDate": (start + timedelta(days=k)).isoformat(),
+                                 "result": str(rng.randint(5, 300)), "units": "U/L",
+                                 "normLow": "5", "normHigh": "40"} for k in range(labs)]
+        c.patient["otherHistory"] = [{"description": rng.choice(terms), "startDate": "2015-01-01",
+                                      "ongoing": True}]
+    return cases
+
+
+def make_signal_cases(n, seed=7, n_drugs=2000, n_events=6000, n_signals=50, signal_rate=0.15):
+    # Zipf-distributed drugs and PTs with 1-3 suspect drugs and 1-4 events
+    # per case; `n_signals` drug -> PT pairs are injected at `signal_rate`
+    # of their drug's cases. Returns (cases, injected pairs as labels).
+    rng    = random.Random(seed)
+    drugs  = drug_names(n_drugs)
+    events = event_terms(n_events)
+    dw     = list(itertools.accumulate(1 / (i + 1) ** 0.9 for i in range(n_drugs)))
+    ew     = list(itertools.accumulate(1 / (i + 1) ** 0.8 for i in range(n_events)))
+    signals = {}
+    for d in rng.sample(range(n_drugs // 4), n_signals):
+        signals.setdefault(d, []).append(rng.randrange(n_events // 2, n_events))
+    cases = []
+    for i in range(n):
+        ds = set(rng.choices(range(n_drugs), cum_weights=dw, k=rng.choice((1, 1, 1, 2, 2, 3))))
+        es = set(rng.choices(range(n_events), cum_weights=ew, k=rng.choice((1, 1, 2, 2, 3, 4))))
+        for d in ds:
+            for e in signals.get(d, ()):
+                if rng.random() < signal_rate:
+                    es.add(e)
+        cases.append(SimpleNamespace(
+            id       = f"SD-{i:07d}",
+            products = [{"name": drugs[d], "role": "Suspect"} for d in ds],
+            events   = [{"term": events[e], "pt": events[e], "pt_code": str(10000000 + e)} for e in es],
+        ))
+    injected = {(drugs[d], events[e]) for d, es in signals.items() for e in es}
+    return cases, injected
+
+
+# ---------------------------------------------------------
+# Free-text narratives — several sentences per case built
+# from the case's own drugs, events and labs plus common
+# clinical phrasing, so word frequencies are skewed the way
+# real narratives are (a few words everywhere, most rare)
+# ---------------------------------------------------------
+
+_OPENERS = ["This spontaneous report was received from a {q} concerning a {age}-year-old {sex} patient.",
+            "A {q} reported that a {age}-year-old {sex} patient experienced an adverse event.",
+            "Initial information was received from a {q} via the company call centre on {d}."]
+_HISTORY = ["Medical history included {h}.", "The patient had a history of {h} and was a non-smoker.",
+            "Relevant history: {h}; no known drug allergies.", "Concurrent conditions were not reported."]
+_COURSE  = ["On {d} the patient started {drug} {dose} mg orally once daily for {ind}.",
+            "{drug} was initiated on {d} at a dose of {dose} mg.",
+            "The patient had been receiving {drug} since {d}."]
+_EVENT   = ["Approximately {n} days later the patient developed {ev}.",
+            "On {d} the patient presented to the emergency department with {ev}.",
+            "The patient experienced {ev} and was hospitalised for observation.",
+            "Shortly afterwards {ev} was noted by the treating physician."]
+_LABS    = ["Laboratory tests showed {lab} of {val} U/L (normal range 5-40).",
+            "{lab} was elevated at {val} U/L on {d}.", "Repeat {lab} on {d} was {val} U/L."]
+_ACTION  = ["{drug} was discontinued and the event resolved without sequelae.",
+            "The dose of {drug} was not changed; the outcome was not recovered at the time of reporting.",
+            "{drug} was withdrawn; the patient was treated with intravenous fluids and recovered.",
+            "Treatment with {drug} continued and the event was resolving at last follow-up."]
+_CLOSING = ["The reporter assessed the event as possibly related to {drug}.",
+            "Causality was assessed as probable by the reporter and unassessable by the company.",
+            "No further information is expected.", "Follow-up information has been requested."]
+
+
+def clinical_narrative(rng, case):
+    drug = case.products[0]["name"]
+    evs  = [e["term"].lower() for e in case.events]
+    labs = [l["testName"] for l in (case.patient or {}).get("labData", [])] or ["ALT"]
+    hist = [h["description"].lower() for h in (case.patient or {}).get("otherHistory", [])] or ["hypertension"]
+    d    = case.events[0].get("onsetDate", "2023-01-01")
+    fill = dict(q=case.triage.get("qualification", "physician").lower(), age=case.patient.get("age", 50),
+                sex=case.patient.get("sex", "female").lower(), d=d, h=", ".join(hist), drug=drug,
+                dose=case.products[0].get("dose", "10"), ind=rng.choice(["hypertension", "pain", "infection",
+                "type 2 diabetes", "rheumatoid arthritis", "depression"]))
+    parts = [rng.choice(_OPENERS), rng.choice(_HISTORY), rng.choice(_COURSE)]
+    for ev in evs:
+        parts.append(rng.choice(_EVENT).replace("{ev}", ev).replace("{n}", str(rng.randint(1, 30))))
+    for lab in rng.sample(labs, min(len(labs), 2)):
+        parts.append(rng.choice(_LABS).replace("{lab}", lab).replace("{val}", str(rng.randint(20, 900))))
+    parts += [rng.choice(_ACTION), rng.choice(_CLOSING)]
+    return " ".join(p.format(**fill) for p in parts)
+
+
+def make_narrative_cases(n, seed=1):
+    rng   = random.Random(seed + 1)
+    cases = make_rich_cases(n, seed, products=2, events=2, labs=3)
+    for c in cases:
+        c.narrative = clinical_narrative(rng, c)
+    return cases
+
+
+# ---------------------------------------------------------
+# Full cases for the load suite: every section the case form
+# saves, with events, history and indications coded against a
+# meddra_terms() dictionary, so MedDRA search, duplicate check
+# and E2B export all see consistent data. Code-list values are
+# keys of the app's OUTCOMES, ACTION_TAKEN, DECHALLENGE,
+# RECHALLENGE and SERIOUS_CODES.
+# ---------------------------------------------------------
+
+STAGES    = ("Triage", "Data Entry", "Medical", "Quality", "Submissions", "Archived")
+_OUTCOMES = ["Recovered / Resolved", "Recovering / Resolving", "Not recovered / Not resolved",
+             "Recovered with sequelae", "Fatal", "Unknown"]
+_ACTIONS  = ["Withdrawn", "Dose reduced", "Dose not changed", "Not applicable", "Unknown"]
+_DECHAL   = ["Positive – Event abated on withdrawal", "Negative – Event did not abate", "Not done", "Unknown"]
+_RECHAL   = ["Positive – Event recurred", "Negative – Event did not recur", "Not done", "Unknown"]
+_SERIOUS  = ["death", "lifeThreatening", "hospitalisation", "disability", "congenital", "medSignificant"]
+_QUALS    = ["Physician", "Pharmacist", "Nurse", "Other HCP", "Consumer"]
+
+
+def _coded(row):
+    # the fields the MedDRA picker writes onto an event
+    return {"llt": row[1], "llt_code": row[0], "pt": row[3], "pt_code": row[2], "soc": row[9],
+            "meddra_version": row[12]}
+
+
+def make_full_cases(n, terms, seed=1, dup_rate=0.03):
+    # terms: meddra_terms() rows. 1-3 suspect and 0-3 concomitant
+    # products, 1-4 events, labs, history and a narrative; steps
+    # spread over the workflow, later steps carrying assessments
+    rng     = random.Random(seed)
+    current = [r for r in terms if r[11] == "Y"] or terms
+    drugs   = drug_names(2000)
+    cases   = make_cases(n, seed, n_drugs=2000, n_events=4000, dup_rate=dup_rate)
+    for c in cases:
+        onset = date.fromisoformat(c.events[0]["onsetDate"])
+        step  = rng.choices(range(1, 7), weights=(3, 3, 3, 2, 2, 2))[0]
+        c.current_step, c.status = step, STAGES[step - 1]
+
+        products = c.products[:1] + [{"name": rng.choice(drugs)} for _ in range(rng.choice((0, 0, 1, 2)))]
+        for j, p in enumerate(products):
+            action = rng.choice(_ACTIONS)
+            p.update(role="Suspect", genericName=p["name"].lower(), frequency=rng.choice(["Once daily", "BID"]),
+                     startDate=(onset - timedelta(days=rng.randint(3, 200))).isoformat(),
+                     indication=rng.choice(current)[3], actionTaken=action,
+                     dechallenge=rng.choice(_DECHAL) if action in ("Withdrawn", "Dose reduced") else "N/A",
+                     rechallenge=rng.choice(_RECHAL) if rng.random() < 0.2 else "N/A",
+                     batch=f"LOT{rng.randint(1000, 99999)}", mah="SkyVigilance Pharma")
+            p.setdefault("dose", str(rng.choice([5, 10, 20, 50])))
+            p.setdefault("doseUnit", "mg")
+            p.setdefault("route", rng.choice(["Oral", "Intravenous", "Subcutaneous"]))
+        products += [{"name": rng.choice(drugs), "role": "Concomitant", "dose": str(rng.choice([1, 2, 5])),
+                      "doseUnit": "mg", "route": "Oral",
+                      "startDate": (onset - timedelta(days=rng.randint(30, 900))).isoformat()}
+                     for _ in range(rng.choice((0, 1, 1, 2, 3)))]
+        c.products = products
+
+        # the first event keeps its verbatim term; its coding follows the
+        # term, so duplicates of a case code the same way
+        first = dict(c.events[0], **_coded(current[zlib.crc32(c.events[0]["term"].encode()) % len(current)]))
+        extra = [dict(_coded(r), term=r[1],
+                      onsetDate=(onset + timedelta(days=rng.randint(0, 14))).isoformat())
+                 for r in rng.sample(current, rng.choice((0, 0, 1, 2, 3)))]
+        for e in [first] + extra:
+            serious = rng.random() < 0.3
+            fatal   = serious and rng.random() < 0.05
+            e["outcome"]     = "Fatal" if fatal else rng.choice([o for o in _OUTCOMES if o != "Fatal"])
+            e["seriousness"] = {k: True for k in rng.sample(_SERIOUS[1:], rng.randint(1, 2))} if serious else {}
+            if e["outcome"] == "Fatal":
+                e["seriousness"]["death"] = True
+            if e["outcome"].startswith("Recovered"):
+                e["stopDate"] = (onset + timedelta(days=rng.randint(1, 60))).isoformat()
+            if step >= 3:
+                e["causality"]  = rng.choice(["Certain", "Probable", "Possible", "Unlikely"])
+                e["listedness"] = rng.choice(["Listed", "Unlisted"])
+        c.events = [first] + extra
+
+        history = [dict(description=r[3], meddraPt=r[3], meddraPtCode=r[2], startDate=f"{rng.randint(2000, 2021)}-01-01",
+                        ongoing=rng.random() < 0.6) for r in rng.sample(current, rng.randint(0, 3))]
+        c.patient.update(
+            dob=f"{onset.year - c.patient['age']}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            height=150 + c.patient["age"] % 40, otherHistory=history,
+            medHistory="" if history else rng.choice(["", "Hypertension", "Type 2 diabetes"]),
+            concomitant="" if len(products) > 1 else rng.choice(["", "Paracetamol PRN"]),
+            labData=[{"testName": t, "testDate": (onset + timedelta(days=k)).isoformat(),
+                      "result": str(rng.randint(5, 300)), "units": "U/L", "normLow": "5", "normHigh": "40",
+                      "assessment": rng.choice(["Normal", "High"])}
+                     for k, t in enumerate(rng.sample(["ALT", "AST", "Bilirubin", "Creatinine", "INR"],
+                                                      rng.randint(0, 4)))])
+        c.triage.update(reportType=c.general["reportType"], reporterFirst=rng.choice(["Anna", "Ravi", "Lena"]),
+                        reporterLast=rng.choice(["Shah", "Meyer", "Costa"]), institution="General Hospital")
+        c.general.update(centralReceiptDate=c.triage["receiptDate"],
+                         seriousness=dict(c.events[0]["seriousness"]))
+        c.medical = {"companyCausality": c.events[0].get("causality", "")} if step >= 3 else {}
+        c.narrative = clinical_narrative(rng, c) if step >= 2 else ""
+    return cases
+
+
+def meddra_next_version(rows, version="29.0", seed=5, changed=0.02):
+    # the following release of meddra_terms() rows: a `changed` share
+    # of LLTs made non-current, moved to another PT, renamed or
+    # deleted, PTs moved to another SOC, and new LLTs added
+    rng  = random.Random(seed)
+    pts  = {r[2]: r for r in rows if r[0] == r[2]}
+    socs = sorted({(r[8], r[9], r[10]) for r in rows})
+    soc_of = {pt: rng.choice(socs) for pt in rng.sample(sorted(pts), int(len(pts) * changed / 4))}
+    out  = []
+    for r in rows:
+        r = list(r[:12]) + [version]
+        if r[2] in soc_of:
+            r[8:11] = soc_of[r[2]]
+        x = rng.random()
+        if r[0] != r[2] and x < changed / 4:
+            continue                                                      # deleted
+        if r[0] != r[2] and x < changed / 2:
+            r[11] = "N"
+        elif r[0] != r[2] and x < changed * 3 / 4:
+            r[2:8] = rng.choice(list(pts.values()))[2:8]                  # moved to another PT
+        elif x < changed:
+            r[1] = r[1] + " (revised)"
+        out.append(tuple(r))
+    code = 30000000
+    for pt in rng.sample(sorted(pts), len(rows) // 100):
+        code += 1
+        out.append((str(code), pts[pt][3] + " NEC") + tuple(pts[pt][2:12]) + (version,))
+    return out
+
+
+def reporter_verbatim(rng, name):
+    # how a reporter might write a dictionary term: as is, another
+    # case, plural, a severity word, words swapped, British / US
+    # spelling, a dropped letter
+    r = rng.random()
+    if r < 0.25:
+        return rng.choice((name, name.lower(), name.upper()))
+    words = name.lower().split()
+    if r < 0.4:
+        return " ".join(words[:-1] + [words[-1] + "s"])
+    if r < 0.5:
+        return rng.choice(("severe ", "mild ", "")) + " ".join(words)
+    if r < 0.6 and len(words) > 1:
+        return " ".join(words[1:] + words[:1])
+    if r < 0.7:
+        swaps = (("edema", "oedema"), ("oedema", "edema"), ("anemia", "anaemia"), ("anaemia", "anemia"))
+        return " ".join(dict(swaps).get(w, w) for w in words)
+    return _typo(rng, name.lower())
+
+
+def meddra_queries(rows, n, rng):
+    # keystroke-style searches as searchMeddra sends them
+    out = []
+    for _ in range(n):
+        name = rng.choice(rows)[1].lower()
+        kind = rng.random()
+        if kind < 0.4:
+            out.append(name[:rng.randint(2, min(8, len(name)))])          # typing a prefix
+        elif kind < 0.7:
+            words = name.split()
+            w = rng.choice(words)
+            out.append(w[:rng.randint(2, len(w))] if len(w) > 2 else w)   # a later word
+        elif kind < 0.85:
+            words = name.split()
+            out.append(" ".join(w[:4] for w in words[-2:]))               # two partial words
+        else:
+            i = rng.randint(1, len(name) - 2)
+            out.append(name[:i] + name[i + 1:])                           # a dropped letter
+    return out
@@ -0,0 +1,213 @@
+# =========================================================
+# RESPONSE CACHE
+# ---------------------------------------------------------
+# RESPONSE_CACHE picks the backend:
+#   memory  per-worker LRU with a TTL (default)
+#   shared  Redis at CACHE_URL, shared by all workers; with
+#           no redis client or no CACHE_URL an in-process
+#           stand-in with the same get/setex semantics is
+#           used, so the code path is exercised in dev
+#   off     every lookup misses
+# Keys carry what makes an entry stale — (case id,
+# updated_at), the list ETag, the MedDRA signature — so a
+# write never has to find and delete entries: the next read
+# simply asks for a different key, and the old one ages out.
+# =========================================================
+
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from lazy import LazyModule, available
+
+REDIS_AVAILABLE = available("redis")
+_redis = LazyModule("redis")
+
+BACKEND     = os.getenv("RESPONSE_CACHE", "memory")
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_SIZE", "20000"))
+TTL         = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+CACHE_URL   = os.getenv("CACHE_URL", "")
+
+
+class LRUCache:
+    # entries expire after ttl seconds and the least recently used
+    # go first once max_entries is reached
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL):
+        self._lock       = threading.Lock()
+        self._items      = OrderedDict()
+        self.max_entries = max_entries
+        self.ttl         = ttl
+        self.evictions   = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._items[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class StandInRedis:
+    # the subset of redis.Redis the shared backend uses, in memory
+
+    def __init__(self):
+        self._lock  = threading.Lock()
+        self._items = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._items.pop(key, None)
+                return None
+            return entry[1]
+
+    def setex(self, key, ttl, value):
+        with self._lock:
+            self._items[key] = (time.monotonic() + ttl, bytes(value))
+
+    def dbsize(self):
+        return len(self._items)
+
+    def flushdb(self):
+        with self._lock:
+            self._items.clear()
+
+
+class SharedCache:
+    # values are pickled; keys are prefixed so one Redis can serve
+    # several deployments
+
+    def __init__(self, client, ttl=TTL, prefix="skyvig:"):
+        self.client    = client
+        self.ttl       = ttl
+        self.prefix    = prefix
+        self.evictions = 0              # Redis evicts on its own (maxmemory-policy)
+
+    def __len__(self):
+        return self.client.dbsize()
+
+    def _key(self, key):
+        return self.prefix + json.dumps(key, default=str, separators=(",", ":"))
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self._key(key))
+        except Exception as e:
+            print(f"[SkyVigilance] Cache read failed: {e}")
+            return None
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        try:
+            self.client.setex(self._key(key), int(ttl or self.ttl), pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except Exception as e:
+            print(f"[SkyVigilance] Cache write failed: {e}")
+
+    def clear(self):
+        self.client.flushdb()
+
+
+class NullCache:
+    evictions = 0
+
+    def __len__(self):
+        return 0
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def clear(self):
+        pass
+
+
+def make_backend(kind=BACKEND):
+    if kind == "off":
+        return NullCache()
+    if kind == "shared":
+        if REDIS_AVAILABLE and CACHE_URL:
+            return SharedCache(_redis.Redis.from_url(CACHE_URL))
+        print("[SkyVigilance] RESPONSE_CACHE=shared without redis/CACHE_URL — using the in-process stand-in.")
+        return SharedCache(StandInRedis())
+    if kind != "memory":
+        raise ValueError(f"RESPONSE_CACHE must be memory, shared or off, not {kind!r}")
+    return LRUCache()
+
+
+class ResponseCache:
+    # one backend, hit/miss counters per namespace ("case", "list", ...)
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock   = threading.Lock()
+        self.counts  = {}
+
+    def _count(self, ns, field, n=1):
+        with self._lock:
+            c = self.counts.setdefault(ns, {"hits": 0, "misses": 0, "sets": 0})
+            c[field] += n
+
+    def get(self, ns, key):
+        value = self.backend.get((ns, key))
+        self._count(ns, "misses" if value is None else "hits")
+        return value
+
+    def get_many(self, ns, keys):
+        # -> {key: value} for the keys present
+        found = {}
+        for key in keys:
+            value = self.backend.get((ns, key))
+            if value is not None:
+                found[key] = value
+        self._count(ns, "hits", len(found))
+        self._count(ns, "misses", len(keys) - len(found))
+        return found
+
+    def set(self, ns, key, value, ttl=None):
+        self.backend.set((ns, key), value, ttl)
+        self._count(ns, "sets")
+
+    def stats(self):
+        with self._lock:
+            spaces = {ns: {**c, "hitRatio": round(c["hits"] / ((c["hits"] + c["misses"]) or 1), 4)}
+                      for ns, c in self.counts.items()}
+        return {
+            "backend":    type(self.backend).__name__,
+            "entries":    len(self.backend),
+            "evictions":  self.backend.evictions,
+            "namespaces": spaces,
+        }
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.counts.clear()
+
+
+response_cache = ResponseCache(make_backend())
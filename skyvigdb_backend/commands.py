@@ -0,0 +1,470 @@
+# =========================================================
+# CLI COMMANDS — run with `flask --app app <command>`
+# =========================================================
+
+import json
+import os
+import time
+
+import click
+from sqlalchemy import text
+
+from app import app, db, Case, CaseSummary, CaseText, MeddraTerm, SignalCount, log_event, ts_now
+from audit import AuditQueryError, export_rows as audit_rows, stream_csv as audit_csv
+from autocode import KINDS as CODING_KINDS, MIN_CONFIDENCE, run_backlog
+from dedup import FORMATS, batch_pairs, detect_format, read_records, self_join_pairs
+from e2b_batch import BatchError, batch_cases, write_batch, xml_cache
+from hooks import (SIGNAL_LEVELS, bump_signal_counts, recompute_signal_counts, refresh_dup_index,
+                   soc_map)
+from ingest import CHUNK, FORMATS as IMPORT_FORMATS, IngestError, ingest, open_upload
+from line_listing import ENCODERS, FLATTEN, listing_rows
+from listing import ListingError
+from meddra_loader import LoaderError, activate, load_release, release_rows, release_version, versions
+from meddra_search import ensure_db_index
+from meddra_upgrade import CHUNK as RECODE_CHUNK, RecodeError, approvals_from, impact, recode
+from migrations import migrate_with_retry, repair_audit_timestamps
+from summary import summarize
+from textsearch import case_text, ensure_index as ensure_text_index
+
+
+def _emit(rows, out):
+    n = 0
+    for row in rows:
+        out.write(json.dumps(row) + "\n")
+        out.flush()
+        n += 1
+    return n
+
+
+def _case_filters(f):
+    # the /api/cases listing filters as CLI options
+    for opt in reversed([
+        click.option("--step", help="Comma-separated workflow steps."),
+        click.option("--status", help="Comma-separated statuses."),
+        click.option("--country"),
+        click.option("--received-from", help="YYYY-MM-DD"),
+        click.option("--received-to", help="YYYY-MM-DD"),
+        click.option("--serious", type=click.Choice(["true", "false"])),
+        click.option("--q", "text", help="Text match on case number, drug, PT, country, initials."),
+    ]):
+        f = opt(f)
+    return f
+
+
+def _filter_args(step, status, country, received_from, received_to, serious, text):
+    args = {"step": step, "status": status, "country": country, "serious": serious,
+            "receivedFrom": received_from, "receivedTo": received_to, "q": text}
+    return {k: v for k, v in args.items() if v is not None}
+
+
+# =========================================================
+# SCHEMA MIGRATIONS
+# =========================================================
+
+@app.cli.command("db-migrate")
+@click.option("--repair-audit", is_flag=True, help="Re-run the audit timestamp repair.")
+def db_migrate(repair_audit):
+    """Create missing tables and apply pending schema migrations (run once per deploy)."""
+    migrate_with_retry(db.engine)
+    if repair_audit:
+        with db.engine.begin() as conn:
+            n = repair_audit_timestamps(conn)
+        click.echo(f"[SkyVigilance] Audit repair: {n} row(s) fixed.")
+
+
+# =========================================================
+# DUPLICATE DETECTION
+# =========================================================
+
+@app.cli.command("dedup-batch")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="Defaults to the file extension.")
+@click.option("--threshold", default=80.0, show_default=True)
+@click.option("--workers", default=os.cpu_count() or 1, show_default=True)
+@click.option("--within-batch/--no-within-batch", default=True, show_default=True)
+@click.option("--out", type=click.File("w"), default="-", help="NDJSON output file (default stdout).")
+def dedup_batch(path, fmt, threshold, workers, within_batch, out):
+    """Score a CSV/JSON/NDJSON batch against pv_case and stream duplicate pairs as NDJSON."""
+    fmt = fmt or detect_format(path)
+    if fmt is None:
+        raise click.UsageError("Cannot infer format from the file name — pass --format.")
+    with click.open_file(path, encoding="utf-8") as f:
+        records = list(read_records(f, fmt))
+    index = refresh_dup_index()
+    n = _emit(batch_pairs(index, records, threshold, workers, within_batch), out)
+    click.echo(f"[SkyVigilance] {len(records)} record(s) checked, {n} pair(s) >= {threshold}.", err=True)
+
+
+@app.cli.command("dedup-scan")
+@click.option("--threshold", default=80.0, show_default=True)
+@click.option("--workers", default=os.cpu_count() or 1, show_default=True)
+@click.option("--out", type=click.File("w"), default="-", help="NDJSON output file (default stdout).")
+def dedup_scan(threshold, workers, out):
+    """Self-join every pv_case row to find historic duplicates, streamed as NDJSON."""
+    index = refresh_dup_index()
+    n = _emit(self_join_pairs(index, threshold, workers), out)
+    click.echo(f"[SkyVigilance] {len(index)} case(s) scanned, {n} pair(s) >= {threshold}.", err=True)
+
+
+# =========================================================
+# CASE SUMMARY BACKFILL
+# =========================================================
+
+@app.cli.command("backfill-summaries")
+@click.option("--chunk", default=1000, show_default=True, help="Cases per transaction.")
+def backfill_summaries(chunk):
+    """Rebuild pv_case_summary from the case JSON in bounded-memory chunks."""
+    table   = CaseSummary.__table__
+    cols    = (Case.id, Case.triage, Case.general, Case.products, Case.events)
+    last_id = ""
+    done    = 0
+    while True:
+        rows = (db.session.query(*cols)
+                .filter(Case.id > last_id)
+                .order_by(Case.id)
+                .limit(chunk)
+                .all())
+        if not rows:
+            break
+        ids = [r.id for r in rows]
+        db.session.execute(table.delete().where(table.c.case_id.in_(ids)))
+        db.session.execute(table.insert(), [summarize(r) for r in rows])
+        db.session.commit()
+        db.session.expunge_all()
+        last_id = ids[-1]
+        done   += len(rows)
+        click.echo(f"[SkyVigilance] Summaries backfilled: {done}", err=True)
+    click.echo(f"[SkyVigilance] Backfill complete — {done} case(s).")
+
+
+# =========================================================
+# FULL-TEXT SEARCH INDEX
+# =========================================================
+
+@app.cli.command("text-index")
+@click.option("--chunk", default=1000, show_default=True, help="Cases per transaction.")
+def text_index(chunk):
+    """Create the full-text search index and reload pv_case_text from the case JSON."""
+    with db.engine.begin() as conn:
+        kind = ensure_text_index(conn)
+    table   = CaseText.__table__
+    cols    = (Case.id, Case.current_step, Case.status, Case.narrative, Case.events, Case.patient)
+    last_id = ""
+    done    = 0
+    while True:
+        rows = (db.session.query(*cols)
+                .filter(Case.id > last_id)
+                .order_by(Case.id)
+                .limit(chunk)
+                .all())
+        if not rows:
+            break
+        ids = [r.id for r in rows]
+        db.session.execute(table.delete().where(table.c.case_id.in_(ids)))
+        db.session.execute(table.insert(), [{"case_id": r.id, "current_step": r.current_step, "status": r.status,
+                                             **case_text(r)} for r in rows])
+        db.session.commit()
+        db.session.expunge_all()
+        last_id = ids[-1]
+        done   += len(rows)
+        click.echo(f"[SkyVigilance] Case text indexed: {done}", err=True)
+    if kind == "fts5":
+        db.session.execute(text("INSERT INTO pv_case_fts(pv_case_fts) VALUES ('optimize')"))
+        db.session.commit()
+    click.echo(f"[SkyVigilance] Full-text index ({kind or 'in-process only'}) — {done} case(s).")
+
+
+# =========================================================
+# MEDDRA SEARCH INDEX
+# =========================================================
+
+@app.cli.command("meddra-search-index")
+def meddra_search_index():
+    """Create the pg_trgm (PostgreSQL) or FTS5 (SQLite) index used by MEDDRA_SEARCH=db."""
+    with db.engine.begin() as conn:
+        kind = ensure_db_index(conn)
+    click.echo(f"[SkyVigilance] MedDRA search index: {kind or 'not supported — LIKE fallback'}.")
+
+
+# =========================================================
+# MEDDRA AUTO-CODING
+# =========================================================
+
+@app.cli.command("meddra-autocode")
+@click.option("--kind", "kinds", multiple=True, type=click.Choice(CODING_KINDS),
+              help="Verbatim kinds to code (repeatable; default all).")
+@click.option("--apply", is_flag=True, help="Write the codes that clear --min-confidence (default: dry run).")
+@click.option("--min-confidence", default=MIN_CONFIDENCE, show_default=True,
+              help="Auto decisions at or above this are applied; confirmed ones always are.")
+@click.option("--chunk", default=1000, show_default=True, help="Cases per transaction.")
+@click.option("--user", default="autocode", show_default=True, help="performedBy on the audit entries.")
+def meddra_autocode(kinds, apply, min_confidence, chunk, user):
+    """Auto-code the uncoded verbatims of every case and refresh the coding review queue."""
+    started = time.monotonic()
+
+    def progress(stats):
+        click.echo(f"[SkyVigilance] Auto-coding: {stats['cases']} case(s), {stats['uncoded']} uncoded, "
+                   f"{stats['coded']} coded", err=True)
+
+    stats = run_backlog(tuple(kinds or CODING_KINDS), apply, min_confidence, chunk=chunk,
+                        user=user, role="system", progress=progress)
+    click.echo(f"[SkyVigilance] Auto-coding {'applied' if apply else 'dry run'} in "
+               f"{time.monotonic() - started:.1f}s — {stats['verbatims']} distinct verbatim(s), "
+               f"{stats['codable']} of {stats['uncoded']} entries codable at >= {min_confidence}, "
+               f"{stats['coded']} coded, {stats['review']} verbatim(s) left for review.")
+
+
+# =========================================================
+# MEDDRA RELEASE LOAD & SWITCH-OVER
+# =========================================================
+
+@app.cli.command("meddra-load")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--version", "version", help="Defaults to meddra_release.asc.")
+@click.option("--encoding", default="utf-8", show_default=True)
+@click.option("--activate/--no-activate", "switch", default=False, show_default=True,
+              help="Make this release live in the same transaction.")
+def meddra_load(directory, version, encoding, switch):
+    """Bulk-load a MedDRA ASCII release (llt.asc, mdhier.asc, ...) beside the live dictionary."""
+    version = version or release_version(directory, encoding)
+    if not version:
+        raise click.UsageError("No meddra_release.asc in the release — pass --version.")
+    started = time.monotonic()
+    try:
+        with db.engine.begin() as conn:
+            table, n = load_release(conn, MeddraTerm.__table__,
+                                    release_rows(directory, version, encoding), version)
+            parked = activate(conn, version) if switch else None
+    except LoaderError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"[SkyVigilance] MedDRA {version}: {n} LLT(s) loaded into {table} "
+               f"in {time.monotonic() - started:.1f}s.")
+    if switch:
+        click.echo(f"[SkyVigilance] MedDRA {version} is live" + (f"; previous release kept as {parked}." if parked else "."))
+
+
+@app.cli.command("meddra-activate")
+@click.argument("version")
+def meddra_activate(version):
+    """Atomically switch meddra_terms to a loaded release (the current one is kept beside it)."""
+    try:
+        with db.engine.begin() as conn:
+            parked = activate(conn, version)
+    except LoaderError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"[SkyVigilance] MedDRA {version} is live" + (f"; previous release kept as {parked}." if parked else "."))
+
+
+@app.cli.command("meddra-versions")
+def meddra_versions():
+    """List the live and side-loaded MedDRA releases."""
+    with db.engine.connect() as conn:
+        for table, version, count, live in versions(conn):
+            click.echo(f"{'*' if live else ' '} {version or '-':8} {count:>8}  {table}")
+
+
+# =========================================================
+# MEDDRA VERSION UPGRADE — impact report & bulk recode
+# =========================================================
+
+@app.cli.command("meddra-impact")
+@click.option("--from", "from_version", required=True, help="The release the cases are coded against.")
+@click.option("--to", "to_version", required=True, help="The release to upgrade to (live or side-loaded).")
+@click.option("--kind", "kinds", multiple=True, type=click.Choice(CODING_KINDS), help="Repeatable; default all.")
+@click.option("--chunk", default=RECODE_CHUNK, show_default=True, help="Cases per scan query.")
+@click.option("--out", type=click.File("w"), default="-", help="JSON report (default stdout).")
+def meddra_impact(from_version, to_version, kinds, chunk, out):
+    """Report the coded case entries a MedDRA release changes, with proposed recodes."""
+    def progress(n):
+        if n % (chunk * 25) == 0:
+            click.echo(f"[SkyVigilance] Impact scan: {n} case(s)", err=True)
+
+    try:
+        report = impact(from_version, to_version, tuple(kinds or CODING_KINDS), chunk, progress)
+    except RecodeError as e:
+        raise click.ClickException(str(e))
+    json.dump(report, out, indent=1)
+    out.write("\n")
+    click.echo(f"[SkyVigilance] MedDRA {from_version} -> {to_version}: {report['diff']} — "
+               f"{report['scanned']} case(s) scanned in {report['seconds']}s, {report['impactedCases']} "
+               f"impacted, {report['entries']} entries in {len(report['groups'])} group(s).", err=True)
+
+
+@app.cli.command("meddra-recode")
+@click.option("--from", "from_version", required=True)
+@click.option("--to", "to_version", required=True)
+@click.option("--approve", type=click.File("r"),
+              help='JSON list of {kind?, lltCode, toLltCode?}, or a meddra-impact report with "approved": true groups.')
+@click.option("--action", "actions", multiple=True, type=click.Choice(["update", "recode"]),
+              help="Approve every proposal of this action (repeatable).")
+@click.option("--kind", "kinds", multiple=True, type=click.Choice(CODING_KINDS), help="Repeatable; default all.")
+@click.option("--chunk", default=RECODE_CHUNK, show_default=True, help="Cases per scan query.")
+@click.option("--user", default="recode", show_default=True, help="performedBy on the audit entries.")
+def meddra_recode(from_version, to_version, approve, actions, kinds, chunk, user):
+    """Apply approved MedDRA upgrade recodes to the cases, with audit entries."""
+    started = time.monotonic()
+
+    def progress(stats):
+        if stats["scanned"] % (chunk * 25) == 0:
+            click.echo(f"[SkyVigilance] Recode: {stats['scanned']} scanned, {stats['cases']} case(s) recoded", err=True)
+
+    try:
+        approvals = approvals_from(json.load(approve)) if approve else []
+        if not approvals and not actions:
+            raise click.UsageError("Pass --approve and/or --action.")
+        stats = recode(from_version, to_version, approvals, actions, tuple(kinds or CODING_KINDS), chunk,
+                       user=user, progress=progress)
+    except RecodeError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"[SkyVigilance] MedDRA {from_version} -> {to_version}: {stats['entries']} entries in "
+               f"{stats['cases']} case(s) recoded ({stats['scanned']} scanned) in "
+               f"{time.monotonic() - started:.1f}s.")
+
+
+# =========================================================
+# E2B(R3) BATCH EXPORT
+# =========================================================
+
+@app.cli.command("e2b-batch")
+@click.option("--out", type=click.File("wb"), default="-", help="Output file (default stdout).")
+@click.option("--gzip", "compress", is_flag=True, help="Gzip-compress the batch.")
+@click.option("--ids", help="Comma-separated case ids.")
+@_case_filters
+@click.option("--batch-id")
+@click.option("--user", default="system", show_default=True, help="Recorded in the audit trail.")
+@click.option("--workers", default=os.cpu_count() or 1, show_default=True, help="Rendering processes.")
+def e2b_batch(out, compress, ids, batch_id, user, workers, **filters):
+    """Write one ICH ICSR batch message (MCCI_IN200100UV01) for many cases (step 3+), streamed."""
+    try:
+        cases = batch_cases(_filter_args(**filters),
+                            [i.strip() for i in (ids or "").split(",") if i.strip()])
+    except BatchError as e:
+        raise click.UsageError(f"{e} {', '.join(e.ids)}")
+    except (ListingError, ValueError) as e:
+        raise click.UsageError(str(e))
+    batch_id = batch_id or f"BATCH-{ts_now()}"
+
+    def audit(case):
+        log_event(case.id, "E2B_EXPORTED", user, "system", section="e2b", details=f"Batch {batch_id}")
+
+    started = time.monotonic()
+    n = write_batch(out, cases, batch_id, compress, audit, workers, xml_cache)
+    db.session.commit()
+    elapsed = time.monotonic() - started
+    click.echo(f"[SkyVigilance] {batch_id}: {n} case(s) in {elapsed:.1f}s "
+               f"({n / elapsed if elapsed else 0:.0f} cases/s).", err=True)
+
+
+# =========================================================
+# BULK CASE IMPORT
+# =========================================================
+
+@app.cli.command("case-import")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option("--format", "fmt", type=click.Choice(IMPORT_FORMATS), help="Sniffed from the content by default.")
+@click.option("--chunk", default=CHUNK, show_default=True, help="Cases per transaction.")
+@click.option("--user", default="import", show_default=True, help="performed_by for the audit trail.")
+@click.option("--results", type=click.File("w"), help="Write one NDJSON line per record (errors included).")
+def case_import(path, fmt, chunk, user, results):
+    """Import cases from an E2B(R3) batch XML or a line listing CSV (optionally gzipped)."""
+    started = time.monotonic()
+    with click.open_file(path, "rb") as f:
+        try:
+            fmt, records = open_upload(f, fmt)
+        except IngestError as e:
+            raise click.UsageError(str(e))
+        on_result = (lambda r: results.write(json.dumps(r) + "\n")) if results else None
+        report = ingest(records, user, "system", os.path.basename(path), chunk, on_result)
+    elapsed = time.monotonic() - started
+    for err in report["errors"][:20]:
+        click.echo(f"    record {err['record']} ({err['caseId'] or '-'}): {err['error']}", err=True)
+    click.echo(f"[SkyVigilance] {fmt}: {report['received']} record(s), {report['created']} created, "
+               f"{report['failed']} failed in {elapsed:.1f}s "
+               f"({report['created'] / elapsed * 60 if elapsed else 0:,.0f} cases/min).", err=True)
+
+
+# =========================================================
+# LINE LISTING
+# =========================================================
+
+@app.cli.command("line-listing")
+@click.option("--out", type=click.File("wb"), default="-", help="Output file (default stdout).")
+@click.option("--format", "fmt", type=click.Choice(list(ENCODERS)), default="csv", show_default=True)
+@click.option("--flatten", type=click.Choice(FLATTEN), default="first", show_default=True,
+              help="first product/event, all joined per cell, or one row per product x event.")
+@click.option("--sort", help="A /api/cases sort key, e.g. receiptDate or -updatedAt (default case number).")
+@_case_filters
+def line_listing(out, fmt, flatten, sort, **filters):
+    """Write the ICSR line listing (the columns of the UI export) as CSV or XLSX, streamed."""
+    args = _filter_args(**filters)
+    if sort:
+        args["sort"] = sort
+    encode, _ = ENCODERS[fmt]
+    started = time.monotonic()
+    try:
+        for chunk in encode(listing_rows(args, flatten)):
+            out.write(chunk)
+    except (ListingError, ValueError) as e:
+        raise click.UsageError(str(e))
+    click.echo(f"[SkyVigilance] Line listing written in {time.monotonic() - started:.1f}s.", err=True)
+
+
+# =========================================================
+# AUDIT TRAIL EXPORT
+# =========================================================
+
+@app.cli.command("audit-export")
+@click.option("--out", type=click.File("wb"), default="-", help="Output file (default stdout).")
+@click.option("--case", "case_id", help="Comma-separated case ids.")
+@click.option("--user", help="Comma-separated performedBy values.")
+@click.option("--role", help="Comma-separated roles.")
+@click.option("--action", help="Comma-separated action types, e.g. CASE_UPDATED,E2B_EXPORTED.")
+@click.option("--section")
+@click.option("--from", "from_", help="ISO date or datetime (inclusive).")
+@click.option("--to", help="ISO date or datetime (a bare date includes the whole day).")
+@click.option("--order", type=click.Choice(["asc", "desc"]), default="asc", show_default=True)
+def audit_export(out, case_id, user, role, action, section, from_, to, order):
+    """Write the audit trail (filtered, in timestamp order) as CSV for an inspection, streamed."""
+    args = {"caseId": case_id, "user": user, "role": role, "action": action, "section": section,
+            "from": from_, "to": to, "order": order}
+    started = time.monotonic()
+    try:
+        for chunk in audit_csv(audit_rows({k: v for k, v in args.items() if v})):
+            out.write(chunk)
+    except (AuditQueryError, ValueError) as e:
+        raise click.UsageError(str(e))
+    click.echo(f"[SkyVigilance] Audit trail written in {time.monotonic() - started:.1f}s.", err=True)
+
+
+# =========================================================
+# SIGNAL COUNTS
+# =========================================================
+
+@app.cli.command("signal-reconcile")
+@click.option("--fix", is_flag=True, help="Rewrite the rows that differ from the recompute.")
+@click.option("--show", default=10, show_default=True, help="Differences to print per level.")
+def signal_reconcile(fix, show):
+    """Check pv_signal_count against a full recompute from the case JSON (also the backfill)."""
+    c = SignalCount.__table__.c
+    soc_of = soc_map(db.session.connection())
+    clean  = True
+    for level in SIGNAL_LEVELS:
+        started  = time.monotonic()
+        expected = recompute_signal_counts(level, soc_of)
+        stored   = {(dk, ek): n for dk, ek, n in db.session.execute(
+            db.select(c.drug_key, c.event_key, c.n).where(c.level == level))}
+        delta = [(level, *k, *expected[k][:2], expected[k][2] - stored.get(k, 0))
+                 for k in expected if expected[k][2] != stored.get(k, 0)]
+        delta += [(level, *k, "", "", -n) for k, n in stored.items() if k not in expected]
+        click.echo(f"[SkyVigilance] {level}: {len(expected)} row(s) recomputed, {len(stored)} stored, "
+                   f"{len(delta)} differ ({time.monotonic() - started:.1f}s).")
+        for _, dk, ek, _, _, d in delta[:show]:
+            click.echo(f"    {dk or '*'} x {ek or '*'}: {d:+d}")
+        if delta and fix:
+            bump_signal_counts(db.session.connection(), delta)
+            db.session.commit()
+            click.echo(f"[SkyVigilance] {level}: {len(delta)} row(s) fixed.")
+        clean = clean and not delta
+        db.session.expunge_all()
+    if not clean and not fix:
+        raise SystemExit(1)
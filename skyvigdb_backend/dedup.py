@@ -0,0 +1,445 @@
+# =========================================================
+# DUPLICATE CANDIDATE INDEX
+# ---------------------------------------------------------
+# Blocking keys narrow the pool before fuzzy scoring. A case
+# is only scored when it shares at least one key pair with the
+# incoming report: drug and event, or the patient (initials
+# plus country) with either. Drug keys are 4-char token stems
+# read from the first and from the second letter, so a misspelt
+# first letter, or any past the stem, still collides.
+# =========================================================
+
+import csv
+import json
+import multiprocessing
+import re
+import threading
+import time
+from datetime import date
+from types import SimpleNamespace
+
+from lazy import LazyModule, available
+from metrics import DEDUP_SCORED, DEDUP_SECONDS
+from streaming import windows
+
+np          = LazyModule("numpy")
+_process    = LazyModule("rapidfuzz.process")     # imported on the first score
+_indel      = LazyModule("rapidfuzz.distance.Indel")
+_fuzz       = LazyModule("fuzzywuzzy.fuzz")       # fallback when rapidfuzz is missing
+
+RAPIDFUZZ_AVAILABLE = available("rapidfuzz") and available("numpy")
+FUZZ_AVAILABLE      = RAPIDFUZZ_AVAILABLE or available("fuzzywuzzy")
+
+WEIGHTS = {"drug": 0.35, "event": 0.35, "initials": 0.20, "country": 0.10}
+
+_TOKEN_RE   = re.compile(r"[a-z0-9]+")
+_STOPWORDS  = {
+    "mg", "mcg", "ug", "g", "ml", "iu", "tab", "tabs", "tablet", "tablets",
+    "cap", "caps", "capsule", "capsules", "inj", "injection", "oral", "solution",
+    "syrup", "cream", "gel", "and", "with", "the", "of",
+}
+PREFIX_LEN = 4
+BATCH_MIN  = 32       # below this many candidates, per-pair calls beat cdist's fixed cost
+
+_NON_WORD_RE  = re.compile(r"\W")
+_LATIN1_HIGH  = dict.fromkeys(range(128, 256))      # what fuzzywuzzy's force_ascii drops
+
+
+def _tokens(text):
+    return [t for t in _TOKEN_RE.findall((text or "").lower())
+            if len(t) >= 3 and not t.isdigit() and t not in _STOPWORDS]
+
+
+def _drug_keys(text):
+    # each stem and the stem one letter in, so a misspelt first
+    # letter ("Setirizine" / "Cetirizine") still shares a key
+    return {k for t in _tokens(text)
+            for k in ((t[:PREFIX_LEN], t[1:PREFIX_LEN + 1]) if len(t) > PREFIX_LEN else (t,))}
+
+
+def _event_keys(term, pt, pt_code):
+    # whole-phrase keys plus the stem of the most specific word;
+    # generic qualifiers ("acute", "severe") would make huge blocks
+    keys = set()
+    for text in (term, pt):
+        toks = _tokens(text)
+        if toks:
+            keys.add(" ".join(sorted(toks)))
+            keys.add(max(toks, key=len)[:PREFIX_LEN + 2])
+    if pt_code:
+        keys.add("#" + pt_code)
+    return keys
+
+
+def _onset_ordinal(iso_date):
+    try:
+        return date.fromisoformat((iso_date or "")[:10]).toordinal()
+    except ValueError:
+        return None
+
+
+# ---------------------------------------------------------
+# Field extraction — mirrors what _fuzzy_score reads
+# ---------------------------------------------------------
+
+def case_fields(case):
+    tr    = case.triage   or {}
+    prods = case.products or [{}]
+    evts  = case.events   or [{}]
+    prod  = (prods[0] if prods else {}) or {}
+    evt   = (evts[0]  if evts  else {}) or {}
+    return {
+        "initials": (tr.get("patientInitials") or "").upper(),
+        "drug":     (prod.get("name")  or "").lower(),
+        "event":    (evt.get("term")   or "").lower(),
+        "pt":       (evt.get("pt")     or "").lower(),
+        "pt_code":  str(evt.get("pt_code") or ""),
+        "country":  tr.get("country") or "",
+        "onset":    _onset_ordinal(evt.get("onsetDate")),
+    }
+
+
+def summary_fields(s):
+    # same shape as case_fields, read from a pv_case_summary row
+    return {
+        "initials": (s.patient_initials or "").upper(),
+        "drug":     (s.first_drug       or "").lower(),
+        "event":    (s.first_event_term or "").lower(),
+        "pt":       (s.first_pt         or "").lower(),
+        "pt_code":  s.first_pt_code or "",
+        "country":  s.country or "",
+        "onset":    s.onset_date.toordinal() if s.onset_date else None,
+    }
+
+
+def incoming_fields(incoming):
+    return {
+        "initials": (incoming.get("patientInitials") or "").upper(),
+        "drug":     (incoming.get("drugName")  or "").lower(),
+        "event":    (incoming.get("eventTerm") or "").lower(),
+        "pt":       (incoming.get("eventPt")   or "").lower(),
+        "pt_code":  str(incoming.get("eventPtCode") or ""),
+        "country":  incoming.get("country") or "",
+        "onset":    _onset_ordinal(incoming.get("onsetDate")),
+    }
+
+
+# ---------------------------------------------------------
+# Scoring — fields are prepared once per case (token-sorted
+# drug and event, raw PT and initials), then one query is
+# scored against all its candidates with a single cdist per
+# field (small candidate sets go pair by pair). Ratios are
+# rounded as fuzzywuzzy rounds them, so the weighted scores
+# are identical to the pairwise token_sort_ratio / ratio
+# formulation.
+# ---------------------------------------------------------
+
+def _token_sort_key(text):
+    # fuzzywuzzy's full_process(force_ascii=True) + sorted tokens
+    text = _NON_WORD_RE.sub(" ", text.translate(_LATIN1_HIGH)).lower()
+    return " ".join(sorted(text.split()))
+
+
+def prepare(fields):
+    # -> (drug, event, pt, initials, country); None where the field is empty
+    return (
+        _token_sort_key(fields["drug"])  if fields["drug"]  else None,
+        _token_sort_key(fields["event"]) if fields["event"] else None,
+        fields["pt"]       or None,
+        fields["initials"] or None,
+        fields["country"]  or None,
+    )
+
+
+def _ratio(a, b):
+    # fuzzywuzzy's ratio: 0-100, rounded half to even by its intr()
+    if a is None or b is None:
+        return 0
+    if not RAPIDFUZZ_AVAILABLE:
+        return _fuzz.ratio(a, b)
+    return round(100 * _indel.normalized_similarity(a, b))
+
+
+def _ratios(query, column):
+    # _ratio of query against a whole column in one call. cdist scores a
+    # None choice 0 and "" against "" 100, as _ratio does
+    if query is None:
+        return np.zeros(len(column))
+    sims = _process.cdist([query], column, scorer=_indel.normalized_similarity, dtype=np.float64)[0]
+    return np.rint(100 * sims)
+
+
+def _score_pair(q, c):
+    drug_score  = _ratio(q[0], c[0])
+    event_score = max(_ratio(q[1], c[1]), _ratio(q[2], c[2]))
+    if drug_score == 0 or event_score == 0:
+        return 0.0
+    return (
+        drug_score                              * WEIGHTS["drug"] +
+        event_score                             * WEIGHTS["event"] +
+        _ratio(q[3], c[3])                      * WEIGHTS["initials"] +
+        (100 if q[4] and q[4] == c[4] else 0)   * WEIGHTS["country"]
+    )
+
+
+def score_many(query, candidates):
+    # prepared query against a list of prepared candidates -> one score each
+    if not FUZZ_AVAILABLE:
+        return [0.0] * len(candidates)
+    path   = "pair" if not RAPIDFUZZ_AVAILABLE or len(candidates) < BATCH_MIN else "batch"
+    t0     = time.perf_counter()
+    scores = [_score_pair(query, c) for c in candidates] if path == "pair" else _score_batch(query, candidates)
+    DEDUP_SECONDS.observe(time.perf_counter() - t0, path)
+    DEDUP_SCORED.inc(path, amount=len(candidates))
+    return scores
+
+
+def _score_batch(query, candidates):
+    drugs, events, pts, initials, countries = zip(*candidates)
+
+    drug_score    = _ratios(query[0], drugs)
+    event_score   = np.maximum(_ratios(query[1], events), _ratios(query[2], pts))
+    init_score    = _ratios(query[3], initials)
+    country_score = np.fromiter((c == query[4] for c in countries), float, len(countries)) * 100 \
+        if query[4] else np.zeros(len(countries))
+
+    score = (
+        drug_score    * WEIGHTS["drug"] +
+        event_score   * WEIGHTS["event"] +
+        init_score    * WEIGHTS["initials"] +
+        country_score * WEIGHTS["country"]
+    )
+    score[(drug_score == 0) | (event_score == 0)] = 0.0
+    return score
+
+
+def score_fields(a, b):
+    return float(score_many(prepare(a), [prepare(b)])[0])
+
+
+def blocking_keys(fields):
+    # (drug key, event key) pairs, and the patient (initials plus
+    # country) paired with each: a case matching on the patient
+    # reaches the threshold on either the drug or the event alone
+    drug_keys  = _drug_keys(fields["drug"])
+    event_keys = _event_keys(fields["event"], fields["pt"], fields.get("pt_code"))
+    keys       = {(dk, ek) for dk in drug_keys for ek in event_keys}
+    if fields["initials"] and fields["country"]:
+        patient = f"@{fields['initials']}:{fields['country']}"
+        keys   |= {(patient, k) for k in drug_keys | event_keys}
+    return keys
+
+
+def band(score):
+    if score >= 85:
+        return "High"
+    if score >= 70:
+        return "Medium"
+    return "Low"
+
+
+# ---------------------------------------------------------
+# In-process inverted index
+# ---------------------------------------------------------
+
+class DuplicateIndex:
+
+    def __init__(self):
+        self._lock      = threading.RLock()
+        self._postings  = {}      # (drug key, event key) -> set(case_id)
+        self._fields    = {}      # case_id -> fields dict
+        self._prepared  = {}      # case_id -> prepare(fields)
+        self.watermark  = None    # newest updated_at seen
+        self.built      = False
+
+    def __len__(self):
+        return len(self._fields)
+
+    def upsert(self, case_id, fields, updated_at=None):
+        keys     = blocking_keys(fields)
+        prepared = prepare(fields)
+        with self._lock:
+            self._drop(case_id)
+            self._fields[case_id]   = fields
+            self._prepared[case_id] = prepared
+            for k in keys:
+                self._postings.setdefault(k, set()).add(case_id)
+            if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+                self.watermark = updated_at
+
+    def upsert_case(self, case):
+        self.upsert(case.id, case_fields(case), getattr(case, "updated_at", None))
+
+    def remove(self, case_id):
+        with self._lock:
+            self._drop(case_id)
+
+    def _drop(self, case_id):
+        # the keys are re-derived from the stored fields rather than
+        # kept per case: a key set per case doubles the index's size
+        fields = self._fields.pop(case_id, None)
+        if fields is None:
+            return
+        for k in blocking_keys(fields):
+            ids = self._postings.get(k)
+            if ids is not None:
+                ids.discard(case_id)
+                if not ids:
+                    del self._postings[k]
+        self._prepared.pop(case_id, None)
+
+    def _candidate_ids(self, fields, country=None, onset_window_days=None):
+        ids = set()
+        for k in blocking_keys(fields):
+            ids |= self._postings.get(k, set())
+        if country:
+            ids = {i for i in ids if self._fields[i]["country"] == country}
+        if onset_window_days is not None and fields.get("onset") is not None:
+            lo = fields["onset"] - onset_window_days
+            hi = fields["onset"] + onset_window_days
+            ids = {i for i in ids
+                   if self._fields[i]["onset"] is None or lo <= self._fields[i]["onset"] <= hi}
+        return ids
+
+    def candidates(self, fields, country=None, onset_window_days=None):
+        with self._lock:
+            return [(i, self._fields[i]) for i in self._candidate_ids(fields, country, onset_window_days)]
+
+    def prepared_candidates(self, fields, country=None, onset_window_days=None):
+        # -> ([case_id], [prepared]) in matching order, for score_many
+        with self._lock:
+            ids = list(self._candidate_ids(fields, country, onset_window_days))
+            return ids, [self._prepared[i] for i in ids]
+
+    def items(self):
+        with self._lock:
+            return sorted(self._fields.items())
+
+    def search(self, incoming, threshold=80.0, limit=10, country=None, onset_window_days=None):
+        return self.search_fields(incoming_fields(incoming), threshold, limit, country, onset_window_days)
+
+    def search_fields(self, fields, threshold=80.0, limit=10, country=None, onset_window_days=None):
+        ids, preps = self.prepared_candidates(fields, country, onset_window_days)
+        scores = score_many(prepare(fields), preps)
+        scored = [(round(float(s), 1), i) for i, s in zip(ids, scores) if s >= threshold]
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return scored[:limit] if limit else scored
+
+
+def brute_force_search(incoming, cases, threshold=80.0, limit=10):
+    scores = score_many(prepare(incoming_fields(incoming)), [prepare(case_fields(c)) for c in cases])
+    scored = [(round(float(s), 1), c.id) for c, s in zip(cases, scores) if s >= threshold]
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return scored[:limit]
+
+
+# ---------------------------------------------------------
+# Batch input — CSV / JSON / NDJSON line listings
+# ---------------------------------------------------------
+
+FORMATS = ("csv", "json", "ndjson")
+
+
+def detect_format(name_or_mimetype):
+    v = (name_or_mimetype or "").lower()
+    if "ndjson" in v or "jsonl" in v or "json-seq" in v:
+        return "ndjson"
+    if "csv" in v:
+        return "csv"
+    if "json" in v:
+        return "json"
+    return None
+
+
+def read_records(stream, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(stream)
+    elif fmt == "ndjson":
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    elif fmt == "json":
+        data = json.load(stream)
+        yield from (data.get("records", []) if isinstance(data, dict) else data)
+    else:
+        raise ValueError(f"Unsupported format '{fmt}' — use one of {', '.join(FORMATS)}.")
+
+
+def record_fields(record):
+    # accepts either the duplicate-check payload or case-shaped JSON
+    if any(k in record for k in ("triage", "products", "events")):
+        return case_fields(SimpleNamespace(triage=record.get("triage"),
+                                           products=record.get("products"),
+                                           events=record.get("events")))
+    return incoming_fields(record)
+
+
+def record_ref(record, n):
+    return str(record.get("id") or record.get("caseNumber") or record.get("ref") or f"#{n}")
+
+
+# ---------------------------------------------------------
+# Pair scanning — in-process or fanned out to a fork pool
+# ---------------------------------------------------------
+
+_pool_index = None         # set in each pool child only, by _init_pool
+
+
+def _score_chunk(index, job):
+    items, threshold, self_join = job
+    out = []
+    for ref, fields in items:
+        ids, preps = index.prepared_candidates(fields)
+        if self_join:
+            keep  = [n for n, cid in enumerate(ids) if cid > ref]
+            ids   = [ids[n] for n in keep]
+            preps = [preps[n] for n in keep]
+        for cid, s in zip(ids, score_many(prepare(fields), preps)):
+            if s >= threshold:
+                out.append((ref, cid, round(float(s), 1)))
+    return out
+
+
+def _init_pool(index):
+    global _pool_index
+    _pool_index = index
+
+
+def _pool_chunk(job):
+    return _score_chunk(_pool_index, job)
+
+
+def scan_pairs(index, items, threshold=80.0, workers=1, chunk_size=500, self_join=False):
+    # the index travels with the scan, never through a shared global;
+    # forked children get it as initializer args, which fork inherits
+    # copy-on-write rather than pickles. Results stream back chunk by chunk
+    jobs = ((chunk, threshold, self_join) for chunk in windows(items, chunk_size))
+    if workers <= 1:
+        for job in jobs:
+            yield from _score_chunk(index, job)
+        return
+    with multiprocessing.get_context("fork").Pool(workers, initializer=_init_pool, initargs=(index,)) as pool:
+        for pairs in pool.imap_unordered(_pool_chunk, jobs):
+            yield from pairs
+
+
+def _pair(left, right, score, match):
+    return {"left": left, "right": right, "score": score, "band": band(score), "match": match}
+
+
+def batch_pairs(index, records, threshold=80.0, workers=1, within_batch=True):
+    items = [(record_ref(r, n), record_fields(r)) for n, r in enumerate(records, 1)]
+    for left, right, score in scan_pairs(index, items, threshold, workers):
+        yield _pair(left, right, score, "case")
+    if within_batch:
+        batch = DuplicateIndex()
+        for ref, fields in items:
+            batch.upsert(ref, fields)
+        for left, right, score in scan_pairs(batch, batch.items(), threshold, workers, self_join=True):
+            yield _pair(left, right, score, "batch")
+
+
+def self_join_pairs(index, threshold=80.0, workers=1):
+    for left, right, score in scan_pairs(index, index.items(), threshold, workers, self_join=True):
+        yield _pair(left, right, score, "case")
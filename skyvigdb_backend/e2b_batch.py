@@ -0,0 +1,232 @@
+# =========================================================
+# E2B(R3) BATCH EXPORT
+# ---------------------------------------------------------
+# Many cases in one ICH ICSR batch message. The
+# MCCI_IN200100UV01 wrapper is written incrementally with
+# etree.xmlfile and each case contributes the
+# PORR_IN049016UV element build_e2b_xml produces, so memory
+# holds one case at a time whatever the batch size.
+#
+# Case bodies can be rendered in a forked process pool and
+# are cached per (case id, updated_at): a re-export of an
+# unchanged case only has its creationTime restamped.
+# =========================================================
+
+import gzip
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app import E, HL7, NSMAP, OID, Case, etree, ts_now
+from listing import apply_filters, base_query, parse_args
+from metrics import E2B_SECONDS
+from streaming import ChunkBuffer, fork_pool, plain, pool_map, windows
+
+E2B_MIN_STEP = 3            # E2B is available from Medical Review onward
+PORR         = f"{{{HL7}}}PORR_IN049016UV"
+CREATION     = f"{{{HL7}}}creationTime"
+
+
+def porr_of(doc):
+    # build_e2b_xml output (bytes, tree or element) -> its PORR_IN049016UV
+    if isinstance(doc, str):
+        doc = doc.encode("utf-8")
+    if isinstance(doc, bytes):
+        doc = etree.fromstring(doc)
+    if hasattr(doc, "getroot"):
+        doc = doc.getroot()
+    return doc if doc.tag == PORR else doc.find(PORR)
+
+
+class BatchError(ValueError):
+    status = 422            # requested cases that cannot go in the batch
+
+    def __init__(self, message, ids):
+        super().__init__(message)
+        self.ids = ids
+
+
+def ineligible(ids, min_step=E2B_MIN_STEP):
+    # the requested ids that do not exist or are before min_step
+    steps = dict(Case.query.with_entities(Case.id, Case.current_step).filter(Case.id.in_(ids)))
+    return [i for i in dict.fromkeys(ids)
+            if i not in steps or (min_step and (steps[i] or 0) < min_step)]
+
+
+def batch_cases(args, ids=None, min_step=E2B_MIN_STEP):
+    # the /api/cases listing filters, restricted to cases from
+    # min_step on (None: any step; the forms batch). Explicit ids
+    # are taken as asked: one that is missing or before min_step
+    # fails the request with the ids rather than silently dropping
+    # out of the batch
+    q = apply_filters(base_query(Case), parse_args(args))
+    if ids:
+        bad = ineligible(ids, min_step)
+        if bad:
+            where = f" or before step {min_step}" if min_step else ""
+            raise BatchError(f"{len(bad)} requested case(s) missing{where}.", bad)
+        q = q.filter(Case.id.in_(ids))
+    elif min_step:
+        q = q.filter(Case.current_step >= min_step)
+    return q.order_by(Case.id).yield_per(200)
+
+
+# ---------------------------------------------------------
+# Per-case rendering — serial, pooled and cached
+# ---------------------------------------------------------
+
+class XmlCache:
+    # serialized PORR per (case id, updated_at), LRU within a byte budget
+
+    def __init__(self, max_bytes):
+        self._lock     = threading.Lock()
+        self._items    = OrderedDict()
+        self.max_bytes = max_bytes
+        self.size      = 0
+        self.hits      = 0
+        self.misses    = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, stamp, xml):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self._items[key] = (stamp, xml)
+            self.size += len(xml)
+            while self.size > self.max_bytes and self._items:
+                _, (_, dropped) = self._items.popitem(last=False)
+                self.size -= len(dropped)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.size = 0
+
+
+xml_cache = XmlCache(int(os.getenv("E2B_CACHE_MB", "256")) * 1024 * 1024)
+
+
+def _render_timed(case):
+    # -> ((creationTime stamp, serialized PORR_IN049016UV), build s, serialize s);
+    # pool children return their timings for the parent to record
+    from app import build_e2b_xml
+    t0   = time.perf_counter()
+    porr = porr_of(build_e2b_xml(case))
+    t1   = time.perf_counter()
+    xml  = etree.tostring(porr, encoding="UTF-8")
+    return (porr.find(CREATION).get("value"), xml), t1 - t0, time.perf_counter() - t1
+
+
+def _record(timed):
+    hit, build, serialize = timed
+    E2B_SECONDS.observe(build, "build")
+    E2B_SECONDS.observe(serialize, "serialize")
+    return hit
+
+
+def render_porr(case):
+    # -> (creationTime stamp, serialized PORR_IN049016UV)
+    return _record(_render_timed(case))
+
+
+def restamp(xml, stamp, now):
+    if stamp == now:
+        return xml
+    return xml.replace(f'value="{stamp}"'.encode(), f'value="{now}"'.encode())
+
+
+def _cache_key(case):
+    return (case.id, case.updated_at) if getattr(case, "updated_at", None) else None
+
+
+def render_porrs(cases, workers=1, cache=None, window=64):
+    # yields (case, stamp, xml) in input order; only cache misses are
+    # rendered, in forked children when workers > 1
+    with fork_pool(workers) as pool:
+        for batch in windows(cases, window * max(1, workers)):
+            hits   = [cache.get(k) if cache is not None and k else None
+                      for k in map(_cache_key, batch)]
+            missed = [c for c, h in zip(batch, hits) if h is None]
+            jobs   = [plain(c, Case.__table__) for c in missed] if pool is not None else missed
+            fresh  = pool_map(pool, _render_timed, _record, jobs, chunksize=8)
+            for case, hit in zip(batch, hits):
+                if hit is None:
+                    hit = next(fresh)
+                    key = _cache_key(case)
+                    if cache is not None and key:
+                        cache.put(key, *hit)
+                yield case, hit[0], hit[1]
+
+
+# ---------------------------------------------------------
+# Writer — yields each case once its PORR has been written
+# ---------------------------------------------------------
+
+def _write(out, cases, batch_id, now, workers=1, cache=None):
+    with etree.xmlfile(out, encoding="UTF-8") as xf:
+        xf.write_declaration()
+        with xf.element(f"{{{HL7}}}MCCI_IN200100UV01", {"ITSVersion": "XML_1.0"}, nsmap=NSMAP):
+            xf.write(E("id",               {"root": OID["batch_id"], "extension": batch_id}))
+            xf.write(E("creationTime",     {"value": now}))
+            xf.write(E("responseModeCode", {"code": "D"}))
+            xf.write(E("interactionId",    {"root": OID["hl7_interaction"], "extension": "MCCI_IN200100UV01"}))
+            xf.write(E("name",             {"code": "1", "codeSystem": OID["cs_msg_type"],
+                                            "codeSystemVersion": "2.0", "displayName": "ICHICSR"}))
+            for case, stamp, xml in render_porrs(cases, workers, cache):
+                xf.flush()
+                out.write(restamp(xml, stamp, now))
+                yield case
+
+            rcv = E("receiver", {"typeCode": "RCV"})
+            E("id", {"root": OID["batch_receiver"], "extension": "EVTEST"},
+              parent=E("device", {"classCode": "DEV", "determinerCode": "INSTANCE"}, parent=rcv))
+            snd = E("sender", {"typeCode": "SND"})
+            E("id", {"root": OID["batch_sender"], "extension": "SKYVIGILANCE"},
+              parent=E("device", {"classCode": "DEV", "determinerCode": "INSTANCE"}, parent=snd))
+            xf.write(rcv)
+            xf.write(snd)
+
+
+def write_batch(out, cases, batch_id=None, compress=False, on_case=None, workers=1, cache=None):
+    now      = ts_now()
+    batch_id = batch_id or f"BATCH-{now}"
+    sink     = gzip.GzipFile(fileobj=out, mode="wb") if compress else out
+    n = 0
+    for case in _write(sink, cases, batch_id, now, workers, cache):
+        n += 1
+        if on_case:
+            on_case(case)
+    if compress:
+        sink.close()
+    return n
+
+
+def stream_batch(cases, batch_id=None, compress=False, on_case=None, workers=1, cache=None):
+    # bytes chunks for a streamed HTTP response
+    now      = ts_now()
+    batch_id = batch_id or f"BATCH-{now}"
+    buf      = ChunkBuffer()
+    sink     = gzip.GzipFile(fileobj=buf, mode="wb") if compress else buf
+    for case in _write(sink, cases, batch_id, now, workers, cache):
+        if on_case:
+            on_case(case)
+        chunk = buf.take()
+        if chunk:
+            yield chunk
+    if compress:
+        sink.close()
+    yield buf.take()
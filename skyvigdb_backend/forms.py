@@ -0,0 +1,708 @@
+# =========================================================
+# CIOMS I AND MEDWATCH 3500A FORMS — PDF rendering
+# ---------------------------------------------------------
+# The PDFs are written directly (PDF 1.4, the base-14
+# Helvetica fonts, WinAnsi text), so no PDF library is
+# needed. Each form is a fixed layout, like the paper form:
+# everything that does not depend on the case — bars, boxes,
+# labels, check box captions, footer — is compiled once per
+# process into a deflated content stream that every page
+# reuses, and a case only adds a second stream with its
+# values and ticks. Text that does not fit its box goes on
+# continuation sheets after the form page.
+#
+# Check boxes and product roles use the E2B builder's code
+# lists (OUTCOMES, SERIOUS_CODES, ACTION_TAKEN, DECHALLENGE,
+# RECHALLENGE, DRUG_CHAR, SEX_CODES), so a form and the
+# E2B(R3) export of a case agree.
+#
+# Batches render in a forked pool, like the E2B batch, and
+# stream as a ZIP with one PDF per case and form.
+# =========================================================
+
+import time
+import zipfile
+import zlib
+from datetime import date
+
+from app import (ACTION_TAKEN, COUNTRY_CODES, DECHALLENGE, DRUG_CHAR, RECHALLENGE, SERIOUS_CODES,
+                 SEX_CODES, Case)
+from metrics import FORM_SECONDS
+from streaming import ChunkBuffer, fork_pool, plain, pool_map, windows
+from summary import serious_flags
+
+PW, PH, M = 210, 297, 10          # A4, mm
+CW        = PW - 2 * M
+_K        = 72 / 25.4             # points per mm
+LEAD      = 3.4                   # 8 pt field text, mm per line
+FOOTER_Y  = PH - 5
+BOTTOM    = PH - 12               # continuation text stops here
+
+# ---------------------------------------------------------
+# Fonts — Helvetica metrics (Adobe AFM), per cp1252 byte
+# ---------------------------------------------------------
+
+_HELV = ([278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278] + [556] * 10 +
+         [278, 278, 584, 584, 584, 556, 1015] +
+         [667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833,
+          722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611] +
+         [278, 278, 278, 469, 556, 333] +
+         [556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833,
+          556, 556, 556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500] +
+         [334, 260, 334, 584])
+_BOLD = ([278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278] + [556] * 10 +
+         [333, 333, 584, 584, 584, 611, 975] +
+         [722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833,
+          722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611] +
+         [333, 278, 333, 584, 556, 333] +
+         [556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889,
+          611, 611, 611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500] +
+         [389, 280, 389, 584])
+
+
+def _table(ascii_widths):
+    table = [556] * 256
+    table[32:127] = ascii_widths
+    table[0x95], table[0x96], table[0x97], table[0xA0] = 350, 556, 1000, 278   # bullet, dashes, nbsp
+    return table
+
+
+_WIDTHS = {"F1": _table(_HELV), "F2": _table(_BOLD), "F3": _table(_HELV)}
+_FONTS  = {"F1": "Helvetica", "F2": "Helvetica-Bold", "F3": "Helvetica-Oblique"}
+
+
+def _units(s, table):
+    return sum(map(table.__getitem__, s.encode("cp1252", "replace")))
+
+
+def text_width(s, font="F1", size=8):
+    # -> mm
+    return _units(s, _WIDTHS[font]) * size / 1000 / _K
+
+
+def wrap(text, width, font="F1", size=8):
+    # greedy word wrap to `width` mm; newlines are kept, words
+    # wider than a whole line are broken where they overflow
+    table = _WIDTHS[font]
+    limit = width * _K * 1000 / size
+    space = table[32]
+    out   = []
+    for para in str(text).replace("\r\n", "\n").replace("\t", " ").split("\n"):
+        line, used = [], 0
+        for word in para.split():
+            w = _units(word, table)
+            if line and used + space + w <= limit:
+                line.append(word)
+                used += space + w
+                continue
+            if line:
+                out.append(" ".join(line))
+            while w > limit:
+                n, acc = 0, 0
+                for b in word.encode("cp1252", "replace"):
+                    acc += table[b]
+                    if acc > limit:
+                        break
+                    n += 1
+                out.append(word[:max(1, n)])
+                word = word[max(1, n):]
+                w    = _units(word, table)
+            line, used = [word], w
+        out.append(" ".join(line))
+    return out
+
+
+def _pdf_text(s):
+    # str -> PDF literal string body, cp1252 carried through latin-1
+    s = s.encode("cp1252", "replace").decode("latin-1")
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# ---------------------------------------------------------
+# Content streams — coordinates in mm from the top left
+# ---------------------------------------------------------
+
+def _n(v):
+    return f"{v:.2f}".rstrip("0").rstrip(".")
+
+
+def _rgb(c):
+    return " ".join(_n(v / 255) for v in c)
+
+
+class Canvas:
+    def __init__(self):
+        self.ops = []
+
+    def rect(self, x, y, w, h, fill=None, stroke=None, width=0.2):
+        box = f"{_n(x * _K)} {_n((PH - y - h) * _K)} {_n(w * _K)} {_n(h * _K)} re"
+        if fill is not None:
+            self.ops.append(f"{_rgb(fill)} rg {box} f")
+        if stroke is not None:
+            self.ops.append(f"{_rgb(stroke)} RG {_n(width * _K)} w {box} S")
+
+    def text(self, x, y, s, font="F1", size=8, color=(0, 0, 0)):
+        if s:
+            self.ops.append(f"BT /{font} {_n(size)} Tf {_rgb(color)} rg "
+                            f"{_n(x * _K)} {_n((PH - y) * _K)} Td ({_pdf_text(s)}) Tj ET")
+
+    def lines(self, x, y, lines, font="F1", size=8, color=(0, 0, 0), lead=LEAD):
+        if not lines:
+            return
+        body = f" 0 {_n(-lead * _K)} Td ".join(f"({_pdf_text(s)}) Tj" for s in lines)
+        self.ops.append(f"BT /{font} {_n(size)} Tf {_rgb(color)} rg "
+                        f"{_n(x * _K)} {_n((PH - y) * _K)} Td {body} ET")
+
+    def stream(self):
+        # -> the stream object body, deflated
+        data = zlib.compress(("q\n" + "\n".join(self.ops) + "\nQ").encode("latin-1"), 6)
+        return b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(data), data)
+
+
+# ---------------------------------------------------------
+# Layouts — rows of boxes placed top to bottom
+# ---------------------------------------------------------
+
+BAR_STYLES = {
+    # fill, text colour, font size, baseline offset
+    "cioms":      ((26, 58, 92),    (255, 255, 255), 7.5, 3.5),
+    "cioms-title": ((26, 58, 92),   (255, 255, 255), 11,  6),
+    "blue":       ((0, 102, 204),   (255, 255, 255), 8,   4),
+    "light":      ((240, 240, 255), (40, 40, 120),   7,   3.5),
+}
+
+
+def box(w, label, field):
+    return ("box", w, label, field)
+
+
+def checks(w, label, field, options, cols=3):
+    # options: [(caption, code)]; ticked when the code is in the field's set
+    return ("checks", w, label, field, options, cols)
+
+
+class Layout:
+    def __init__(self, bar_style):
+        self.y         = M
+        self.bar_style = bar_style
+        self.static    = []              # (kind, args) drawn once, into the template
+        self.fields    = []              # per-case: box text, ticks, values
+
+    def bar(self, text, h=5, style=None, gap=1):
+        self.static.append(("bar", (self.y, h, text, style or self.bar_style)))
+        self.y += h + gap
+
+    def note(self, text, h=6, font="F3", size=7, color=(100, 100, 100)):
+        self.static.append(("text", (M, self.y + 3.5, text, font, size, color)))
+        self.y += h
+
+    def value(self, field, h=6, size=7):
+        self.fields.append(("value", M, self.y + 3, field, size))
+        self.y += h
+
+    def row(self, h, *cells):
+        x = M
+        for cell in cells:
+            kind, w, label = cell[:3]
+            self.static.append(("box", (x, self.y, w, h, label)))
+            if kind == "box":
+                self.fields.append(("box", x, self.y, w, h, cell[3], label))
+            else:
+                field, options, cols = cell[3:]
+                col = (w - 2) / cols
+                for i, (caption, code) in enumerate(options):
+                    cx, cy = x + 1 + col * (i % cols), self.y + 7.5 + 4.5 * (i // cols)
+                    self.static.append(("check", (cx, cy, caption)))
+                    self.fields.append(("check", cx, cy, field, code))
+            x += w
+        self.y += h + 1
+
+
+def _draw_static(canvas, kind, args):
+    if kind == "bar":
+        y, h, text, style = args
+        fill, color, size, base = BAR_STYLES[style]
+        canvas.rect(M, y, CW, h, fill=fill)
+        canvas.text(M + 2, y + base, text, "F2", size, color)
+    elif kind == "box":
+        x, y, w, h, label = args
+        canvas.rect(x, y, w, h, stroke=(100, 100, 100))
+        canvas.text(x + 1, y + 3.5, label, "F2", 6, (70, 70, 70))
+    elif kind == "check":
+        x, y, caption = args
+        canvas.rect(x, y - 2.5, 3, 3, stroke=(60, 60, 60))
+        canvas.text(x + 4, y, caption, "F1", 6.5)
+    elif kind == "text":
+        canvas.text(*args)
+
+
+class Form:
+    # a layout compiled for one process: the static page streams
+    # and the per-case field list
+
+    def __init__(self, key, filename, layout, cont_title, footer, extract):
+        self.key      = key
+        self.filename = filename
+        self.fields   = layout.fields
+        self.style    = layout.bar_style
+        self.extract  = extract
+        self.footer   = footer
+
+        front = Canvas()
+        for kind, args in layout.static:
+            _draw_static(front, kind, args)
+        cont = Canvas()
+        _draw_static(cont, "bar", (M, 9, cont_title, layout.static[0][1][3]))
+        for c in (front, cont):
+            c.text(M, FOOTER_Y, footer, "F3", 6.5, (150, 150, 150))
+        self.front = front.stream()
+        self.cont  = cont.stream()
+        self.cont_top = M + 10
+
+    def render(self, case, today=None):
+        f = self.extract(case, today or date.today())
+        page, spill = Canvas(), []
+        for spec in self.fields:
+            kind = spec[0]
+            if kind == "box":
+                _, x, y, w, h, field, label = spec
+                lines = wrap(f[field], w - 2) if f.get(field) else []
+                cap   = int((h - 8) / LEAD) + 1
+                if len(lines) > cap:
+                    spill.append((label, lines[cap - 1:]))
+                    lines = lines[:cap - 1]
+                    page.text(x + 1, y + 7 + LEAD * len(lines), "(continued on the continuation sheet)",
+                              "F3", 7, (90, 90, 90))
+                page.lines(x + 1, y + 7, lines)
+            elif kind == "check":
+                _, x, y, field, code = spec
+                if code in f.get(field, ()):
+                    page.text(x + 0.55, y, "X", "F2", 8)
+            else:
+                _, x, y, field, size = spec
+                page.text(x, y, f.get(field) or "", "F1", size, (100, 100, 100))
+
+        for heading, text in f.get("_sections", ()):
+            if text:
+                spill.append((heading, wrap(text, CW - 2)))
+        pages = [(self.front, page)] + self._continuation(spill, f.get("header") or "")
+        for i, (_, canvas) in enumerate(pages, 1):
+            label = f"Page {i} / {len(pages)}"
+            canvas.text(PW - M - text_width(label, "F3", 6.5), FOOTER_Y, label, "F3", 6.5, (150, 150, 150))
+        return write_pdf([(tpl, canvas.stream()) for tpl, canvas in pages],
+                         f"{self.filename} {case.id}")
+
+    def _continuation(self, sections, header):
+        pages, canvas, y = [], None, BOTTOM
+        for heading, lines in sections:
+            first = True
+            while lines:
+                if canvas is None or y + 6 + LEAD > BOTTOM:
+                    canvas = Canvas()
+                    pages.append((self.cont, canvas))
+                    canvas.text(M, self.cont_top + 3, header, "F1", 7, (100, 100, 100))
+                    y = self.cont_top + 6
+                fill, color, size, base = BAR_STYLES[self.style]
+                canvas.rect(M, y, CW, 5, fill=fill)
+                canvas.text(M + 2, y + base, heading if first else f"{heading} (continued)", "F2",
+                            min(size, 7.5), color)
+                y += 6
+                n = max(1, int((BOTTOM - y - 3) / LEAD))
+                canvas.lines(M + 1, y + 3.5, lines[:n])
+                y += 3.5 + LEAD * min(n, len(lines)) + 2
+                lines, first = lines[n:], False
+        return pages
+
+
+# ---------------------------------------------------------
+# PDF file — catalog, page tree, fonts, shared resources,
+# the two template streams, then a stream and page per page
+# ---------------------------------------------------------
+
+def _static_objects():
+    fonts = [b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % name.encode()
+             for name in _FONTS.values()]
+    resources = b"<< /Font << /F1 3 0 R /F2 4 0 R /F3 5 0 R >> /ProcSet [/PDF /Text] >>"
+    return fonts + [resources]
+
+
+_OBJECTS = _static_objects()          # objects 3-6
+_MEDIA   = f"[0 0 {_n(PW * _K)} {_n(PH * _K)}]".encode()
+
+
+def write_pdf(pages, title):
+    # pages: [(template stream, field stream)] -> PDF bytes
+    templates = []
+    for tpl, _ in pages:
+        if tpl not in templates:
+            templates.append(tpl)
+    first = 7 + len(templates)              # first field stream
+    kids  = [first + 2 * i + 1 for i in range(len(pages))]
+    info  = first + 2 * len(pages)
+    objs  = [b"<< /Type /Catalog /Pages 2 0 R >>",
+             b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(pages)),
+             *_OBJECTS, *templates]
+    for i, (tpl, stream) in enumerate(pages):
+        objs.append(stream)
+        objs.append(b"<< /Type /Page /Parent 2 0 R /MediaBox %s /Resources 6 0 R /Contents [%d 0 R %d 0 R] >>"
+                    % (_MEDIA, 7 + templates.index(tpl), first + 2 * i))
+    objs.append(b"<< /Title (%s) /Producer (SkyVigilance) >>" % _pdf_text(title).encode("latin-1"))
+
+    out, offsets = [b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"], []
+    pos = len(out[0])
+    for num, body in enumerate(objs, 1):
+        chunk = b"%d 0 obj\n%s\nendobj\n" % (num, body)
+        offsets.append(pos)
+        out.append(chunk)
+        pos += len(chunk)
+    out.append(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1))
+    out.append(b"".join(b"%010d 00000 n \n" % o for o in offsets))
+    out.append(b"trailer\n<< /Size %d /Root 1 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+               % (len(objs) + 1, info, pos))
+    return b"".join(out)
+
+
+# ---------------------------------------------------------
+# Case data -> field values
+# ---------------------------------------------------------
+
+def _dmy(value):
+    # ISO date (or YYYY-MM) -> DD/MM/YYYY
+    if not value:
+        return ""
+    return "/".join(reversed(str(value).split("T")[0].split("-")))
+
+
+def _numbered(items):
+    items = [i for i in items if i]
+    if len(items) <= 1:
+        return items[0] if items else ""
+    return "\n".join(f"#{n} {i}" for n, i in enumerate(items, 1))
+
+
+def _suspects(case):
+    prods = [p for p in (case.products or []) if isinstance(p, dict)]
+    sus   = [p for p in prods if DRUG_CHAR.get(p.get("role") or "Suspect") in ("1", "3")]
+    return sus or prods
+
+
+def _concomitants(case):
+    pat   = case.patient or {}
+    items = [" ".join(filter(None, (p.get("name"), _therapy(p))))
+             for p in (case.products or [])
+             if isinstance(p, dict) and DRUG_CHAR.get(p.get("role")) == "2"]
+    if pat.get("concomitant"):
+        items.append(pat["concomitant"])
+    return "; ".join(i for i in items if i) or "None reported"
+
+
+def _therapy(drug):
+    if not (drug.get("startDate") or drug.get("stopDate")):
+        return ""
+    return f"{_dmy(drug.get('startDate')) or '—'} to {_dmy(drug.get('stopDate')) or 'ongoing'}"
+
+
+def _dose(drug):
+    return " ".join(filter(None, (str(drug.get("dose") or ""), drug.get("doseUnit"), drug.get("frequency"))))
+
+
+def serious_codes(case):
+    # SERIOUS_CODES of summary.serious_flags (a fatal outcome ticks death)
+    return {SERIOUS_CODES[k] for k in serious_flags(case) if k in SERIOUS_CODES}
+
+
+def challenge(case):
+    # -> ({abated}, {reappeared}), each "yes", "no" or "na". Abatement
+    # only counts when the drug was withdrawn or reduced (ACTION_TAKEN 1/2)
+    abate = reappear = "na"
+    for drug in _suspects(case):
+        if ACTION_TAKEN.get(drug.get("actionTaken")) in ("1", "2"):
+            code  = DECHALLENGE.get(drug.get("dechallenge"))
+            abate = "yes" if code == "1" or abate == "yes" else "no" if code == "2" else abate
+        code     = RECHALLENGE.get(drug.get("rechallenge"))
+        reappear = "yes" if code == "1" or reappear == "yes" else "no" if code == "2" else reappear
+    return {abate}, {reappear}
+
+
+def history_text(pat):
+    # as buildMedHistoryText in the frontend
+    parts = [pat["medHistory"]] if pat.get("medHistory") else []
+    for h in pat.get("otherHistory") or []:
+        if not isinstance(h, dict) or not (h.get("description") or h.get("substance") or h.get("meddraPt")):
+            continue
+        entry = h.get("description") or h.get("substance") or ""
+        if h.get("meddraPt") and h["meddraPt"] != entry:
+            entry = f"{entry} [MedDRA: {h['meddraPt']}]" if entry else f"[MedDRA: {h['meddraPt']}]"
+        if h.get("startDate"):
+            entry += f" (from {h['startDate']}"
+            entry += f" to {h['stopDate']})" if h.get("stopDate") else ", ongoing)" if h.get("ongoing") else ")"
+        if entry.strip():
+            parts.append(entry.strip())
+    if pat.get("medHistoryPt") and not any(pat["medHistoryPt"] in s for s in parts):
+        parts.append(f"{pat['medHistoryPt']} [MedDRA PT]")
+    return "; ".join(parts) or "no relevant past history"
+
+
+def lab_text(pat):
+    out = []
+    for lab in pat.get("labData") or []:
+        if not isinstance(lab, dict) or not lab.get("testName"):
+            continue
+        s = " ".join(filter(None, (lab["testName"], str(lab.get("result") or ""), lab.get("units"))))
+        if lab.get("assessment") and lab["assessment"] != "Normal":
+            s += f" ({lab['assessment']})"
+        if lab.get("testDate"):
+            s += f" on {_dmy(lab['testDate'])}"
+        out.append(s)
+    return "; ".join(out)
+
+
+def _event_text(e):
+    parts = [e.get("term") or e.get("pt") or "Unspecified event"]
+    if e.get("pt"):
+        parts.append(f"MedDRA PT: {e['pt']}{' (' + str(e['pt_code']) + ')' if e.get('pt_code') else ''}"
+                     f"{' | SOC: ' + e['soc'] if e.get('soc') else ''}")
+    if e.get("onsetDate") or e.get("stopDate"):
+        parts.append(f"{_dmy(e.get('onsetDate')) or '—'} to {_dmy(e.get('stopDate')) or '—'}")
+    if e.get("outcome"):
+        parts.append(f"Outcome: {e['outcome']}")
+    return " — ".join(parts)
+
+
+def _common(case, today):
+    tr, gen, pat = case.triage or {}, case.general or {}, case.patient or {}
+    evts  = [e for e in (case.events or []) if isinstance(e, dict)]
+    ev    = evts[0] if evts else {}
+    sus   = _suspects(case)
+    abate, reappear = challenge(case)
+    rtype = str(gen.get("reportType") or tr.get("reportType") or "").lower()
+    age   = f"{pat['age']} {pat.get('ageUnit') or 'years'}" if pat.get("age") not in (None, "") else ""
+    return {
+        "initials":    pat.get("initials") or tr.get("patientInitials") or "",
+        "country":     tr.get("country") or "",
+        "dob":         _dmy(pat.get("dob")),
+        "age":         age,
+        "weight":      f"{pat['weight']} kg" if pat.get("weight") else "",
+        "sex":         {SEX_CODES.get(pat.get("sex") or tr.get("sex") or "Unknown", "0")},
+        "onset":       _dmy(ev.get("onsetDate")),
+        "stop":        _dmy(ev.get("stopDate")),
+        "serious":     serious_codes(case),
+        "drugs":       _numbered(f"{d.get('name') or '—'}{' / ' + d['genericName'] if d.get('genericName') else ''}"
+                                 for d in sus),
+        "doses":       _numbered(_dose(d) for d in sus),
+        "routes":      _numbered(d.get("route") for d in sus),
+        "indications": _numbered(d.get("indication") or d.get("indicationPt") for d in sus),
+        "therapy":     _numbered(_therapy(d) for d in sus),
+        "duration":    _numbered(d.get("duration") for d in sus),
+        "abate":       abate,
+        "reappear":    reappear,
+        "concomitant": _concomitants(case),
+        "history":     history_text(pat),
+        "labs":        lab_text(pat),
+        "mah":         next((d["mah"] for d in sus if d.get("mah")), "SkyVigilance Training Platform"),
+        "case_id":     case.id,
+        "received":    _dmy(gen.get("dateReceivedMAH") or gen.get("centralReceiptDate") or tr.get("receiptDate")),
+        "report_date": today.strftime("%d/%m/%Y"),
+        "source":      {"study" if "stud" in rtype else "lit" if "lit" in rtype else "hp"},
+        "report_type": {"followup" if "follow" in rtype else "initial"},
+        "header":      f"Case No: {case.id}   |   Generated: {today:%d/%m/%Y}   |   SkyVigilance Training Platform",
+        "pt":          ev.get("pt") or "Not coded",
+        "pt_code":     str(ev.get("pt_code") or "—"),
+        "soc":         ev.get("soc") or "—",
+        "causality":   ev.get("causality") or "Not assessed",
+        "listedness":  ev.get("listedness") or "Not assessed",
+    }
+
+
+def cioms_fields(case, today):
+    f        = _common(case, today)
+    evts     = [e for e in (case.events or []) if isinstance(e, dict)]
+    reaction = "\n".join(_event_text(e) for e in evts) or "—"
+    if f["labs"]:
+        reaction += f"\nRelevant tests / lab data: {f['labs']}"
+    if case.narrative:
+        reaction += f"\n\n{case.narrative}"
+    f["reactions"] = reaction
+    return f
+
+
+def medwatch_fields(case, today):
+    f    = _common(case, today)
+    tr   = case.triage or {}
+    gen  = case.general or {}
+    pat  = case.patient or {}
+    evts = [e for e in (case.events or []) if isinstance(e, dict)]
+    sus  = _suspects(case)
+    rep  = gen.get("reporter") if isinstance(gen.get("reporter"), dict) else {}
+    f["race"]       = pat.get("ethnicity") or pat.get("race") or ""
+    f["describe"]   = case.narrative or "\n".join(_event_text(e) for e in evts)
+    f["products"]   = _numbered(f"{d.get('name') or '—'}{' (' + d['genericName'] + ')' if d.get('genericName') else ''}"
+                                f"{', ' + d['mah'] if d.get('mah') else ''}" for d in sus)
+    f["dosing"]     = _numbered(", ".join(filter(None, (_dose(d), d.get("route")))) for d in sus)
+    f["terms"]      = "; ".join(e.get("pt") or e.get("term") for e in evts if e.get("pt") or e.get("term"))
+    f["reporter"]   = "; ".join(filter(None, (
+        " ".join(filter(None, (tr.get("reporterFirst") or rep.get("firstName"),
+                               tr.get("reporterLast") or rep.get("lastName")))),
+        tr.get("institution") or rep.get("institution"))))
+    qual = tr.get("qualification") or rep.get("qualification") or ""
+    f["occupation"] = qual
+    f["hp"]         = {"yes" if qual in ("Physician", "Pharmacist", "Nurse", "Other HCP") else "no"}
+    f["report_src"] = f["source"] | ({"foreign"} if COUNTRY_CODES.get(f["country"], "US") != "US" else set())
+    f["event_kind"] = {"ae"}
+    return f
+
+
+# ---------------------------------------------------------
+# The two forms
+# ---------------------------------------------------------
+
+YES_NO = [("YES", "yes"), ("NO", "no"), ("NA / NK", "na")]
+
+
+def _cioms():
+    L = Layout("cioms")
+    L.bar("CIOMS I FORM — SUSPECT ADVERSE REACTION REPORT", h=9, style="cioms-title")
+    L.value("header")
+    L.bar("I.  REACTION INFORMATION")
+    L.row(14, box(38, "1. PATIENT INITIALS", "initials"), box(40, "1a. COUNTRY", "country"),
+          box(30, "2. DATE OF BIRTH", "dob"), box(22, "2a. AGE", "age"),
+          checks(60, "3. SEX", "sex", [("Male", SEX_CODES["Male"]), ("Female", SEX_CODES["Female"]),
+                                        ("Unknown", SEX_CODES["Unknown"])]))
+    L.row(12, box(95, "4-6. REACTION ONSET", "onset"), box(95, "REACTION STOP / RECOVERY DATE", "stop"))
+    L.row(16, checks(CW, "8-12. CHECK ALL APPROPRIATE TO ADVERSE REACTION", "serious", [
+        ("PATIENT DIED", SERIOUS_CODES["death"]),
+        ("PROLONGED INPATIENT HOSPITALISATION", SERIOUS_CODES["hospitalisation"]),
+        ("PERSISTENT OR SIGNIFICANT DISABILITY", SERIOUS_CODES["disability"]),
+        ("LIFE THREATENING", SERIOUS_CODES["lifeThreatening"]),
+        ("CONGENITAL ANOMALY", SERIOUS_CODES["congenital"]),
+        ("OTHER MEDICALLY IMPORTANT CONDITION", SERIOUS_CODES["medSignificant"])]))
+    L.row(52, box(CW, "7+13. DESCRIBE REACTION(S) (including relevant tests / lab data)", "reactions"))
+    L.bar("II.  SUSPECT DRUG(S) INFORMATION")
+    L.row(16, box(70, "14. SUSPECT DRUG(S) (include generic name)", "drugs"), box(35, "15. DAILY DOSE(S)", "doses"),
+          box(85, "16. ROUTE(S) OF ADMINISTRATION", "routes"))
+    L.row(16, box(70, "17. INDICATION(S) FOR USE", "indications"), box(60, "18. THERAPY DATES (from / to)", "therapy"),
+          box(60, "19. THERAPY DURATION", "duration"))
+    L.row(12, checks(95, "20. DID REACTION ABATE AFTER STOPPING DRUG?", "abate", YES_NO),
+          checks(95, "21. DID REACTION REAPPEAR AFTER REINTRODUCTION?", "reappear", YES_NO))
+    L.bar("III.  CONCOMITANT DRUG(S) AND HISTORY")
+    L.row(16, box(CW, "22. CONCOMITANT DRUG(S) AND DATES OF ADMINISTRATION", "concomitant"))
+    L.row(20, box(CW, "23. OTHER RELEVANT HISTORY (e.g. diagnostics, allergies, pregnancy)", "history"))
+    L.bar("IV.  MANUFACTURER INFORMATION")
+    L.row(12, box(90, "24a. NAME AND ADDRESS OF MANUFACTURER", "mah"), box(40, "24b. MFR CONTROL NO.", "case_id"),
+          box(60, "24c. DATE RECEIVED BY MANUFACTURER", "received"))
+    L.row(12, checks(95, "24d. REPORT SOURCE", "source", [("STUDY", "study"), ("LITERATURE", "lit"),
+                                                         ("HEALTH PROFESSIONAL", "hp")]),
+          box(45, "DATE OF THIS REPORT", "report_date"),
+          checks(50, "25a. REPORT TYPE", "report_type", [("INITIAL", "initial"), ("FOLLOWUP", "followup")], 2))
+    L.bar("MEDICAL ASSESSMENT — SkyVigilance supplementary (not part of the CIOMS I form)", style="light")
+    L.row(12, box(50, "MedDRA PT", "pt"), box(25, "PT CODE", "pt_code"), box(45, "SOC", "soc"),
+          box(40, "CAUSALITY", "causality"), box(30, "LISTEDNESS", "listedness"))
+    return Form("cioms", "CIOMS_I", L, "CIOMS I FORM — CONTINUATION SHEET",
+                "Generated by SkyVigilance Training Platform — For training purposes only — "
+                "Not for regulatory submission", cioms_fields)
+
+
+def _medwatch():
+    L = Layout("blue")
+    L.static.append(("bar", (L.y, 16, "", "blue")))
+    L.static.append(("text", (M + 2, L.y + 5, "U.S. DEPARTMENT OF HEALTH AND HUMAN SERVICES", "F2", 9, (255, 255, 255))))
+    L.static.append(("text", (M + 2, L.y + 10, "Food and Drug Administration", "F2", 9, (255, 255, 255))))
+    L.static.append(("text", (M + 105, L.y + 11, "MEDWATCH — FORM FDA 3500A", "F2", 13, (255, 255, 255))))
+    L.y += 17
+    L.note("For use by user-facilities, importers, distributors and manufacturers for MANDATORY reporting")
+    L.value("header")
+    L.bar("A.  PATIENT INFORMATION", h=6)
+    L.row(14, box(52, "1. Patient identifier", "initials"), box(25, "2. Age at event", "age"),
+          checks(33, "3. Sex", "sex", [("Male", SEX_CODES["Male"]), ("Female", SEX_CODES["Female"])], 2),
+          box(30, "4. Weight", "weight"), box(50, "5. Ethnicity / Race", "race"))
+    L.bar("B.  ADVERSE EVENT OR PRODUCT PROBLEM", h=6)
+    L.row(14, checks(60, "1. Type of report", "event_kind", [("Adverse event", "ae"), ("Product problem", "pp")], 2),
+          checks(130, "2. Outcomes attributed to adverse event", "serious", [
+              ("Death", SERIOUS_CODES["death"]), ("Hospitalization", SERIOUS_CODES["hospitalisation"]),
+              ("Congenital anomaly", SERIOUS_CODES["congenital"]),
+              ("Life-threatening", SERIOUS_CODES["lifeThreatening"]), ("Disability", SERIOUS_CODES["disability"]),
+              ("Other serious", SERIOUS_CODES["medSignificant"])]))
+    L.row(12, box(95, "3. Date of event (DD/MM/YYYY)", "onset"), box(95, "4. Date of this report", "report_date"))
+    L.row(34, box(CW, "5. Describe event or problem", "describe"))
+    L.row(14, box(CW, "6. Relevant tests / laboratory data, including dates", "labs"))
+    L.row(14, box(CW, "7. Other relevant history, including preexisting medical conditions", "history"))
+    L.bar("C.  SUSPECT PRODUCT(S)", h=6)
+    L.row(14, box(CW, "1. Name, strength, manufacturer / labeler", "products"))
+    L.row(12, box(95, "2. Dose, frequency & route used", "dosing"), box(95, "3. Therapy dates (from / to)", "therapy"))
+    L.row(12, box(80, "4. Diagnosis for use (indication)", "indications"),
+          checks(55, "5. Event abated after use stopped?", "abate", [("Yes", "yes"), ("No", "no"), ("N/A", "na")]),
+          checks(55, "6. Event reappeared on reintroduction?", "reappear",
+                 [("Yes", "yes"), ("No", "no"), ("N/A", "na")]))
+    L.row(12, box(CW, "10. Concomitant medical products and therapy dates", "concomitant"))
+    L.note("D.  SUSPECT MEDICAL DEVICE  /  F.  FOR USE BY USER FACILITY — not applicable (drug / biologic case)",
+           h=5, color=(150, 150, 150))
+    L.bar("E.  INITIAL REPORTER", h=6)
+    L.row(12, box(95, "1. Name and institution", "reporter"), box(50, "3. Occupation", "occupation"),
+          checks(45, "2. Health professional?", "hp", [("Yes", "yes"), ("No", "no")], 2))
+    L.bar("G.  ALL MANUFACTURERS", h=6)
+    L.row(14, box(60, "1. Contact office (name / address)", "mah"),
+          checks(85, "3. Report source", "report_src", [("Foreign", "foreign"), ("Study", "study"),
+                                                       ("Literature", "lit"), ("Health professional", "hp")], 2),
+          box(45, "4. Date received by manufacturer", "received"))
+    L.row(12, checks(50, "7. Type of report", "report_type", [("Initial", "initial"), ("Follow-up", "followup")], 2),
+          box(90, "8. Adverse event term(s)", "terms"), box(50, "9. Manufacturer report number", "case_id"))
+    return Form("medwatch", "MedWatch_3500A", L, "MEDWATCH — FORM FDA 3500A — CONTINUATION PAGE",
+                "Form FDA 3500A MedWatch — SkyVigilance Training Platform — For training purposes only",
+                medwatch_fields)
+
+
+FORMS = {"cioms": _cioms(), "medwatch": _medwatch()}
+
+
+def filename(form, case_id):
+    return f"{FORMS[form].filename}_{case_id}.pdf"
+
+
+def render(case, form, today=None):
+    with FORM_SECONDS.time(form):
+        return FORMS[form].render(case, today)
+
+
+# ---------------------------------------------------------
+# Batches — forked pool, streamed ZIP
+# ---------------------------------------------------------
+
+def _render_timed(job):
+    # (case, forms) -> [(form, pdf, seconds)]; pool children hand the timings back
+    case, forms = job
+    out = []
+    for form in forms:
+        t0  = time.perf_counter()
+        pdf = FORMS[form].render(case)
+        out.append((form, pdf, time.perf_counter() - t0))
+    return out
+
+
+def _record(timed):
+    for form, _, seconds in timed:
+        FORM_SECONDS.observe(seconds, form)
+    return [(form, pdf) for form, pdf, _ in timed]
+
+
+def render_forms(cases, forms, workers=1, window=32):
+    # yields (case, [(form, pdf)]) in input order
+    with fork_pool(workers) as pool:
+        for batch in windows(cases, window * max(1, workers)):
+            jobs = [(plain(c, Case.__table__) if pool is not None else c, forms) for c in batch]
+            yield from zip(batch, pool_map(pool, _render_timed, _record, jobs, chunksize=4))
+
+
+def stream_zip(cases, forms, on_case=None, workers=1):
+    # bytes chunks of a ZIP, one PDF per case and form; stored, not
+    # deflated again — the page streams already are
+    buf = ChunkBuffer()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        for case, pdfs in render_forms(cases, forms, workers):
+            for form, pdf in pdfs:
+                zf.writestr(filename(form, case.id), pdf)
+            if on_case:
+                on_case(case)
+            chunk = buf.take()
+            if chunk:
+                yield chunk
+    yield buf.take()
@@ -0,0 +1,493 @@
+# =========================================================
+# ORM HOOKS & IN-PROCESS INDEXES
+# ---------------------------------------------------------
+# Imported by app.py once the models exist. Each gunicorn
+# worker holds its own indexes; writes made by other workers
+# are picked up through an updated_at watermark catch-up
+# (cases) or a signature check (MedDRA, signal tables).
+# =========================================================
+
+import threading
+import time
+
+from sqlalchemy import bindparam, event, func, inspect, select
+from sqlalchemy.orm import object_session
+
+from app import db, Case, CaseSummary, MeddraTerm, SignalCount
+from dedup import DuplicateIndex, case_fields, summary_fields
+from meddra_search import COLUMNS as MEDDRA_COLUMNS, MeddraIndex
+from signals import case_events, contributions, counts_table, suspect_drugs
+from summary import due_date, summarize
+from textsearch import TextIndex, case_text, delete_case_text, write_case_state, write_case_text
+
+
+# =========================================================
+# CASE SUMMARY — written on the flush connection, so it
+# commits or rolls back with the case row itself
+# =========================================================
+
+_summary = CaseSummary.__table__
+
+
+def write_summary(connection, case):
+    row = summarize(case)
+    res = connection.execute(_summary.update()
+                             .where(_summary.c.case_id == case.id)
+                             .values(**row))
+    if res.rowcount == 0:
+        connection.execute(_summary.insert().values(**row))
+
+
+@event.listens_for(Case, "after_insert")
+@event.listens_for(Case, "after_update")
+def _summary_upsert(mapper, connection, target):
+    write_summary(connection, target)
+
+
+@event.listens_for(Case, "after_delete")
+def _summary_delete(mapper, connection, target):
+    connection.execute(_summary.delete().where(_summary.c.case_id == target.id))
+
+
+# =========================================================
+# WORKLIST — the due date follows the receipt date and
+# seriousness; a step change ends the lease on the case
+# =========================================================
+
+_DUE_ATTRS = ("triage", "general", "events")
+
+
+@event.listens_for(Case, "before_insert")
+def _worklist_insert(mapper, connection, target):
+    target.due_date = due_date(target)
+
+
+@event.listens_for(Case, "before_update")
+def _worklist_update(mapper, connection, target):
+    state = inspect(target)
+    if target.due_date is None or any(state.attrs[a].history.has_changes() for a in _DUE_ATTRS):
+        target.due_date = due_date(target)
+    if state.attrs.current_step.history.has_changes():
+        target.claimed_by = target.claim_expires = None
+
+
+# =========================================================
+# IN-PROCESS INDEX UPDATES — queued in session.info at
+# flush, applied when the transaction commits and dropped
+# when it (or the savepoint they were made in) rolls back,
+# so a failed write leaves no phantom or missing entries.
+# What an update needs is read from the case at flush; the
+# instance is expired by the time the commit hook runs.
+# =========================================================
+
+PENDING_INDEX = "pending_index"
+
+
+def _defer(target, fn, *args):
+    session = object_session(target)
+    tx = session.get_nested_transaction() or session.get_transaction()
+    session.info.setdefault(PENDING_INDEX, []).append((tx, fn, args))
+
+
+def _within(tx, outer):
+    while tx is not None:
+        if tx is outer:
+            return True
+        tx = tx.parent
+    return False
+
+
+@event.listens_for(db.session, "after_commit")
+def _index_commit(session):
+    for _, fn, args in session.info.pop(PENDING_INDEX, ()):
+        fn(*args)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def _index_rollback(session, previous_transaction):
+    pending = session.info.get(PENDING_INDEX)
+    if not pending:
+        return
+    if not previous_transaction.nested:
+        session.info.pop(PENDING_INDEX, None)
+        return
+    session.info[PENDING_INDEX] = [p for p in pending if not _within(p[0], previous_transaction)]
+
+
+# =========================================================
+# DUPLICATE INDEX
+# =========================================================
+
+dup_index = DuplicateIndex()
+
+_DUP_SUMMARY = (Case.id, Case.updated_at, CaseSummary.patient_initials, CaseSummary.first_drug,
+                CaseSummary.first_event_term, CaseSummary.first_pt, CaseSummary.first_pt_code,
+                CaseSummary.country, CaseSummary.onset_date)
+_DUP_JSON    = (Case.id, Case.triage, Case.products, Case.events, Case.updated_at)
+
+
+def refresh_dup_index():
+    # summary rows feed the index without decoding JSON; cases the
+    # backfill has not reached yet are read from their sections
+    since = dup_index.watermark if dup_index.built else None
+    q = db.session.query(*_DUP_SUMMARY).join(CaseSummary, CaseSummary.case_id == Case.id)
+    if since is not None:
+        q = q.filter(Case.updated_at >= since)
+    for row in q.yield_per(2000):
+        dup_index.upsert(row.id, summary_fields(row), row.updated_at)
+
+    q = (db.session.query(*_DUP_JSON)
+         .outerjoin(CaseSummary, CaseSummary.case_id == Case.id)
+         .filter(CaseSummary.case_id.is_(None)))
+    if since is not None:
+        q = q.filter(Case.updated_at >= since)
+    for row in q.yield_per(2000):
+        dup_index.upsert_case(row)
+
+    if not dup_index.built:
+        dup_index.built = True
+        print(f"[SkyVigilance] Duplicate index built ({len(dup_index)} cases).")
+    return dup_index
+
+
+@event.listens_for(Case, "after_insert")
+@event.listens_for(Case, "after_update")
+def _dup_index_upsert(mapper, connection, target):
+    if dup_index.built:
+        _defer(target, dup_index.upsert, target.id, case_fields(target), target.updated_at)
+
+
+@event.listens_for(Case, "after_delete")
+def _dup_index_remove(mapper, connection, target):
+    _defer(target, dup_index.remove, target.id)
+
+
+# =========================================================
+# CASE TEXT — pv_case_text rows for full-text search, on the
+# flush connection; the in-process index (the fallback
+# engine), once built, when the transaction commits. A step
+# or status change alone only copies the two columns;
+# nothing is re-indexed.
+# =========================================================
+
+text_index = TextIndex()
+
+_TEXT_ATTRS  = ("narrative", "events", "patient")
+_STATE_ATTRS = ("current_step", "status")
+_TEXT_COLS  = (Case.id, Case.updated_at, Case.current_step, Case.status,
+               Case.narrative, Case.events, Case.patient)
+
+
+def refresh_text_index():
+    since = text_index.watermark if text_index.built else None
+    q = db.session.query(*_TEXT_COLS)
+    if since is not None:
+        q = q.filter(Case.updated_at >= since)
+    for row in q.yield_per(2000):
+        text_index.upsert_case(row)
+    if not text_index.built:
+        text_index.built = True
+        print(f"[SkyVigilance] Case text index built ({len(text_index)} cases).")
+    return text_index
+
+
+def _text_args(case):
+    # TextIndex.upsert arguments, read while the case is loaded
+    return case.id, tuple(case_text(case).values()), case.current_step, case.status, case.updated_at
+
+
+@event.listens_for(Case, "after_insert")
+def _text_insert(mapper, connection, target):
+    write_case_text(connection, target)
+    if text_index.built:
+        _defer(target, text_index.upsert, *_text_args(target))
+
+
+@event.listens_for(Case, "after_update")
+def _text_update(mapper, connection, target):
+    state   = inspect(target)
+    changed = any(state.attrs[a].history.has_changes() for a in _TEXT_ATTRS)
+    if changed:
+        write_case_text(connection, target)
+    elif any(state.attrs[a].history.has_changes() for a in _STATE_ATTRS):
+        write_case_state(connection, target)
+    if text_index.built:
+        if changed:
+            _defer(target, text_index.upsert, *_text_args(target))
+        else:
+            _defer(target, text_index.set_state, target.id, target.current_step, target.status,
+                   target.updated_at)
+
+
+@event.listens_for(Case, "after_delete")
+def _text_delete(mapper, connection, target):
+    delete_case_text(connection, target.id)
+    _defer(target, text_index.remove, target.id)
+
+
+# =========================================================
+# MEDDRA SEARCH INDEX — loaded once per worker, reloaded
+# when the dictionary's row count or version changes
+# =========================================================
+
+meddra_index    = MeddraIndex()
+MEDDRA_RECHECK  = 60        # seconds between signature checks
+_meddra_checked = 0.0
+
+
+def meddra_signature():
+    count, version = db.session.query(func.count(MeddraTerm.llt_code),
+                                      func.max(MeddraTerm.meddra_version)).one()
+    return (count, version)
+
+
+def get_meddra_index():
+    global _meddra_checked
+    now = time.monotonic()
+    if meddra_index.signature is None or now - _meddra_checked > MEDDRA_RECHECK:
+        _meddra_checked = now
+        sig = meddra_signature()
+        if sig != meddra_index.signature:
+            cols = [getattr(MeddraTerm, c) for c in MEDDRA_COLUMNS]
+            meddra_index.load(db.session.query(*cols).yield_per(5000), sig)
+            print(f"[SkyVigilance] MedDRA search index loaded ({len(meddra_index)} terms).")
+    return meddra_index
+
+
+_meddra_sig = {"signature": None, "checked": 0.0}
+
+
+def meddra_cache_signature():
+    # the dictionary signature for cache keys when searches go to the
+    # database; re-read at most every MEDDRA_RECHECK seconds
+    now = time.monotonic()
+    if _meddra_sig["signature"] is None or now - _meddra_sig["checked"] > MEDDRA_RECHECK:
+        _meddra_sig.update(signature=meddra_signature(), checked=now)
+    return _meddra_sig["signature"]
+
+
+# =========================================================
+# SIGNAL COUNTS — pv_signal_count kept in step with the case
+# JSON on the flush connection: each write adds the rows its
+# new products/events count towards and subtracts the old
+# ones. Bulk SQL that bypasses the ORM (and a MedDRA switch
+# that moves PTs between SOCs) is caught by signal-reconcile.
+# =========================================================
+
+SIGNAL_LEVELS = ("pt", "soc")
+_counts       = SignalCount.__table__
+_CLIP         = 500
+_soc_state    = {"signature": None, "checked": 0.0, "map": {}}
+
+
+def soc_map(connection):
+    # PT code / PT name -> primary SOC from the live dictionary
+    now = time.monotonic()
+    st  = _soc_state
+    if st["signature"] is None or now - st["checked"] > MEDDRA_RECHECK:
+        st["checked"] = now
+        mt  = MeddraTerm.__table__.c
+        sig = tuple(connection.execute(select(func.count(mt.llt_code), func.max(mt.meddra_version))).one())
+        if sig != st["signature"]:
+            soc_of = {}
+            for pt_code, pt_name, soc_name in connection.execute(
+                    select(mt.pt_code, mt.pt_name, mt.soc_name).distinct()):
+                if soc_name:
+                    soc_of.setdefault(pt_code, soc_name)
+                    soc_of.setdefault((pt_name or "").lower(), soc_name)
+            st["map"], st["signature"] = soc_of, sig
+    return st["map"]
+
+
+def case_contributions(products, events, soc_of):
+    # {level: {(drug_key, event_key): (drug, event)}} for one case
+    drugs     = suspect_drugs(products)
+    pts, socs = case_events(events, soc_of)
+    out = {}
+    for level, evts in zip(SIGNAL_LEVELS, (pts, socs)):
+        out[level] = {(dk[:_CLIP], ek[:_CLIP]): (dl[:_CLIP], el[:_CLIP])
+                      for (dk, ek), (dl, el) in contributions(drugs, evts).items()}
+    return out
+
+
+def _upsert(connection):
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    stmt = insert(_counts)
+    return stmt.on_conflict_do_update(index_elements=["level", "drug_key", "event_key"],
+                                      set_={"n": _counts.c.n + stmt.excluded.n})
+
+
+_pk = ((_counts.c.level == bindparam("k_level")) & (_counts.c.drug_key == bindparam("k_drug"))
+       & (_counts.c.event_key == bindparam("k_event")))
+
+
+def bump_signal_counts(connection, rows):
+    # rows: [(level, drug_key, event_key, drug, event, delta)]. Keys are
+    # written in sorted order so concurrent transactions lock rows in
+    # the same sequence and cannot deadlock on each other.
+    rows = sorted(r for r in rows if r[5])
+    up   = [{"level": l, "drug_key": dk, "event_key": ek, "drug": dl, "event": el, "n": d}
+            for l, dk, ek, dl, el, d in rows if d > 0]
+    down = [{"k_level": l, "k_drug": dk, "k_event": ek, "d": -d}
+            for l, dk, ek, dl, el, d in rows if d < 0]
+    if up:
+        stmt = _upsert(connection)
+        if stmt is not None:
+            connection.execute(stmt, up)
+        else:
+            for r in up:
+                res = connection.execute(_counts.update().where(
+                    (_counts.c.level == r["level"]) & (_counts.c.drug_key == r["drug_key"])
+                    & (_counts.c.event_key == r["event_key"])).values(n=_counts.c.n + r["n"]))
+                if res.rowcount == 0:
+                    connection.execute(_counts.insert().values(**r))
+    if down:
+        connection.execute(_counts.update().where(_pk).values(n=_counts.c.n - bindparam("d")), down)
+        connection.execute(_counts.delete().where(_pk & (_counts.c.n <= 0)),
+                           [{k: r[k] for k in ("k_level", "k_drug", "k_event")} for r in down])
+
+
+def signal_delta(old, new):
+    rows = []
+    for level in SIGNAL_LEVELS:
+        before, after = old.get(level, {}), new.get(level, {})
+        rows += [(level, *k, *after[k], 1) for k in after.keys() - before.keys()]
+        rows += [(level, *k, *before[k], -1) for k in before.keys() - after.keys()]
+    return rows
+
+
+def _stored_sections(connection, target):
+    # products / events as they were before this flush; the committed
+    # value when it was loaded, otherwise the row still in the database
+    state, old = inspect(target), {}
+    for name in ("products", "events"):
+        hist = state.attrs[name].history
+        if not hist.has_changes():
+            old[name] = getattr(target, name)
+        elif hist.deleted:
+            old[name] = hist.deleted[0]
+    if len(old) < 2:
+        c = Case.__table__.c
+        row = connection.execute(select(c.products, c.events).where(c.id == target.id)).one()
+        old = {"products": row.products, "events": row.events, **old}
+    return old
+
+
+@event.listens_for(Case, "after_insert")
+def _signal_insert(mapper, connection, target):
+    new = case_contributions(target.products, target.events, soc_map(connection))
+    bump_signal_counts(connection, signal_delta({}, new))
+
+
+@event.listens_for(Case, "before_update")
+def _signal_update(mapper, connection, target):
+    state = inspect(target)
+    if not (state.attrs.products.history.has_changes() or state.attrs.events.history.has_changes()):
+        return
+    soc_of = soc_map(connection)
+    old = _stored_sections(connection, target)
+    bump_signal_counts(connection, signal_delta(
+        case_contributions(old["products"], old["events"], soc_of),
+        case_contributions(target.products, target.events, soc_of)))
+
+
+@event.listens_for(Case, "before_delete")
+def _signal_delete(mapper, connection, target):
+    c   = Case.__table__.c
+    row = connection.execute(select(c.products, c.events).where(c.id == target.id)).one_or_none()
+    if row is None:
+        return
+    old = case_contributions(row.products, row.events, soc_map(connection))
+    bump_signal_counts(connection, signal_delta(old, {}))
+
+
+def recompute_signal_counts(level, soc_of):
+    # {(drug_key, event_key): [drug, event, n]} from the case JSON
+    counts = {}
+    for row in db.session.query(Case.products, Case.events).yield_per(2000):
+        for key, labels in case_contributions(row.products, row.events, soc_of)[level].items():
+            hit = counts.get(key)
+            if hit is None:
+                counts[key] = [*labels, 1]
+            else:
+                hit[2] += 1
+    return counts
+
+
+def top_signal_counts(level, drug=None, event=None, limit=20):
+    # a drug's most reported events or an event's most reported drugs,
+    # served by the (level, drug_key|event_key, n) indexes
+    c = _counts.c
+    if drug:
+        own, other, label = c.drug_key, c.event_key, c.event
+        key = drug.strip().lower()[:_CLIP]
+    else:
+        own, other, label = c.event_key, c.drug_key, c.drug
+        key = event.strip().lower()[:_CLIP]
+    base  = select(c.n).where(c.level == level, own == key, other == "")
+    total = db.session.execute(base).scalar()
+    rows  = db.session.execute(
+        select(label, c.n).where(c.level == level, own == key, other != "")
+        .order_by(c.n.desc()).limit(limit)).all()
+    return total or 0, [{"name": name, "count": n} for name, n in rows]
+
+
+# =========================================================
+# SIGNAL TABLES — drug x PT and drug x SOC statistics,
+# reloaded from pv_signal_count when the case count or
+# newest update changes
+# =========================================================
+
+SIGNAL_RECHECK  = 300       # seconds between signature checks
+_signal_lock    = threading.Lock()
+_signal_state   = {"signature": None, "checked": 0.0, "tables": None}
+
+
+def case_signature():
+    count, newest = db.session.query(func.count(Case.id), func.max(Case.updated_at)).one()
+    return (count, newest)
+
+
+def build_signal_tables(n_cases):
+    c = _counts.c
+    stored = db.session.execute(
+        select(c.n).where(c.level == "pt", c.drug_key == "", c.event_key == "")).scalar()
+    if stored != n_cases:
+        # aggregates not backfilled (or drifted): count from the JSON
+        print(f"[SkyVigilance] pv_signal_count holds {stored or 0} of {n_cases} cases — "
+              f"counting from case JSON; run `flask signal-reconcile --fix`.")
+        soc_of = soc_map(db.session.connection())
+        tables = {}
+        for level in SIGNAL_LEVELS:
+            rows = ((dk, ek, dl, el, n) for (dk, ek), (dl, el, n)
+                    in recompute_signal_counts(level, soc_of).items())
+            tables[level] = counts_table(rows)
+        return tables
+    return {level: counts_table(db.session.execute(
+                select(c.drug_key, c.event_key, c.drug, c.event, c.n).where(c.level == level)))
+            for level in SIGNAL_LEVELS}
+
+
+def get_signal_tables():
+    now = time.monotonic()
+    with _signal_lock:
+        st = _signal_state
+        if st["tables"] is None or now - st["checked"] > SIGNAL_RECHECK:
+            st["checked"] = now
+            sig = case_signature()
+            if sig != st["signature"]:
+                started = time.monotonic()
+                st["tables"], st["signature"] = build_signal_tables(sig[0]), sig
+                print(f"[SkyVigilance] Signal tables built ({sig[0]} cases, "
+                      f"{len(st['tables']['pt'])} drug-PT pairs) in {time.monotonic() - started:.1f}s.")
+                for level, table in st["tables"].items():
+                    if table.prior_fit == "degenerate":
+                        print(f"[SkyVigilance] WARNING: MGPS prior fit degenerate at level {level} "
+                              f"({', '.join(f'{float(x):.3g}' for x in table.prior)}) — EBGM / EB05 withheld.")
+        return st["tables"]
@@ -0,0 +1,477 @@
+# =========================================================
+# BULK CASE INGESTION
+# ---------------------------------------------------------
+# The inverse of build_e2b_xml and of the line listing
+# export. ICH E2B(R3) batch XML is stream-parsed with
+# iterparse, one PORR_IN049016UV at a time, each cleared
+# once mapped; CSV line listings are read row by row. Both
+# become Case JSON sections, inserted in chunks with one
+# AuditLog entry per case. A bad record is reported and
+# skipped, never fatal to the batch.
+# =========================================================
+
+import csv
+import gzip
+import io
+import itertools
+
+from app import (ACTION_TAKEN, AGE_UNITS, COUNTRY_CODES, HL7, OID, OUTCOMES, SERIOUS_CODES, SEX_CODES,
+                 db, etree, Case, MeddraTerm, _validate_step, log_event, ts_now)
+from line_listing import COLUMNS
+from summary import SERIOUS_LABELS
+
+FORMATS    = ("e2b", "csv")
+CHUNK      = 500            # cases per transaction
+MAX_ERRORS = 1000           # errors kept in the report (all are counted)
+
+NS   = {"h": HL7}
+PORR = f"{{{HL7}}}PORR_IN049016UV"
+
+
+class IngestError(ValueError):
+    pass
+
+
+def _inverse(mapping):
+    out = {}
+    for k, v in mapping.items():
+        out.setdefault(v, k)
+    return out
+
+
+SEX           = _inverse(SEX_CODES)
+ACTION        = _inverse(ACTION_TAKEN)
+OUTCOME       = _inverse(OUTCOMES)
+SERIOUS       = _inverse(SERIOUS_CODES)
+COUNTRY       = _inverse(COUNTRY_CODES)
+AGE_UNIT      = {v: k.capitalize() for k, v in AGE_UNITS.items()}
+ROLE          = {"1": "Suspect", "2": "Concomitant", "3": "Interacting"}
+QUALIFICATION = {"1": "Physician", "2": "Pharmacist", "3": "Other HCP", "4": "Lawyer", "5": "Consumer"}
+REPORT_TYPE   = {"1": "Spontaneous", "2": "Clinical Trial", "3": "Other", "4": "Other"}   # C.1.3
+
+
+# =========================================================
+# E2B(R3) — one PORR_IN049016UV -> Case sections
+# =========================================================
+
+def _find(el, path):
+    return el.find(path, NS) if el is not None else None
+
+
+def _attr(el, path, name="value"):
+    node = _find(el, path)
+    return node.get(name) if node is not None else None
+
+
+def _text(el, path=None):
+    node = _find(el, path) if path else el
+    if node is None:
+        return None
+    return (node.text or "").strip() or None
+
+
+def _date(value):
+    # HL7 TS (YYYY[MM[DD[hhmmss]]]) -> ISO date, to the precision given
+    if not value:
+        return None
+    v = value[:8]
+    return "-".join(p for p in (v[:4], v[4:6], v[6:8]) if p)
+
+
+def _code(el):
+    return _attr(el, "h:code", "code")
+
+
+def _compact(d):
+    return {k: v for k, v in d.items() if v not in (None, "", {}, [])}
+
+
+def _range(el):
+    eff = _find(el, "h:effectiveTime")
+    return _date(_attr(eff, ".//h:low")), _date(_attr(eff, ".//h:high"))
+
+
+def _reaction(obs):
+    val     = _find(obs, "h:value")
+    country = _attr(obs, "h:location/h:locatedEntity/h:locatedPlace/h:code", "code")
+    onset, stop = _range(obs)
+    ev = {
+        "term":      _text(val, "h:originalText"),
+        "llt_code":  val.get("code") if val is not None and val.get("codeSystem") == OID["meddra"] else None,
+        "onsetDate": onset,
+        "stopDate":  stop,
+        "country":   COUNTRY.get(country, country),
+    }
+    serious = {}
+    for rel in obs.iterfind("h:outboundRelationship2/h:observation", NS):
+        code = _code(rel)
+        if code == "27":
+            ev["outcome"] = OUTCOME.get(_attr(rel, "h:value", "code"))
+        elif code in SERIOUS and _attr(rel, "h:value") == "true":
+            serious[SERIOUS[code]] = True
+    ev["seriousness"] = serious
+    return _compact(ev)
+
+
+def _history(org):
+    out = []
+    for obs in org.iterfind("h:component/h:observation", NS):
+        start, stop = _range(obs)
+        h = {"description": _text(obs, "h:code/h:originalText"), "startDate": start, "stopDate": stop}
+        for rel in obs.iterfind("h:inboundRelationship/h:observation", NS):
+            if _code(rel) == "13":
+                h["ongoing"] = _attr(rel, "h:value") == "true"
+        for rel in obs.iterfind("h:outboundRelationship2/h:observation", NS):
+            if _code(rel) == "10":
+                h["notes"] = _text(rel, "h:value")
+        out.append(_compact(h))
+    return [h for h in out if h.get("description")]
+
+
+def _labs(org):
+    out = []
+    for obs in org.iterfind("h:component/h:observation", NS):
+        lab = {"testName": _text(obs, "h:code/h:originalText"),
+               "testDate": _date(_attr(obs, "h:effectiveTime")),
+               "result":   _text(obs, "h:value")}
+        for rng in obs.iterfind("h:referenceRange/h:observationRange", NS):
+            bound = "normLow" if _attr(rng, "h:interpretationCode", "code") == "L" else "normHigh"
+            lab[bound] = _attr(rng, "h:value")
+            lab["units"] = lab.get("units") or _attr(rng, "h:value", "unit")
+        if lab["result"] and lab.get("units") and lab["result"].endswith(" " + lab["units"]):
+            lab["result"] = lab["result"][:-len(lab["units"]) - 1]
+        out.append(_compact(lab))
+    return [l for l in out if l.get("testName")]
+
+
+def _drug(sa):
+    product  = _find(sa, "h:consumable/h:instanceOfKind/h:kindOfProduct")
+    approval = _find(product, "h:asManufacturedProduct/h:subjectOf/h:approval")
+    dose     = _find(sa, "h:outboundRelationship2/h:substanceAdministration")
+    start, stop = _range(dose)
+    route    = _find(dose, "h:routeCode")
+    form     = _find(dose, ".//h:formCode")
+    country  = _attr(approval, "h:author/h:territorialAuthority/h:territory/h:code", "code")
+    drug = {
+        "name":        _text(product, "h:name"),
+        "genericName": _text(product, "h:activeIngredient/h:ingredient/h:ingredientSubstance/h:name"),
+        "authNumber":  _attr(approval, "h:id", "extension"),
+        "authCountry": COUNTRY.get(country, country),
+        "frequency":   _text(dose, "h:text"),
+        "startDate":   start,
+        "stopDate":    stop,
+        "route":       (_text(route, "h:originalText") or route.get("code")) if route is not None else None,
+        "dose":        _attr(dose, "h:doseQuantity"),
+        "doseUnit":    _attr(dose, "h:doseQuantity", "unit"),
+        "formulation": (_text(form, "h:originalText") or form.get("code")) if form is not None else None,
+        "batch":       _text(dose, ".//h:lotNumberText"),
+    }
+    for rel in sa.iterfind("h:inboundRelationship", NS):
+        if rel.get("typeCode") == "RSON":
+            drug["indication"] = _text(rel, "h:observation/h:value/h:originalText")
+        elif rel.get("typeCode") == "CAUS":
+            drug["actionTaken"] = ACTION.get(_attr(rel, "h:act/h:code", "code"))
+    return _attr(sa, "h:id", "root"), _compact(drug)
+
+
+def porr_case(porr):
+    # -> Case column values (id may be None) for one PORR_IN049016UV
+    inv = _find(porr, "h:controlActProcess/h:subject/h:investigationEvent")
+    if inv is None:
+        raise IngestError("no investigationEvent in PORR_IN049016UV")
+    case_id = next((i.get("extension") for i in inv.iterfind("h:id", NS)
+                    if i.get("root") == OID["case_id"]), None) or _attr(porr, "h:id", "extension")
+
+    triage, general, patient = {}, {}, {}
+    triage["receiptDate"] = _date(_attr(inv, "h:effectiveTime/h:low"))
+    central = _date(_attr(inv, "h:availabilityTime"))
+    if central != triage["receiptDate"]:
+        general["centralReceiptDate"] = central
+    for ch in inv.iterfind("h:subjectOf2/h:investigationCharacteristic", NS):
+        if _code(ch) == "1":
+            general["reportType"] = REPORT_TYPE.get(_attr(ch, "h:value", "code"))
+
+    source = _find(inv, "h:outboundRelationship/h:relatedInvestigation/h:subjectOf2/h:controlActEvent"
+                        "/h:author/h:assignedEntity")
+    triage["qualification"]   = QUALIFICATION.get(_attr(source, "h:code", "code"))
+    country = _attr(source, "h:asLocatedEntity/h:location/h:code", "code")
+    triage["reporterCountry"] = COUNTRY.get(country, country)
+
+    assessment = _find(inv, "h:component/h:adverseEventAssessment")
+    role   = _find(assessment, "h:subject1/h:primaryRole")
+    player = _find(role, "h:player1")
+    patient.update(
+        initials = _text(player, "h:name"),
+        sex      = SEX.get(_attr(player, "h:administrativeGenderCode", "code")),
+        dob      = _date(_attr(player, "h:birthTime")),
+        patId    = _attr(player, "h:asIdentifiedEntity/h:id", "extension"),
+    )
+    triage["patientInitials"] = patient["initials"]
+
+    events, drugs = [], {}
+    for sub in (role.iterfind("h:subjectOf2/*", NS) if role is not None else ()):
+        kind, code = etree.QName(sub).localname, _code(sub)
+        if kind == "observation":
+            if code == "29":
+                events.append(_reaction(sub))
+            elif code in ("3", "7", "17"):
+                key = {"3": "age", "7": "weight", "17": "height"}[code]
+                patient[key] = _attr(sub, "h:value")
+                if code == "3":
+                    patient["ageUnit"] = AGE_UNIT.get(_attr(sub, "h:value", "unit"))
+        elif kind == "organizer":
+            if code == "1":
+                patient["otherHistory"] = _history(sub)
+            elif code == "3":
+                patient["labData"] = _labs(sub)
+            elif code == "4":
+                for sa in sub.iterfind("h:component/h:substanceAdministration", NS):
+                    uid, drug = _drug(sa)
+                    drugs[uid or len(drugs)] = drug
+
+    # drug characterisation (G.k.1) is a causalityAssessment pointing at the drug's id
+    for ca in (assessment.iterfind("h:component1/h:causalityAssessment", NS) if assessment is not None else ()):
+        if _code(ca) == "20":
+            uid = _attr(ca, "h:subject2/h:productUseReference/h:id", "root")
+            if uid in drugs:
+                drugs[uid]["role"] = ROLE.get(_attr(ca, "h:value", "code"))
+
+    serious = {}
+    for ev in events:
+        serious.update(ev.get("seriousness") or {})
+    if serious:
+        general["seriousness"] = serious
+    # country of incidence: where the first reaction occurred (E.i.9), else the reporter's
+    countries = [ev.pop("country", None) for ev in events]
+    triage["country"] = next(filter(None, countries), None) or triage["reporterCountry"]
+    return {
+        "id":        case_id,
+        "triage":    _compact(triage),
+        "general":   _compact(general),
+        "patient":   _compact(patient),
+        "products":  [_compact(d) for d in drugs.values()],
+        "events":    events,
+        "narrative": _text(inv, "h:text"),
+    }
+
+
+def e2b_records(f):
+    # (record number, Case values | IngestError) per PORR, in constant memory
+    n = 0
+    parser = etree.iterparse(f, events=("end",), tag=PORR, resolve_entities=False, no_network=True,
+                             remove_comments=True)
+    try:
+        for _, porr in parser:
+            n += 1
+            try:
+                yield n, porr_case(porr)
+            except (IngestError, AttributeError, TypeError, KeyError, ValueError) as e:
+                yield n, IngestError(str(e) or type(e).__name__)
+            porr.clear(keep_tail=True)
+            while porr.getprevious() is not None:
+                del porr.getparent()[0]
+    except etree.XMLSyntaxError as e:
+        yield n + 1, IngestError(f"XML syntax error, rest of file skipped: {e}")
+
+
+# =========================================================
+# CSV — line listing rows (any of flatten first / joined /
+# rows), grouped into cases by consecutive Case #
+# =========================================================
+
+_BY_HEADER = {**{h.lower(): k for k, h in COLUMNS}, **{k.lower(): k for k, _ in COLUMNS}}
+_SERIOUS   = {v.lower(): k for k, v in reversed(list(SERIOUS_LABELS.items()))}
+_PRODUCT   = ("drug", "genericName", "dose", "route", "indication", "startDate", "stopDate")
+_EVENT     = ("eventVerbatim", "pt", "ptCode", "soc", "onsetDate", "causality", "listedness", "outcome")
+
+
+def _clean(value):
+    value = (value or "").strip()
+    return None if value in ("", "—", "-") else value
+
+
+def _cells(rows, keys):
+    # distinct value tuples across rows; " | "-joined cells fan out
+    seen = {}
+    for row in rows:
+        parts = [(row.get(k) or "").split(" | ") for k in keys]
+        for vals in itertools.zip_longest(*parts, fillvalue=""):
+            vals = tuple(_clean(v) for v in vals)
+            if any(vals):
+                seen.setdefault(vals, None)
+    return [dict(zip(keys, vals)) for vals in seen]
+
+
+def _split(value):
+    head, _, tail = (value or "").partition(" ")
+    return (head or None), (tail.strip() or None)
+
+
+def csv_case(rows):
+    r = {k: _clean(v) for k, v in rows[0].items()}
+    age, unit = _split(r.get("age"))
+    flags = [s.strip().lower() for s in (r.get("serious") or "").split(";")]
+    serious = {_SERIOUS[f]: True for f in flags if f in _SERIOUS}
+    products = []
+    for p in _cells(rows, _PRODUCT):
+        dose, dose_unit = _split(p["dose"])
+        products.append(_compact({
+            "name": p["drug"], "genericName": p["genericName"], "dose": dose, "doseUnit": dose_unit,
+            "route": p["route"], "indication": p["indication"],
+            "startDate": p["startDate"], "stopDate": p["stopDate"],
+        }))
+    events = [_compact({
+        "term": e["eventVerbatim"], "pt": e["pt"], "pt_code": e["ptCode"], "soc": e["soc"],
+        "onsetDate": e["onsetDate"], "causality": e["causality"], "listedness": e["listedness"],
+        "outcome": e["outcome"],
+    }) for e in _cells(rows, _EVENT)]
+    return {
+        "id":       r.get("caseNumber"),
+        "triage":   _compact({"receiptDate": r.get("receiptDate"), "country": r.get("country"),
+                              "qualification": r.get("reporter"), "patientInitials": r.get("patientInitials")}),
+        "general":  _compact({"reportType": r.get("reportType"), "seriousness": serious}),
+        "patient":  _compact({"initials": r.get("patientInitials"), "age": age,
+                              "ageUnit": "Years" if unit == "yrs" else unit, "sex": r.get("sex")}),
+        "products": products,
+        "events":   events,
+    }
+
+
+def csv_records(f):
+    reader = csv.reader(f)
+    header = next(reader, None)
+    if not header:
+        yield 1, IngestError("empty CSV")
+        return
+    keys = [_BY_HEADER.get(h.strip().lower()) for h in header]
+    if not {"receiptDate", "drug", "eventVerbatim", "pt"} & set(keys):
+        yield 1, IngestError(f"unrecognised CSV header: {header[:5]}")
+        return
+    rows    = ({k: v for k, v in zip(keys, row) if k} for row in reader if any(row))
+    counter = itertools.count()
+    for n, (_, group) in enumerate(itertools.groupby(
+            rows, key=lambda r: _clean(r.get("caseNumber")) or f"#{next(counter)}"), 1):
+        try:
+            yield n, csv_case(list(group))
+        except (ValueError, KeyError) as e:
+            yield n, IngestError(str(e))
+
+
+# =========================================================
+# Input detection
+# =========================================================
+
+def open_upload(stream, fmt=None):
+    # binary stream, optionally gzipped -> (format, records); the format
+    # is sniffed from the first byte when not given
+    if not hasattr(stream, "peek"):
+        stream = io.BufferedReader(stream)
+    if stream.peek(2)[:2] == b"\x1f\x8b":
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    if fmt is None:
+        fmt = "e2b" if stream.peek(64).lstrip(b"\xef\xbb\xbf \t\r\n")[:1] == b"<" else "csv"
+    if fmt not in FORMATS:
+        raise IngestError(f"format must be one of {list(FORMATS)}.")
+    if fmt == "e2b":
+        return fmt, e2b_records(stream)
+    return fmt, csv_records(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+
+
+# =========================================================
+# Insert — chunked, one AuditLog row per case
+# =========================================================
+
+def _code_events(batch):
+    # fill PT / SOC for E2B reactions that only carry a MedDRA LLT code
+    codes = {e["llt_code"] for _, d in batch for e in d["events"] if e.get("llt_code") and not e.get("pt")}
+    if not codes:
+        return
+    terms = {t.llt_code: t for t in db.session.query(
+        MeddraTerm.llt_code, MeddraTerm.llt_name, MeddraTerm.pt_code, MeddraTerm.pt_name, MeddraTerm.soc_name)
+        .filter(MeddraTerm.llt_code.in_(codes))}
+    for _, d in batch:
+        for e in d["events"]:
+            t = terms.get(e.get("llt_code"))
+            if t and not e.get("pt"):
+                e.update(llt=t.llt_name, pt=t.pt_name, pt_code=t.pt_code, soc=t.soc_name)
+                e.setdefault("term", t.llt_name)
+
+
+def _add(data, n, user, role, source):
+    db.session.add(Case(**data))
+    db.session.flush()
+    log_event(data["id"], "CASE_IMPORTED", user, role, step_to=1, section="import",
+              details=f"Imported from {source} (record {n})")
+
+
+def _insert_chunk(batch, user, role, source):
+    # -> [(record, case id, error or None)]
+    ids   = [d["id"] for _, d in batch]
+    taken = {i for (i,) in db.session.query(Case.id).filter(Case.id.in_(ids))}
+    _code_events(batch)
+    results, fresh, seen = [], [], set()
+    for n, d in batch:
+        if d["id"] in taken or d["id"] in seen:
+            results.append((n, d["id"], f"case {d['id']} already exists"))
+        else:
+            seen.add(d["id"])
+            fresh.append((n, d))
+    try:
+        for n, d in fresh:
+            db.session.add(Case(**d))
+        db.session.flush()
+        for n, d in fresh:
+            log_event(d["id"], "CASE_IMPORTED", user, role, step_to=1, section="import",
+                      details=f"Imported from {source} (record {n})")
+        db.session.commit()
+        results += [(n, d["id"], None) for n, d in fresh]
+    except Exception:
+        # isolate the failing record(s) with a savepoint each
+        db.session.rollback()
+        for n, d in fresh:
+            try:
+                with db.session.begin_nested():
+                    _add(d, n, user, role, source)
+                results.append((n, d["id"], None))
+            except Exception as e:
+                results.append((n, d["id"], str(getattr(e, "orig", e)).splitlines()[0]))
+        db.session.commit()
+    db.session.expunge_all()
+    return sorted(results)
+
+
+def ingest(records, user="import", role="system", source="upload", chunk=CHUNK, on_result=None):
+    # records: (record number, Case values | IngestError); -> report
+    prefix = f"IMP-{ts_now()}"
+    report = {"source": source, "received": 0, "created": 0, "failed": 0, "errors": []}
+
+    def result(n, case_id, error):
+        report["received"] += 1
+        if error:
+            report["failed"] += 1
+            if len(report["errors"]) < MAX_ERRORS:
+                report["errors"].append({"record": n, "caseId": case_id, "error": error})
+        else:
+            report["created"] += 1
+        if on_result:
+            on_result({"record": n, "caseId": case_id, "error": error})
+
+    batch = []
+    for n, data in records:
+        if isinstance(data, Exception):
+            result(n, None, str(data))
+            continue
+        data["id"] = data.get("id") or f"{prefix}-{n:06d}"
+        ok, errors = _validate_step(data, 1)
+        if not ok:
+            result(n, data["id"], " ".join(errors))
+            continue
+        batch.append((n, data))
+        if len(batch) >= chunk:
+            for r in _insert_chunk(batch, user, role, source):
+                result(*r)
+            batch = []
+    if batch:
+        for r in _insert_chunk(batch, user, role, source):
+            result(*r)
+    return report
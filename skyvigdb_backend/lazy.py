@@ -0,0 +1,34 @@
+# =========================================================
+# DEFERRED IMPORTS
+# ---------------------------------------------------------
+# lxml, numpy and fuzzywuzzy are imported on first use
+# rather than at worker boot. Availability is probed with
+# find_spec, which locates a module without executing it.
+# =========================================================
+
+import importlib
+import importlib.util
+
+
+def available(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+class LazyModule:
+    # stands in for a module; the first attribute access imports it
+    # and each attribute is cached on the proxy, so later lookups
+    # cost the same as on the module itself
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+
+    def __getattr__(self, attr):
+        value = getattr(importlib.import_module(self._name), attr)
+        self.__dict__[attr] = value
+        return value
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
@@ -0,0 +1,229 @@
+# =========================================================
+# LINE LISTING EXPORT
+# ---------------------------------------------------------
+# Server-side counterpart of lineListingRows /
+# exportLineListing in App.js: the same columns, seriousness
+# labels and product/event flattening, with the /api/cases
+# filters applied in SQL and rows streamed out as CSV or
+# XLSX in constant memory.
+# =========================================================
+
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from app import Case
+from listing import apply_filters, apply_keyset, base_query, parse_args
+from streaming import ChunkBuffer
+from summary import SERIOUS_LABELS
+
+COLUMNS = [
+    ("caseNumber",      "Case #"),
+    ("receiptDate",     "Receipt Date"),
+    ("country",         "Country"),
+    ("reportType",      "Report Type"),
+    ("patientInitials", "Patient Initials"),
+    ("age",             "Age"),
+    ("sex",             "Sex"),
+    ("drug",            "Drug (Brand)"),
+    ("genericName",     "Generic Name"),
+    ("dose",            "Dose"),
+    ("route",           "Route"),
+    ("indication",      "Indication"),
+    ("startDate",       "Drug Start"),
+    ("stopDate",        "Drug Stop"),
+    ("eventVerbatim",   "Event Verbatim"),
+    ("pt",              "MedDRA PT"),
+    ("ptCode",          "PT Code"),
+    ("soc",             "SOC"),
+    ("onsetDate",       "Onset Date"),
+    ("serious",         "Seriousness"),
+    ("causality",       "Causality"),
+    ("listedness",      "Listedness"),
+    ("outcome",         "Outcome"),
+    ("status",          "Status"),
+    ("reporter",        "Reporter Qualification"),
+]
+KEYS    = [k for k, _ in COLUMNS]
+HEADERS = [h for _, h in COLUMNS]
+
+FORMATS = ("csv", "xlsx")
+FLATTEN = ("first", "joined", "rows")   # first product/event | all, joined per cell | one row per pair
+
+_LOAD = (Case.id, Case.status, Case.triage, Case.general, Case.patient, Case.products, Case.events)
+
+
+def _v(value):
+    return value or "—"
+
+
+# ---------------------------------------------------------
+# Row building — mirrors lineListingRows
+# ---------------------------------------------------------
+
+def _case_part(c):
+    t = c.triage  or {}
+    g = c.general or {}
+    p = c.patient or {}
+    s = g.get("seriousness") or t.get("seriousness") or {}
+    flags = [SERIOUS_LABELS.get(k, k) for k, v in s.items() if v]
+    return {
+        "caseNumber":      c.id,
+        "receiptDate":     _v(t.get("receiptDate")),
+        "country":         _v(t.get("country")),
+        "reportType":      _v(t.get("reportType") or g.get("reportType")),
+        "patientInitials": _v(p.get("initials") or t.get("patientInitials")),
+        "age":             f"{p['age']} {p.get('ageUnit') or 'yrs'}" if p.get("age") else "—",
+        "sex":             _v(p.get("sex")),
+        "serious":         "; ".join(flags) if flags else "Non-serious",
+        "status":          _v(c.status),
+        "reporter":        _v(t.get("qualification")),
+    }
+
+
+def _product_part(d):
+    return {
+        "drug":        _v(d.get("name")),
+        "genericName": _v(d.get("genericName")),
+        "dose":        f"{d['dose']} {d.get('doseUnit') or ''}".strip() if d.get("dose") else "—",
+        "route":       _v(d.get("route")),
+        "indication":  _v(d.get("indication")),
+        "startDate":   _v(d.get("startDate")),
+        "stopDate":    _v(d.get("stopDate")),
+    }
+
+
+def _event_part(e):
+    return {
+        "eventVerbatim": _v(e.get("term")),
+        "pt":            _v(e.get("pt")),
+        "ptCode":        _v(e.get("pt_code")),
+        "soc":           _v(e.get("soc")),
+        "onsetDate":     _v(e.get("onsetDate")),
+        "causality":     _v(e.get("causality")),
+        "listedness":    _v(e.get("listedness")),
+        "outcome":       _v(e.get("outcome")),
+    }
+
+
+def _joined(parts):
+    return {k: " | ".join(str(p[k]) for p in parts) for k in parts[0]}
+
+
+def case_rows(c, flatten="first"):
+    # -> row lists in KEYS order
+    base     = _case_part(c)
+    products = [p or {} for p in (c.products or [])] or [{}]
+    events   = [e or {} for e in (c.events   or [])] or [{}]
+    if flatten == "first":
+        pairs = [(_product_part(products[0]), _event_part(events[0]))]
+    elif flatten == "joined":
+        pairs = [(_joined([_product_part(p) for p in products]), _joined([_event_part(e) for e in events]))]
+    else:
+        evts  = [_event_part(e) for e in events]
+        pairs = [(_product_part(p), e) for p in products for e in evts]
+    for prod, evt in pairs:
+        row = {**base, **prod, **evt}
+        yield [row[k] for k in KEYS]
+
+
+def listing_rows(args, flatten="first"):
+    opts = parse_args(args)
+    q = apply_filters(base_query(*_LOAD), opts)
+    if args.get("sort"):
+        q, _ = apply_keyset(q, opts)
+    else:
+        q = q.order_by(Case.id)
+    for c in q.yield_per(500):
+        yield from case_rows(c, flatten)
+
+
+# ---------------------------------------------------------
+# Encoders — generators of bytes chunks
+# ---------------------------------------------------------
+
+def stream_csv(rows):
+    buf = io.StringIO()
+    out = csv.writer(buf, quoting=csv.QUOTE_ALL, lineterminator="\n")
+    out.writerow(HEADERS)
+    for row in rows:
+        out.writerow(row)
+        if buf.tell() > 64 * 1024:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+_XML_BAD = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_XLSX_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Line Listing" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'),
+}
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0">'
+    '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+    '</sheetView></sheetViews><sheetData>')
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+def _xlsx_row(values):
+    cells = "".join(f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_XML_BAD.sub("", str(v)))}</t></is></c>'
+                    for v in values)
+    return f"<row>{cells}</row>".encode("utf-8")
+
+
+def stream_xlsx(rows):
+    # a minimal single-sheet workbook with inline strings; zipfile
+    # writes data descriptors, so the archive needs no seeking
+    buf = ChunkBuffer()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, body in _XLSX_PARTS.items():
+            zf.writestr(name, body)
+        with zf.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(_SHEET_HEAD.encode("utf-8"))
+            sheet.write(_xlsx_row(HEADERS))
+            for row in rows:
+                sheet.write(_xlsx_row(row))
+                chunk = buf.take()
+                if chunk:
+                    yield chunk
+            sheet.write(_SHEET_TAIL.encode("utf-8"))
+    yield buf.take()
+
+
+ENCODERS = {
+    "csv":  (stream_csv,  "text/csv"),
+    "xlsx": (stream_xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
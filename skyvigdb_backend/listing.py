@@ -0,0 +1,294 @@
+# =========================================================
+# CASE LISTING — filters, sorting, keyset pagination and
+# field projection shared by the /api/cases listing and the
+# export endpoints
+# =========================================================
+
+import base64
+import hashlib
+import json
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from sqlalchemy import Date, and_, or_, func, literal
+from sqlalchemy.orm import load_only
+
+from app import db, Case, CaseSummary
+from cache import response_cache
+from summary import summarize
+
+SECTIONS = ("triage", "general", "patient", "products", "events",
+            "medical", "quality", "submissions", "archival", "narrative")
+
+BASE_FIELDS    = ("id", "caseNumber", "currentStep", "status", "createdAt", "updatedAt")
+SUMMARY_FIELDS = ("receiptDate", "country", "drug", "genericName", "eventTerm", "pt",
+                  "serious", "reporter")
+
+MAX_LIMIT = 500
+
+_SUMMARY_FILTERS = ("country", "q", "from", "to", "serious")     # filters that need pv_case_summary
+
+
+class ListingError(ValueError):
+    pass
+
+
+def _sort_columns():
+    # (expression, cursor value kind) — NULL summary values are
+    # coalesced so the keyset comparison stays total
+    return {
+        "updatedAt":   (Case.updated_at,   "datetime"),
+        "createdAt":   (Case.created_at,   "datetime"),
+        "id":          (Case.id,           None),
+        "currentStep": (Case.current_step, None),
+        "receiptDate": (func.coalesce(CaseSummary.receipt_date, literal(date.min, Date)), "date"),
+        "country":     (func.coalesce(CaseSummary.country, ""), None),
+    }
+
+
+def _iso_date(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ListingError(f"{name} must be an ISO date (YYYY-MM-DD).")
+
+
+# ---------------------------------------------------------
+# Request parsing
+# ---------------------------------------------------------
+
+def parse_args(args):
+    opts = {
+        "step":     [int(s) for s in args.get("step", "").split(",") if s.strip()],
+        "status":   [s.strip() for s in args.get("status", "").split(",") if s.strip()],
+        "serious":  args.get("serious"),
+        "country":  args.get("country"),
+        "q":        (args.get("q") or "").strip(),
+        "from":     args.get("receivedFrom"),
+        "to":       args.get("receivedTo"),
+        "sort":     args.get("sort", "-updatedAt"),
+        "cursor":   args.get("cursor"),
+        "limit":    args.get("limit"),
+        "fields":   args.get("fields"),
+    }
+    opts["from"] = _iso_date(opts["from"], "receivedFrom") if opts["from"] else None
+    opts["to"]   = _iso_date(opts["to"],   "receivedTo")   if opts["to"]   else None
+    if opts["serious"] not in (None, "", "true", "false"):
+        raise ListingError("serious must be 'true' or 'false'.")
+    if opts["sort"].lstrip("-") not in _sort_columns():
+        raise ListingError(f"sort must be one of: {', '.join(_sort_columns())} (prefix '-' for descending).")
+    if opts["limit"] not in (None, ""):
+        opts["limit"] = max(1, min(int(opts["limit"]), MAX_LIMIT))
+    else:
+        opts["limit"] = None
+    opts["fields"] = parse_fields(opts["fields"])
+    return opts
+
+
+def parse_fields(raw):
+    if not raw:
+        return None
+    wanted = []
+    for f in raw.split(","):
+        f = f.strip()
+        if f == "summary":
+            wanted.extend(BASE_FIELDS + SUMMARY_FIELDS)
+        elif f in BASE_FIELDS or f in SUMMARY_FIELDS or f in SECTIONS:
+            wanted.append(f)
+        elif f:
+            raise ListingError(f"Unknown field '{f}'.")
+    return list(dict.fromkeys(wanted))
+
+
+# ---------------------------------------------------------
+# Query building
+# ---------------------------------------------------------
+
+def apply_filters(q, opts):
+    if opts["step"]:
+        q = q.filter(Case.current_step.in_(opts["step"]))
+    if opts["status"]:
+        q = q.filter(Case.status.in_(opts["status"]))
+    if opts["country"]:
+        q = q.filter(CaseSummary.country == opts["country"])
+    if opts["q"]:
+        like = f"%{opts['q']}%"
+        q = q.filter(or_(Case.id.ilike(like), CaseSummary.first_drug.ilike(like),
+                         CaseSummary.first_pt.ilike(like), CaseSummary.country.ilike(like),
+                         CaseSummary.patient_initials.ilike(like)))
+    if opts["from"]:
+        q = q.filter(CaseSummary.receipt_date >= opts["from"])
+    if opts["to"]:
+        q = q.filter(CaseSummary.receipt_date <= opts["to"])
+    if opts["serious"] == "true":
+        q = q.filter(CaseSummary.serious.is_(True))
+    elif opts["serious"] == "false":
+        q = q.filter(or_(CaseSummary.serious.is_(False), CaseSummary.serious.is_(None)))
+    return q
+
+
+def base_query(*entities):
+    return (db.session.query(*entities)
+            .outerjoin(CaseSummary, CaseSummary.case_id == Case.id))
+
+
+def encode_cursor(value, case_id):
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    raw = json.dumps([value, case_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, kind):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, case_id = json.loads(raw)
+        if kind == "datetime" and value is not None:
+            value = datetime.fromisoformat(value)
+        elif kind == "date" and value is not None:
+            value = date.fromisoformat(value)
+        return value, case_id
+    except (ValueError, TypeError) as e:
+        raise ListingError(f"Invalid cursor: {e}")
+
+
+def apply_keyset(q, opts):
+    key  = opts["sort"].lstrip("-")
+    desc = opts["sort"].startswith("-")
+    col, kind = _sort_columns()[key]
+
+    if opts["cursor"]:
+        value, last_id = decode_cursor(opts["cursor"], kind)
+        if desc:
+            q = q.filter(or_(col < value, and_(col == value, Case.id < last_id)))
+        else:
+            q = q.filter(or_(col > value, and_(col == value, Case.id > last_id)))
+
+    order = (col.desc(), Case.id.desc()) if desc else (col.asc(), Case.id.asc())
+    return q.add_columns(col.label("_sort_value")).order_by(*order), key
+
+
+def columns_for(fields):
+    if fields is None:
+        return None
+    cols = {"id", "current_step", "status", "created_at", "updated_at"}
+    cols.update(f for f in fields if f in SECTIONS)
+    return [getattr(Case, c) for c in sorted(cols)]
+
+
+# ---------------------------------------------------------
+# Serialisation
+# ---------------------------------------------------------
+
+def summary_of(c, s=None):
+    # rows not yet backfilled fall back to the JSON sections
+    if s is None:
+        s = SimpleNamespace(**summarize(c))
+    return {
+        "receiptDate": s.receipt_date.isoformat() if s.receipt_date else None,
+        "country":     s.country,
+        "drug":        s.first_drug,
+        "genericName": s.first_generic,
+        "eventTerm":   s.first_event_term,
+        "pt":          s.first_pt,
+        "serious":     bool(s.serious),
+        "reporter":    s.reporter_qual,
+    }
+
+
+def project(c, fields, s=None):
+    if fields is None:
+        return c.to_dict()
+    full = {
+        "id":          c.id,
+        "caseNumber":  c.id,
+        "currentStep": c.current_step,
+        "status":      c.status,
+        "createdAt":   c.created_at.isoformat() if c.created_at else None,
+        "updatedAt":   c.updated_at.isoformat() if c.updated_at else None,
+    }
+    if any(f in SUMMARY_FIELDS for f in fields):
+        full.update(summary_of(c, s))
+    out = {}
+    for f in fields:
+        if f in full:
+            out[f] = full[f]
+        elif f == "narrative":
+            out[f] = c.narrative or ""
+        else:
+            out[f] = getattr(c, f) or ([] if f in ("products", "events") else {})
+    return out
+
+
+# ---------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------
+
+def list_etag(args):
+    # -> (opts, etag, total): one aggregate query, no case rows read
+    opts = parse_args(args)
+    aggregate = (func.count(Case.id), func.max(Case.updated_at))
+    if any(opts[k] for k in _SUMMARY_FILTERS):
+        q = base_query(*aggregate)
+    else:
+        q = db.session.query(*aggregate)       # answered from ix_case_updated alone
+    total, newest = apply_filters(q, opts).one()
+    tag_src = f"{total}|{newest.isoformat() if newest else ''}|{sorted(args.items(multi=True))}"
+    return opts, 'W/"' + hashlib.sha1(tag_src.encode()).hexdigest()[:20] + '"', total
+
+
+def etag_matches(if_none_match, etag):
+    return bool(if_none_match) and etag in [t.strip() for t in if_none_match.split(",")]
+
+
+def case_dicts(pairs):
+    # [(case id, updated_at)] -> [to_dict()], from the response cache where
+    # the (id, updated_at) entry exists; only the misses load their JSON
+    keys  = [(i, u.isoformat() if u else None) for i, u in pairs]
+    found = response_cache.get_many("case", keys)
+    fresh = {}
+    missing = [k[0] for k in keys if k not in found]
+    if missing:
+        for c in db.session.query(Case).filter(Case.id.in_(missing)):
+            d = c.to_dict()
+            fresh[c.id] = d
+            response_cache.set("case", (c.id, d["updatedAt"]), d)
+    # a case written between the two queries is served as now stored
+    return [found.get(k) or fresh.get(k[0]) for k in keys]
+
+
+def list_page(opts, total):
+    if opts["fields"] is None:
+        # full case dicts: page over (id, updated_at), then fill from the cache
+        q, key = apply_keyset(apply_filters(base_query(Case.id, Case.updated_at), opts), opts)
+        rows = q.all() if opts["limit"] is None else q.limit(opts["limit"] + 1).all()
+        more = opts["limit"] is not None and len(rows) > opts["limit"]
+        rows = rows[:opts["limit"]] if opts["limit"] is not None else rows
+        items = [d for d in case_dicts([(r[0], r[1]) for r in rows]) if d is not None]
+        last  = (rows[-1][2], rows[-1][0]) if (more and rows) else None
+    else:
+        filtered = apply_filters(base_query(Case, CaseSummary), opts)
+        filtered = filtered.options(load_only(*columns_for(opts["fields"])))
+        q, key = apply_keyset(filtered, opts)
+        rows = q.all() if opts["limit"] is None else q.limit(opts["limit"] + 1).all()
+        more = opts["limit"] is not None and len(rows) > opts["limit"]
+        rows = rows[:opts["limit"]] if opts["limit"] is not None else rows
+        items = [project(c, opts["fields"], cs) for c, cs, _ in rows]
+        last  = (rows[-1][2], rows[-1][0].id) if (more and rows) else None
+
+    if opts["limit"] is None:
+        return items
+    return {
+        "items":      items,
+        "total":      total,
+        "limit":      opts["limit"],
+        "sort":       opts["sort"],
+        "nextCursor": encode_cursor(*last) if last else None,
+    }
+
+
+def list_cases(args, if_none_match=None):
+    opts, etag, total = list_etag(args)
+    if etag_matches(if_none_match, etag):
+        return None, etag, total
+    return list_page(opts, total), etag, total
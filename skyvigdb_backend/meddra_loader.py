@@ -0,0 +1,175 @@
+# =========================================================
+# MEDDRA RELEASE LOADER
+# ---------------------------------------------------------
+# Streams the `$`-delimited ASCII files of a MedDRA release
+# into a versioned side table (meddra_terms_v<version>) with
+# COPY (PostgreSQL) or executemany, then swaps it in for
+# meddra_terms by renaming inside one transaction. The
+# superseded release is parked under its own versioned name,
+# so switching back is another activate.
+# =========================================================
+
+import csv
+import io
+import os
+import re
+
+from sqlalchemy import MetaData, inspect, text
+
+from meddra_search import COLUMNS, detach_db_index, ensure_db_index
+from streaming import windows
+
+LIVE_TABLE = "meddra_terms"
+_CHUNK     = 10000
+
+
+class LoaderError(ValueError):
+    pass
+
+
+def staging_name(version):
+    return f"{LIVE_TABLE}_v" + re.sub(r"\W", "_", version)
+
+
+# ---------------------------------------------------------
+# ASCII parsing
+# ---------------------------------------------------------
+
+def _find(directory, name):
+    for f in os.listdir(directory):
+        if f.lower() == name:
+            return os.path.join(directory, f)
+    return None
+
+
+def _records(directory, name, encoding, required=True):
+    path = _find(directory, name)
+    if path is None:
+        if required:
+            raise LoaderError(f"{name} not found in {directory}.")
+        return
+    with open(path, encoding=encoding, newline="") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if line:
+                yield line.split("$")
+
+
+def release_version(directory, encoding="utf-8"):
+    for f in _records(directory, "meddra_release.asc", encoding, required=False):
+        return f[0].strip() or None
+    return None
+
+
+def hierarchy(directory, encoding="utf-8"):
+    # pt_code -> (pt_name, hlt_code, hlt_name, hlgt_code, hlgt_name,
+    #             soc_code, soc_name, soc_abbrev) along the primary SOC path
+    hier = {}
+    if _find(directory, "mdhier.asc"):
+        for f in _records(directory, "mdhier.asc", encoding):
+            pt, hlt, hlgt, soc, pt_name, hlt_name, hlgt_name, soc_name, abbrev = f[:9]
+            path = (pt_name, hlt, hlt_name, hlgt, hlgt_name, soc, soc_name, abbrev)
+            if len(f) > 11 and f[11] == "Y":
+                hier[pt] = path
+            else:
+                hier.setdefault(pt, path)
+        return hier
+
+    # no mdhier.asc: walk the link files, preferring each PT's primary SOC
+    pts    = {f[0]: (f[1], f[3] if len(f) > 3 else "") for f in _records(directory, "pt.asc", encoding)}
+    hlts   = {f[0]: f[1] for f in _records(directory, "hlt.asc", encoding)}
+    hlgts  = {f[0]: f[1] for f in _records(directory, "hlgt.asc", encoding)}
+    socs   = {f[0]: (f[1], f[2]) for f in _records(directory, "soc.asc", encoding)}
+    pt_hlt, hlt_hlgt, hlgt_soc = {}, {}, {}
+    for f in _records(directory, "hlt_pt.asc", encoding):
+        pt_hlt.setdefault(f[1], []).append(f[0])
+    for f in _records(directory, "hlgt_hlt.asc", encoding):
+        hlt_hlgt.setdefault(f[1], []).append(f[0])
+    for f in _records(directory, "soc_hlgt.asc", encoding):
+        hlgt_soc.setdefault(f[1], []).append(f[0])
+
+    for pt, (pt_name, primary) in pts.items():
+        for hlt in pt_hlt.get(pt, ()):
+            for hlgt in hlt_hlgt.get(hlt, ()):
+                for soc in hlgt_soc.get(hlgt, ()):
+                    soc_name, abbrev = socs.get(soc, ("", ""))
+                    path = (pt_name, hlt, hlts.get(hlt, ""), hlgt, hlgts.get(hlgt, ""), soc, soc_name, abbrev)
+                    if soc == primary:
+                        hier[pt] = path
+                    else:
+                        hier.setdefault(pt, path)
+        hier.setdefault(pt, (pt_name,) + ("",) * 7)
+    return hier
+
+
+def release_rows(directory, version, encoding="utf-8"):
+    # tuples in meddra_search.COLUMNS order, one per LLT
+    hier  = hierarchy(directory, encoding)
+    blank = (None,) * 8
+    for f in _records(directory, "llt.asc", encoding):
+        currency = (f[9] if len(f) > 9 else "") or "Y"
+        yield (f[0], f[1], f[2]) + hier.get(f[2], blank) + (currency, version)
+
+
+# ---------------------------------------------------------
+# Bulk load & switch-over
+# ---------------------------------------------------------
+
+def _copy(conn, table, batch):
+    buf = io.StringIO()
+    csv.writer(buf).writerows(batch)
+    buf.seek(0)
+    cur = conn.connection.cursor()
+    cur.copy_expert(f"COPY {table} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf)
+    cur.close()
+
+
+def load_release(conn, template, rows, version):
+    # template: the MeddraTerm table, whose columns the side table copies
+    name  = staging_name(version)
+    table = template.to_metadata(MetaData(), name=name)
+    table.drop(conn, checkfirst=True)
+    table.create(conn)
+    n = 0
+    for batch in windows(rows, _CHUNK):
+        if conn.dialect.name == "postgresql":
+            _copy(conn, name, batch)
+        else:
+            conn.execute(table.insert(), [dict(zip(COLUMNS, r)) for r in batch])
+        n += len(batch)
+    return name, n
+
+
+def _rename(conn, old, new):
+    conn.execute(text(f'ALTER TABLE "{old}" RENAME TO "{new}"'))
+
+
+def activate(conn, version):
+    staged = staging_name(version)
+    if not inspect(conn).has_table(staged):
+        raise LoaderError(f"MedDRA {version} is not loaded ({staged} does not exist).")
+
+    had_index = detach_db_index(conn)
+    incoming  = f"{LIVE_TABLE}_incoming"
+    parked    = None
+    _rename(conn, staged, incoming)
+    if inspect(conn).has_table(LIVE_TABLE):
+        old    = conn.execute(text(f"SELECT max(meddra_version) FROM {LIVE_TABLE}")).scalar()
+        parked = staging_name(old) if old else f"{LIVE_TABLE}_previous"
+        conn.execute(text(f'DROP TABLE IF EXISTS "{parked}"'))
+        _rename(conn, LIVE_TABLE, parked)
+    _rename(conn, incoming, LIVE_TABLE)
+    if had_index:
+        ensure_db_index(conn)
+    return parked
+
+
+def versions(conn):
+    # [(table, version, llt count, active)]
+    out = []
+    for name in sorted(inspect(conn).get_table_names()):
+        if name == LIVE_TABLE or name.startswith(f"{LIVE_TABLE}_v") or name == f"{LIVE_TABLE}_previous":
+            version, count = conn.execute(
+                text(f'SELECT max(meddra_version), count(*) FROM "{name}"')).one()
+            out.append((name, version, count, name == LIVE_TABLE))
+    return out
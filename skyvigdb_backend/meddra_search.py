@@ -0,0 +1,305 @@
+# =========================================================
+# MEDDRA DICTIONARY SEARCH
+# ---------------------------------------------------------
+# An in-process index over meddra_terms, loaded once per
+# worker into parallel lists (no ORM objects). Ranking is
+# exact > prefix > token-prefix > fuzzy (spelling-corrected
+# words, then trigram overlap), shortest name first within
+# a tier. A database-side path (pg_trgm /
+# FTS5 / LIKE) is kept for instances too small to hold it.
+# =========================================================
+
+import heapq
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from sqlalchemy import text
+
+COLUMNS = ("llt_code", "llt_name", "pt_code", "pt_name", "hlt_code", "hlt_name",
+           "hlgt_code", "hlgt_name", "soc_code", "soc_name", "soc_abbrev",
+           "current_llt", "meddra_version")
+
+_TOKEN_RE      = re.compile(r"[a-z0-9]+")
+_PREFIX_SCAN   = 2000     # max lexicographic prefix hits examined per query
+_TRIGRAM_SKIP  = 1500     # trigrams this common carry no signal for ranking
+_FUZZY_MIN     = 0.3
+
+
+def normalize(s):
+    return " ".join((s or "").lower().split())
+
+
+def _trigrams(s):
+    s = f"  {s} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+def to_dict(row):
+    return {
+        "llt_code":   row[0],
+        "llt":        row[1],
+        "pt_code":    row[2],
+        "pt":         row[3],
+        "hlt_code":   row[4],
+        "hlt":        row[5],
+        "hlgt_code":  row[6],
+        "hlgt":       row[7],
+        "soc_code":   row[8],
+        "soc":        row[9],
+        "soc_abbrev": row[10],
+        "current":    row[11],
+        "version":    row[12],
+    }
+
+
+class MeddraIndex:
+    # Row ids are assigned in (name length, name) order, so every
+    # posting list is already in ranking order and a query can stop
+    # as soon as it has `limit` hits.
+
+    def __init__(self):
+        self._lock     = threading.Lock()
+        self.signature = None
+        self.rows      = []            # tuples in COLUMNS order
+        self.names     = []            # normalized llt_name per row
+        self.tokens    = []            # token tuple per row
+        self.current   = bytearray()
+        self.exact     = {}            # name -> array of row ids
+        self.sorted    = []            # names in lexicographic order
+        self.sorted_id = array("i")    # row id for each entry of self.sorted
+        self.vocab     = []            # sorted distinct tokens
+        self.postings  = []            # vocab position -> array of row ids
+        self.trigrams  = {}            # trigram -> array of row ids
+        self.vocab_tri = {}            # trigram -> vocab positions (spelling correction)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # -----------------------------------------------------
+    # Build
+    # -----------------------------------------------------
+
+    def load(self, rows, signature=None):
+        keyed    = sorted((normalize(r[1]), tuple(r)) for r in rows)
+        keyed.sort(key=lambda x: len(x[0]))
+        names    = [n for n, _ in keyed]
+        rows     = [r for _, r in keyed]
+        tokens   = [tuple(_TOKEN_RE.findall(n)) for n in names]
+        current  = bytearray(1 if (r[11] or "Y") == "Y" else 0 for r in rows)
+        exact    = {}
+        tok_rows = {}
+        tri_rows = {}
+        for i, name in enumerate(names):
+            exact.setdefault(name, array("i")).append(i)
+            for t in set(tokens[i]):
+                tok_rows.setdefault(t, array("i")).append(i)
+            for g in _trigrams(name):
+                tri_rows.setdefault(g, array("i")).append(i)
+        lex   = sorted(range(len(names)), key=names.__getitem__)
+        vocab = sorted(tok_rows)
+        vocab_tri = {}
+        for k, t in enumerate(vocab):
+            for g in _trigrams(t):
+                vocab_tri.setdefault(g, array("i")).append(k)
+        with self._lock:
+            self.rows, self.names, self.tokens, self.current = rows, names, tokens, current
+            self.exact     = exact
+            self.sorted    = [names[i] for i in lex]
+            self.sorted_id = array("i", lex)
+            self.vocab     = vocab
+            self.postings  = [tok_rows[t] for t in vocab]
+            self.trigrams  = tri_rows
+            self.vocab_tri = vocab_tri
+            self.signature = signature
+        return self
+
+    # -----------------------------------------------------
+    # Query tiers — each yields row ids in ranking order
+    # -----------------------------------------------------
+
+    def _prefix(self, q):
+        i   = bisect_left(self.sorted, q)
+        end = min(len(self.sorted), i + _PREFIX_SCAN)
+        j   = i
+        while j < end and self.sorted[j].startswith(q):
+            j += 1
+        return sorted(self.sorted_id[i:j])
+
+    def _vocab_span(self, tok):
+        i = bisect_left(self.vocab, tok)
+        j = i
+        while j < len(self.vocab) and self.vocab[j].startswith(tok):
+            j += 1
+        return i, j, sum(len(self.postings[k]) for k in range(i, j))
+
+    def _correct(self, tok):
+        # closest vocabulary word by trigram overlap, for a word
+        # that is not a prefix of anything in the dictionary
+        if self._vocab_span(tok)[2] or len(tok) < 3:
+            return tok
+        grams = _trigrams(tok)
+        hits  = Counter()
+        for g in grams:
+            hits.update(self.vocab_tri.get(g, ()))
+        best, best_sim = tok, _FUZZY_MIN
+        for k, n in hits.items():
+            sim = n / (len(grams) + len(self.vocab[k]) + 2 - n)
+            if sim > best_sim:
+                best, best_sim = self.vocab[k], sim
+        return best
+
+    def _token(self, q, correct=False):
+        toks = _TOKEN_RE.findall(q)
+        if correct:
+            toks = [self._correct(t) for t in toks]
+        if not toks:
+            return
+        spans = sorted((self._vocab_span(t) + (t,) for t in toks), key=lambda s: s[2])
+        if len(spans) == 1:
+            # one word: merge the sorted postings lazily, stop at limit
+            i, j, _, _ = spans[0]
+            last = -1
+            for r in heapq.merge(*(self.postings[k] for k in range(i, j))):
+                if r != last:
+                    last = r
+                    yield r
+            return
+        cand = None
+        for i, j, size, tok in spans:
+            if size == 0:
+                return
+            if cand is not None and size > 8 * len(cand):
+                # cheaper to check the few survivors than to build the set
+                cand = {r for r in cand if any(w.startswith(tok) for w in self.tokens[r])}
+            else:
+                rows = set()
+                for k in range(i, j):
+                    rows.update(self.postings[k])
+                cand = rows if cand is None else cand & rows
+            if not cand:
+                return
+        yield from sorted(cand)
+
+    def _fuzzy(self, q):
+        grams = _trigrams(q)
+        hits  = Counter()
+        for g in grams:
+            rows = self.trigrams.get(g)
+            if rows is not None and len(rows) <= _TRIGRAM_SKIP:
+                hits.update(rows)
+        scored = []
+        for r, n in hits.items():
+            sim = n / (len(grams) + len(self.names[r]) + 2 - n)
+            if sim >= _FUZZY_MIN:
+                scored.append((-sim, r))
+        scored.sort()
+        return [r for _, r in scored]
+
+    def search(self, q, limit=20, current_only=True):
+        q = normalize(q)
+        if len(q) < 2 or not self.rows:
+            return []
+        seen, ranked = set(), []
+
+        def take(ids):
+            for r in ids:
+                if len(ranked) >= limit:
+                    return
+                if r in seen or (current_only and not self.current[r]):
+                    continue
+                seen.add(r)
+                ranked.append(r)
+
+        take(self.exact.get(q, ()))
+        take(self._prefix(q))
+        take(self._token(q))
+        if len(ranked) < limit and len(q) >= 3:
+            take(self._token(q, correct=True))
+        if len(ranked) < limit and len(q) >= 3:
+            take(self._fuzzy(q))
+        return [self.rows[r] for r in ranked]
+
+
+# =========================================================
+# DATABASE-SIDE SEARCH
+# =========================================================
+
+def ensure_db_index(conn):
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_meddra_llt_trgm "
+                          "ON meddra_terms USING gin (lower(llt_name) gin_trgm_ops)"))
+        return "pg_trgm"
+    if dialect == "sqlite":
+        conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS meddra_terms_fts USING fts5("
+                          "llt_name, content='meddra_terms', content_rowid='rowid', "
+                          "tokenize='unicode61', prefix='2 3 4')"))
+        conn.execute(text("INSERT INTO meddra_terms_fts(meddra_terms_fts) VALUES ('rebuild')"))
+        return "fts5"
+    return None
+
+
+def detach_db_index(conn):
+    # before meddra_terms is swapped for another version: the trigram
+    # index would follow the old table, while the FTS5 table follows the
+    # name and only needs a rebuild. Returns whether an index existed.
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        had = conn.execute(text("SELECT to_regclass('ix_meddra_llt_trgm')")).scalar() is not None
+        conn.execute(text("DROP INDEX IF EXISTS ix_meddra_llt_trgm"))
+        return had
+    if dialect == "sqlite":
+        return _has_fts(conn)
+    return False
+
+
+def db_search(conn, q, limit=20, current_only=True):
+    q = normalize(q)
+    if len(q) < 2:
+        return []
+    cols    = ", ".join(f"m.{c}" for c in COLUMNS)
+    current = "AND m.current_llt = 'Y'" if current_only else ""
+    dialect = conn.dialect.name
+
+    if dialect == "postgresql":
+        sql = text(f"""
+            SELECT {cols} FROM meddra_terms m
+            WHERE lower(m.llt_name) LIKE :contains {current}
+               OR (lower(m.llt_name) % :q {current})
+            ORDER BY (lower(m.llt_name) = :q) DESC,
+                     (lower(m.llt_name) LIKE :prefix) DESC,
+                     similarity(lower(m.llt_name), :q) DESC,
+                     length(m.llt_name)
+            LIMIT :limit""")
+        return conn.execute(sql, {"q": q, "prefix": q + "%", "contains": f"%{q}%",
+                                  "limit": limit}).fetchall()
+
+    if dialect == "sqlite" and _has_fts(conn):
+        match = " ".join(f'"{t}"*' for t in _TOKEN_RE.findall(q))
+        if not match:
+            return []
+        sql = text(f"""
+            SELECT {cols} FROM meddra_terms_fts f
+            JOIN meddra_terms m ON m.rowid = f.rowid
+            WHERE meddra_terms_fts MATCH :match {current}
+            ORDER BY (lower(m.llt_name) = :q) DESC,
+                     (lower(m.llt_name) LIKE :prefix) DESC,
+                     length(m.llt_name)
+            LIMIT :limit""")
+        return conn.execute(sql, {"match": match, "q": q, "prefix": q + "%",
+                                  "limit": limit}).fetchall()
+
+    sql = text(f"""
+        SELECT {cols} FROM meddra_terms m
+        WHERE lower(m.llt_name) LIKE :contains {current}
+        ORDER BY (lower(m.llt_name) LIKE :prefix) DESC, length(m.llt_name)
+        LIMIT :limit""")
+    return conn.execute(sql, {"contains": f"%{q}%", "prefix": q + "%", "limit": limit}).fetchall()
+
+
+def _has_fts(conn):
+    return conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'meddra_terms_fts'")).first() is not None
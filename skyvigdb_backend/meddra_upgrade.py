@@ -0,0 +1,370 @@
+# =========================================================
+# MEDDRA VERSION UPGRADE — impact analysis & bulk recoding
+# ---------------------------------------------------------
+# Two loaded releases (the live meddra_terms and a side
+# table from `flask meddra-load`, or two side tables) are
+# compared as sorted LLT code arrays: intersect / setdiff
+# give the added and deleted LLTs, and element-wise
+# comparison of the aligned PT, SOC, currency and name
+# columns the changed ones. Each changed LLT gets a reason
+# and a proposed target in the new release:
+#   deleted / non_current   recode to the PT's own LLT
+#                           (manual when the PT is gone)
+#   pt_moved / soc_moved /  keep the LLT, refresh the PT,
+#   renamed                 HLT, SOC and names ("update")
+# Cases are then scanned in keyset chunks. A case's JSON is
+# decoded only when its raw text mentions an affected code,
+# so a pass costs little more than reading the rows.
+# Approved recodes are written chunk by chunk, one
+# MEDDRA_RECODED audit entry per case.
+# =========================================================
+
+import json
+import os
+import re
+import time
+import zlib
+
+from sqlalchemy import Text, cast, text
+
+from app import db, Case, log_event
+from autocode import CODE_KEYS, KINDS, code_fields, entry_lists, store_lists
+from lazy import LazyModule, available
+from meddra_loader import versions
+from meddra_search import COLUMNS
+
+NUMPY_AVAILABLE = available("numpy")
+np = LazyModule("numpy")
+
+CHUNK       = int(os.getenv("MEDDRA_RECODE_CHUNK", "2000"))
+REASONS     = ("deleted", "non_current", "pt_moved", "soc_moved", "renamed", "unknown")
+ACTIONS     = ("update", "recode", "manual")
+SAMPLE_IDS  = 20           # case ids listed per report group
+
+_CODE_RE = re.compile(r'"(\d{8})"')     # codes are JSON strings (picker, import, auto-coder)
+
+
+class RecodeError(ValueError):
+    pass
+
+
+# =========================================================
+# RELEASES
+# =========================================================
+
+class Release:
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows    = {r[0]: tuple(r) for r in rows}                       # llt_code -> row
+        self.pt_llt  = {r[2]: r[0] for r in self.rows.values() if r[0] == r[2]}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def current(self, code):
+        row = self.rows.get(code)
+        return row is not None and (row[11] or "Y") == "Y"
+
+
+def load_release(conn, version):
+    # the live table when it holds `version`, else its side table
+    tables = sorted((not live, table) for table, v, _, live in versions(conn) if v == version)
+    if not tables:
+        raise RecodeError(f"MedDRA {version} is not loaded (see `flask meddra-versions`).")
+    table = tables[0][1]
+    rows  = conn.execute(text(f'SELECT {", ".join(COLUMNS)} FROM "{table}"'))
+    return Release(version, rows)
+
+
+# =========================================================
+# DIFF — set operations on the code arrays
+# =========================================================
+
+def _key(row):
+    # what a coded entry copies from a row, besides the codes
+    return zlib.crc32("\0".join(str(x or "") for x in (row[1], row[3], row[5], row[7], row[9])).encode())
+
+
+def _changed_numpy(old, new):
+    def columns(rel):
+        codes = sorted(rel.rows, key=int)
+        rows  = [rel.rows[c] for c in codes]
+        return (codes,
+                np.array([int(c) for c in codes], dtype=np.int64),
+                np.array([int(r[2] or 0) for r in rows], dtype=np.int64),
+                np.array([int(r[8] or 0) for r in rows], dtype=np.int64),
+                np.array([(r[11] or "Y") == "Y" for r in rows], dtype=bool),
+                np.array([_key(r) for r in rows], dtype=np.int64))
+
+    o_codes, o_llt, o_pt, o_soc, o_cur, o_key = columns(old)
+    n_codes, n_llt, n_pt, n_soc, n_cur, n_key = columns(new)
+    _, oi, ni = np.intersect1d(o_llt, n_llt, assume_unique=True, return_indices=True)
+    deleted   = np.nonzero(~np.isin(o_llt, n_llt, assume_unique=True))[0]
+    added     = int(len(n_llt) - len(oi))
+    moved     = ((o_pt[oi] != n_pt[ni]) | (o_soc[oi] != n_soc[ni])
+                 | (o_cur[oi] != n_cur[ni]) | (o_key[oi] != n_key[ni]))
+    changed   = [o_codes[i] for i in oi[moved]]
+    return [o_codes[i] for i in deleted], changed, added
+
+
+def _changed_sets(old, new):
+    common  = old.rows.keys() & new.rows.keys()
+    changed = [c for c in common
+               if (old.rows[c][2], old.rows[c][8], old.current(c), _key(old.rows[c]))
+               != (new.rows[c][2], new.rows[c][8], new.current(c), _key(new.rows[c]))]
+    return list(old.rows.keys() - new.rows.keys()), changed, len(new.rows.keys() - old.rows.keys())
+
+
+def _numeric(rel):
+    return all(c.isdigit() and (r[2] or "0").isdigit() and (r[8] or "0").isdigit()
+               for c, r in rel.rows.items())
+
+
+class VersionDiff:
+
+    def __init__(self, old, new):
+        self.old, self.new = old, new
+        if NUMPY_AVAILABLE and _numeric(old) and _numeric(new):
+            deleted, changed, self.added = _changed_numpy(old, new)
+        else:
+            deleted, changed, self.added = _changed_sets(old, new)
+        self.changes = {}              # old llt_code -> (reason, action, target llt_code | None)
+        for code in deleted:
+            self.changes[code] = self._recode("deleted", old.rows[code][2])
+        for code in changed:
+            o, n = old.rows[code], new.rows[code]
+            if not new.current(code):
+                # a non-current LLT is only followed when its PT moves
+                if old.current(code) or o[2] != n[2]:
+                    self.changes[code] = self._recode("non_current" if old.current(code) else "pt_moved", n[2])
+            elif o[2] != n[2]:
+                self.changes[code] = ("pt_moved", "update", code)
+            elif o[8] != n[8]:
+                self.changes[code] = ("soc_moved", "update", code)
+            elif _key(o) != _key(n):
+                self.changes[code] = ("renamed", "update", code)
+
+    def _recode(self, reason, pt_code):
+        target = self.new.pt_llt.get(pt_code)
+        if target is not None and self.new.current(target):
+            return reason, "recode", target
+        return reason, "manual", None
+
+    def change(self, code):
+        # -> (reason, action, target) for a coded LLT, None if unaffected
+        hit = self.changes.get(code)
+        if hit is not None or code in self.new.rows:
+            return hit
+        return "unknown", "manual", None
+
+    def affects(self, codes):
+        return any(c in self.changes or c not in self.new.rows for c in codes)
+
+    def summary(self):
+        counts = {r: 0 for r in REASONS[:-1]}
+        for reason, _, _ in self.changes.values():
+            counts[reason] += 1
+        return dict(counts, llts_from=len(self.old), llts_to=len(self.new), added=self.added)
+
+
+def version_diff(from_version, to_version):
+    if from_version == to_version:
+        raise RecodeError("from and to must be different MedDRA versions.")
+    with db.engine.connect() as conn:
+        return VersionDiff(load_release(conn, from_version), load_release(conn, to_version))
+
+
+# =========================================================
+# CASE SCAN — keyset chunks; the JSON is decoded only for
+# cases whose raw text carries an affected code
+# =========================================================
+
+_SCAN_COLS = (Case.id, cast(Case.events, Text), cast(Case.patient, Text), cast(Case.products, Text))
+
+
+def _coded(events, patient, products):
+    # (kind, index, effective llt code, entry); an entry coded at PT
+    # level counts as the PT's own LLT, which shares its code
+    lists = (("event", events or []), ("history", (patient or {}).get("otherHistory") or []),
+             ("lab", (patient or {}).get("labData") or []), ("indication", products or []))
+    for kind, entries in lists:
+        llt_key, pt_key, _ = CODE_KEYS[kind]
+        for i, e in enumerate(entries):
+            code = e.get(llt_key) or e.get(pt_key)
+            if code:
+                yield kind, i, str(code), e
+
+
+def scan(diff, kinds=KINDS, chunk=CHUNK, progress=None):
+    # yields (case id, [(kind, index, code, entry, change)]) per affected case
+    last_id, seen = "", 0
+    while True:
+        rows = (db.session.query(*_SCAN_COLS)
+                .filter(Case.id > last_id)
+                .order_by(Case.id)
+                .limit(chunk)
+                .all())
+        if not rows:
+            break
+        for case_id, events, patient, products in rows:
+            raw = f"{events or ''}{patient or ''}{products or ''}"
+            if not diff.affects(_CODE_RE.findall(raw)):
+                continue
+            hits = []
+            for kind, i, code, entry in _coded(*(json.loads(x) if x else None for x in (events, patient, products))):
+                # entries already coded against the new release are done
+                if kind not in kinds or entry.get(CODE_KEYS[kind][2]) == diff.new.version:
+                    continue
+                change = diff.change(code)
+                if change is not None:
+                    hits.append((kind, i, code, entry, change))
+            if hits:
+                yield case_id, hits
+        last_id = rows[-1][0]
+        seen   += len(rows)
+        db.session.expunge_all()
+        if progress is not None:
+            progress(seen)
+
+
+# =========================================================
+# IMPACT REPORT
+# =========================================================
+
+def _row_fields(prefix, row):
+    if row is None:
+        return {f"{prefix}LltCode": None, f"{prefix}Llt": None, f"{prefix}PtCode": None,
+                f"{prefix}Pt": None, f"{prefix}Soc": None}
+    return {f"{prefix}LltCode": row[0], f"{prefix}Llt": row[1], f"{prefix}PtCode": row[2],
+            f"{prefix}Pt": row[3], f"{prefix}Soc": row[9]}
+
+
+def impact(from_version, to_version, kinds=KINDS, chunk=CHUNK, progress=None):
+    started = time.monotonic()
+    diff    = version_diff(from_version, to_version)
+    groups  = {}
+    cases   = entries = 0
+    scanned = [0]
+
+    def seen(n):
+        scanned[0] = n
+        if progress is not None:
+            progress(n)
+
+    for case_id, hits in scan(diff, kinds, chunk, seen):
+        cases += 1
+        for kind, _, code, entry, (reason, action, target) in hits:
+            entries += 1
+            g = groups.get((kind, code))
+            if g is None:
+                old = diff.old.rows.get(code)
+                g = groups[(kind, code)] = {
+                    "kind": kind, "reason": reason, "action": action,
+                    **_row_fields("from", old or (code, entry.get("llt") or entry.get("meddraLlt"), None,
+                                                  None, None, None, None, None, None, None)),
+                    **_row_fields("to", diff.new.rows.get(target) if target else None),
+                    "entries": 0, "cases": 0, "sampleCases": [], "_last": None}
+            g["entries"] += 1
+            if g["_last"] != case_id:
+                g["_last"]  = case_id
+                g["cases"] += 1
+                if len(g["sampleCases"]) < SAMPLE_IDS:
+                    g["sampleCases"].append(case_id)
+    out = sorted(groups.values(), key=lambda g: (-g["cases"], g["kind"], g["fromLltCode"]))
+    for g in out:
+        del g["_last"]
+    return {"from": from_version, "to": to_version, "diff": diff.summary(), "scanned": scanned[0],
+            "impactedCases": cases, "entries": entries, "groups": out,
+            "seconds": round(time.monotonic() - started, 2)}
+
+
+# =========================================================
+# BULK RECODE
+# =========================================================
+
+def approvals_from(items):
+    # a list of {kind?, lltCode, toLltCode?}, or an impact report
+    # whose groups a reviewer marked "approved": true
+    if isinstance(items, dict):
+        items = [g for g in items.get("groups") or [] if g.get("approved")]
+    if not isinstance(items, list):
+        raise RecodeError("approvals must be a list or an impact report.")
+    return [{"kind": a.get("kind"), "lltCode": a.get("lltCode") or a.get("fromLltCode"),
+             "toLltCode": a.get("toLltCode")} for a in items if isinstance(a, dict)]
+
+
+def plan(diff, approvals=(), actions=()):
+    # -> {(kind | None, old llt_code): new row}. approvals: [{kind?,
+    # lltCode, toLltCode?}] (toLltCode defaults to the proposal and is
+    # required for manual ones); actions approves every proposal of
+    # those kinds, e.g. ("update",)
+    out = {}
+    for action in actions:
+        if action not in ACTIONS[:2]:
+            raise RecodeError(f"actions must be a subset of {list(ACTIONS[:2])}.")
+    for code, (_, action, target) in diff.changes.items():
+        if action in actions:
+            out[(None, code)] = diff.new.rows[target]
+    for a in approvals:
+        kind, code = a.get("kind"), str(a.get("lltCode") or "")
+        change     = diff.change(code)
+        target     = str(a.get("toLltCode") or "") or (change[2] if change else None)
+        if kind is not None and kind not in KINDS:
+            raise RecodeError(f"kind must be one of {list(KINDS)}.")
+        if change is None:
+            raise RecodeError(f"LLT {code} is not affected by {diff.old.version} -> {diff.new.version}.")
+        if not target or not diff.new.current(target):
+            raise RecodeError(f"LLT {code}: toLltCode must be a current LLT of MedDRA {diff.new.version}.")
+        out[(kind, code)] = diff.new.rows[target]
+    return out
+
+
+def recode(from_version, to_version, approvals=(), actions=(), kinds=KINDS, chunk=CHUNK,
+           user="recode", role="system", progress=None):
+    diff  = version_diff(from_version, to_version)
+    todo  = plan(diff, approvals, actions)
+    stats = {"scanned": 0, "cases": 0, "entries": 0}
+    if not todo:
+        return stats
+
+    def seen(n):
+        stats["scanned"] = n
+        if progress is not None:
+            progress(stats)
+
+    batch = {}
+
+    def flush():
+        for case in db.session.query(Case).filter(Case.id.in_(list(batch))):
+            patient, lists = entry_lists(case)
+            touched, notes = set(), []
+            for kind, i, code in batch[case.id]:
+                row     = todo.get((kind, code)) or todo.get((None, code))
+                llt_key = CODE_KEYS[kind][0]
+                entries = lists[kind]
+                # the case may have been edited since the scan
+                if i >= len(entries) or str(entries[i].get(llt_key) or entries[i].get(CODE_KEYS[kind][1])) != code:
+                    continue
+                entries[i].update(code_fields(kind, row))
+                touched.add(kind)
+                notes.append(f"{kind} {code} -> {row[0]} {row[1]} / PT {row[3]} ({row[2]}) / {row[9]}")
+            if notes:
+                store_lists(case, patient, lists, touched)
+                log_event(case.id, "MEDDRA_RECODED", user, role, section="coding",
+                          details=f"MedDRA {from_version} -> {to_version}: " + "; ".join(notes))
+                stats["cases"]   += 1
+                stats["entries"] += len(notes)
+        db.session.commit()
+        batch.clear()
+
+    for case_id, hits in scan(diff, kinds, chunk, seen):
+        mine = [(kind, i, code) for kind, i, code, _, _ in hits
+                if (kind, code) in todo or (None, code) in todo]
+        if mine:
+            batch[case_id] = mine
+        if len(batch) >= chunk // 4:
+            flush()
+    if batch:
+        flush()
+    return stats
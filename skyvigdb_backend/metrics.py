@@ -0,0 +1,238 @@
+# =========================================================
+# METRICS — a small Prometheus registry (text exposition
+# format 0.0.4), no client library needed
+# ---------------------------------------------------------
+# Values live in the process that records them. Under
+# gunicorn set METRICS_DIR to a directory the workers share
+# (one host): each worker writes its values there at most
+# every METRICS_FLUSH seconds and before it answers a
+# scrape, and /metrics sums the files of the workers still
+# running, so whichever worker gets the scrape reports for
+# all of them. Gauges are reported per worker (pid label).
+# Without METRICS_DIR a scrape sees one worker's numbers.
+#
+# Duplicate scans fanned out to a fork pool (workers > 1)
+# score in children that are not counted; forked E2B and
+# form renders hand their timings back to the parent.
+# =========================================================
+
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+METRICS_DIR   = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH = float(os.getenv("METRICS_FLUSH", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS    = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS   = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name   = name
+        self.help   = help
+        self.labels = tuple(labels)
+        self.values = {}                 # label values tuple -> value
+        self._lock  = threading.Lock()
+        REGISTRY.append(self)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), v[:] if isinstance(v, list) else v] for k, v in self.values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1.0):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def lines(self, values, names):
+        for key, v in values.items():
+            yield f"{self.name}{_labels(names, key)} {v:g}"
+
+
+class Histogram(_Metric):
+    # per label set: [count per bucket (non-cumulative) + overflow, sum]
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            v = self.values.get(labels)
+            if v is None:
+                v = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            v[bisect_left(self.buckets, value)] += 1
+            v[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *labels)
+
+    def lines(self, values, names):
+        bounds = [f'le="{b:g}"' for b in self.buckets] + ['le="+Inf"']
+        for key, v in values.items():
+            running = 0
+            for le, n in zip(bounds, v):
+                running += n
+                yield f"{self.name}_bucket{_labels(names, key, le)} {running}"
+            yield f"{self.name}_sum{_labels(names, key)} {v[-1]:g}"
+            yield f"{self.name}_count{_labels(names, key)} {running}"
+
+
+class Gauge(_Metric):
+    # read at scrape / flush time: read() -> {label values tuple: value}
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), read=None):
+        super().__init__(name, help, labels)
+        self.read = read
+
+    def snapshot(self):
+        try:
+            return [[list(k), v] for k, v in (self.read() if self.read else {}).items()]
+        except Exception as e:       # a gauge must never break a scrape
+            print(f"[SkyVigilance] Metric {self.name} unavailable: {e}")
+            return []
+
+    def lines(self, values, names):
+        for key, v in values.items():
+            yield f"{self.name}{_labels(names, key)} {v:g}"
+
+
+# ---------------------------------------------------------
+# Metrics recorded by the request hooks (telemetry.py, which
+# also defines the pool gauge) and the hot paths
+# ---------------------------------------------------------
+
+HTTP_SECONDS   = Histogram("skyvig_http_request_duration_seconds",
+                           "Time until the view returned (streamed bodies excluded).",
+                           ("method", "route", "status"))
+DB_QUERIES     = Histogram("skyvig_db_queries_per_request", "SQL statements run by one request.",
+                           ("route",), COUNT_BUCKETS)
+DB_QUERY_TOTAL = Counter("skyvig_db_queries_total", "SQL statements run, by route ((background) outside requests).",
+                         ("route",))
+DB_SECONDS     = Counter("skyvig_db_query_seconds_total", "Time spent in SQL statements, by route.", ("route",))
+
+DEDUP_SCORED   = Counter("skyvig_dedup_candidates_scored_total", "Candidates scored for duplicate detection.",
+                         ("path",))
+DEDUP_SECONDS  = Histogram("skyvig_dedup_score_seconds", "Time to score one query against its candidates.",
+                           ("path",), FAST_BUCKETS)
+E2B_SECONDS    = Histogram("skyvig_e2b_render_seconds", "E2B(R3) case rendering time per phase.",
+                           ("phase",), FAST_BUCKETS)
+FORM_SECONDS   = Histogram("skyvig_form_render_seconds", "CIOMS I / MedWatch 3500A PDF rendering time per form.",
+                           ("form",), FAST_BUCKETS)
+MEDDRA_SECONDS = Histogram("skyvig_meddra_search_seconds", "MedDRA search time by backend (cache = response cache hit).",
+                           ("backend",), FAST_BUCKETS)
+AUTOCODE_TOTAL = Counter("skyvig_meddra_autocode_total",
+                         "Verbatims auto-coded, by method (memo = repeat answered from the cache).", ("method",))
+WORKLIST_CLAIMS = Counter("skyvig_worklist_claims_total",
+                          "Worklist claim requests, by step and outcome (empty = nothing left to claim, busy = SQLite lock timeouts).",
+                          ("step", "outcome"))
+
+
+# ---------------------------------------------------------
+# Exposition and the per-worker files
+# ---------------------------------------------------------
+
+def snapshot():
+    return {m.name: m.snapshot() for m in REGISTRY}
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_flush_lock = threading.Lock()
+_last_flush = [0.0]
+
+
+def flush(force=False):
+    # this worker's values -> METRICS_DIR/metrics-<pid>.json
+    if not METRICS_DIR or (not force and time.monotonic() - _last_flush[0] < METRICS_FLUSH):
+        return
+    with _flush_lock:
+        _last_flush[0] = time.monotonic()
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"metrics-{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(snapshot(), f)
+        os.replace(path + ".tmp", path)
+
+
+def collect():
+    # -> [(pid, snapshot)] for every live worker, this one included
+    if not METRICS_DIR:
+        return [(os.getpid(), snapshot())]
+    flush(force=True)
+    out = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "metrics-*.json")):
+        pid = int(os.path.basename(path)[8:-5])
+        if not _alive(pid):
+            try:
+                os.remove(path)
+            except OSError:
+                pass                       # another worker got there first
+            continue
+        try:
+            with open(path) as f:
+                out.append((pid, json.load(f)))
+        except (OSError, ValueError):
+            continue                       # replaced or removed while reading
+    return out
+
+
+def render():
+    merged = {m.name: {} for m in REGISTRY}
+    for pid, snap in collect():
+        for m in REGISTRY:
+            values = merged[m.name]
+            for key, v in snap.get(m.name, []):
+                if m.kind == "gauge":
+                    values[tuple(key) + (pid,)] = v
+                elif m.kind == "histogram":
+                    prev = values.get(tuple(key))
+                    values[tuple(key)] = v if prev is None else [a + b for a, b in zip(prev, v)]
+                else:
+                    values[tuple(key)] = values.get(tuple(key), 0.0) + v
+    out = []
+    for m in REGISTRY:
+        out.append(f"# HELP {m.name} {m.help}")
+        out.append(f"# TYPE {m.name} {m.kind}")
+        names = m.labels + ("pid",) if m.kind == "gauge" else m.labels
+        out.extend(m.lines(merged[m.name], names))
+    return "\n".join(out) + "\n"
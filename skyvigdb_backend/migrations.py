@@ -0,0 +1,202 @@
+# =========================================================
+# SCHEMA MIGRATIONS
+# ---------------------------------------------------------
+# Run once per deploy with `flask --app app db-migrate` (the
+# Procfile release phase), not by every worker at import.
+# Applied steps are recorded in schema_version, so a re-run
+# only creates missing tables. On PostgreSQL an advisory
+# lock keeps two concurrent runners from interleaving.
+# =========================================================
+
+import time
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, func, inspect, select, text
+
+from app import db, AuditLog, Case, CaseSummary
+from summary import due_date, serious_flags
+from textsearch import ensure_index
+
+_meta          = MetaData()
+schema_version = Table(
+    "schema_version", _meta,
+    Column("version",    Integer,     primary_key=True),
+    Column("name",       String(200), nullable=False),
+    Column("applied_at", DateTime,    nullable=False),
+)
+_LOCK_KEY = 0x5C7D6B01      # pg_advisory_xact_lock key for migrate()
+
+
+# ---------------------------------------------------------
+# Steps — append only; never renumber an applied step
+# ---------------------------------------------------------
+
+def _case_columns(conn):
+    have = {c["name"] for c in inspect(conn).get_columns("pv_case")}
+    for col in ("submissions", "archival"):
+        if col not in have:
+            conn.execute(text(f"ALTER TABLE pv_case ADD COLUMN {col} JSON"))
+            print(f"[SkyVigilance] Migration: added column '{col}' to pv_case.")
+
+
+def repair_audit_timestamps(conn):
+    # one set-based UPDATE instead of loading every audit row; on
+    # SQLite the column is text, so unparseable values count as corrupt
+    t = AuditLog.__table__
+    bad = t.c.timestamp.is_(None)
+    if conn.dialect.name == "sqlite":
+        bad = bad | text("(typeof(audit_log.timestamp) != 'text' OR audit_log.timestamp "
+                         "NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*')")
+    fixed = conn.execute(t.update().where(bad).values(timestamp=datetime.utcnow())).rowcount
+    if fixed:
+        print(f"[SkyVigilance] Repaired {fixed} corrupt audit timestamp(s).")
+    return fixed
+
+
+def audit_indexes(conn):
+    # composite (filter, timestamp, id) indexes for audit.py; the old
+    # single-column case_id index is a prefix of ix_audit_case_ts
+    for ix in AuditLog.__table__.indexes:
+        ix.create(conn, checkfirst=True)
+    have = {i["name"] for i in inspect(conn).get_indexes("audit_log")}
+    if "ix_audit_log_case_id" in have:
+        conn.execute(text("DROP INDEX ix_audit_log_case_id"))
+
+
+def _case_index(conn, name):
+    # by name: a later step's index may need columns this step predates
+    for ix in Case.__table__.indexes:
+        if ix.name == name:
+            ix.create(conn, checkfirst=True)
+
+
+def case_updated_index(conn):
+    _case_index(conn, "ix_case_updated")
+
+
+def case_text_index(conn):
+    # tsvector / FTS5 structures only; existing cases are loaded by
+    # `flask text-index`, which can run while the app serves traffic
+    kind = ensure_index(conn)
+    if conn.execute(select(func.count()).select_from(Case.__table__)).scalar():
+        print(f"[SkyVigilance] Full-text index: {kind or 'in-process'} — "
+              f"run `flask text-index` to load existing cases.")
+
+
+def case_worklist(conn):
+    # lease / due-date columns; the due dates and ix_case_worklist
+    # come with step 7
+    have = {c["name"] for c in inspect(conn).get_columns("pv_case")}
+    for col, kind in (("due_date", "DATE"), ("claimed_by", "VARCHAR(120)"), ("claim_expires", "TIMESTAMP")):
+        if col not in have:
+            conn.execute(text(f"ALTER TABLE pv_case ADD COLUMN {col} {kind}"))
+            print(f"[SkyVigilance] Migration: added column '{col}' to pv_case.")
+
+
+def case_due_dates(conn, chunk=5000):
+    # one keyset pass over every case: the due date and the summary's
+    # serious / serious_flags from summary.serious_flags, which also
+    # reads event-level criteria and fatal outcomes. Due dates written
+    # by step 6 or the hooks before that only saw triage / general;
+    # rows already right are left alone
+    t, s = Case.__table__, CaseSummary.__table__
+    q = (select(t.c.id, t.c.created_at, t.c.triage, t.c.general, t.c.events, t.c.due_date,
+                s.c.case_id.label("summary"), s.c.serious_flags)
+         .outerjoin(s, s.c.case_id == t.c.id).order_by(t.c.id).limit(chunk))
+    put_due  = (t.update().where(t.c.id == bindparam("k_id"))
+                .values(due_date=bindparam("due"), updated_at=t.c.updated_at))
+    put_flag = (s.update().where(s.c.case_id == bindparam("k_id"))
+                .values(serious=bindparam("serious"), serious_flags=bindparam("flags")))
+    dues = flags = 0
+    last = ""
+    while True:
+        rows = conn.execute(q.where(t.c.id > last)).all()
+        if not rows:
+            break
+        due_rows, flag_rows = [], []
+        for r in rows:
+            found = serious_flags(r)
+            due   = due_date(r)
+            if due != r.due_date:
+                due_rows.append({"k_id": r.id, "due": due})
+            joined = ";".join(found)[:200] or None
+            if r.summary is not None and joined != r.serious_flags:
+                flag_rows.append({"k_id": r.id, "serious": bool(found), "flags": joined})
+        if due_rows:
+            conn.execute(put_due, due_rows)
+        if flag_rows:
+            conn.execute(put_flag, flag_rows)
+        dues  += len(due_rows)
+        flags += len(flag_rows)
+        last   = rows[-1].id
+    if dues or flags:
+        print(f"[SkyVigilance] Worklist: due dates set for {dues} case(s), "
+              f"seriousness refreshed in {flags} summary row(s).")
+    _case_index(conn, "ix_case_worklist")            # built once, after the backfill
+    return dues
+
+
+MIGRATIONS = [
+    (1, "pv_case submissions / archival columns",    _case_columns),
+    (2, "audit_log timestamp repair",                repair_audit_timestamps),
+    (3, "audit_log composite query indexes",         audit_indexes),
+    (4, "pv_case updated_at index",                  case_updated_index),
+    (5, "case free-text search index",               case_text_index),
+    (6, "pv_case worklist leases and due dates",     case_worklist),
+    (7, "worklist due dates from event seriousness", case_due_dates),
+]
+
+
+# ---------------------------------------------------------
+# Runner
+# ---------------------------------------------------------
+
+def pending(conn):
+    if not inspect(conn).has_table("schema_version"):
+        return list(MIGRATIONS)
+    done = set(conn.execute(select(schema_version.c.version)).scalars())
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def migrate(engine):
+    # create missing tables (checkfirst, so existing ones are untouched),
+    # then apply the steps not yet recorded; -> versions applied
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": _LOCK_KEY})
+        todo = pending(conn)
+        db.metadata.create_all(conn)
+        _meta.create_all(conn)
+        for version, name, step in todo:
+            step(conn)
+            conn.execute(schema_version.insert().values(version=version, name=name,
+                                                        applied_at=datetime.utcnow()))
+            print(f"[SkyVigilance] Migration {version} applied: {name}.")
+    return [m[0] for m in todo]
+
+
+def behind(engine):
+    with engine.connect() as conn:
+        return bool(pending(conn))
+
+
+def migrate_with_retry(engine, attempts=5, strict=True, only_if_behind=False):
+    # the database may still be waking up (Neon free tier) on deploy.
+    # strict (`flask db-migrate`) re-raises the last failure; at boot
+    # it is logged and the app starts anyway, as init_db() used to
+    for attempt in range(1, attempts + 1):
+        try:
+            if only_if_behind and not behind(engine):
+                return []
+            applied = migrate(engine)
+            print(f"[SkyVigilance] DB migrate OK (attempt {attempt}, {len(applied)} step(s) applied).")
+            return applied
+        except Exception as e:
+            if attempt == attempts:
+                if strict:
+                    raise
+                print(f"[SkyVigilance] WARNING: DB migrate failed after all retries: {e}")
+                return None
+            wait = attempt * 2
+            print(f"[SkyVigilance] DB migrate attempt {attempt} failed: {e}. Retrying in {wait}s...")
+            time.sleep(wait)
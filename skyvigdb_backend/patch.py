@@ -0,0 +1,289 @@
+# =========================================================
+# CASE PATCH — RFC 6902 JSON Patch and RFC 7396 JSON Merge
+# Patch over the case sections, with optimistic concurrency
+# on updated_at (ETag / If-Match). Only the sections a patch
+# actually changes are assigned, so the UPDATE carries those
+# columns alone, and the audit entry of each section lists
+# the changed paths with their old and new values.
+# =========================================================
+
+import copy
+import json
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import flag_modified
+
+from app import db, Case, log_event
+
+SECTIONS = ("triage", "general", "patient", "products", "events",
+            "medical", "quality", "submissions", "archival", "narrative")
+
+JSON_PATCH  = "application/json-patch+json"
+MERGE_PATCH = "application/merge-patch+json"
+
+MAX_OPS       = 1000
+AUDIT_VALUE   = 200         # characters of an old/new value kept in the audit diff
+AUDIT_CHANGES = 200         # changed paths listed per section entry
+
+_MISSING = object()
+
+
+class PatchError(ValueError):
+    status = 422            # well-formed, but cannot be applied to this case
+
+
+class PatchConflict(PatchError):
+    status = 409            # a "test" operation failed
+
+
+class PreconditionFailed(PatchError):
+    status = 412
+
+
+# ---------------------------------------------------------
+# JSON Pointer (RFC 6901)
+# ---------------------------------------------------------
+
+def parse_pointer(pointer):
+    if pointer == "":
+        return []
+    if not isinstance(pointer, str) or not pointer.startswith("/"):
+        raise PatchError(f"Invalid JSON pointer {pointer!r}.")
+    return [t.replace("~1", "/").replace("~0", "~") for t in pointer[1:].split("/")]
+
+
+def to_pointer(tokens):
+    return "".join("/" + str(t).replace("~", "~0").replace("/", "~1") for t in tokens)
+
+
+def _index(container, token, pointer, append=False):
+    if append and token == "-":
+        return len(container)
+    if not token.isdigit() or (token != "0" and token.startswith("0")):
+        raise PatchError(f"{pointer}: '{token}' is not an array index.")
+    i = int(token)
+    if i > len(container) or (i == len(container) and not append):
+        raise PatchError(f"{pointer}: index {i} is out of range.")
+    return i
+
+
+def _parent(doc, tokens, pointer):
+    node = doc
+    for t in tokens[:-1]:
+        if isinstance(node, dict) and t in node:
+            node = node[t]
+        elif isinstance(node, list):
+            node = node[_index(node, t, pointer)]
+        else:
+            raise PatchError(f"{pointer}: path does not exist.")
+    return node
+
+
+def _get(doc, tokens, pointer):
+    if not tokens:
+        return doc
+    parent, last = _parent(doc, tokens, pointer), tokens[-1]
+    if isinstance(parent, dict):
+        if last not in parent:
+            raise PatchError(f"{pointer}: path does not exist.")
+        return parent[last]
+    if isinstance(parent, list):
+        return parent[_index(parent, last, pointer)]
+    raise PatchError(f"{pointer}: path does not exist.")
+
+
+def _add(doc, tokens, value, pointer):
+    parent, last = _parent(doc, tokens, pointer), tokens[-1]
+    if isinstance(parent, dict):
+        parent[last] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, last, pointer, append=True), value)
+    else:
+        raise PatchError(f"{pointer}: parent is not an object or array.")
+
+
+def _remove(doc, tokens, pointer):
+    parent, last = _parent(doc, tokens, pointer), tokens[-1]
+    if isinstance(parent, dict):
+        if last not in parent:
+            raise PatchError(f"{pointer}: path does not exist.")
+        return parent.pop(last)
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, last, pointer))
+    raise PatchError(f"{pointer}: path does not exist.")
+
+
+# ---------------------------------------------------------
+# RFC 6902 / RFC 7396
+# ---------------------------------------------------------
+
+def apply_json_patch(doc, ops):
+    # doc is modified in place; the caller passes a copy
+    if not isinstance(ops, list):
+        raise PatchError("A JSON Patch document must be an array of operations.")
+    if len(ops) > MAX_OPS:
+        raise PatchError(f"At most {MAX_OPS} operations per patch.")
+    for n, op in enumerate(ops):
+        if not isinstance(op, dict) or "op" not in op or "path" not in op:
+            raise PatchError(f"Operation {n}: 'op' and 'path' are required.")
+        kind, pointer = op["op"], op["path"]
+        tokens = parse_pointer(pointer)
+        if not tokens:
+            raise PatchError(f"Operation {n}: the whole document cannot be replaced; patch a section.")
+        if kind in ("add", "replace", "test") and "value" not in op:
+            raise PatchError(f"Operation {n}: '{kind}' requires 'value'.")
+        if kind == "add":
+            _add(doc, tokens, copy.deepcopy(op["value"]), pointer)
+        elif kind == "remove":
+            _remove(doc, tokens, pointer)
+        elif kind == "replace":
+            _get(doc, tokens, pointer)
+            _remove(doc, tokens, pointer)
+            _add(doc, tokens, copy.deepcopy(op["value"]), pointer)
+        elif kind in ("move", "copy"):
+            source = parse_pointer(op.get("from", ""))
+            if kind == "move" and len(tokens) > len(source) and tokens[:len(source)] == source:
+                raise PatchError(f"Operation {n}: cannot move {op['from']} into itself.")
+            value = _remove(doc, source, op["from"]) if kind == "move" else copy.deepcopy(_get(doc, source, op["from"]))
+            _add(doc, tokens, value, pointer)
+        elif kind == "test":
+            if _get(doc, tokens, pointer) != op["value"]:
+                raise PatchConflict(f"Operation {n}: test failed at {pointer}.")
+        else:
+            raise PatchError(f"Operation {n}: unknown op '{kind}'.")
+    return doc
+
+
+def apply_merge_patch(target, patch):
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    out = dict(target) if isinstance(target, dict) else {}
+    for k, v in patch.items():
+        if v is None:
+            out.pop(k, None)
+        else:
+            out[k] = apply_merge_patch(out.get(k), v)
+    return out
+
+
+def touched_sections(body):
+    # top-level keys a patch can reach; anything else is refused up front
+    if isinstance(body, list):
+        keys = {parse_pointer(op[f])[0] for op in body if isinstance(op, dict)
+                for f in ("path", "from") if op.get(f)}
+    else:
+        keys = set(body)
+    bad = keys - set(SECTIONS)
+    if bad:
+        raise PatchError(f"Only case sections can be patched ({', '.join(SECTIONS)}); got {sorted(bad)}.")
+    return keys
+
+
+# ---------------------------------------------------------
+# Diff for the audit trail
+# ---------------------------------------------------------
+
+def diff(old, new, path=()):
+    # -> [(pointer, old, new)] at the deepest level where they differ;
+    # arrays are compared by index, so an insert shows as a cascade
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        out = []
+        for k in list(old) + [k for k in new if k not in old]:
+            out += diff(old.get(k, _MISSING), new.get(k, _MISSING), path + (k,))
+        return out
+    if isinstance(old, list) and isinstance(new, list):
+        out = []
+        for i in range(max(len(old), len(new))):
+            out += diff(old[i] if i < len(old) else _MISSING, new[i] if i < len(new) else _MISSING, path + (i,))
+        return out
+    return [(to_pointer(path), old, new)]
+
+
+def _short(value):
+    if value is _MISSING:
+        return None
+    text = value if isinstance(value, str) else json.dumps(value, default=str)
+    return text if len(text) <= AUDIT_VALUE else text[:AUDIT_VALUE] + "…"
+
+
+def audit_details(changes):
+    rows = [{"op": "add" if o is _MISSING else "remove" if n is _MISSING else "replace",
+             "path": p, "from": _short(o), "to": _short(n)} for p, o, n in changes[:AUDIT_CHANGES]]
+    if len(changes) > AUDIT_CHANGES:
+        rows.append({"op": "truncated", "path": "", "from": None, "to": f"{len(changes) - AUDIT_CHANGES} more"})
+    return json.dumps(rows, ensure_ascii=False)
+
+
+# ---------------------------------------------------------
+# Concurrency
+# ---------------------------------------------------------
+
+def case_etag(case):
+    # strong validator derived from updated_at (microsecond resolution)
+    return '"' + (case.updated_at.isoformat() if case.updated_at else "0") + '"'
+
+
+def _matches(if_match, etag):
+    tags = [t.strip() for t in if_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+# ---------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------
+
+def patch_case(case_id, body, content_type, if_match, user, role):
+    # -> (case, changed sections); raises PatchError subclasses, LookupError
+    kind = JSON_PATCH if isinstance(body, list) else MERGE_PATCH
+    if content_type in (JSON_PATCH, MERGE_PATCH) and content_type != kind:
+        raise PatchError(f"{content_type} body must be {'an array' if content_type == JSON_PATCH else 'an object'}.")
+    keys = touched_sections(body)
+
+    case = db.session.get(Case, case_id)
+    if case is None:
+        raise LookupError(case_id)
+    etag = case_etag(case)
+    if not _matches(if_match, etag):
+        raise PreconditionFailed(f"Case {case_id} was modified by someone else (current ETag {etag}).")
+
+    before = case.to_dict()
+    doc    = json.loads(json.dumps({s: before[s] for s in keys}))     # a C-speed deep copy
+    if kind == JSON_PATCH:
+        doc = apply_json_patch(doc, body)
+    else:
+        doc = apply_merge_patch(doc, body)
+    for s in keys:
+        if s == "narrative" and not isinstance(doc.get(s, ""), str):
+            raise PatchError("narrative must be a string.")
+        if s in ("products", "events") and not isinstance(doc.get(s, []), list):
+            raise PatchError(f"{s} must be an array.")
+        if s not in ("narrative", "products", "events") and not isinstance(doc.get(s, {}), dict):
+            raise PatchError(f"{s} must be an object.")
+
+    changed = {s: diff(before[s], doc.get(s), (s,)) for s in keys}
+    changed = {s: c for s, c in changed.items() if c}
+    if not changed:
+        return case, {}
+
+    # compare-and-set on updated_at: a concurrent writer that committed
+    # since our read makes this match no row (and holds the row lock
+    # until we commit on PostgreSQL)
+    now = datetime.utcnow()
+    claimed = db.session.execute(update(Case).where(Case.id == case_id, Case.updated_at == case.updated_at)
+                                 .values(updated_at=now).execution_options(synchronize_session=False))
+    if claimed.rowcount != 1:
+        db.session.rollback()
+        raise PreconditionFailed(f"Case {case_id} was modified by someone else.")
+
+    for s in changed:
+        setattr(case, s, doc.get(s))
+        if s != "narrative":
+            flag_modified(case, s)
+        log_event(case_id, "CASE_PATCHED", user, role, step_from=case.current_step,
+                  step_to=case.current_step, section=s, details=audit_details(changed[s]))
+    case.updated_at = now
+    db.session.commit()
+    return case, changed
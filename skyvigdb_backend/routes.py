@@ -0,0 +1,689 @@
+# =========================================================
+# API ROUTES
+# ---------------------------------------------------------
+# Imported by app.py after the models and helpers are defined
+# (Flask's "views module" layout), so everything above the
+# import is available here.
+# =========================================================
+
+import hashlib
+import io
+import itertools
+import json
+import os
+import time
+from datetime import date
+
+from flask import request, jsonify, Response, stream_with_context
+
+from app import app, db, Case, CodingDecision, extract_audit, log_event, ts_now
+from audit import AuditQueryError, count as audit_count, export_rows as audit_rows, query_page as audit_page, stream_csv as audit_csv
+from autocode import (KINDS as CODING_KINDS, MIN_CONFIDENCE, STATUSES as CODING_STATUSES, AutocodeError,
+                      record_decisions, run_backlog, suggestions)
+from cache import response_cache
+from dedup import FUZZ_AVAILABLE, band, batch_pairs, detect_format, read_records, self_join_pairs
+from e2b_batch import BatchError, batch_cases, stream_batch, xml_cache
+from forms import FORMS, filename as form_filename, render as render_form, stream_zip as stream_forms
+from hooks import (get_meddra_index, get_signal_tables, meddra_cache_signature, refresh_dup_index,
+                   refresh_text_index, top_signal_counts)
+from ingest import CHUNK, IngestError, ingest, open_upload
+from line_listing import ENCODERS, FLATTEN, listing_rows
+from listing import ListingError, etag_matches, list_etag, list_page
+from meddra_search import db_search, to_dict as meddra_dict
+from meddra_upgrade import (KINDS as RECODE_KINDS, RecodeError, approvals_from, impact as meddra_impact,
+                            recode as meddra_recode)
+from metrics import MEDDRA_SECONDS
+from patch import JSON_PATCH, MERGE_PATCH, PatchError, case_etag, patch_case
+from signals import NUMPY_AVAILABLE, THRESHOLDS
+from textsearch import SearchError, db_search as text_db_search, engine as text_engine, parse_args as text_args
+from worklist import (WorklistError, claim as worklist_claim, lease_arg, limit_arg, queue as worklist_queue,
+                      release as worklist_release, renew as worklist_renew, resolve_step)
+
+# "memory" (per-worker index) or "db" (pg_trgm / FTS5 / LIKE)
+MEDDRA_SEARCH_BACKEND = os.getenv("MEDDRA_SEARCH", "memory")
+
+
+def _first(items):
+    return ((items or [{}])[0] if items else {}) or {}
+
+
+def _ndjson(rows):
+    return Response((json.dumps(r) + "\n" for r in rows), mimetype="application/x-ndjson")
+
+
+def _arg_float(name, default):
+    return float(request.args.get(name, default))
+
+
+def _arg_int(name, default):
+    return int(request.args.get(name, default))
+
+
+# =========================================================
+# CASE LISTING
+# =========================================================
+
+@app.route("/api/cases", methods=["GET"])
+def get_cases():
+    # pages are cached as serialized JSON under their ETag (filters +
+    # count + newest updated_at), case dicts under (id, updated_at)
+    try:
+        opts, etag, total = list_etag(request.args)
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            resp = Response(status=304)
+        else:
+            body = response_cache.get("list", etag)
+            if body is None:
+                body = app.json.dumps(list_page(opts, total)).encode()
+                response_cache.set("list", etag, body)
+            resp = Response(body, mimetype="application/json")
+    except (ListingError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    resp.headers["ETag"]          = etag
+    resp.headers["X-Total-Count"] = str(total)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+# =========================================================
+# CASE PATCH — RFC 6902 / RFC 7396 with If-Match
+# ---------------------------------------------------------
+# ETag is the quoted updatedAt of the case; send it back in
+# If-Match. A merge patch may carry _audit like the PUT body;
+# a JSON Patch array takes ?user= &role=.
+# =========================================================
+
+@app.route("/api/cases/<case_id>", methods=["PATCH"])
+def patch_case_route(case_id):
+    content_type = request.mimetype
+    if content_type not in (JSON_PATCH, MERGE_PATCH, "application/json"):
+        return jsonify({"error": f"Content-Type must be {JSON_PATCH} or {MERGE_PATCH}."}), 415
+    if_match = request.headers.get("If-Match")
+    if not if_match:
+        return jsonify({"error": "If-Match with the case ETag is required."}), 428
+    body = request.get_json(force=True, silent=True)
+    if not isinstance(body, (list, dict)):
+        return jsonify({"error": "Body must be a JSON Patch array or a merge patch object."}), 400
+
+    user, role = request.args.get("user", "unknown"), request.args.get("role", "unknown")
+    if isinstance(body, dict) and "_audit" in body:
+        user, role, body = extract_audit(body)
+    try:
+        case, changed = patch_case(case_id, body, content_type, if_match, user, role)
+    except LookupError:
+        return jsonify({"error": f"Case {case_id} not found."}), 404
+    except PatchError as e:
+        db.session.rollback()
+        resp = jsonify({"error": str(e)})
+        current = db.session.get(Case, case_id) if e.status == 412 else None
+        if current is not None:
+            resp.headers["ETag"] = case_etag(current)
+        return resp, e.status
+
+    body = case.to_dict()
+    response_cache.set("case", (case.id, body["updatedAt"]), body)
+    resp = jsonify({**body, "changed": {s: len(c) for s, c in changed.items()}})
+    resp.headers["ETag"] = case_etag(case)
+    return resp
+
+
+# =========================================================
+# DUPLICATE CHECK
+# =========================================================
+
+@app.route("/api/cases/duplicate-check", methods=["POST"])
+def duplicate_check():
+    data = request.get_json(silent=True) or {}
+    if not FUZZ_AVAILABLE:
+        return jsonify({"duplicates": [], "fuzzyAvailable": False})
+
+    try:
+        threshold = float(data.get("threshold", 80))
+        limit     = min(int(data.get("limit", 10)), 50)
+        window    = data.get("onsetWindowDays")
+        window    = int(window) if window not in (None, "") else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "threshold, limit and onsetWindowDays must be numeric."}), 400
+
+    index = refresh_dup_index()
+    hits  = index.search(data, threshold=threshold, limit=limit,
+                         country=data.get("country") if data.get("sameCountry") else None,
+                         onset_window_days=window)
+
+    rows = {c.id: c for c in Case.query.filter(Case.id.in_([cid for _, cid in hits]))}
+    duplicates = []
+    for score, cid in hits:
+        c = rows.get(cid)
+        if c is None:
+            index.remove(cid)
+            continue
+        evt = _first(c.events)
+        duplicates.append({
+            "caseNumber": c.id,
+            "score":      score,
+            "band":       band(score),
+            "drug":       _first(c.products).get("name", ""),
+            "event":      evt.get("term", ""),
+            "eventPt":    evt.get("pt", ""),
+            "country":    (c.triage or {}).get("country", ""),
+            "status":     c.status,
+        })
+
+    return jsonify({"duplicates": duplicates, "fuzzyAvailable": True, "indexedCases": len(index)})
+
+
+@app.route("/api/cases/duplicate-check/batch", methods=["POST"])
+def duplicate_check_batch():
+    if not FUZZ_AVAILABLE:
+        return jsonify({"error": "neither rapidfuzz nor fuzzywuzzy installed — duplicate scoring disabled."}), 503
+    fmt = request.args.get("format") or detect_format(request.mimetype) or "json"
+    try:
+        threshold = _arg_float("threshold", 80)
+        workers   = max(1, min(_arg_int("workers", 1), os.cpu_count() or 1))
+        records   = list(read_records(io.StringIO(request.get_data(as_text=True)), fmt))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Could not read batch: {e}"}), 400
+    within = request.args.get("withinBatch", "true").lower() != "false"
+
+    index = refresh_dup_index()
+    return _ndjson(batch_pairs(index, records, threshold, workers, within))
+
+
+@app.route("/api/cases/duplicates/scan", methods=["GET"])
+def duplicate_scan():
+    if not FUZZ_AVAILABLE:
+        return jsonify({"error": "neither rapidfuzz nor fuzzywuzzy installed — duplicate scoring disabled."}), 503
+    try:
+        threshold = _arg_float("threshold", 80)
+        workers   = max(1, min(_arg_int("workers", 1), os.cpu_count() or 1))
+    except ValueError:
+        return jsonify({"error": "threshold and workers must be numeric."}), 400
+
+    index = refresh_dup_index()
+    return _ndjson(self_join_pairs(index, threshold, workers))
+
+
+# =========================================================
+# FULL-TEXT CASE SEARCH — narratives, event verbatims, lab
+# test names, medical history (textsearch.py)
+# =========================================================
+
+@app.route("/api/cases/search", methods=["GET"])
+def case_text_search():
+    try:
+        opts = text_args(request.args)
+    except SearchError as e:
+        return jsonify({"error": str(e)}), 400
+
+    name = text_engine()
+    if name == "memory":
+        index = refresh_text_index()
+        items, total = index.search(opts)
+        # cases deleted through another worker are dropped from this one's index
+        ids  = [i["caseNumber"] for i in items]
+        live = {cid for (cid,) in db.session.query(Case.id).filter(Case.id.in_(ids))}
+        for cid in set(ids) - live:
+            index.remove(cid)
+        items = [i for i in items if i["caseNumber"] in live]
+    else:
+        with db.engine.connect() as conn:
+            items, total = text_db_search(conn, opts, name)
+
+    body = {"items": items, "limit": opts["limit"], "offset": opts["offset"], "engine": name}
+    if total is not None:
+        body["total"] = total
+    return jsonify(body)
+
+
+# =========================================================
+# WORKLIST — a step's queue in due-date order, and leased
+# claims on it (worklist.py)
+# =========================================================
+
+def _statuses(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    return [s.strip() for s in value or () if s and s.strip()] or None
+
+
+@app.route("/api/worklist", methods=["GET"])
+def worklist():
+    # ?step=3 | role=Medical [&status=a,b] [&limit=20]; nothing is claimed
+    try:
+        step  = resolve_step(request.args.get("step"), request.args.get("role"))
+        limit = limit_arg(request.args.get("limit"), 20)
+    except WorklistError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"step": step, "items": worklist_queue(step, _statuses(request.args.get("status")), limit)})
+
+
+@app.route("/api/worklist/claim", methods=["POST"])
+def worklist_claim_next():
+    # {"step" | role from _audit, "status": [...], "limit": 1, "leaseSeconds": 900, "_audit": {...}}
+    user, role, data = extract_audit(request.get_json(silent=True) or {})
+    if user == "unknown":
+        return jsonify({"error": "_audit.performedBy is required to claim cases."}), 400
+    try:
+        step  = resolve_step(data.get("step"), data.get("role") or role)
+        limit = limit_arg(data.get("limit"), 1)
+        lease = lease_arg(data.get("leaseSeconds"))
+    except WorklistError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"step": step, "claimed": worklist_claim(step, user, role, _statuses(data.get("status")),
+                                                             limit, lease)})
+
+
+@app.route("/api/worklist/renew", methods=["POST"])
+def worklist_renew_leases():
+    # {"caseIds": [...], "leaseSeconds": 900, "_audit": {...}} — the caller's own claims only
+    user, role, data = extract_audit(request.get_json(silent=True) or {})
+    try:
+        lease = lease_arg(data.get("leaseSeconds"))
+    except WorklistError as e:
+        return jsonify({"error": str(e)}), 400
+    ids = [str(i) for i in data.get("caseIds") or []]
+    return jsonify({"renewed": worklist_renew(ids, user, lease) if ids else []})
+
+
+@app.route("/api/worklist/release", methods=["POST"])
+def worklist_release_claims():
+    # {"caseIds": [...], "_audit": {...}} — the caller's own claims only
+    user, role, data = extract_audit(request.get_json(silent=True) or {})
+    ids = [str(i) for i in data.get("caseIds") or []]
+    return jsonify({"released": worklist_release(ids, user, role) if ids else []})
+
+
+# =========================================================
+# MEDDRA SEARCH
+# =========================================================
+
+@app.route("/api/meddra/search", methods=["GET"])
+def meddra_search():
+    q = request.args.get("q", "")
+    try:
+        limit = max(1, min(int(request.args.get("limit", 20)), 100))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer."}), 400
+    current_only = request.args.get("current", "true").lower() != "false"
+
+    # results only change with the dictionary: key on its signature
+    index = get_meddra_index() if MEDDRA_SEARCH_BACKEND != "db" else None
+    sig   = index.signature if index is not None else meddra_cache_signature()
+    key   = (MEDDRA_SEARCH_BACKEND, str(sig), q.strip().lower(), limit, current_only)
+    etag  = 'W/"' + hashlib.sha1(repr(key).encode()).hexdigest()[:20] + '"'
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        resp = Response(status=304)
+    else:
+        t0   = time.perf_counter()
+        body = response_cache.get("meddra", key)
+        if body is None:
+            if index is None:
+                with db.engine.connect() as conn:
+                    rows = db_search(conn, q, limit, current_only)
+            else:
+                rows = index.search(q, limit, current_only)
+            body = app.json.dumps([meddra_dict(r) for r in rows]).encode()
+            response_cache.set("meddra", key, body)
+            MEDDRA_SECONDS.observe(time.perf_counter() - t0, MEDDRA_SEARCH_BACKEND)
+        else:
+            MEDDRA_SECONDS.observe(time.perf_counter() - t0, "cache")
+        resp = Response(body, mimetype="application/json")
+    resp.headers["ETag"]          = etag
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
+# =========================================================
+# MEDDRA AUTO-CODING — suggestions with confidence, the
+# review queue of decisions, and the backlog run
+# =========================================================
+
+@app.route("/api/meddra/autocode", methods=["POST"])
+def meddra_autocode():
+    data = request.get_json(silent=True) or {}
+    verbatims = data.get("verbatims")
+    if not isinstance(verbatims, list) or len(verbatims) > 1000:
+        return jsonify({"error": "verbatims must be a list of at most 1000 strings."}), 400
+    try:
+        limit = max(1, min(int(data.get("limit", 5)), 20))
+        return jsonify(suggestions([str(v or "") for v in verbatims], data.get("kind", "event"), limit))
+    except (AutocodeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/api/meddra/autocode/decisions", methods=["GET"])
+def coding_decisions():
+    # the review queue: most frequent verbatims first
+    q = db.session.query(CodingDecision)
+    status = request.args.get("status", "auto")
+    kind   = request.args.get("kind")
+    if status not in CODING_STATUSES or (kind and kind not in CODING_KINDS):
+        return jsonify({"error": f"status must be one of {list(CODING_STATUSES)}, kind one of {list(CODING_KINDS)}."}), 400
+    try:
+        limit    = max(1, min(_arg_int("limit", 100), 1000))
+        offset   = max(0, _arg_int("offset", 0))
+        max_conf = request.args.get("maxConfidence")
+        q = q.filter(CodingDecision.status == status)
+        if kind:
+            q = q.filter(CodingDecision.kind == kind)
+        if max_conf is not None:
+            q = q.filter(CodingDecision.confidence < float(max_conf))
+    except ValueError:
+        return jsonify({"error": "limit, offset and maxConfidence must be numbers."}), 400
+    rows = (q.order_by(CodingDecision.cases.desc(), CodingDecision.kind, CodingDecision.verbatim_key)
+            .offset(offset).limit(limit).all())
+    return jsonify([r.to_dict() for r in rows])
+
+
+@app.route("/api/meddra/autocode/decisions", methods=["POST"])
+def save_coding_decisions():
+    # {"decisions": [{kind, verbatim | key, lltCode, status: confirmed | rejected}], "_audit": {...}}
+    user, role, data = extract_audit(request.get_json(silent=True) or {})
+    items = data.get("decisions")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "decisions must be a non-empty list."}), 400
+    try:
+        saved = record_decisions(items, user)
+    except AutocodeError as e:
+        return jsonify({"error": str(e)}), 400
+    db.session.commit()
+    return jsonify({"saved": len(saved)})
+
+
+@app.route("/api/meddra/autocode/run", methods=["POST"])
+def meddra_autocode_run():
+    # {"apply": bool, "minConfidence": 0.95, "kinds": [...], "caseIds": [...]};
+    # the whole backlog is better run with `flask meddra-autocode`
+    user, role, data = extract_audit(request.get_json(silent=True) or {})
+    kinds = data.get("kinds") or list(CODING_KINDS)
+    ids   = data.get("caseIds")
+    if any(k not in CODING_KINDS for k in kinds):
+        return jsonify({"error": f"kinds must be a subset of {list(CODING_KINDS)}."}), 400
+    try:
+        min_conf = float(data.get("minConfidence", MIN_CONFIDENCE))
+    except (TypeError, ValueError):
+        return jsonify({"error": "minConfidence must be a number."}), 400
+    stats = run_backlog(tuple(kinds), bool(data.get("apply")), min_conf,
+                        ids=[str(i) for i in ids] if ids else None, user=user, role=role)
+    return jsonify(dict(stats))
+
+
+# =========================================================
+# MEDDRA VERSION UPGRADE — impact of a release on the coded
+# cases, and the approved recodes. A full pass over a large
+# database is better run with `flask meddra-impact` /
+# `flask meddra-recode`.
+# =========================================================
+
+@app.route("/api/meddra/impact", methods=["GET"])
+def meddra_upgrade_impact():
+    kinds = [k for k in request.args.get("kind", "").split(",") if k] or list(RECODE_KINDS)
+    if not request.args.get("from") or not request.args.get("to") or any(k not in RECODE_KINDS for k in kinds):
+        return jsonify({"error": f"from and to are required; kind is a comma-separated subset of {list(RECODE_KINDS)}."}), 400
+    try:
+        return jsonify(meddra_impact(request.args["from"], request.args["to"], tuple(kinds)))
+    except RecodeError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route("/api/meddra/recode", methods=["POST"])
+def meddra_upgrade_recode():
+    # {"from", "to", "approvals": [{kind?, lltCode, toLltCode?}] | report, "actions": ["update"], "kinds"}
+    user, role, data = extract_audit(request.get_json(silent=True) or {})
+    kinds = data.get("kinds") or list(RECODE_KINDS)
+    if not data.get("from") or not data.get("to") or any(k not in RECODE_KINDS for k in kinds):
+        return jsonify({"error": f"from and to are required; kinds a subset of {list(RECODE_KINDS)}."}), 400
+    try:
+        stats = meddra_recode(data["from"], data["to"], approvals_from(data.get("approvals") or []),
+                              tuple(data.get("actions") or ()), tuple(kinds), user=user, role=role)
+    except RecodeError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(stats)
+
+
+# =========================================================
+# E2B(R3) BATCH EXPORT
+# =========================================================
+
+@app.route("/api/e2b/batch", methods=["GET", "POST"])
+def e2b_batch():
+    data     = request.get_json(silent=True) or {}
+    ids      = data.get("caseIds") or [i.strip() for i in request.args.get("ids", "").split(",") if i.strip()]
+    compress = request.args.get("gzip", "false").lower() == "true"
+    user     = request.args.get("user", "unknown")
+    role     = request.args.get("role", "unknown")
+    batch_id = request.args.get("batchId") or f"BATCH-{ts_now()}"
+    try:
+        workers = max(1, min(_arg_int("workers", 1), os.cpu_count() or 1))
+        cases   = batch_cases(request.args, ids)
+    except BatchError as e:
+        return jsonify({"error": str(e), "ineligible": e.ids}), e.status
+    except (ListingError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    def audit(case):
+        log_event(case.id, "E2B_EXPORTED", user, role, section="e2b", details=f"Batch {batch_id}")
+
+    def body():
+        yield from stream_batch(cases, batch_id, compress, audit, workers, xml_cache)
+        db.session.commit()
+
+    resp = Response(stream_with_context(body()),
+                    mimetype="application/gzip" if compress else "application/xml")
+    resp.headers["Content-Disposition"] = f'attachment; filename="{batch_id}.xml{".gz" if compress else ""}"'
+    return resp
+
+
+# =========================================================
+# CIOMS I / MEDWATCH 3500A FORMS — one PDF, or a ZIP batch
+# =========================================================
+
+@app.route("/api/cases/<case_id>/forms/<form>", methods=["GET"])
+def case_form(case_id, form):
+    if form not in FORMS:
+        return jsonify({"error": f"form must be one of {list(FORMS)}."}), 400
+    case = db.session.get(Case, case_id)
+    if case is None:
+        return jsonify({"error": f"Case {case_id} not found."}), 404
+    pdf = render_form(case, form)
+    log_event(case.id, "FORM_EXPORTED", request.args.get("user", "unknown"), request.args.get("role", "unknown"),
+              section="forms", details=form)
+    db.session.commit()
+    resp = Response(pdf, mimetype="application/pdf")
+    resp.headers["Content-Disposition"] = f'attachment; filename="{form_filename(form, case.id)}"'
+    return resp
+
+
+@app.route("/api/forms/batch", methods=["GET", "POST"])
+def forms_batch():
+    # ?form=cioms,medwatch plus the /api/cases filters or ids; any
+    # step, like the single-case form, and unknown ids are a 422
+    data  = request.get_json(silent=True) or {}
+    ids   = data.get("caseIds") or [i.strip() for i in request.args.get("ids", "").split(",") if i.strip()]
+    forms = [f.strip() for f in request.args.get("form", "cioms").split(",") if f.strip()]
+    user  = request.args.get("user", "unknown")
+    role  = request.args.get("role", "unknown")
+    name  = request.args.get("batchId") or f"FORMS-{ts_now()}"
+    if not forms or any(f not in FORMS for f in forms):
+        return jsonify({"error": f"form must be a comma-separated list of {list(FORMS)}."}), 400
+    try:
+        workers = max(1, min(_arg_int("workers", 1), os.cpu_count() or 1))
+        cases   = batch_cases(request.args, ids, min_step=None)
+    except BatchError as e:
+        return jsonify({"error": str(e), "ineligible": e.ids}), e.status
+    except (ListingError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    def audit(case):
+        log_event(case.id, "FORM_EXPORTED", user, role, section="forms", details=f"{','.join(forms)} in {name}")
+
+    def body():
+        yield from stream_forms(cases, forms, audit, workers)
+        db.session.commit()
+
+    resp = Response(stream_with_context(body()), mimetype="application/zip")
+    resp.headers["Content-Disposition"] = f'attachment; filename="{name}.zip"'
+    return resp
+
+
+# =========================================================
+# BULK CASE IMPORT — E2B(R3) batch XML or line listing CSV
+# =========================================================
+
+@app.route("/api/cases/import", methods=["POST"])
+def import_cases():
+    # multipart "file" field or the raw request body; gzip is detected
+    upload = request.files.get("file")
+    stream = upload.stream if upload else request.stream
+    source = (upload.filename if upload else None) or request.args.get("source") or "upload"
+    try:
+        fmt, records = open_upload(stream, request.args.get("format"))
+        chunk = max(1, min(_arg_int("chunk", CHUNK), 5000))
+    except (IngestError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    report = ingest(records, request.values.get("user", "unknown"), request.values.get("role", "unknown"),
+                    source, chunk)
+    report["format"] = fmt
+    return jsonify(report)
+
+
+# =========================================================
+# LINE LISTING EXPORT
+# =========================================================
+
+@app.route("/api/line-listing", methods=["GET"])
+def line_listing():
+    fmt     = request.args.get("format", "csv")
+    flatten = request.args.get("flatten", "first")
+    if fmt not in ENCODERS or flatten not in FLATTEN:
+        return jsonify({"error": f"format must be one of {list(ENCODERS)}, flatten one of {list(FLATTEN)}."}), 400
+
+    rows = listing_rows(request.args, flatten)
+    try:
+        first = next(rows, None)        # surfaces filter errors before streaming starts
+    except (ListingError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    if first is not None:
+        rows = itertools.chain([first], rows)
+
+    encode, mimetype = ENCODERS[fmt]
+    resp = Response(stream_with_context(encode(rows)), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="LineListing_{date.today().isoformat()}.{fmt}"'
+    return resp
+
+
+# =========================================================
+# AUDIT TRAIL
+# ---------------------------------------------------------
+# ?caseId= &user= &role= &action= &section= (comma lists),
+# &from= &to= (ISO date/datetime), &order=asc|desc,
+# &limit= &cursor= (nextCursor of the previous page)
+# =========================================================
+
+@app.route("/api/audit", methods=["GET"])
+def audit_trail():
+    try:
+        body = audit_page(request.args)
+        total = audit_count(request.args) if request.args.get("count", "false").lower() == "true" else None
+    except (AuditQueryError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    resp = jsonify(body)
+    if total is not None:
+        resp.headers["X-Total-Count"] = str(total)
+    return resp
+
+
+@app.route("/api/audit/export", methods=["GET"])
+def audit_export():
+    rows = audit_rows(request.args)
+    try:
+        first = next(rows, None)        # surfaces filter errors before streaming starts
+    except (AuditQueryError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    if first is not None:
+        rows = itertools.chain([first], rows)
+
+    resp = Response(stream_with_context(audit_csv(rows)), mimetype="text/csv")
+    resp.headers["Content-Disposition"] = f'attachment; filename="AuditTrail_{date.today().isoformat()}.csv"'
+    return resp
+
+
+# =========================================================
+# SIGNAL DETECTION
+# =========================================================
+
+SIGNAL_METHODS = ("prr", "ror", "ic", "ebgm")
+SIGNAL_SORTS   = ("eb05", "ebgm", "prr", "ror", "ic025", "chi2", "count")
+
+
+@app.route("/api/signals", methods=["GET"])
+def signal_detection():
+    if not NUMPY_AVAILABLE:
+        return jsonify({"error": "numpy not installed — signal detection disabled."}), 503
+    level   = request.args.get("level", "pt")
+    methods = [m for m in request.args.get("method", "").split(",") if m] or list(SIGNAL_METHODS)
+    sort    = request.args.get("sort", "eb05")
+    if level not in ("pt", "soc") or sort not in SIGNAL_SORTS or not set(methods) <= set(SIGNAL_METHODS):
+        return jsonify({"error": f"level must be pt or soc, method any of {list(SIGNAL_METHODS)}, "
+                                 f"sort one of {list(SIGNAL_SORTS)}."}), 400
+    try:
+        th    = {k: float(request.args[k]) for k in THRESHOLDS if k in request.args}
+        limit = max(1, min(_arg_int("limit", 100), 5000))
+    except ValueError:
+        return jsonify({"error": "thresholds and limit must be numeric."}), 400
+
+    table = get_signal_tables()[level]
+    rows  = table.query(th, methods, request.args.get("drug"), request.args.get("event"), sort, limit,
+                        signals_only=request.args.get("all", "false").lower() != "true")
+    return jsonify({
+        "level":      level,
+        "cases":      table.n_cases,
+        "pairs":      len(table),
+        "thresholds": {**THRESHOLDS, **th},
+        "mgpsPrior":  [round(float(x), 6) for x in table.prior] if table.prior else None,
+        "priorFit":   table.prior_fit,
+        "signals":    rows,
+    })
+
+
+@app.route("/api/signals/top", methods=["GET"])
+def signal_top_counts():
+    # ?drug=X -> its most reported PTs/SOCs; ?event=Y -> its most reported suspect drugs
+    level = request.args.get("level", "pt")
+    drug, evt = request.args.get("drug", "").strip(), request.args.get("event", "").strip()
+    if level not in ("pt", "soc") or bool(drug) == bool(evt):
+        return jsonify({"error": "level must be pt or soc, and exactly one of drug / event is required."}), 400
+    try:
+        limit = max(1, min(_arg_int("limit", 20), 500))
+    except ValueError:
+        return jsonify({"error": "limit must be numeric."}), 400
+
+    total, rows = top_signal_counts(level, drug or None, evt or None, limit)
+    return jsonify({
+        "level":  level,
+        "drug":   drug or None,
+        "event":  evt or None,
+        "cases":  total,
+        "top":    rows,
+    })
+
+
+# =========================================================
+# CACHE METRICS — hit / miss counts per namespace, for sizing
+# RESPONSE_CACHE_SIZE and E2B_CACHE_MB (per worker)
+# =========================================================
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    stats = response_cache.stats()
+    stats["e2b"] = {
+        "entries":  len(xml_cache),
+        "bytes":    xml_cache.size,
+        "maxBytes": xml_cache.max_bytes,
+        "hits":     xml_cache.hits,
+        "misses":   xml_cache.misses,
+        "hitRatio": round(xml_cache.hits / ((xml_cache.hits + xml_cache.misses) or 1), 4),
+    }
+    return jsonify(stats)
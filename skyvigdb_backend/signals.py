@@ -0,0 +1,447 @@
+# =========================================================
+# SIGNAL DETECTION — disproportionality statistics
+# ---------------------------------------------------------
+# Drug x event contingency tables are counted in one pass
+# over the cases (each case counts once per distinct pair),
+# then PRR, ROR, IC025 (BCPNN) and EBGM / EB05 (DuMouchel's
+# MGPS) are computed for every pair at once with NumPy.
+#
+#               event    other events
+#   drug          a           b          n_drug = a + b
+#   other drugs   c           d
+#               n_event                  N = a + b + c + d
+# =========================================================
+
+import math
+from array import array
+
+from lazy import LazyModule, available
+
+np              = LazyModule("numpy")           # imported on the first table build
+NUMPY_AVAILABLE = available("numpy")
+
+SUSPECT_ROLES = ("Suspect", "Co-suspect", "Interacting")
+
+THRESHOLDS = {          # a pair is flagged by a method when all its limits hold
+    "minCount": 3,      # a >= 3                          (all methods)
+    "prr":      2.0,    # PRR >= 2 and chi2 >= 4          (Evans 2001)
+    "chi2":     4.0,
+    "ror025":   1.0,    # lower 95% bound of ROR > 1
+    "ic025":    0.0,    # lower 95% bound of IC > 0      (WHO-UMC)
+    "eb05":     2.0,    # lower 5% bound of EBGM >= 2    (FDA MGPS)
+}
+
+MGPS_START = (0.2, 0.1, 2.0, 4.0, 1 / 3)    # alpha1, beta1, alpha2, beta2, P
+MGPS_RANGE = (1e-8, 1e8)                    # alpha / beta beyond these: the fit ran off to 0 or infinity
+MGPS_P_MIN = 1e-6                           # P is clamped to [MGPS_P_MIN, 1 - MGPS_P_MIN]
+
+
+def drug_key(product):
+    name = (product.get("name") or product.get("genericName") or "").strip()
+    return (name.lower(), name) if name else None
+
+
+def suspect_drugs(products):
+    keys = {}
+    for p in products or []:
+        if p and (p.get("role") or "Suspect") in SUSPECT_ROLES:
+            k = drug_key(p)
+            if k:
+                keys.setdefault(k[0], k[1])
+    return keys
+
+
+def case_events(events, soc_of=None):
+    # -> ({PT key: label}, {SOC key: label}) for one case; the SOC comes
+    # from the dictionary (by PT code, then PT name) before the event's own
+    soc_of = soc_of or {}
+    pts, socs = {}, {}
+    for e in events or []:
+        if not e:
+            continue
+        pt = (e.get("pt") or "").strip()
+        if pt:
+            pts.setdefault(pt.lower(), pt)
+        soc = soc_of.get(e.get("pt_code")) or soc_of.get(pt.lower()) or e.get("soc")
+        if soc:
+            socs.setdefault(soc.lower(), soc)
+    return pts, socs
+
+
+def contributions(drugs, events):
+    # the pv_signal_count rows one case counts towards, {(drug_key,
+    # event_key): (drug, event)}: its pairs, the drug and event
+    # marginals ("" on the other side) and the case total ("", "")
+    rows = {("", ""): ("", "")}
+    if drugs and events:
+        for dk, dl in drugs.items():
+            rows[(dk, "")] = (dl, "")
+            for ek, el in events.items():
+                rows[(dk, ek)] = (dl, el)
+        for ek, el in events.items():
+            rows[("", ek)] = ("", el)
+    return rows
+
+
+# =========================================================
+# ONE-PASS PAIR COUNTING
+# =========================================================
+
+class PairCounter:
+    # interns drug / event keys to ints and records, per case, the
+    # distinct drugs, events and drug-event pairs; NumPy does the rest
+
+    def __init__(self):
+        self.drugs        = {}
+        self.events       = {}
+        self.drug_labels  = []
+        self.event_labels = []
+        self.case_drugs   = array("i")
+        self.case_events  = array("i")
+        self.pair_drugs   = array("i")
+        self.pair_events  = array("i")
+        self.n_cases      = 0
+
+    def _id(self, table, labels, key, label):
+        i = table.get(key)
+        if i is None:
+            i = table[key] = len(labels)
+            labels.append(label)
+        return i
+
+    def add(self, drugs, events):
+        # drugs / events: {key: label} for one case
+        self.n_cases += 1
+        if not drugs or not events:
+            return
+        d_ids = [self._id(self.drugs,  self.drug_labels,  k, v) for k, v in drugs.items()]
+        e_ids = [self._id(self.events, self.event_labels, k, v) for k, v in events.items()]
+        self.case_drugs.extend(d_ids)
+        self.case_events.extend(e_ids)
+        for d in d_ids:
+            self.pair_drugs.extend([d] * len(e_ids))
+            self.pair_events.extend(e_ids)
+
+    def table(self, mgps=True):
+        n_event = len(self.event_labels)
+        codes = np.frombuffer(self.pair_drugs, dtype=np.int32).astype(np.int64) * max(n_event, 1) \
+            + np.frombuffer(self.pair_events, dtype=np.int32)
+        codes, a = np.unique(codes, return_counts=True)
+        return SignalTable(
+            self.drug_labels, self.event_labels,
+            (codes // max(n_event, 1)).astype(np.int32), (codes % max(n_event, 1)).astype(np.int32), a,
+            np.bincount(np.frombuffer(self.case_drugs,  dtype=np.int32), minlength=len(self.drug_labels)),
+            np.bincount(np.frombuffer(self.case_events, dtype=np.int32), minlength=n_event),
+            self.n_cases, mgps=mgps)
+
+
+def counts_table(rows, mgps=True):
+    # SignalTable from stored aggregate rows (drug_key, event_key, drug, event, n)
+    pc = PairCounter()
+    pair_a, n_drug, n_event = array("q"), {}, {}
+    for dk, ek, dl, el, n in rows:
+        if dk and ek:
+            pc.pair_drugs.append(pc._id(pc.drugs, pc.drug_labels, dk, dl))
+            pc.pair_events.append(pc._id(pc.events, pc.event_labels, ek, el))
+            pair_a.append(n)
+        elif dk:
+            n_drug[dk] = n
+        elif ek:
+            n_event[ek] = n
+        else:
+            pc.n_cases = n
+    return SignalTable(
+        pc.drug_labels, pc.event_labels,
+        np.frombuffer(pc.pair_drugs, dtype=np.int32), np.frombuffer(pc.pair_events, dtype=np.int32),
+        np.frombuffer(pair_a, dtype=np.int64),
+        np.array([n_drug.get(k, 0) for k in pc.drugs], dtype=np.int64),
+        np.array([n_event.get(k, 0) for k in pc.events], dtype=np.int64),
+        pc.n_cases, mgps=mgps)
+
+
+# =========================================================
+# SPECIAL FUNCTIONS (vectorized; NumPy has none of these)
+# =========================================================
+
+_LANCZOS = (0.99999999999980993, 676.5203681218851, -1259.1392167224028,
+            771.32342877765313, -176.61502916214059, 12.507343278686905,
+            -0.13857109526572012, 9.9843695780195716e-6, 1.5056327351493116e-7)
+
+
+def gammaln(x):
+    x = np.asarray(x, dtype=float)
+    small = x < 0.5
+    y = np.where(small, x + 1.0, x) - 1.0
+    s = np.full_like(y, _LANCZOS[0])
+    for i, c in enumerate(_LANCZOS[1:], 1):
+        s += c / (y + i)
+    t = y + 7.5
+    out = 0.5 * math.log(2 * math.pi) + (y + 0.5) * np.log(t) - t + np.log(s)
+    return np.where(small, out - np.log(x), out)
+
+
+def digamma(x):
+    x = np.array(x, dtype=float)
+    acc = np.zeros_like(x)
+    for _ in range(6):
+        low = x < 6.0
+        acc -= np.where(low, 1.0 / x, 0.0)
+        x = np.where(low, x + 1.0, x)
+    inv2 = 1.0 / (x * x)
+    return acc + np.log(x) - 0.5 / x - inv2 * (1 / 12 - inv2 * (1 / 120 - inv2 / 252))
+
+
+def norm_cdf(z):
+    # Abramowitz & Stegun 7.1.26, |error| < 1.5e-7
+    x = np.abs(z) / math.sqrt(2)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-x * x)
+    return 0.5 * (1.0 + np.where(z < 0, -erf, erf))
+
+
+def gamma_cdf(x, shape, rate):
+    # Wilson-Hilferty cube-root normal approximation
+    k = shape
+    z = (np.cbrt(rate * x / k) - (1 - 1 / (9 * k))) * np.sqrt(9 * k)
+    return norm_cdf(z)
+
+
+def gamma_ppf(p, shape, rate):
+    # inverse of gamma_cdf; p is a scalar lower-tail probability
+    z = _norm_ppf(p)
+    k = shape
+    return k / rate * np.maximum(1 - 1 / (9 * k) + z / np.sqrt(9 * k), 1e-3) ** 3
+
+
+def _norm_ppf(p):
+    lo, hi = -10.0, 10.0
+    for _ in range(60):
+        mid = (lo + hi) / 2
+        lo, hi = (mid, hi) if norm_cdf(np.array(mid)) < p else (lo, mid)
+    return (lo + hi) / 2
+
+
+# =========================================================
+# MGPS — two-component gamma mixture prior, fitted by
+# maximum likelihood on the observed (n >= 1) pairs
+# =========================================================
+
+def _nb_logpmf(n, E, alpha, beta):
+    return (gammaln(alpha + n) - gammaln(alpha) - gammaln(n + 1)
+            + alpha * np.log(beta / (beta + E)) + n * np.log(E / (beta + E)))
+
+
+def _unpack(theta):
+    a1, b1, a2, b2 = np.exp(theta[:4])
+    p = 1 / (1 + math.exp(-theta[4]))
+    return a1, b1, a2, b2, min(max(p, MGPS_P_MIN), 1 - MGPS_P_MIN)
+
+
+def _neg_loglik(theta, n, E, w):
+    a1, b1, a2, b2, p = _unpack(theta)
+    log_f = np.logaddexp(math.log(p) + _nb_logpmf(n, E, a1, b1),
+                         math.log(1 - p) + _nb_logpmf(n, E, a2, b2))
+    f0 = p * (b1 / (b1 + E)) ** a1 + (1 - p) * (b2 / (b2 + E)) ** a2
+    ll = np.sum(w * (log_f - np.log1p(-np.minimum(f0, 1 - 1e-12))))
+    return -ll if np.isfinite(ll) else np.inf
+
+
+def _nelder_mead(f, x0, step=0.5, iters=600, tol=1e-7):
+    # -> (best point, converged within iters)
+    dim  = len(x0)
+    pts  = [np.array(x0, dtype=float)]
+    for i in range(dim):
+        x = pts[0].copy()
+        x[i] += step
+        pts.append(x)
+    vals = [f(x) for x in pts]
+    for _ in range(iters):
+        order = np.argsort(vals)
+        pts   = [pts[i] for i in order]
+        vals  = [vals[i] for i in order]
+        if abs(vals[-1] - vals[0]) <= tol * (abs(vals[0]) + tol):
+            return pts[0], bool(np.isfinite(vals[0]))
+        centroid = np.mean(pts[:-1], axis=0)
+        xr = centroid + (centroid - pts[-1])
+        fr = f(xr)
+        if fr < vals[0]:
+            xe = centroid + 2 * (centroid - pts[-1])
+            fe = f(xe)
+            pts[-1], vals[-1] = (xe, fe) if fe < fr else (xr, fr)
+        elif fr < vals[-2]:
+            pts[-1], vals[-1] = xr, fr
+        else:
+            xc = centroid + 0.5 * (pts[-1] - centroid)
+            fc = f(xc)
+            if fc < vals[-1]:
+                pts[-1], vals[-1] = xc, fc
+            else:
+                pts  = [pts[0] + 0.5 * (x - pts[0]) for x in pts]
+                vals = [vals[0]] + [f(x) for x in pts[1:]]
+    return pts[int(np.argmin(vals))], False
+
+
+def fit_mgps(n, E):
+    # -> (prior, ok). Pairs are squashed into (n, E within ~5%) bins
+    # first, as the likelihood barely moves within a bin and the fit
+    # gets ~10x cheaper. ok is False when the optimiser did not
+    # converge or stopped on a degenerate prior
+    n  = np.minimum(n, 10_000).astype(float)
+    lb = np.round(np.log(E) * 20)
+    keys, inv, w = np.unique(np.stack([n, lb]), axis=1, return_inverse=True, return_counts=True)
+    sn, sE = keys[0], np.exp(keys[1] / 20)
+    theta0 = np.log(np.array(MGPS_START[:4]))
+    theta0 = np.append(theta0, math.log(MGPS_START[4] / (1 - MGPS_START[4])))
+    theta, converged = _nelder_mead(lambda t: _neg_loglik(t, sn, sE, w), theta0)
+    prior = _unpack(theta)
+    return prior, converged and not degenerate(prior)
+
+
+def degenerate(prior):
+    # P pinned at its clamp, or a shape / rate run off towards 0 or
+    # infinity: EBGM from such a prior looks precise and means nothing.
+    # A small P or a tight component on its own is a legitimate fit
+    lo, hi = MGPS_RANGE
+    *shapes, p = prior
+    return min(p, 1 - p) <= MGPS_P_MIN * 1.01 or any(not lo < x < hi for x in shapes)
+
+
+def ebgm(n, E, prior):
+    a1, b1, a2, b2, p = prior
+    n = n.astype(float)
+    l1 = math.log(p) + _nb_logpmf(n, E, a1, b1)
+    l2 = math.log(1 - p) + _nb_logpmf(n, E, a2, b2)
+    q  = np.exp(l1 - np.logaddexp(l1, l2))                 # posterior weight of component 1
+    k1, r1, k2, r2 = a1 + n, b1 + E, a2 + n, b2 + E
+    e_log = q * (digamma(k1) - np.log(r1)) + (1 - q) * (digamma(k2) - np.log(r2))
+
+    # EB05: the mixture's 5th percentile lies between the components'
+    # own 5th percentiles (closed form under Wilson-Hilferty); bisect
+    # only where the posterior is genuinely mixed
+    x1, x2 = gamma_ppf(0.05, k1, r1), gamma_ppf(0.05, k2, r2)
+    eb05   = np.where(q >= 0.5, x1, x2)
+    mixed  = np.flatnonzero((q > 1e-6) & (q < 1 - 1e-6))
+    if len(mixed):
+        qm, k1m, r1m, k2m, r2m = q[mixed], k1[mixed], r1[mixed], k2[mixed], r2[mixed]
+        lo = np.log(np.minimum(x1[mixed], x2[mixed]))
+        hi = np.log(np.maximum(x1[mixed], x2[mixed]))
+        for _ in range(30):
+            mid = (lo + hi) / 2
+            lam = np.exp(mid)
+            below = qm * gamma_cdf(lam, k1m, r1m) + (1 - qm) * gamma_cdf(lam, k2m, r2m) < 0.05
+            lo = np.where(below, mid, lo)
+            hi = np.where(below, hi, mid)
+        eb05[mixed] = np.exp((lo + hi) / 2)
+    return np.exp(e_log), eb05
+
+
+# =========================================================
+# STATISTICS TABLE
+# =========================================================
+
+class SignalTable:
+
+    def __init__(self, drug_labels, event_labels, drug_ids, event_ids, a, n_drug, n_event, n_cases,
+                 mgps=True):
+        self.drug_labels  = drug_labels
+        self.event_labels = event_labels
+        self.drug_ids     = drug_ids
+        self.event_ids    = event_ids
+        self.n_cases      = n_cases
+        self.prior        = None
+        self.prior_fit    = None    # "ok" / "degenerate" once MGPS has run
+
+        N  = float(max(n_cases, 1))
+        a  = a.astype(float)
+        nd = n_drug[drug_ids].astype(float)
+        ne = n_event[event_ids].astype(float)
+        b, c = nd - a, ne - a
+        d  = N - nd - ne + a
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.a   = a
+            self.E   = nd * ne / N
+            self.prr = (a / nd) / (c / (N - nd))
+            se_prr   = np.sqrt(1 / a - 1 / nd + 1 / c - 1 / (N - nd))
+            self.prr025 = np.exp(np.log(self.prr) - 1.96 * se_prr)
+            self.chi2 = N * (np.abs(a * d - b * c) - N / 2) ** 2 / (nd * (N - nd) * ne * (N - ne))
+
+            # Haldane correction only where a cell is empty
+            zero = (b == 0) | (c == 0) | (d == 0)
+            ha, hb, hc, hd = (np.where(zero, x + 0.5, x) for x in (a, b, c, d))
+            self.ror    = (ha * hd) / (hb * hc)
+            se_ror      = np.sqrt(1 / ha + 1 / hb + 1 / hc + 1 / hd)
+            self.ror025 = np.exp(np.log(self.ror) - 1.96 * se_ror)
+
+            self.ic    = np.log2((a + 0.5) / (self.E + 0.5))
+            self.ic025 = self.ic - 3.3 * (a + 0.5) ** -0.5 - 2 * (a + 0.5) ** -1.5
+
+        if mgps and len(a):
+            self.prior, ok = fit_mgps(a, self.E)
+            self.prior_fit = "ok" if ok else "degenerate"
+        if self.prior_fit == "ok":
+            with np.errstate(all="ignore"):
+                self.ebgm, self.eb05 = ebgm(a, self.E, self.prior)
+            if not (np.all(np.isfinite(self.ebgm)) and np.all(np.isfinite(self.eb05))):
+                self.prior_fit = "degenerate"
+        if self.prior_fit != "ok":
+            # no usable prior: EBGM / EB05 are null and flag nothing
+            self.ebgm = self.eb05 = np.full_like(a, np.nan)
+
+    def __len__(self):
+        return len(self.a)
+
+    def flags(self, th=None):
+        th = {**THRESHOLDS, **(th or {})}
+        enough = self.a >= th["minCount"]
+        return {
+            "prr": enough & (self.prr >= th["prr"]) & (self.chi2 >= th["chi2"]),
+            "ror": enough & (self.ror025 > th["ror025"]),
+            "ic":  enough & (self.ic025 > th["ic025"]),
+            "ebgm": enough & (self.eb05 >= th["eb05"]),
+        }
+
+    def query(self, th=None, methods=None, drug=None, event=None, sort="eb05", limit=100,
+              signals_only=True):
+        flags = self.flags(th)
+        mask  = np.ones(len(self.a), dtype=bool)
+        if signals_only:
+            hit = np.zeros(len(self.a), dtype=bool)
+            for m in (methods or flags):
+                hit |= flags[m]
+            mask &= hit
+        else:
+            mask &= self.a >= {**THRESHOLDS, **(th or {})}["minCount"]
+        if drug:
+            wanted = {i for i, l in enumerate(self.drug_labels) if drug.lower() in l.lower()}
+            mask &= np.isin(self.drug_ids, list(wanted))
+        if event:
+            wanted = {i for i, l in enumerate(self.event_labels) if event.lower() in l.lower()}
+            mask &= np.isin(self.event_ids, list(wanted))
+
+        idx  = np.flatnonzero(mask)
+        col  = self.a if sort == "count" else getattr(self, sort)
+        key  = np.nan_to_num(col[idx], nan=-np.inf, posinf=np.finfo(float).max)
+        idx  = idx[np.argsort(-key, kind="stable")][:limit]
+        return [self.row(i, flags) for i in idx]
+
+    def row(self, i, flags):
+        def num(x, nd=3):
+            x = float(x)
+            return round(x, nd) if math.isfinite(x) else None
+        return {
+            "drug":     self.drug_labels[self.drug_ids[i]],
+            "event":    self.event_labels[self.event_ids[i]],
+            "count":    int(self.a[i]),
+            "expected": num(self.E[i]),
+            "prr":      num(self.prr[i]),
+            "prr025":   num(self.prr025[i]),
+            "chi2":     num(self.chi2[i]),
+            "ror":      num(self.ror[i]),
+            "ror025":   num(self.ror025[i]),
+            "ic":       num(self.ic[i]),
+            "ic025":    num(self.ic025[i]),
+            "ebgm":     num(self.ebgm[i]),
+            "eb05":     num(self.eb05[i]),
+            "signals":  [m for m in flags if flags[m][i]],
+        }
@@ -0,0 +1,70 @@
+# =========================================================
+# STREAMING HELPERS
+# ---------------------------------------------------------
+# Writers that want a file object (lxml xmlfile, gzip,
+# zipfile, csv) write into a ChunkBuffer; the generator
+# behind a streamed response drains it between records.
+# Batch renderers take their input in windows and, with
+# workers > 1, render each window in a forked pool whose
+# children hand their timings back for the parent's
+# metrics (pool_map).
+# =========================================================
+
+import multiprocessing
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+
+class ChunkBuffer:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        out = b"".join(self.chunks)
+        self.chunks.clear()
+        return out
+
+
+def windows(items, size):
+    # an iterable in lists of up to `size`, read lazily
+    window = []
+    for item in items:
+        window.append(item)
+        if len(window) >= size:
+            yield window
+            window = []
+    if window:
+        yield window
+
+
+def plain(row, table):
+    # picklable copy of the row's values for the table's columns, for pool children
+    return SimpleNamespace(**{c.key: getattr(row, c.key, None) for c in table.columns})
+
+
+@contextmanager
+def fork_pool(workers):
+    # a forked pool for workers > 1, else None; terminated on exit,
+    # so an abandoned stream does not leave children behind
+    pool = multiprocessing.get_context("fork").Pool(workers) if workers > 1 else None
+    try:
+        yield pool
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def pool_map(pool, timed, record, jobs, chunksize=1):
+    # timed(job) -> result with its timings, in the pool when there
+    # is one and more than a job; record() files the timings in this
+    # process and returns the result. Lazy, in job order
+    if pool is not None and len(jobs) > 1:
+        return map(record, pool.map(timed, jobs, chunksize=chunksize))
+    return map(record, map(timed, jobs))
@@ -0,0 +1,102 @@
+# =========================================================
+# CASE SUMMARY EXTRACTION
+# ---------------------------------------------------------
+# Flattens the Case JSON sections into the typed columns of
+# pv_case_summary. Pure function — no database access — so
+# the ORM hooks and the backfill command share one mapping.
+# =========================================================
+
+from datetime import date, datetime, timedelta
+
+from app import OUTCOMES
+
+SERIOUS_LABELS = {
+    "death":           "Death",
+    "lifeThreatening": "Life-threatening",
+    "hospitalised":    "Hospitalisation",
+    "hospitalisation": "Hospitalisation",
+    "disability":      "Disability",
+    "congenital":      "Congenital anomaly",
+    "medSignificant":  "Medically significant",
+}
+
+SUSPECT_ROLES = ("Suspect", "Co-suspect", "Interacting")
+
+# reporting clock from receipt, for the worklist due date
+DUE_DAYS = {"fatal": 7, "serious": 15, "non-serious": 90}
+_FATAL   = {"death", "lifeThreatening"}
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(str(value or "")[:10])
+    except ValueError:
+        return None
+
+
+def _clip(value, n):
+    return str(value)[:n] if value not in (None, "") else None
+
+
+def _first(items):
+    return ((items or [{}])[0] if items else {}) or {}
+
+
+def suspect_product(products):
+    for p in products or []:
+        if p and (p.get("role") or "Suspect") in SUSPECT_ROLES:
+            return p
+    return _first(products)
+
+
+def serious_flags(case):
+    # criteria ticked on any event, the general section or triage; a
+    # fatal event outcome (OUTCOMES 5) counts as death. The summary
+    # columns, the reporting clock and the CIOMS / MedWatch boxes
+    # all read seriousness from here
+    events = [e for e in (case.events or []) if isinstance(e, dict)]
+    found  = [(case.general or {}).get("seriousness"), (case.triage or {}).get("seriousness")]
+    found += [e.get("seriousness") for e in events]
+    flags  = dict.fromkeys(k for f in found if isinstance(f, dict) for k, v in f.items() if v)
+    if any(OUTCOMES.get(e.get("outcome")) == "5" for e in events):
+        flags.setdefault("death")
+    return list(flags)
+
+
+def due_from(receipt, flags, created=None):
+    start = receipt or (created or datetime.utcnow()).date()
+    flags = set(flags or ())
+    kind  = "fatal" if flags & _FATAL else "serious" if flags else "non-serious"
+    return start + timedelta(days=DUE_DAYS[kind])
+
+
+def due_date(case):
+    return due_from(_date((case.triage or {}).get("receiptDate")), serious_flags(case), case.created_at)
+
+
+def summarize(case):
+    t = case.triage  or {}
+    g = case.general or {}
+    d = _first(case.products)
+    e = _first(case.events)
+    sp = suspect_product(case.products)
+    flags = serious_flags(case)
+    suspect = _clip(sp.get("name"), 255)
+    return {
+        "case_id":          case.id,
+        "country":          _clip(t.get("country"), 100),
+        "receipt_date":     _date(t.get("receiptDate")),
+        "report_type":      _clip(t.get("reportType") or g.get("reportType"), 60),
+        "reporter_qual":    _clip(t.get("qualification"), 60),
+        "patient_initials": _clip(t.get("patientInitials"), 20),
+        "first_drug":       _clip(d.get("name"), 255),
+        "first_generic":    _clip(d.get("genericName"), 255),
+        "suspect_drug":     suspect,
+        "suspect_drug_key": suspect.strip().lower() if suspect else None,
+        "first_event_term": _clip(e.get("term"), 500),
+        "first_pt":         _clip(e.get("pt"), 500),
+        "first_pt_code":    _clip(e.get("pt_code"), 8),
+        "onset_date":       _date(e.get("onsetDate")),
+        "serious":          bool(flags),
+        "serious_flags":    _clip(";".join(flags), 200) if flags else None,
+    }
@@ -0,0 +1,210 @@
+# =========================================================
+# TELEMETRY — request metrics, SQL accounting, connection
+# pool gauges, /metrics and on-demand profiles
+# ---------------------------------------------------------
+# Every request records its latency per route and the count
+# and time of the SQL statements it ran; the same totals go
+# out in a Server-Timing header. Statements outside a
+# request (CLI, the audit writer thread) count under the
+# route "(background)".
+#
+# Profiles: a request carrying X-Profile: <PROFILE_TOKEN>,
+# or a PROFILE_SAMPLE fraction of all requests, runs under
+# cProfile (PROFILER=pyinstrument for a call tree) and the
+# profile lands in PROFILE_DIR; X-Profile-File names it.
+# One profile at a time per worker — concurrent requests
+# are not profiled. Streamed bodies are produced after the
+# view returns and fall outside the profile and the timing.
+#
+# METRICS_TOKEN, when set, is required as a bearer token on
+# /metrics.
+# =========================================================
+
+import cProfile
+import hmac
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from flask import Response, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app, db
+from lazy import LazyModule, available
+from metrics import DB_QUERIES, DB_QUERY_TOTAL, DB_SECONDS, HTTP_SECONDS, Gauge, flush, render
+
+PYINSTRUMENT_AVAILABLE = available("pyinstrument")
+_pyinstrument = LazyModule("pyinstrument")
+
+PROFILER       = os.getenv("PROFILER", "cprofile")
+PROFILE_TOKEN  = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE = float(os.getenv("PROFILE_SAMPLE", "0"))
+PROFILE_DIR    = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "skyvig-profiles"))
+METRICS_TOKEN  = os.getenv("METRICS_TOKEN", "")
+
+if PROFILER not in ("cprofile", "pyinstrument"):
+    raise ValueError(f"PROFILER must be cprofile or pyinstrument, not {PROFILER!r}")
+if PROFILER == "pyinstrument" and not PYINSTRUMENT_AVAILABLE:
+    print("[SkyVigilance] WARNING: pyinstrument not installed — profiling with cProfile.")
+    PROFILER = "cprofile"
+
+_profile_lock = threading.Lock()
+_UNSAFE_RE    = re.compile(r"[^A-Za-z0-9]+")
+
+
+def _route():
+    # the URL rule, not the path, so case ids do not become label values
+    if not has_request_context():
+        return "(background)"
+    rule = request.url_rule
+    return rule.rule if rule is not None else "(unmatched)"
+
+
+# ---------------------------------------------------------
+# SQL statements and the connection pool
+# ---------------------------------------------------------
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _sql_start(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._skyvig_t0 = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _sql_end(conn, cursor, statement, parameters, context, executemany):
+    t0 = getattr(context, "_skyvig_t0", None)
+    if t0 is None:
+        return
+    elapsed = time.perf_counter() - t0
+    if has_request_context() and g.get("sql_count") is not None:
+        # summed per request; after_request adds them to the counters once
+        g.sql_count   += 1
+        g.sql_seconds += elapsed
+        return
+    route = _route()                 # background, or a streamed body after the view
+    DB_QUERY_TOTAL.inc(route)
+    DB_SECONDS.inc(route, amount=elapsed)
+
+
+def _pool_state():
+    # QueuePool reports all four (overflow counts up from -size
+    # until the pool is full); the SQLite / static pools may not
+    pool = db.engine.pool
+    out  = {}
+    for state, method in (("size", "size"), ("checked_out", "checkedout"),
+                          ("checked_in", "checkedin"), ("overflow", "overflow")):
+        fn = getattr(pool, method, None)
+        if fn is not None:
+            out[(state,)] = max(0, fn())
+    return out
+
+
+DB_POOL = Gauge("skyvig_db_pool_connections", "Connection pool of the SQLAlchemy engine, per worker.",
+                ("state",), _pool_state)
+
+
+# ---------------------------------------------------------
+# Profiling
+# ---------------------------------------------------------
+
+def _wants_profile():
+    token = request.headers.get("X-Profile")
+    if token and PROFILE_TOKEN:
+        return hmac.compare_digest(token, PROFILE_TOKEN)
+    return PROFILE_SAMPLE > 0 and random.random() < PROFILE_SAMPLE
+
+
+def _start_profile():
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    if PROFILER == "pyinstrument":
+        prof = _pyinstrument.Profiler()
+        prof.start()
+    else:
+        prof = cProfile.Profile()
+        prof.enable()
+    return prof
+
+
+def _stop_profile(prof):
+    try:
+        if PROFILER == "pyinstrument":
+            prof.stop()
+        else:
+            prof.disable()
+    finally:
+        _profile_lock.release()
+
+
+def _save_profile(prof, route):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stem = (f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{os.getpid()}-{request.method}"
+            f"{_UNSAFE_RE.sub('_', route).rstrip('_')}")
+    if PROFILER == "pyinstrument":
+        name = stem + ".html"
+        with open(os.path.join(PROFILE_DIR, name), "w") as f:
+            f.write(prof.output_html())
+    else:
+        name = stem + ".prof"
+        prof.dump_stats(os.path.join(PROFILE_DIR, name))
+    return name
+
+
+# ---------------------------------------------------------
+# Request hooks
+# ---------------------------------------------------------
+
+@app.before_request
+def _request_start():
+    g.request_t0  = time.perf_counter()
+    g.sql_count   = 0
+    g.sql_seconds = 0.0
+    if request.path != "/metrics" and _wants_profile():
+        g.profiler = _start_profile()
+
+
+@app.after_request
+def _request_end(response):
+    if "request_t0" not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_t0
+    route   = _route()
+    prof    = g.pop("profiler", None)
+    if prof is not None:
+        _stop_profile(prof)
+        response.headers["X-Profile-File"] = _save_profile(prof, route)
+    count, seconds = g.sql_count, g.sql_seconds
+    g.sql_count    = None
+    HTTP_SECONDS.observe(elapsed, request.method, route, str(response.status_code))
+    DB_QUERIES.observe(count, route)
+    DB_QUERY_TOTAL.inc(route, amount=count)
+    DB_SECONDS.inc(route, amount=seconds)
+    response.headers["Server-Timing"] = (f"app;dur={elapsed * 1000:.1f}, "
+                                         f'db;dur={seconds * 1000:.1f};desc="{count} queries"')
+    flush()
+    return response
+
+
+@app.teardown_request
+def _request_teardown(exc):
+    # after_request is skipped when the response itself failed
+    prof = g.pop("profiler", None)
+    if prof is not None:
+        _stop_profile(prof)
+
+
+# =========================================================
+# METRICS ENDPOINT
+# =========================================================
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get("Authorization", ""),
+                                                 f"Bearer {METRICS_TOKEN}"):
+        return jsonify({"error": "Metrics token required."}), 401
+    return Response(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
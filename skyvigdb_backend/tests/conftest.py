@@ -0,0 +1,50 @@
+# =========================================================
+# TEST FIXTURES — the app against a throwaway SQLite file,
+# migrated at import like a worker boot. Every test starts
+# from empty tables.
+#   cd skyvigdb_backend && python -m pytest tests
+# =========================================================
+
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_DIR = tempfile.mkdtemp(prefix="skyvig-test-")
+os.environ["DATABASE_URL"]    = f"sqlite:///{os.path.join(_DIR, 'test.db')}"
+os.environ["AUDIT_WRITER"]    = "sync"
+os.environ["AUDIT_SPOOL_DIR"] = os.path.join(_DIR, "spool")
+os.environ.pop("MIGRATE_ON_BOOT", None)
+
+import app as app_module                                     # noqa: E402
+from app import AuditLog, Case, CaseSummary, CaseText, SignalCount, db   # noqa: E402
+
+
+@pytest.fixture
+def app():
+    with app_module.app.app_context():
+        for model in (AuditLog, SignalCount, CaseSummary, CaseText, Case):
+            db.session.query(model).delete()
+        db.session.commit()
+        yield app_module.app
+        db.session.rollback()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_case(app):
+    def make(case_id, step=1, status="Triage", **sections):
+        now  = datetime.utcnow()
+        case = Case(id=case_id, current_step=step, status=status, created_at=now, updated_at=now,
+                    **{"triage": {"receiptDate": "2025-03-01", "country": "US"}, **sections})
+        db.session.add(case)
+        db.session.commit()
+        return case
+    return make
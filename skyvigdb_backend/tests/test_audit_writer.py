@@ -0,0 +1,82 @@
+import glob
+import json
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app import AuditLog, db
+from audit_writer import DEAD_LETTER, AuditWriter
+
+
+def _rows(case_id, n, bad=()):
+    return [dict(case_id=case_id, timestamp=datetime.utcnow(), action_type="TEST",
+                 performed_by=None if i in bad else "tester", role="QA", step_from=None, step_to=None,
+                 section="test", details=f"entry {i}")
+            for i in range(n)]
+
+
+@pytest.fixture
+def writer(app, tmp_path):
+    # the background thread only wakes on a full batch; tests flush by hand
+    return AuditWriter(durability="spool", flush_ms=3_600_000, flush_size=10_000, spool_dir=str(tmp_path))
+
+
+def _segments(writer):
+    return glob.glob(os.path.join(writer.spool_dir, "audit-*.ndjson"))
+
+
+def test_rejected_rows_are_dead_lettered(writer, make_case):
+    make_case("PV-A")
+    writer.submit(_rows("PV-A", 20, bad=(3, 17)))
+    assert writer.flush() == 18
+    assert writer.stats["deadLettered"] == 2
+    assert writer.retry == [] and _segments(writer) == []
+
+    with open(os.path.join(writer.spool_dir, DEAD_LETTER)) as f:
+        dead = [json.loads(line) for line in f]
+    assert sorted(d["details"] for d in dead) == ["entry 17", "entry 3"]
+    assert all(d["error"] for d in dead)
+
+    # the next batch is not held up behind the rejected rows
+    writer.submit(_rows("PV-A", 5))
+    assert writer.flush() == 5
+    assert db.session.query(AuditLog).count() == 23
+
+
+def test_transient_error_keeps_the_batch(writer, make_case):
+    make_case("PV-B")
+    failures = {"left": 1}
+
+    def down(conn, cursor, statement, params, context, executemany):
+        if statement.startswith("INSERT INTO audit_log") and failures["left"]:
+            failures["left"] -= 1
+            raise OperationalError(statement, params, Exception("server closed the connection"))
+
+    event.listen(db.engine, "before_cursor_execute", down)
+    try:
+        writer.submit(_rows("PV-B", 8))
+        assert writer.flush() == 0
+        assert writer.stats["deadLettered"] == 0
+        assert len(writer.retry) == 1 and len(_segments(writer)) == 1
+    finally:
+        event.remove(db.engine, "before_cursor_execute", down)
+
+    assert writer.flush() == 8
+    assert writer.retry == [] and _segments(writer) == []
+    assert db.session.query(AuditLog).count() == 8
+
+
+def test_unflushed_journal_is_replayed(writer, make_case, tmp_path):
+    make_case("PV-C")
+    writer.submit(_rows("PV-C", 4))
+    # the worker dies before flushing: its lock goes, the segment stays
+    writer.segment.f.close()
+    writer.segment, writer.queue = None, []
+
+    fresh = AuditWriter(durability="spool", flush_ms=3_600_000, spool_dir=str(tmp_path))
+    assert fresh.replay() == 4
+    assert _segments(fresh) == []
+    assert db.session.query(AuditLog).count() == 4
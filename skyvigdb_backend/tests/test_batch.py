@@ -0,0 +1,31 @@
+import io
+import zipfile
+
+import pytest
+
+
+@pytest.fixture
+def cases(make_case):
+    for case_id, step in (("PV-1", 1), ("PV-2", 2), ("PV-3", 3), ("PV-4", 4)):
+        make_case(case_id, step=step)
+
+
+def test_e2b_filter_selection_keeps_the_step_floor(client, cases):
+    r = client.get("/api/e2b/batch")
+    assert r.status_code == 200
+    assert b"PV-3" in r.data and b"PV-4" in r.data and b"PV-1" not in r.data
+
+
+def test_e2b_explicit_ids_below_the_floor_are_rejected(client, cases):
+    r = client.post("/api/e2b/batch", json={"caseIds": ["PV-1", "PV-3", "PV-9"]})
+    assert r.status_code == 422
+    assert r.get_json()["ineligible"] == ["PV-1", "PV-9"]
+
+
+def test_forms_batch_takes_any_step(client, cases):
+    r = client.post("/api/forms/batch", json={"caseIds": ["PV-1", "PV-3"]})
+    assert r.status_code == 200
+    assert zipfile.ZipFile(io.BytesIO(r.data)).namelist() == ["CIOMS_I_PV-1.pdf", "CIOMS_I_PV-3.pdf"]
+
+    r = client.post("/api/forms/batch", json={"caseIds": ["PV-1", "PV-9"]})
+    assert r.status_code == 422 and r.get_json()["ineligible"] == ["PV-9"]
@@ -0,0 +1,41 @@
+from app import Case, db
+from hooks import dup_index, refresh_dup_index, refresh_text_index, text_index
+
+
+def _case(case_id):
+    return Case(id=case_id, current_step=1, status="Triage", triage={"country": "US"},
+                products=[{"name": "Aspirin", "role": "Suspect"}], events=[{"term": "rash"}],
+                narrative="patient developed a rash")
+
+
+def test_rolled_back_writes_leave_the_indexes_alone(app):
+    refresh_dup_index()
+    refresh_text_index()
+
+    db.session.add(_case("HK-1"))
+    db.session.flush()
+    db.session.rollback()
+    assert "HK-1" not in dup_index._fields and "HK-1" not in text_index.doc_of
+
+    db.session.add(_case("HK-2"))
+    db.session.commit()
+    assert "HK-2" in dup_index._fields and "HK-2" in text_index.doc_of
+
+    db.session.delete(db.session.get(Case, "HK-2"))
+    db.session.flush()
+    db.session.rollback()
+    assert "HK-2" in dup_index._fields and "HK-2" in text_index.doc_of
+
+
+def test_rolled_back_savepoint_only_drops_its_own_writes(app):
+    refresh_dup_index()
+    db.session.add(_case("HK-3"))
+    try:
+        with db.session.begin_nested():
+            db.session.add(_case("HK-4"))
+            db.session.flush()
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    db.session.commit()
+    assert "HK-3" in dup_index._fields and "HK-4" not in dup_index._fields
@@ -0,0 +1,54 @@
+import pytest
+
+from app import AuditLog, Case, CaseSummary, db
+from hooks import dup_index, refresh_dup_index
+from ingest import ingest
+
+
+def _record(n, case_id=None, **sections):
+    data = {"triage": {"receiptDate": "2025-02-01", "country": "FR"},
+            "products": [{"name": f"Drug{n}", "role": "Suspect"}], "events": [{"term": "rash"}], **sections}
+    if case_id:
+        data["id"] = case_id
+    return n, data
+
+
+@pytest.fixture
+def index(app):
+    refresh_dup_index()
+    return dup_index
+
+
+def test_bad_record_rolls_back_alone(app, index):
+    # a value the database driver cannot bind fails the chunk's flush;
+    # the chunk is rolled back and retried one savepoint per record
+    records = [_record(1, "IMP-1"), _record(2, "IMP-2", general={"bad": {1, 2}}), _record(3, "IMP-3")]
+    report = ingest(iter(records), chunk=10)
+
+    assert (report["created"], report["failed"]) == (2, 1)
+    assert report["errors"][0]["caseId"] == "IMP-2"
+    assert {c.id for c in db.session.query(Case)} == {"IMP-1", "IMP-3"}
+    assert {s.case_id for s in db.session.query(CaseSummary)} == {"IMP-1", "IMP-3"}
+    assert {a.case_id for a in db.session.query(AuditLog).filter_by(action_type="CASE_IMPORTED")} \
+        == {"IMP-1", "IMP-3"}
+    # nothing of the rolled back attempts reached the in-process index
+    assert "IMP-2" not in index._fields
+    assert {"IMP-1", "IMP-3"} <= set(index._fields)
+
+
+def test_existing_and_invalid_records_are_reported(make_case):
+    make_case("IMP-9")
+    report = ingest(iter([_record(1, "IMP-9"), (2, ValueError("unreadable record")),
+                          (3, {"triage": {"country": "FR"}}), _record(4, "IMP-4"), _record(5, "IMP-4")]))
+    assert (report["received"], report["created"], report["failed"]) == (5, 1, 4)
+    assert sorted(e["record"] for e in report["errors"]) == [1, 2, 3, 5]
+    assert db.session.query(Case).count() == 2
+
+
+def test_chunks_commit_independently(app):
+    records = [_record(n, f"IMP-{n}") for n in range(1, 8)]
+    records[5] = _record(6, "IMP-6", general={"bad": {1}})
+    report = ingest(iter(records), chunk=3)
+    assert report["created"] == 6
+    assert db.session.query(Case).count() == 6
+    assert db.session.get(Case, "IMP-6") is None
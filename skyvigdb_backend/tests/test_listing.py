@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import Case, db
+
+
+@pytest.fixture
+def cases(app):
+    # three updated_at values shared by many cases: pages must split ties
+    base = datetime(2025, 5, 1, 12)
+    for i in range(25):
+        db.session.add(Case(id=f"LS-{i:03d}", current_step=1 + i % 3, status="Triage",
+                            created_at=base, updated_at=base + timedelta(minutes=i % 3),
+                            triage={"receiptDate": f"2025-04-{1 + i % 28:02d}",
+                                    **({"country": "DE"} if i % 2 else {})}))
+    db.session.commit()
+    return [f"LS-{i:03d}" for i in range(25)]
+
+
+def _walk(client, **query):
+    ids, cursor, pages = [], None, 0
+    while True:
+        r = client.get("/api/cases", query_string={**query, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200
+        body = r.get_json()
+        ids += [c["id"] for c in body["items"]]
+        pages += 1
+        cursor = body["nextCursor"]
+        if not cursor:
+            return ids, pages
+
+
+@pytest.mark.parametrize("sort", ["-updatedAt", "updatedAt", "id", "-currentStep", "country", "-receiptDate"])
+def test_keyset_pages_cover_every_case_once(client, cases, sort):
+    ids, pages = _walk(client, sort=sort, limit=4, fields="id,country")
+    assert sorted(ids) == cases and pages == 7
+
+
+def test_keyset_order_matches_unpaged_order(client, cases):
+    paged, _ = _walk(client, sort="-updatedAt", limit=4)
+    whole = [c["id"] for c in client.get("/api/cases", query_string={"sort": "-updatedAt"}).get_json()]
+    assert paged == whole
+
+
+def test_cursor_survives_inserts_ahead_of_it(client, cases):
+    first = client.get("/api/cases", query_string={"sort": "id", "limit": 10}).get_json()
+    db.session.add(Case(id="LS-000a", current_step=1, status="Triage", triage={}))
+    db.session.commit()
+    rest, _ = _walk(client, sort="id", limit=10, cursor=first["nextCursor"])
+    assert [c["id"] for c in first["items"]] == cases[:10] and rest == cases[10:]
+
+
+def test_bad_cursor_is_400(client, cases):
+    assert client.get("/api/cases", query_string={"limit": 4, "cursor": "not-a-cursor"}).status_code == 400
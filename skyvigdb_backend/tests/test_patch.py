@@ -0,0 +1,77 @@
+import pytest
+
+from app import AuditLog, Case, db
+from patch import JSON_PATCH, MERGE_PATCH, case_etag
+
+
+@pytest.fixture
+def case(make_case):
+    return make_case("PV-P", patient={"initials": "AB", "age": 40, "weight": 70},
+                     events=[{"term": "rash"}], narrative="first")
+
+
+def _patch(client, body, etag, ctype=JSON_PATCH, **query):
+    return client.patch("/api/cases/PV-P", json=body, headers={"If-Match": etag, "Content-Type": ctype},
+                        query_string=query)
+
+
+def test_json_patch_applies_and_audits(client, case):
+    etag = case_etag(case)
+    r = _patch(client, [{"op": "replace", "path": "/patient/age", "value": 41},
+                        {"op": "add", "path": "/events/-", "value": {"term": "fever"}}],
+               etag, user="jdoe", role="Medical")
+    assert r.status_code == 200
+    body = r.get_json()
+    assert body["patient"]["age"] == 41 and [e["term"] for e in body["events"]] == ["rash", "fever"]
+    assert body["changed"] == {"patient": 1, "events": 1}
+    assert r.headers["ETag"] != etag
+
+    audit = db.session.query(AuditLog).filter_by(case_id="PV-P", action_type="CASE_PATCHED").all()
+    assert sorted(a.section for a in audit) == ["events", "patient"]
+    assert {a.performed_by for a in audit} == {"jdoe"}
+
+
+def test_merge_patch_null_removes(client, case):
+    r = _patch(client, {"patient": {"weight": None, "initials": "CD"}}, case_etag(case), MERGE_PATCH)
+    assert r.status_code == 200
+    assert r.get_json()["patient"] == {"initials": "CD", "age": 40}
+
+
+def test_untouched_sections_survive(client, case):
+    _patch(client, {"narrative": "second"}, case_etag(case), MERGE_PATCH)
+    stored = db.session.get(Case, "PV-P")
+    db.session.refresh(stored)
+    assert stored.narrative == "second" and stored.events == [{"term": "rash"}]
+
+
+def test_if_match_required(client, case):
+    r = client.patch("/api/cases/PV-P", json=[], headers={"Content-Type": JSON_PATCH})
+    assert r.status_code == 428
+
+
+def test_stale_etag_is_412_with_current_etag(client, case):
+    stale = case_etag(case)
+    assert _patch(client, {"narrative": "second"}, stale, MERGE_PATCH).status_code == 200
+    r = _patch(client, {"narrative": "third"}, stale, MERGE_PATCH)
+    assert r.status_code == 412
+    assert r.headers["ETag"] == case_etag(db.session.get(Case, "PV-P"))
+    assert db.session.get(Case, "PV-P").narrative == "second"
+
+
+def test_failed_test_op_is_409_and_changes_nothing(client, case):
+    r = _patch(client, [{"op": "test", "path": "/patient/age", "value": 99},
+                        {"op": "replace", "path": "/patient/age", "value": 50}], case_etag(case))
+    assert r.status_code == 409
+    db.session.expire_all()
+    assert db.session.get(Case, "PV-P").patient["age"] == 40
+    assert db.session.query(AuditLog).filter_by(action_type="CASE_PATCHED").count() == 0
+
+
+def test_invalid_patches(client, case):
+    etag = case_etag(case)
+    assert _patch(client, {"events": {"term": "x"}}, etag, MERGE_PATCH).status_code == 422
+    assert _patch(client, [{"op": "remove", "path": "/patient/missing"}], etag).status_code == 422
+    assert _patch(client, {"narrative": "x"}, etag, JSON_PATCH).status_code == 422
+    assert _patch(client, [], etag, "text/plain").status_code == 415
+    r = client.patch("/api/cases/PV-NONE", json={}, headers={"If-Match": "*", "Content-Type": MERGE_PATCH})
+    assert r.status_code == 404
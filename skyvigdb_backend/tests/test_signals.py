@@ -0,0 +1,30 @@
+import numpy as np
+
+from signals import MGPS_START, SignalTable, degenerate, fit_mgps
+
+
+def _table(a, nd, ne, n_cases):
+    k = len(a)
+    return SignalTable([f"d{i}" for i in range(k)], [f"e{i}" for i in range(k)], np.arange(k), np.arange(k),
+                       np.array(a), np.array(nd), np.array(ne), n_cases)
+
+
+def test_degenerate_prior_withholds_ebgm():
+    # every pair seen exactly as often as expected: nothing to fit a mixture to
+    prior, ok = fit_mgps(np.ones(500), np.ones(500))
+    assert not ok
+    t = _table([1] * 3, [2] * 3, [2] * 3, 4)
+    assert t.prior_fit == "degenerate"
+    assert all(r["ebgm"] is None and "ebgm" not in r["signals"] for r in t.query(th={"minCount": 1},
+                                                                              signals_only=False))
+
+
+def test_overdispersed_counts_fit():
+    rng = np.random.default_rng(3)
+    E = rng.uniform(0.05, 5, 4000)
+    lam = np.where(rng.random(4000) < 0.9, rng.gamma(2.0, 0.5, 4000), rng.gamma(3.0, 2.0, 4000))
+    n = rng.poisson(lam * E)
+    keep = n > 0
+    prior, ok = fit_mgps(n[keep].astype(float), E[keep])
+    assert ok and not degenerate(prior)
+    assert not degenerate(MGPS_START)
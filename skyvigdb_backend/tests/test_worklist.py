@@ -0,0 +1,114 @@
+import threading
+from datetime import date, datetime, timedelta
+
+import worklist
+from app import Case, CaseSummary, db
+
+_t = Case.__table__
+
+
+def _fill(n, step=3, status="Medical"):
+    now = datetime.utcnow()
+    db.session.execute(_t.insert(), [
+        {"id": f"WL-{i:04d}", "current_step": step, "status": status, "triage": {},
+         "due_date": date(2025, 1, 1) + timedelta(days=i % 40), "created_at": now, "updated_at": now}
+        for i in range(n)])
+    db.session.commit()
+
+
+def test_queue_is_due_date_order(app):
+    _fill(30)
+    ids = [c["id"] for c in worklist.queue(3, limit=10)]
+    due = [c["dueDate"] for c in worklist.items(ids)]
+    assert len(ids) == 10 and due == sorted(due)
+    assert worklist.queue(2) == []
+
+
+def test_concurrent_claims_never_overlap(app):
+    _fill(60)
+    got, errors = {}, []
+
+    def claimer(n):
+        mine = got.setdefault(n, [])
+        try:
+            with app.app_context():
+                while True:
+                    ids = [c["id"] for c in worklist.claim(3, f"user{n}", "Medical", limit=3)]
+                    if not ids and not worklist.queue(3, limit=1):
+                        break
+                    mine.extend(ids)
+                db.session.remove()
+        except Exception as e:      # noqa: BLE001 — surfaced by the assert below
+            errors.append(e)
+
+    threads = [threading.Thread(target=claimer, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(60)
+    assert errors == []
+
+    claimed = [i for ids in got.values() for i in ids]
+    assert len(claimed) == len(set(claimed)) == 60
+    db.session.expire_all()
+    owner = dict(db.session.execute(db.select(Case.id, Case.claimed_by)).all())
+    assert all(owner[i] == f"user{n}" for n, ids in got.items() for i in ids)
+
+
+def test_lapsed_lease_is_claimable_again(app):
+    _fill(2)
+    first = [c["id"] for c in worklist.claim(3, "alice", limit=2)]
+    assert worklist.claim(3, "bob") == []
+
+    db.session.execute(_t.update().where(_t.c.id == first[0])
+                       .values(claim_expires=datetime.utcnow() - timedelta(seconds=1)))
+    db.session.commit()
+    assert [c["id"] for c in worklist.claim(3, "bob", limit=2)] == [first[0]]
+    assert worklist.renew(first, "alice") == [first[1]]
+
+
+def test_claim_keeps_updated_at_and_release_frees(app):
+    _fill(1)
+    before = db.session.get(Case, "WL-0000").updated_at
+    assert [c["claimedBy"] for c in worklist.claim(3, "alice")] == ["alice"]
+    db.session.expire_all()
+    assert db.session.get(Case, "WL-0000").updated_at == before
+
+    assert worklist.release(["WL-0000"], "bob") == []
+    assert worklist.release(["WL-0000"], "alice") == ["WL-0000"]
+    assert [c["id"] for c in worklist.queue(3)] == ["WL-0000"]
+
+
+def test_moving_the_case_ends_the_lease(app):
+    _fill(1)
+    worklist.claim(3, "alice")
+    case = db.session.get(Case, "WL-0000")
+    case.current_step, case.status = 4, "Quality"
+    db.session.commit()
+    assert (case.claimed_by, case.claim_expires) == (None, None)
+
+
+def test_due_date_reads_event_seriousness_and_fatal_outcomes(make_case):
+    receipt = {"receiptDate": "2025-03-01", "country": "US"}
+    plain   = make_case("WL-N", triage=receipt, events=[{"term": "rash"}])
+    hosp    = make_case("WL-H", triage=receipt, events=[{"term": "rash"},
+                                                        {"term": "sepsis", "seriousness": {"hospitalisation": True}}])
+    fatal   = make_case("WL-F", triage=receipt, events=[{"term": "arrest", "outcome": "Fatal"}])
+    assert [c.due_date for c in (plain, hosp, fatal)] == [date(2025, 5, 30), date(2025, 3, 16), date(2025, 3, 8)]
+    serious = {c["id"]: c["serious"] for c in worklist.items(["WL-N", "WL-H", "WL-F"])}
+    assert serious == {"WL-N": False, "WL-H": True, "WL-F": True}
+
+
+def test_due_date_migration_recomputes_stored_dates(make_case):
+    from migrations import case_due_dates
+    make_case("WL-F", triage={"receiptDate": "2025-03-01", "country": "US"},
+              events=[{"term": "arrest", "outcome": "Fatal"}])
+    db.session.execute(_t.update().values(due_date=date(2025, 5, 30)))
+    db.session.execute(CaseSummary.__table__.update().values(serious=False, serious_flags=None))
+    db.session.commit()
+
+    with db.engine.begin() as conn:
+        assert case_due_dates(conn) == 1
+    db.session.expire_all()
+    assert db.session.get(Case, "WL-F").due_date == date(2025, 3, 8)
+    assert db.session.get(CaseSummary, "WL-F").serious_flags == "death"
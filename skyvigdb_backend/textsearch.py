@@ -0,0 +1,595 @@
+# =========================================================
+# CASE FREE-TEXT SEARCH
+# ---------------------------------------------------------
+# Narratives, event verbatims, lab test names and medical
+# history descriptions, searched across cases, ranked, with
+# highlighted snippets. The flattened text lives in
+# pv_case_text, written by the ORM hooks on the flush
+# connection so it commits with the case row. TEXT_SEARCH
+# picks the engine:
+#   auto    PostgreSQL tsvector + GIN, SQLite FTS5 (external
+#           content over pv_case_text, kept in step by
+#           triggers); the in-process index where neither is
+#           set up (default)
+#   memory  per-worker inverted index, BM25 ranking
+# One query syntax for all engines: words (all must match),
+# "quoted phrases", prefix*, -excluded. The database engines
+# rank at most RANK_WINDOW matches, the most recently
+# indexed: a broad query ("patient") stays fast on a large
+# table and is ordered by relevance within its newest hits.
+# =========================================================
+
+import html
+import math
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import DBAPIError
+
+from app import db, CaseText
+from lazy import LazyModule
+
+np = LazyModule("numpy")
+
+TEXT_SEARCH   = os.getenv("TEXT_SEARCH", "auto")
+FIELDS        = ("events", "history", "labs", "narrative")
+FIELD_WEIGHTS = (3.0, 2.0, 2.0, 1.0)      # a verbatim hit outranks a narrative mention
+MAX_LIMIT     = 100
+MAX_TERMS     = 20
+SNIPPET_WORDS = 16
+RANK_WINDOW   = int(os.getenv("TEXT_RANK_WINDOW", "5000"))
+
+_HIT, _END = "\x02", "\x03"               # highlight markers inside engine snippets
+_WORD_RE   = re.compile(r"\w+")
+_QUERY_RE  = re.compile(r'(-?)"([^"]*)"|(-?)(\S+)')
+_T         = CaseText.__table__
+
+# PostgreSQL: the weighted document, a generated column (PostgreSQL 12+)
+_PG_DOC = ("setweight(to_tsvector('english', coalesce(events, '')), 'A') || "
+           "setweight(to_tsvector('english', coalesce(history, '')), 'B') || "
+           "setweight(to_tsvector('english', coalesce(labs, '')), 'B') || "
+           "setweight(to_tsvector('english', coalesce(narrative, '')), 'C')")
+
+_FTS_COLS     = ", ".join(FIELDS)
+_FTS_NEW      = ", ".join("new." + f for f in FIELDS)
+_FTS_OLD      = ", ".join("old." + f for f in FIELDS)
+_FTS_TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS pv_case_text_ai AFTER INSERT ON pv_case_text BEGIN
+          INSERT INTO pv_case_fts(rowid, {_FTS_COLS}) VALUES (new.docid, {_FTS_NEW});
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS pv_case_text_ad AFTER DELETE ON pv_case_text BEGIN
+          INSERT INTO pv_case_fts(pv_case_fts, rowid, {_FTS_COLS}) VALUES ('delete', old.docid, {_FTS_OLD});
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS pv_case_text_au AFTER UPDATE OF {_FTS_COLS} ON pv_case_text BEGIN
+          INSERT INTO pv_case_fts(pv_case_fts, rowid, {_FTS_COLS}) VALUES ('delete', old.docid, {_FTS_OLD});
+          INSERT INTO pv_case_fts(rowid, {_FTS_COLS}) VALUES (new.docid, {_FTS_NEW});
+        END""",
+)
+
+
+class SearchError(ValueError):
+    pass
+
+
+# ---------------------------------------------------------
+# Text extraction — pure, shared by the hooks, the backfill
+# and the in-process index
+# ---------------------------------------------------------
+
+def _lines(items, key):
+    return "\n".join(str(i[key]) for i in (items or []) if i and i.get(key))
+
+
+def case_text(case):
+    # -> {field: text} from a Case or any row with narrative / events / patient
+    patient = case.patient or {}
+    return {
+        "events":    _lines(case.events, "term"),
+        "history":   _lines(patient.get("otherHistory"), "description"),
+        "labs":      _lines(patient.get("labData"), "testName"),
+        "narrative": case.narrative or "",
+    }
+
+
+def write_case_text(connection, case):
+    row = {**case_text(case), "current_step": case.current_step, "status": case.status}
+    res = connection.execute(_T.update().where(_T.c.case_id == case.id).values(**row))
+    if res.rowcount == 0:
+        connection.execute(_T.insert().values(case_id=case.id, **row))
+
+
+def write_case_state(connection, case):
+    # step / status only: the FTS5 update trigger does not fire
+    connection.execute(_T.update().where(_T.c.case_id == case.id)
+                       .values(current_step=case.current_step, status=case.status))
+
+
+def delete_case_text(connection, case_id):
+    connection.execute(_T.delete().where(_T.c.case_id == case_id))
+
+
+# ---------------------------------------------------------
+# Request parsing
+# ---------------------------------------------------------
+
+def parse_query(q):
+    # -> {"words", "prefixes", "phrases", "excluded"}, lower-cased tokens;
+    # phrases and exclusions are token lists
+    out = {"words": [], "prefixes": [], "phrases": [], "excluded": []}
+    for neg_quoted, quoted, neg, raw in _QUERY_RE.findall(q or ""):
+        toks = _WORD_RE.findall((quoted or raw).lower())
+        if not toks:
+            continue
+        if neg_quoted or neg:
+            out["excluded"].append(toks)
+        elif raw.endswith("*") and len(toks) == 1:
+            out["prefixes"].append(toks[0])
+        elif len(toks) == 1:
+            out["words"].append(toks[0])
+        else:
+            out["phrases"].append(toks)          # quoted, or hyphenated like "drug-induced"
+    if not (out["words"] or out["prefixes"] or out["phrases"]):
+        raise SearchError("q must contain at least one word to search for.")
+    if sum(len(v) for v in out.values()) > MAX_TERMS:
+        raise SearchError(f"At most {MAX_TERMS} search terms.")
+    return out
+
+
+def _list(args, name):
+    return [s.strip() for s in (args.get(name) or "").split(",") if s.strip()]
+
+
+def parse_args(args):
+    q = parse_query(args.get("q"))
+    try:
+        return {
+            "q":      q,
+            "step":   [int(s) for s in _list(args, "step")],
+            "status": _list(args, "status"),
+            "limit":  max(1, min(int(args.get("limit") or 20), MAX_LIMIT)),
+            "offset": max(0, int(args.get("offset") or 0)),
+            "count":  (args.get("count") or "false").lower() == "true",
+        }
+    except ValueError:
+        raise SearchError("step, limit and offset must be integers.")
+
+
+# ---------------------------------------------------------
+# Results
+# ---------------------------------------------------------
+
+def _render(snippet):
+    # engine snippets carry raw text; escape it, then turn the markers into <mark>
+    return html.escape(" ".join(snippet.split())).replace(_HIT, "<mark>").replace(_END, "</mark>")
+
+
+def result(case_id, step, status, score, snippets):
+    return {
+        "caseNumber":  case_id,
+        "currentStep": step,
+        "status":      status,
+        "score":       round(float(score), 4),
+        "highlights":  [{"field": f, "snippet": _render(s)} for f, s in zip(FIELDS, snippets)
+                        if s and _HIT in s],
+    }
+
+
+# ---------------------------------------------------------
+# Database engines
+# ---------------------------------------------------------
+
+_engine = {"name": None}
+
+
+def ensure_index(conn):
+    # -> "tsvector" | "fts5" | None (no database engine; the in-process index is used)
+    _engine["name"] = None
+    _T.create(conn, checkfirst=True)
+    dialect = conn.dialect.name
+    try:
+        if dialect == "postgresql":
+            with conn.begin_nested():
+                conn.execute(text(f"ALTER TABLE pv_case_text ADD COLUMN IF NOT EXISTS doc tsvector "
+                                  f"GENERATED ALWAYS AS ({_PG_DOC}) STORED"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_case_text_doc ON pv_case_text USING gin (doc)"))
+            return "tsvector"
+        if dialect == "sqlite":
+            created = not _has_fts(conn)
+            conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS pv_case_fts USING fts5({_FTS_COLS}, "
+                              f"content='pv_case_text', content_rowid='docid', "
+                              f"tokenize='porter unicode61 remove_diacritics 2')"))
+            for stmt in _FTS_TRIGGERS:
+                conn.execute(text(stmt))
+            if created:
+                conn.execute(text("INSERT INTO pv_case_fts(pv_case_fts) VALUES ('rebuild')"))
+            return "fts5"
+    except DBAPIError as e:
+        print(f"[SkyVigilance] Full-text index not available on {dialect} ({e.orig}) — "
+              f"the in-process index will be used.")
+    return None
+
+
+def _has_fts(conn):
+    return conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'pv_case_fts'")).first() is not None
+
+
+def detect_engine(conn):
+    if TEXT_SEARCH == "memory":
+        return "memory"
+    if TEXT_SEARCH != "auto":
+        raise ValueError(f"TEXT_SEARCH must be auto or memory, not {TEXT_SEARCH!r}")
+    dialect = conn.dialect.name
+    if dialect == "postgresql" and conn.execute(text("SELECT to_regclass('ix_case_text_doc')")).scalar():
+        name = "tsvector"
+    elif dialect == "sqlite" and _has_fts(conn):
+        name = "fts5"
+    else:
+        return "memory"
+    cases, texts = conn.execute(text("SELECT (SELECT count(*) FROM pv_case), (SELECT count(*) FROM pv_case_text)")).one()
+    if texts < cases:
+        print(f"[SkyVigilance] pv_case_text holds {texts} of {cases} cases — "
+              f"run `flask text-index` to backfill the search index.")
+    return name
+
+
+def engine():
+    if _engine["name"] is None:
+        with db.engine.connect() as conn:
+            _engine["name"] = detect_engine(conn)
+    return _engine["name"]
+
+
+def _filters(opts, params):
+    sql = ""
+    if opts["step"]:
+        sql += " AND t.current_step IN :steps"
+        params["steps"] = opts["step"]
+    if opts["status"]:
+        sql += " AND t.status IN :statuses"
+        params["statuses"] = opts["status"]
+    return sql
+
+
+def _statement(sql, params):
+    stmt = text(sql)
+    for name in ("steps", "statuses"):
+        if name in params:
+            stmt = stmt.bindparams(bindparam(name, expanding=True))
+    return stmt
+
+
+def fts5_match(q):
+    # tokens are \w+ runs, so quoting needs no escaping
+    quote = lambda toks: '"' + " ".join(toks) + '"'
+    expr = " AND ".join([quote([w]) for w in q["words"]] +
+                        [quote([p]) + "*" for p in q["prefixes"]] +
+                        [quote(ph) for ph in q["phrases"]])
+    for ex in q["excluded"]:
+        expr += " NOT " + quote(ex)
+    return expr
+
+
+def _pg_query(q, params):
+    parts = []
+    for kind, fn, items in (("w", "plainto_tsquery", q["words"]),
+                            ("p", "to_tsquery", [p + ":*" for p in q["prefixes"]]),
+                            ("f", "phraseto_tsquery", [" ".join(ph) for ph in q["phrases"]]),
+                            ("x", "!! phraseto_tsquery", [" ".join(ex) for ex in q["excluded"]])):
+        for i, value in enumerate(items):
+            params[f"{kind}{i}"] = value
+            parts.append(f"{fn}('english', :{kind}{i})")
+    return " && ".join(parts)
+
+
+def _window(opts):
+    return max(RANK_WINDOW, opts["offset"] + opts["limit"])
+
+
+def _search_fts5(conn, opts):
+    params = {"match": fts5_match(opts["q"]), "limit": opts["limit"], "offset": opts["offset"],
+              "window": _window(opts), "hit": _HIT, "end": _END}
+    where  = "pv_case_fts MATCH :match" + _filters(opts, params)
+    weights = ", ".join(str(w) for w in FIELD_WEIGHTS)
+    # bm25() costs a docsize read per row, so only the newest :window
+    # matches are ranked: the scalar subquery finds the docid just below
+    # them (FTS5 walks rowids newest-first without scoring), then snippet()
+    # runs on the page rows only
+    page = conn.execute(_statement(f"""
+        SELECT f.rowid, t.case_id, t.current_step, t.status, bm25(pv_case_fts, {weights}) AS score
+        FROM pv_case_fts f JOIN pv_case_text t ON t.docid = f.rowid
+        WHERE {where} AND f.rowid > coalesce((
+            SELECT f.rowid FROM pv_case_fts f JOIN pv_case_text t ON t.docid = f.rowid
+            WHERE {where}
+            ORDER BY f.rowid DESC LIMIT 1 OFFSET :window), 0)
+        ORDER BY score, f.rowid DESC
+        LIMIT :limit OFFSET :offset""", params), params).all()
+    snippets = {}
+    if page:
+        cols = ", ".join(f"snippet(pv_case_fts, {i}, :hit, :end, '…', {SNIPPET_WORDS})" for i in range(len(FIELDS)))
+        for row in conn.execute(text(f"SELECT rowid, {cols} FROM pv_case_fts "
+                                     f"WHERE pv_case_fts MATCH :match AND rowid IN ({','.join(str(r[0]) for r in page)})"),
+                                {"match": params["match"], "hit": _HIT, "end": _END}):
+            snippets[row[0]] = row[1:]
+    items = [result(r.case_id, r.current_step, r.status, -r.score, snippets.get(r[0], ())) for r in page]
+    total = None
+    if opts["count"]:
+        join  = " JOIN pv_case_text t ON t.docid = f.rowid" if (opts["step"] or opts["status"]) else ""
+        total = conn.execute(_statement(f"SELECT count(*) FROM pv_case_fts f{join} WHERE {where}",
+                                        params), params).scalar()
+    return items, total
+
+
+def _search_pg(conn, opts):
+    params  = {"limit": opts["limit"], "offset": opts["offset"], "window": _window(opts),
+               "opts": f"StartSel={_HIT}, StopSel={_END}, MaxWords={SNIPPET_WORDS}, MinWords=6, "
+                       f"MaxFragments=2, FragmentDelimiter=\" … \""}
+    query   = _pg_query(opts["q"], params)
+    filters = _filters(opts, params)
+    heads   = ", ".join(f"ts_headline('english', coalesce(p.{f}, ''), q.query, :opts)" for f in FIELDS)
+    # ts_rank_cd detoasts each tsvector, so it ranks the newest :window
+    # matches only; ts_headline re-parses the text, so it runs on the page
+    page = conn.execute(_statement(f"""
+        WITH q AS (SELECT ({query}) AS query)
+        SELECT p.case_id, p.current_step, p.status, p.score, {heads}
+        FROM (SELECT w.*, ts_rank_cd(w.doc, q.query) AS score
+              FROM (SELECT t.* FROM pv_case_text t, q
+                    WHERE t.doc @@ q.query{filters}
+                    ORDER BY t.docid DESC LIMIT :window) w, q
+              ORDER BY score DESC, w.docid DESC
+              LIMIT :limit OFFSET :offset) p, q
+        ORDER BY p.score DESC, p.docid DESC""", params), params).all()
+    items = [result(r[0], r[1], r[2], r[3], r[4:]) for r in page]
+    total = None
+    if opts["count"]:
+        total = conn.execute(_statement(f"""
+            SELECT count(*) FROM pv_case_text t
+            WHERE t.doc @@ ({query}){filters}""", params), params).scalar()
+    return items, total
+
+
+def db_search(conn, opts, name):
+    # -> (result dicts, total or None)
+    return _search_pg(conn, opts) if name == "tsvector" else _search_fts5(conn, opts)
+
+
+# ---------------------------------------------------------
+# In-process index
+# ---------------------------------------------------------
+
+_K1, _B = 1.2, 0.75
+
+
+def _snippet(text_, match):
+    # SNIPPET_WORDS words from just before the first hit, hits marked
+    words = list(_WORD_RE.finditer(text_))
+    first = next((i for i, m in enumerate(words) if match(m.group().lower())), None)
+    if first is None:
+        return None
+    lo  = max(0, first - SNIPPET_WORDS // 4)
+    hi  = min(len(words), lo + SNIPPET_WORDS)
+    out, pos = [], words[lo].start()
+    for m in words[lo:hi]:
+        if match(m.group().lower()):
+            out += [text_[pos:m.start()], _HIT, m.group(), _END]
+            pos = m.end()
+    out.append(text_[pos:words[hi - 1].end()])
+    return ("…" if lo else "") + "".join(out) + ("…" if hi < len(words) else "")
+
+
+def _has_phrase(texts, toks):
+    needle = " " + " ".join(toks) + " "
+    return any(needle in " " + " ".join(_WORD_RE.findall(t.lower())) + " " for t in texts)
+
+
+class TextIndex:
+    # Docids are handed out in write order: an upsert retires the case's
+    # old docid and appends it again, so posting arrays stay sorted and
+    # AND queries are numpy intersections. Retired postings are skipped
+    # via `alive` until compaction renumbers the live documents.
+
+    def __init__(self):
+        self._lock      = threading.RLock()
+        self.postings   = {}             # token -> (array of docids, array of weighted tf)
+        self._vocab     = None           # sorted tokens for prefix queries, rebuilt lazily
+        self.doc_of     = {}             # case_id -> docid
+        self.case_ids   = []             # docid -> case_id
+        self.texts      = []             # docid -> field texts (None once retired)
+        self.alive      = bytearray()
+        self.lengths    = array("f")
+        self.steps      = array("h")
+        self.statuses   = array("h")
+        self.status_of  = {}             # status -> code
+        self.status_names = []
+        self.total_len  = 0.0
+        self.retired    = 0
+        self.watermark  = None
+        self.built      = False
+
+    def __len__(self):
+        return len(self.doc_of)
+
+    def _status_code(self, status):
+        code = self.status_of.get(status)
+        if code is None:
+            code = self.status_of[status] = len(self.status_names)
+            self.status_names.append(status)
+        return code
+
+    def upsert(self, case_id, texts, step, status, updated_at=None):
+        counts, length = Counter(), 0.0
+        for txt, weight in zip(texts, FIELD_WEIGHTS):
+            toks = _WORD_RE.findall(txt.lower())
+            length += weight * len(toks)
+            for tok, n in Counter(toks).items():
+                counts[tok] += weight * n
+        with self._lock:
+            self._retire(case_id)
+            docid = len(self.case_ids)
+            for tok, tf in counts.items():
+                p = self.postings.get(tok)
+                if p is None:
+                    p = self.postings[tok] = (array("i"), array("f"))
+                    self._vocab = None
+                p[0].append(docid)
+                p[1].append(tf)
+            self.doc_of[case_id] = docid
+            self.case_ids.append(case_id)
+            self.texts.append(tuple(texts))
+            self.alive.append(1)
+            self.lengths.append(length)
+            self.steps.append(step or 0)
+            self.statuses.append(self._status_code(status))
+            self.total_len += length
+            self._seen(updated_at)
+            if self.retired > 10000 and self.retired > len(self.doc_of):
+                self._compact()
+
+    def upsert_case(self, case):
+        self.upsert(case.id, tuple(case_text(case).values()), case.current_step, case.status,
+                    getattr(case, "updated_at", None))
+
+    def set_state(self, case_id, step, status, updated_at=None):
+        # a workflow move without text changes: no re-indexing
+        with self._lock:
+            docid = self.doc_of.get(case_id)
+            if docid is not None:
+                self.steps[docid]    = step or 0
+                self.statuses[docid] = self._status_code(status)
+            self._seen(updated_at)
+
+    def remove(self, case_id):
+        with self._lock:
+            self._retire(case_id)
+
+    def _seen(self, updated_at):
+        if updated_at is not None and (self.watermark is None or updated_at > self.watermark):
+            self.watermark = updated_at
+
+    def _retire(self, case_id):
+        docid = self.doc_of.pop(case_id, None)
+        if docid is not None:
+            self.alive[docid] = 0
+            self.texts[docid] = None
+            self.total_len   -= self.lengths[docid]
+            self.retired     += 1
+
+    def _compact(self):
+        alive = np.frombuffer(bytes(self.alive), dtype=np.uint8).astype(bool)
+        remap = np.cumsum(alive, dtype=np.int64) - 1
+        for tok, (ids, tf) in list(self.postings.items()):
+            ids_np = np.array(ids, dtype=np.int32)
+            keep   = alive[ids_np]
+            if not keep.any():
+                del self.postings[tok]
+                continue
+            new_ids, new_tf = array("i"), array("f")
+            new_ids.frombytes(remap[ids_np[keep]].astype(np.int32).tobytes())
+            new_tf.frombytes(np.array(tf, dtype=np.float32)[keep].tobytes())
+            self.postings[tok] = (new_ids, new_tf)
+        live = np.nonzero(alive)[0]
+        self.case_ids = [self.case_ids[i] for i in live]
+        self.texts    = [self.texts[i] for i in live]
+        self.doc_of   = {cid: i for i, cid in enumerate(self.case_ids)}
+        self.alive    = bytearray(b"\x01" * len(live))
+        for name in ("lengths", "steps", "statuses"):
+            old = getattr(self, name)
+            setattr(self, name, array(old.typecode, (old[i] for i in live)))
+        self.retired = 0
+        self._vocab  = None
+
+    # -- query ----------------------------------------------------------
+
+    def _term(self, tok):
+        p = self.postings.get(tok)
+        if p is None:
+            return np.zeros(0, np.int32), np.zeros(0, np.float32)
+        return np.array(p[0], dtype=np.int32), np.array(p[1], dtype=np.float32)
+
+    def _prefix(self, prefix):
+        if self._vocab is None:
+            self._vocab = sorted(self.postings)
+        i, parts = bisect_left(self._vocab, prefix), []
+        while i < len(self._vocab) and self._vocab[i].startswith(prefix):
+            parts.append(self._term(self._vocab[i]))
+            i += 1
+        if not parts:
+            return np.zeros(0, np.int32), np.zeros(0, np.float32)
+        ids, inv = np.unique(np.concatenate([p[0] for p in parts]), return_inverse=True)
+        return ids.astype(np.int32), np.bincount(inv, weights=np.concatenate([p[1] for p in parts])).astype(np.float32)
+
+    def _bm25(self, ids, tf, lengths, avg, n_docs):
+        idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+        return idf * tf * (_K1 + 1) / (tf + _K1 * (1 - _B + _B * lengths[ids] / avg))
+
+    def search(self, opts):
+        # -> (result dicts, total or None)
+        q = opts["q"]
+        with self._lock:
+            n_docs  = max(len(self.doc_of), 1)
+            avg     = max(self.total_len / n_docs, 1.0)
+            lengths = np.array(self.lengths, dtype=np.float32)
+            terms   = ([self._term(w) for w in q["words"]] + [self._prefix(p) for p in q["prefixes"]] +
+                       [self._term(t) for ph in q["phrases"] for t in ph])
+            terms.sort(key=lambda t: len(t[0]))
+
+            ids, score = terms[0][0], self._bm25(*terms[0], lengths, avg, n_docs)
+            for t_ids, tf in terms[1:]:
+                ids, ia, ib = np.intersect1d(ids, t_ids, assume_unique=True, return_indices=True)
+                score = score[ia] + self._bm25(t_ids, tf, lengths, avg, n_docs)[ib]
+
+            keep = np.frombuffer(bytes(self.alive), dtype=np.uint8)[ids].astype(bool)
+            if opts["step"]:
+                keep &= np.isin(np.array(self.steps, dtype=np.int16)[ids], opts["step"])
+            if opts["status"]:
+                codes = [self.status_of[s] for s in opts["status"] if s in self.status_of]
+                keep &= np.isin(np.array(self.statuses, dtype=np.int16)[ids], codes)
+            for ex in q["excluded"]:
+                if len(ex) == 1:
+                    keep &= ~np.isin(ids, self._term(ex[0])[0], assume_unique=True)
+            ids, score = ids[keep], score[keep]
+
+            # phrases (and excluded phrases) are checked on the text itself,
+            # in rank order, only as far as the page needs unless counting
+            verify  = q["phrases"] + [ex for ex in q["excluded"] if len(ex) > 1]
+            want    = opts["offset"] + opts["limit"]
+            matched = len(ids)
+            if not verify and len(ids) > 4 * want:
+                kth = np.partition(score, len(score) - want)[len(score) - want]
+                sel = np.nonzero(score >= kth)[0]
+                ids, score = ids[sel], score[sel]
+            order = np.lexsort((ids, -score))
+
+            def ok(docid):
+                texts = self.texts[docid]
+                return (all(_has_phrase(texts, ph) for ph in q["phrases"]) and
+                        not any(_has_phrase(texts, ex) for ex in q["excluded"] if len(ex) > 1))
+
+            hits, total = [], None
+            if not verify:
+                hits  = list(order[opts["offset"]:want])
+                total = matched if opts["count"] else None
+            else:
+                n = 0
+                for i in order:
+                    if ok(int(ids[i])):
+                        if opts["offset"] <= n < want:
+                            hits.append(i)
+                        n += 1
+                        if n >= want and not opts["count"]:
+                            break
+                total = n if opts["count"] else None
+
+            words    = set(q["words"]) | {t for ph in q["phrases"] for t in ph}
+            prefixes = tuple(q["prefixes"])
+            match    = lambda tok: tok in words or (prefixes and tok.startswith(prefixes))
+            items = []
+            for i in hits:
+                d = int(ids[i])
+                items.append(result(self.case_ids[d], self.steps[d], self.status_names[self.statuses[d]],
+                                    score[i], [_snippet(t, match) for t in self.texts[d]]))
+        return items, total
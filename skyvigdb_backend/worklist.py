@@ -0,0 +1,241 @@
+# =========================================================
+# WORKLIST — per-step work queues with leased claims
+# ---------------------------------------------------------
+# Every case carries a due date, the reporting clock from
+# receipt (7 days fatal / life-threatening, 15 serious, 90
+# non-serious), and an optional lease: claimed_by and
+# claim_expires. A step's queue is its unclaimed or lapsed
+# cases in (due_date, id) order — most urgent first, the
+# oldest receipt first within a clock — read from
+# ix_case_worklist (current_step, status, due_date, id):
+# one LIMIT-ed index range per status at the step, merged,
+# so a page costs the same whatever the backlog size.
+# Claiming is atomic on both backends:
+#   postgresql  SELECT … FOR UPDATE SKIP LOCKED per status,
+#               then UPDATE the chosen rows; concurrent
+#               claimers pass over each other's rows
+#               instead of queueing behind them
+#   sqlite      one UPDATE … WHERE id IN (queue head) AND
+#               lease free RETURNING id; SQLite runs one
+#               writer at a time, so the statement is the
+#               lock
+# A lease lapses by itself after LEASE_SECONDS unless
+# renewed; moving the case to another step ends it
+# (hooks.py). Claim updates keep updated_at, so listing
+# ETags and cached case bodies are unaffected. Due dates
+# come from summary.due_date: hooks.py on every write,
+# migration 7 for the cases that predate it.
+# =========================================================
+
+import heapq
+import os
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, or_, select, union_all
+from sqlalchemy.exc import OperationalError
+
+from app import db, Case, CaseSummary, log_event
+from metrics import WORKLIST_CLAIMS
+
+LEASE_SECONDS  = int(os.getenv("WORKLIST_LEASE", "900"))
+MAX_LEASE      = 4 * 3600
+MAX_LIMIT      = 100
+CLAIM_ATTEMPTS = 3             # SQLite write-lock timeouts before a claim gives up
+
+# the roles of the workflow (frontend ROLE_MAPPING) -> step
+ROLE_STEPS = {
+    "Triage":      1,
+    "Data Entry":  2,
+    "Medical":     3,
+    "Quality":     4,
+    "Submissions": 5,
+    "Archival":    6,
+}
+
+_t = Case.__table__
+_s = CaseSummary.__table__
+
+
+class WorklistError(ValueError):
+    pass
+
+
+# ---------------------------------------------------------
+# Queue reads
+# ---------------------------------------------------------
+
+def resolve_step(step=None, role=None):
+    if step not in (None, ""):
+        try:
+            step = int(step)
+        except (TypeError, ValueError):
+            raise WorklistError("step must be an integer.")
+        if step not in ROLE_STEPS.values():
+            raise WorklistError(f"step must be one of {sorted(ROLE_STEPS.values())}.")
+        return step
+    if role in ROLE_STEPS:
+        return ROLE_STEPS[role]
+    raise WorklistError(f"step or a role of {list(ROLE_STEPS)} is required.")
+
+
+def limit_arg(value, default):
+    try:
+        n = int(value if value not in (None, "") else default)
+    except (TypeError, ValueError):
+        raise WorklistError("limit must be an integer.")
+    return max(1, min(n, MAX_LIMIT))
+
+
+def lease_arg(value):
+    try:
+        n = int(value if value not in (None, "") else LEASE_SECONDS)
+    except (TypeError, ValueError):
+        raise WorklistError("leaseSeconds must be an integer.")
+    return max(60, min(n, MAX_LEASE))
+
+
+def step_statuses(step):
+    # loose index scan over ix_case_worklist: one MIN() seek per
+    # distinct status at the step, however many cases there are
+    found, prev = [], None
+    while True:
+        q = select(func.min(_t.c.status)).where(_t.c.current_step == step)
+        q = q.where(_t.c.status > prev if prev is not None else _t.c.status.isnot(None))
+        status = db.session.execute(q).scalar()
+        if status is None:
+            return found
+        found.append(status)
+        prev = status
+
+
+def _free(now):
+    return or_(_t.c.claim_expires.is_(None), _t.c.claim_expires < now)
+
+
+def _head(step, status, limit, now):
+    return (select(_t.c.id, _t.c.due_date)
+            .where(_t.c.current_step == step, _t.c.status == status, _free(now))
+            .order_by(_t.c.due_date, _t.c.id)
+            .limit(limit))
+
+
+def _merged(heads, limit):
+    return [r.id for r in heapq.merge(*heads, key=lambda r: (r.due_date or date.max, r.id))][:limit]
+
+
+def items(ids, today=None):
+    # -> worklist rows for the ids, in queue order
+    if not ids:
+        return []
+    today = today or date.today()
+    rows  = db.session.execute(
+        select(_t.c.id, _t.c.current_step, _t.c.status, _t.c.due_date, _t.c.claimed_by,
+               _t.c.claim_expires, _s.c.receipt_date, _s.c.serious, _s.c.country,
+               _s.c.suspect_drug, _s.c.first_pt)
+        .outerjoin(_s, _s.c.case_id == _t.c.id)
+        .where(_t.c.id.in_(ids))).all()
+    out = []
+    for r in sorted(rows, key=lambda r: (r.due_date or date.max, r.id)):
+        out.append({
+            "id":           r.id,
+            "caseNumber":   r.id,
+            "currentStep":  r.current_step,
+            "status":       r.status,
+            "dueDate":      r.due_date.isoformat() if r.due_date else None,
+            "daysLeft":     (r.due_date - today).days if r.due_date else None,
+            "receiptDate":  r.receipt_date.isoformat() if r.receipt_date else None,
+            "serious":      bool(r.serious),
+            "country":      r.country,
+            "drug":         r.suspect_drug,
+            "pt":           r.first_pt,
+            "claimedBy":    r.claimed_by,
+            "claimExpires": r.claim_expires.isoformat() if r.claim_expires else None,
+        })
+    return out
+
+
+def queue(step, statuses=None, limit=20):
+    # the next `limit` unclaimed cases at a step, without claiming them
+    now   = datetime.utcnow()
+    heads = [db.session.execute(_head(step, s, limit, now)).all()
+             for s in statuses or step_statuses(step)]
+    return items(_merged(heads, limit))
+
+
+# ---------------------------------------------------------
+# Claims
+# ---------------------------------------------------------
+
+def _target(step, statuses, limit, now):
+    # the ids to claim: locked and chosen here on PostgreSQL, a
+    # subquery of the UPDATE itself elsewhere
+    if db.engine.dialect.name == "postgresql":
+        heads = [db.session.execute(_head(step, s, limit, now).with_for_update(skip_locked=True)).all()
+                 for s in statuses]
+        return _merged(heads, limit)
+    if len(statuses) == 1:
+        return _head(step, statuses[0], limit, now).with_only_columns(_t.c.id)
+    heads = union_all(*[select(h.c.id, h.c.due_date) for h in
+                        (_head(step, s, limit, now).subquery() for s in statuses)]).subquery()
+    return select(heads.c.id).order_by(heads.c.due_date, heads.c.id).limit(limit)
+
+
+def claim(step, user, role="unknown", statuses=None, limit=1, lease=LEASE_SECONDS):
+    # -> the claimed cases (possibly fewer than `limit`, or none)
+    statuses = statuses or step_statuses(step)
+    if not statuses:
+        WORKLIST_CLAIMS.inc(str(step), "empty")
+        return []
+    db.session.commit()                  # claim in a transaction of its own
+    for attempt in range(CLAIM_ATTEMPTS):
+        now = datetime.utcnow()
+        try:
+            ids = db.session.execute(
+                _t.update()
+                .where(_t.c.id.in_(_target(step, statuses, limit, now)), _free(now))
+                .values(claimed_by=user, claim_expires=now + timedelta(seconds=lease),
+                        updated_at=_t.c.updated_at)
+                .returning(_t.c.id)).scalars().all()
+            for case_id in ids:
+                log_event(case_id, "CASE_CLAIMED", user, role, step_from=step, step_to=step,
+                          section="worklist", details=f"Lease {lease}s")
+            db.session.commit()
+            break
+        except OperationalError as e:
+            # SQLite: other claimers held the write lock past the busy
+            # timeout. Nothing was claimed; after the last attempt the
+            # caller gets what SKIP LOCKED gives when every row is taken
+            db.session.rollback()
+            if "database is locked" not in str(e.orig):
+                raise
+    else:
+        WORKLIST_CLAIMS.inc(str(step), "busy")
+        return []
+    WORKLIST_CLAIMS.inc(str(step), "claimed" if ids else "empty")
+    return items(ids)
+
+
+def renew(ids, user, lease=LEASE_SECONDS):
+    # extends the caller's own leases, lapsed ones included as long
+    # as nobody has claimed the case since; -> ids renewed
+    ids = db.session.execute(
+        _t.update()
+        .where(_t.c.id.in_(ids), _t.c.claimed_by == user)
+        .values(claim_expires=datetime.utcnow() + timedelta(seconds=lease), updated_at=_t.c.updated_at)
+        .returning(_t.c.id)).scalars().all()
+    db.session.commit()
+    return ids
+
+
+def release(ids, user, role="unknown"):
+    # hands the caller's cases back to the queue; -> ids released
+    ids = db.session.execute(
+        _t.update()
+        .where(_t.c.id.in_(ids), _t.c.claimed_by == user)
+        .values(claimed_by=None, claim_expires=None, updated_at=_t.c.updated_at)
+        .returning(_t.c.id)).scalars().all()
+    for case_id in ids:
+        log_event(case_id, "CASE_RELEASED", user, role, section="worklist")
+    db.session.commit()
+    return ids
+